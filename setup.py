@@ -56,16 +56,19 @@ setup(
     package_dir={"": "src/main/python"},
     packages=find_packages(where="src/main/python"),
     scripts=["src/main/python/scripts/backup-rotation"],
-    install_requires=[
-        "python-dateutil==2.8.1",
-    ],
+    install_requires=[],
     extras_require={
+        "numpy": [
+            "numpy>=1.13"
+        ],
         "dev": [
+            "python-dateutil>=2.8.1",
             "behave>=1.2.6",
             "pylint>=2.6.0",
             "wheel>=0.35.1",
             "stdeb>=0.9.1",
-            "coverage>=5.2.1"
+            "coverage>=5.2.1",
+            "numpy>=1.13"
         ]
     }
 )
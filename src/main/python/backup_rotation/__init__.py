@@ -21,16 +21,61 @@
 #
 
 """ A simple package for rotating backups using directories ot indicate
-    desired backup frequencies."""
+    desired backup frequencies.
+
+    The cli module, and argparse with it, is only imported once used so that
+    importing the package stays fast."""
 
-from .cli import rotate, rotate_and_exit
 from .__version__ import __VERSION__
 from .backup_rotation import \
     BackupRotator, \
     BackupRotationException, \
-    BackupRootFolderMissingException
+    BackupRootFolderMissingException, \
+    BackupEffectFailedException
+from .backends import \
+    StorageBackend, \
+    LocalBackend, \
+    MemoryBackend, \
+    FakeRemoteBackend
+from .frequencies import CalendarDelta
+
+# The cli module is imported once used, see above.
+# pylint: disable=import-outside-toplevel
+
+def rotate(argv):
+    """ Runs the command line interface with the arguments given, see
+        cli.rotate """
+    from .cli import rotate as cli_rotate
+    return cli_rotate(argv)
+
+
+def rotate_and_exit(argv=None):
+    """ Runs the command line interface and exits, see
+        cli.rotate_and_exit """
+    from .cli import rotate_and_exit as cli_rotate_and_exit
+    cli_rotate_and_exit(argv)
+
+
+def __getattr__(name):
+    """ Imports the cli module when it is first accessed as an attribute of
+        the package (Python 3.7 and later, import it explicitly before). """
+    if name == "cli":
+        # Not "from . import cli", which looks the attribute up first and
+        # would end up here again.
+        import importlib
+        return importlib.import_module(".cli", __name__)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
 
 __all__ = [
+    'rotate',
+    'rotate_and_exit',
     'BackupRotator',
     'BackupRotationException',
-    'BackupRootFolderMissingException']
+    'BackupRootFolderMissingException',
+    'BackupEffectFailedException',
+    'StorageBackend',
+    'LocalBackend',
+    'MemoryBackend',
+    'FakeRemoteBackend',
+    'CalendarDelta']
@@ -0,0 +1,419 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" Storage backends used by the BackupRotator to list, promote and delete
+    backup files. The rotator only ever talks to its backend, which allows
+    the planner to be run against storage other than a local directory. """
+# The modules only the LocalBackend needs (dirfd, transfer) are imported
+# where they are used, so that importing the package does not load them.
+# pylint: disable=import-outside-toplevel
+import logging
+import os
+import posixpath
+import threading
+import time
+from collections import Counter
+
+from .catalog import CatalogEntry, new_stat_counter, scan_directory, \
+    scan_directory_concurrently, NANOSECONDS_PER_SECOND
+
+LOG = logging.getLogger(__name__)
+
+
+class StorageBackend():
+    """ The interface every storage backend implements. Files are identified
+        by the opaque path found in the CatalogEntry produced while
+        scanning. """
+    # Whether a ScanIndex may be used to skip re-listing directories.
+    supports_index = False
+    # The most files delete_many is given at once, 1 if the backend can only
+    # delete one file per request.
+    delete_batch_size = 1
+    # Whether the links made and deleted within a directory only survive a
+    # crash once the directory is synced (see sync_directory), and whether
+    # link must sync the data of any copy it makes before it is in place.
+    needs_sync = False
+    sync_copies = False
+
+    def root_exists(self):
+        """ Returns whether the backup root exists. """
+        raise NotImplementedError()
+
+    def bucket_exists(self, bucket):
+        """ Returns whether the time bucket exists within the backup root. """
+        raise NotImplementedError()
+
+    def make_bucket(self, bucket):
+        """ Creates the time bucket within the backup root. """
+        raise NotImplementedError()
+
+    def scan_bucket(self, bucket, name_filter, index=None, stats=None):
+        """ Yields, per directory within the time bucket, a list of the
+            CatalogEntry of each file accepted by name_filter sorted oldest
+            first, not descending into the directories name_filter excludes
+            if it is a matcher.NameMatcher. Any stat calls made are counted
+            in the RunStats provided. """
+        raise NotImplementedError()
+
+    def start_scan(self, bucket, name_filter, pool, index=None, stats=None):
+        """ Starts scan_bucket in the concurrent.futures executor given and
+            returns an iterator yielding what it yields. Backends able to
+            read the directories of a time bucket concurrently read each in
+            a task of its own, the others the whole time bucket in one. The
+            stat calls are added to the RunStats provided as the directories
+            are consumed, by the thread consuming them. """
+        counter = new_stat_counter()
+        future = pool.submit(
+            lambda: list(self.scan_bucket(bucket, name_filter, index,
+                                          counter)))
+
+        def consume():
+            directories = future.result()
+            if stats is not None:
+                stats.stat_calls += counter.stat_calls
+            yield from directories
+
+        return consume()
+
+    def expect_links(self, buckets):
+        """ Tells the backend, before the time buckets are scanned, that links
+            are only ever made into the time buckets given, so that it need
+            not look for what it keeps with the links it makes in the
+            others. """
+
+    def bucket_path(self, bucket, name):
+        """ Returns the path a file of the given name has within the top of
+            the time bucket. """
+        raise NotImplementedError()
+
+    def link(self, path, target_path):
+        """ Makes the file at path also available at target_path. May return
+            a transfer.Transfer describing how. """
+        raise NotImplementedError()
+
+    def delete(self, path):
+        """ Deletes the file at path. """
+        raise NotImplementedError()
+
+    def delete_many(self, paths):
+        """ Deletes the files at paths, at most delete_batch_size of them, and
+            returns the (path, OSError) of each which could not be deleted.
+            Raises an OSError if none could. """
+        failures = []
+        for path in paths:
+            try:
+                self.delete(path)
+            except OSError as ex:
+                failures.append((path, ex))
+        return failures
+
+    def stat(self, path):
+        """ Returns the CatalogEntry of the file at path, raising an OSError
+            such as FileNotFoundError if there is none. """
+        raise NotImplementedError()
+
+    def sync_directory(self, directory):
+        """ Makes the links made and deleted within the directory, given as
+            the os.path.dirname of their paths, durable. """
+
+    def release(self):
+        """ Releases what the backend holds on to between operations, such
+            as open directories. The backend can still be used after. """
+
+    def disk_usage(self):
+        """ Returns the (total, available) bytes of the storage holding the
+            backup root, or None where they are unknown. """
+        return None
+
+
+class LocalBackend(StorageBackend):
+    """ A backend for a backup root on a local (or mounted) POSIX file
+        system. Promotions are hardlinks, or copies keeping the modification
+        time where hardlinks are impossible (see transfer). """
+    supports_index = True
+    needs_sync = True
+
+    def __init__(self, backup_root):
+        from . import dirfd
+        self.backup_root = backup_root
+        # The directories kept open to stat, link and unlink relative to
+        # them where the platform allows it.
+        self.handles = dirfd.DirectoryHandles() if dirfd.SUPPORTED else None
+        # The entry of every file scanned by its file_id, so that the other
+        # hardlinks of a file are not stat'ed again.
+        self.inodes = {}
+
+    def root_exists(self):
+        return os.path.exists(self.backup_root)
+
+    def bucket_exists(self, bucket):
+        return os.path.exists(os.path.join(self.backup_root, bucket))
+
+    def make_bucket(self, bucket):
+        os.mkdir(os.path.join(self.backup_root, bucket))
+
+    def scan_bucket(self, bucket, name_filter, index=None, stats=None):
+        return scan_directory(os.path.join(self.backup_root, bucket),
+                              name_filter, index, stats, self.handles,
+                              self.inodes)
+
+    def start_scan(self, bucket, name_filter, pool, index=None, stats=None):
+        return scan_directory_concurrently(
+            os.path.join(self.backup_root, bucket), name_filter, pool, index,
+            stats, self.handles, self.inodes)
+
+    def bucket_path(self, bucket, name):
+        return os.path.join(self.backup_root, bucket, name)
+
+    def link(self, path, target_path):
+        from .transfer import promote_file
+        return promote_file(path, target_path, self.handles,
+                            self.sync_copies)
+
+    def delete(self, path):
+        if self.handles is not None:
+            self.handles.unlink(path)
+        else:
+            os.remove(path)
+
+    def stat(self, path):
+        stat_result = self.handles.stat(path) if self.handles is not None \
+            else os.stat(path)
+        return CatalogEntry.from_stat(path, os.path.basename(path),
+                                      stat_result)
+
+    def sync_directory(self, directory):
+        descriptor = self.handles.get(directory) \
+            if self.handles is not None else None
+        if descriptor is not None:
+            os.fsync(descriptor)
+            return
+        descriptor = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def release(self):
+        if self.handles is not None:
+            self.handles.close()
+        self.inodes = {}
+
+    def disk_usage(self):
+        usage = os.statvfs(self.backup_root)
+        return (usage.f_blocks * usage.f_frsize,
+                usage.f_bavail * usage.f_frsize)
+
+
+class MemoryBackend(StorageBackend):
+    """ A backend which keeps the whole backup root in memory. Useful to run
+        the planner against millions of files without touching the disk.
+        Paths use "/" as separator and start with the root's name. The
+        storage holds capacity bytes, if given. """
+    def __init__(self, backup_root="memory", capacity=None):
+        self.backup_root = backup_root
+        self.capacity = capacity
+        # The number and bytes of the files stored, each hardlinked file
+        # counted once.
+        self.files = 0
+        self.used = 0
+        self.__files = {backup_root: {}}
+        self.__subdirs = {backup_root: []}
+        # The number of hardlinks of every file by inode, numbered from 1 in
+        # the order the files were added.
+        self.__links = Counter()
+
+    def __make_dirs(self, directory):
+        if directory in self.__files:
+            return
+        parent = posixpath.dirname(directory)
+        self.__make_dirs(parent)
+        self.__files[directory] = {}
+        self.__subdirs[directory] = []
+        self.__subdirs[parent].append(directory)
+
+    def add_file(self, relative_path, mtime, size=0):
+        """ Creates a file (and its parent directories) below the root with
+            the modification time given in seconds since the epoch. """
+        path = posixpath.join(self.backup_root, relative_path)
+        directory, name = posixpath.split(path)
+        self.__make_dirs(directory)
+        seconds = int(mtime)
+        mtime_ns = seconds * NANOSECONDS_PER_SECOND + \
+            int(round((mtime - seconds) * NANOSECONDS_PER_SECOND))
+        inode = len(self.__links) + 1
+        self.__files[directory][name] = CatalogEntry(
+            path, name, mtime_ns, size, inode)
+        self.__links[inode] = 1
+        self.files += 1
+        self.used += size
+        return path
+
+    def list_files(self, bucket):
+        """ Returns the paths of every file within the time bucket. """
+        top = posixpath.join(self.backup_root, bucket)
+        return [path for directory, files in self.__files.items()
+                if directory == top or directory.startswith(top + "/")
+                for path in (x.path for x in files.values())]
+
+    def stat(self, path):
+        directory, name = posixpath.split(path)
+        try:
+            entry = self.__files[directory][name]
+        except KeyError:
+            raise FileNotFoundError(path) from None
+        entry.links = self.__links[entry.inode]
+        return entry
+
+    def root_exists(self):
+        return True
+
+    def bucket_exists(self, bucket):
+        return posixpath.join(self.backup_root, bucket) in self.__files
+
+    def make_bucket(self, bucket):
+        self.__make_dirs(posixpath.join(self.backup_root, bucket))
+
+    def scan_bucket(self, bucket, name_filter, index=None, stats=None):
+        excluded = getattr(name_filter, "excluded", None)
+        pending = [posixpath.join(self.backup_root, bucket)]
+        while pending:
+            directory = pending.pop()
+            if directory not in self.__files:
+                continue
+            entries = [x for x in self.__files[directory].values()
+                       if name_filter(x.name)]
+            for entry in entries:
+                entry.links = self.__links[entry.inode]
+            entries.sort(key=lambda x: x.mtime_ns)
+            yield entries
+            pending.extend(
+                x for x in reversed(self.__subdirs[directory])
+                if excluded is None or not excluded(posixpath.basename(x)))
+
+    def bucket_path(self, bucket, name):
+        return posixpath.join(self.backup_root, bucket, name)
+
+    def link(self, path, target_path):
+        directory, name = posixpath.split(path)
+        source = self.__files[directory][name]
+        target_directory, target_name = posixpath.split(target_path)
+        target_files = self.__files[target_directory]
+        if target_name in target_files:
+            raise FileExistsError(target_path)
+        target_files[target_name] = source.linked_as(target_path,
+                                                     target_name)
+        self.__links[source.inode] += 1
+
+    def delete(self, path):
+        directory, name = posixpath.split(path)
+        try:
+            entry = self.__files[directory].pop(name)
+        except KeyError:
+            raise FileNotFoundError(path) from None
+        self.__links[entry.inode] -= 1
+        if not self.__links[entry.inode]:
+            self.files -= 1
+            self.used -= entry.size
+
+    def disk_usage(self):
+        if self.capacity is None:
+            return None
+        return self.capacity, self.capacity - self.used
+
+
+class FakeRemoteBackend(StorageBackend):
+    """ Wraps another backend and injects latency into every request, the way
+        a remote or network file system would. Each directory listing, link,
+        delete and bucket operation costs `latency` seconds and each listed
+        entry additionally costs `entry_latency` seconds. The number of
+        requests of each kind is counted in `calls` and the most requests
+        seen in flight at once in `peak_concurrency`. Links and deletes of
+        the paths in `failing_paths` fail with an OSError. """
+    # The settings and the counters of the simulation.
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, backend, latency=0.01, entry_latency=0.0):
+        self.backend = backend
+        self.latency = latency
+        self.entry_latency = entry_latency
+        self.calls = Counter()
+        self.peak_concurrency = 0
+        self.failing_paths = set()
+        self.__in_flight = 0
+        self.__lock = threading.Lock()
+
+    def __request(self, kind, entries=0, path=None):
+        with self.__lock:
+            self.calls[kind] += 1
+            self.__in_flight += 1
+            self.peak_concurrency = max(self.peak_concurrency,
+                                        self.__in_flight)
+        try:
+            time.sleep(self.latency + self.entry_latency * entries)
+        finally:
+            with self.__lock:
+                self.__in_flight -= 1
+        if path in self.failing_paths:
+            raise OSError("Simulated failure of %s %s" % (kind, path))
+
+    def root_exists(self):
+        self.__request("root_exists")
+        return self.backend.root_exists()
+
+    def bucket_exists(self, bucket):
+        self.__request("bucket_exists")
+        return self.backend.bucket_exists(bucket)
+
+    def make_bucket(self, bucket):
+        self.__request("make_bucket")
+        self.backend.make_bucket(bucket)
+
+    def scan_bucket(self, bucket, name_filter, index=None, stats=None):
+        for entries in self.backend.scan_bucket(bucket, name_filter):
+            self.__request("list", len(entries))
+            yield entries
+
+    def expect_links(self, buckets):
+        self.backend.expect_links(buckets)
+
+    def bucket_path(self, bucket, name):
+        return self.backend.bucket_path(bucket, name)
+
+    def link(self, path, target_path):
+        self.__request("link", path=target_path)
+        return self.backend.link(path, target_path)
+
+    def delete(self, path):
+        self.__request("delete", path=path)
+        self.backend.delete(path)
+
+    def stat(self, path):
+        self.__request("stat")
+        return self.backend.stat(path)
+
+    def release(self):
+        self.backend.release()
+
+    def disk_usage(self):
+        self.__request("statfs")
+        return self.backend.disk_usage()
@@ -21,24 +21,28 @@
 #
 
 """ Backup file rotation script for backup files. See DESCRIPTION."""
+# Modules which only some runs need (json, fnmatch, sqlite3 through the scan
+# index...), and those of the package which importing it need not load (the
+# backends, the columns, the stats, the executor...), are imported where they
+# are used to keep the startup fast.
+# pylint: disable=import-outside-toplevel
+import heapq
 import logging
-import json
-import re
-import fnmatch
 import os
-from os.path import join, getmtime, basename
-from functools import partial
-from datetime import datetime
+import time
+from os.path import join
+from collections import deque
+from contextlib import contextmanager, ExitStack
+
+from .catalog import Catalog, CatalogEntry, merge_entries
+from .exceptions import BackupRotationException
+from .frequencies import nominal_length
+from .plan import Plan
+from .timekeys import Boundaries
 
 LOG = logging.getLogger(__name__)
 EXIT_CODE_MISSING_BACKUP_ROOT = 100
-
-class BackupRotationException(Exception):
-    """ Base class for handled exceptions generated by this script """
-    def __init__(self, message, preferred_exit_code):
-        super().__init__(message)
-        self.message = message
-        self.preferred_exit_code = preferred_exit_code
+EXIT_CODE_EFFECT_FAILURES = 101
 
 
 class BackupRootFolderMissingException(BackupRotationException):
@@ -49,178 +53,781 @@ class BackupRootFolderMissingException(BackupRotationException):
         super().__init__(message % backup_root, EXIT_CODE_MISSING_BACKUP_ROOT)
 
 
+class BackupEffectFailedException(BackupRotationException):
+    """ Exception for when some promotions or deletions could not be
+        effected. The rest of the plan was still effected. """
+    def __init__(self, failures):
+        message = "%s promotions or deletions failed, see the errors " + \
+            "logged above."
+        super().__init__(message % len(failures), EXIT_CODE_EFFECT_FAILURES)
+        self.failures = failures
+
+
 class BackupRotator():
     """ A Rotator which creates a plan and effects it. """
-    def __init__(self, time_buckets):
+    # The settings of a rotation are attributes, set before rotate_backups.
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, time_buckets, backend=None):
         self.is_dry_run = False
         self.backup_root = "backups"
+        # The StorageBackend holding the backups, a LocalBackend for the
+        # backup_root is used when none is provided.
+        self.backend = backend
+        # The LocalBackend used when no backend is provided, kept for the
+        # whole rotation so that its directories are only opened once.
+        self.__local_backend = None
+        # The number of worker threads used to effect the plan, and the
+        # EffectFailure of every operation which failed.
+        self.jobs = 1
+        self.failures = []
+        # Whether to sync the directories the links were made in before
+        # deleting anything, and those the links were deleted from after, so
+        # that a crash cannot lose a promotion whose source was deleted.
+        self.durable = False
+        # The number of worker threads reading and stat'ing the time buckets.
+        # With more than one, every time bucket is scanned at once while the
+        # planner consumes them in processing order.
+        self.scan_jobs = 1
+        # Whether large time buckets are planned with NumPy when it is
+        # installed (see columns).
+        self.vectorize = True
+        # The paths whose promotion failed, the promoted paths which had to
+        # be copied, and the paths promoted by hardlink in the last rotation.
+        self.__unpromoted = set()
+        self.__copied = set()
+        self.__linked = []
         self.pattern = "*.*"
-        self.__time_buckets = \
-                sorted(time_buckets.items(),
-                       key=lambda x: (datetime.now() + x[1].get("frequency")),
-                       reverse=True)
+        # Further globs of the files to consider, and globs of the files and
+        # directories to ignore, in every time bucket. A time bucket's config
+        # may have its own "include" globs, used instead of pattern and
+        # include, and "exclude" globs, used as well as exclude.
+        self.include = []
+        self.exclude = []
+        # Whether to keep a persistent scan index within the backup root, and
+        # whether to ignore what it recorded and list every directory again.
+        self.use_index = False
+        self.index_path = None
+        self.force_rescan = False
+        # The directories to list again in the next rotation although their
+        # modification time is unchanged.
+        self.rescan_paths = []
+        self.__scan_index = None
+        # The reclaim.FreeTarget to ensure on the volume and the most bytes
+        # a time bucket may hold, met by deleting more files if need be.
+        self.ensure_free = None
+        self.max_bucket_bytes = None
+        # The file to write the plan to before effecting it, if any (see
+        # planfile).
+        self.plan_out = None
+        # Whether the last rotation was skipped as nothing changed, and the
+        # RunStats of the last rotation.
+        self.was_unchanged = False
+        from .stats import RunStats
+        self.stats = RunStats(self.backup_root)
+        # The span hooks added with add_span_hook.
+        self.span_hooks = []
+        # Coarsest first, by the length of the frequencies from a fixed
+        # moment so the order is the same on every run. Time buckets with
+        # the same frequency are ordered by their "order", if any, and then
+        # as given.
+        self.__time_buckets = sorted(
+            time_buckets.items(),
+            key=lambda x: (-nominal_length(x[1]["frequency"]),
+                           x[1].get("order", 0)))
+
+        self.plan = Plan()
+        # Maps the absolute path of every file scanned to its CatalogEntry
+        # (see catalog.Catalog).
+        self.catalog = Catalog()
+        # Maps the absolute path of every file kept to its time key and each
+        # time bucket to the Boundaries of its frequency.
+        self.__time_keys = {}
+        self.__boundaries = {}
+
+    def add_span_hook(self, hook):
+        """ Adds a hook to trace the spans of a rotation. For every span,
+            hook(name, attributes) is called and must return a context
+            manager which is entered for the duration of the span. The spans
+            are:
+                rotate       the whole rotation (backup_root)
+                scan_bucket  listing and stat'ing the directories of a time
+                             bucket (bucket, directories, files)
+                plan_bucket  planning a time bucket (bucket, files)
+                promote      effecting the promotions (files)
+                delete       effecting the deletions (files)
+            attributes is a dict, those known once the span ends (such as
+            files) are added to it before the context manager exits. """
+        self.span_hooks.append(hook)
 
-        self.backup_plan = {
-        }
+    @contextmanager
+    def span(self, name, **attributes):
+        """ A context manager for a span, which the span hooks are entered
+            around. Yields the attributes of the span. """
+        if not self.span_hooks:
+            yield attributes
+            return
+        with ExitStack() as stack:
+            for hook in self.span_hooks:
+                stack.enter_context(hook(name, attributes))
+            yield attributes
 
-    @staticmethod
-    def __get_mod_time(filename):
-        """ Convenience method to retrieve the last modification time of a
-            given file as datetime """
-        return datetime.fromtimestamp(getmtime(filename))
+    def __get_backend(self):
+        """ Returns the backend to use, defaulting to the local backup root."""
+        if self.backend is None:
+            if self.__local_backend is None or \
+                    self.__local_backend.backup_root != self.backup_root:
+                from .backends import LocalBackend
+                self.__local_backend = LocalBackend(self.backup_root)
+            return self.__local_backend
+        return self.backend
+
+    @property
+    def copied_paths(self):
+        """ The paths the last rotation copied promoted files to, as they
+            could not be hardlinked. """
+        return frozenset(self.__copied)
+
+    @property
+    def backup_plan(self):
+        """ The plan in the nested dict format of earlier releases. This is a
+            compatibility export, use plan instead. """
+        return self.plan.as_dict()
 
     def effect_promotions(self):
         """ Promotes files which are listed in files_to_promote into the
             backup time buckets provided."""
-        backup_plan = self.backup_plan
+        backend = self.__get_backend()
         LOG.debug("Handling promotions")
-        for backup_directory in map(lambda x: x[0], self.__time_buckets):
-            for filename in backup_plan[backup_directory]["files_to_promote"]:
-                LOG.debug("Promoting %s to %s", filename, backup_directory)
-                target_filename = join(
-                    self.backup_root,
-                    backup_directory,
-                    basename(filename)
-                )
-                if not self.is_dry_run:
-                    os.link(filename, target_filename)
+        promotions = []
+        for backup_directory, filename in self.plan.promotions():
+            LOG.debug("Promoting %s to %s", filename, backup_directory)
+            target_filename = backend.bucket_path(
+                backup_directory, self.catalog[filename].name)
+            promotions.append((filename, target_filename))
+        self.__promote(promotions)
+
+    def __promote(self, promotions):
+        """ Effects the (path, target path) promotions, unless this is a dry
+            run, and notes those which failed and those made by hardlinks. """
+        if self.is_dry_run:
+            self.__linked = [x[0] for x in promotions]
+        else:
+            backend = self.__get_backend()
+            backend.sync_copies = self.durable
+            from .executor import PlanExecutor
+            executor = PlanExecutor(backend, self.jobs)
+            # Every link has been made once promote returns, so no deletion
+            # can remove the last link of a file before it was promoted.
+            with self.span("promote", files=len(promotions)):
+                failed = executor.promote(promotions)
+            self.__unpromoted.update(x.path for x in failed)
+            # Nor before the links made are durable. Should any directory
+            # fail to sync, every promoted file is kept.
+            if self.__sync([x[1] for x in promotions
+                            if x[0] not in self.__unpromoted]):
+                self.__unpromoted.update(x[0] for x in promotions)
+            self.failures.extend(executor.failures)
+            self.stats.links_created += len(promotions) - len(failed)
+            self.stats.failures += len(failed)
+            self.__record_transfers(executor.results)
+            self.__linked = [
+                x[0] for x in promotions
+                if x[0] not in self.__unpromoted and x[1] not in self.__copied]
+
+    def __record_transfers(self, results):
+        """ Counts the promotions which had to be copied. """
+        stats = self.stats
+        for result in results:
+            transfer = result.result
+            if transfer.method == "hardlink":
+                continue
+            self.__copied.add(result.target)
+            stats.files_copied += 1
+            stats.bytes_copied += transfer.size
+            stats.copy_seconds += transfer.seconds
+        if stats.files_copied:
+            from .transfer import Transfer, format_throughput
+            LOG.info("Copied %s promoted files: %s", stats.files_copied,
+                     format_throughput(Transfer("copy", stats.bytes_copied,
+                                                stats.copy_seconds)))
 
     def effect_deletions(self):
         """ Deletes the files which have been listed for deletion based on the
-            backup_plan """
-        backup_plan = self.backup_plan
-        LOG.debug("Results: %s", json.dumps(
-            backup_plan,
-            sort_keys=True,
-            indent=4,
-            default=lambda x: list(x) if isinstance(x, set) else "Skip"))
+            plan """
         LOG.debug("Handling deletions")
-        # Collect all files to delete into a set (if a file was cycled out
-        # of both daily AND a monthly then we will attempt to delete twice).
-        files_to_delete = set()
-        for backup_directory in map(lambda x: x[0], self.__time_buckets):
-            files_to_delete = files_to_delete | \
-                    backup_plan[backup_directory]["files_to_delete"]
-        # Delete if we are not a dry run.
-        for filename in sorted(files_to_delete):
+        self.__delete(self.plan.files_to_delete())
+
+    def __delete(self, files_to_delete):
+        """ Deletes the files, unless this is a dry run, apart from those
+            which could not be promoted, and counts the space freed. """
+        # Never delete a file which failed to be promoted, it may be the
+        # only copy left.
+        for filename in sorted(set(files_to_delete) & self.__unpromoted):
+            LOG.warning("Keeping %s as it could not be promoted.", filename)
+        files_to_delete = sorted(set(files_to_delete) - self.__unpromoted)
+        for filename in files_to_delete:
             LOG.debug("Deleting %s", filename)
-            if not self.is_dry_run:
-                os.remove(filename)
+        # Delete if we are not a dry run.
+        if self.is_dry_run:
+            self.__count_space(files_to_delete)
+        else:
+            from .executor import PlanExecutor
+            executor = PlanExecutor(self.__get_backend(), self.jobs)
+            with self.span("delete", files=len(files_to_delete)):
+                failed = set(
+                    x.path for x in executor.delete(files_to_delete))
+            self.failures.extend(executor.failures)
+            self.stats.failures += len(failed)
+            self.__count_space(
+                [x for x in files_to_delete if x not in failed])
+            self.__sync([x for x in files_to_delete if x not in failed])
+        LOG.info("%s", self.stats.describe_space())
+
+    def __sync(self, paths):
+        """ Syncs each directory holding the paths once, when the rotation is
+            durable and the backend needs it, and returns the failures. """
+        backend = self.__get_backend()
+        if not self.durable or not backend.needs_sync:
+            return []
+        directories = sorted(set(os.path.dirname(x) for x in paths))
+        from .executor import PlanExecutor
+        executor = PlanExecutor(backend, self.jobs)
+        started = time.perf_counter()
+        with self.span("sync", directories=len(directories)):
+            failed = executor.sync(directories)
+        self.stats.sync_seconds += time.perf_counter() - started
+        self.stats.directories_synced += len(directories) - len(failed)
+        self.failures.extend(executor.failures)
+        self.stats.failures += len(failed)
+        return failed
+
+    def __count_space(self, deleted):
+        """ Counts the space freed by deleting files after the promotions.
+            Only the last link of a file frees its space; the link counts of
+            the files come from the scan, so links outside the backup root
+            keep a file alive too. """
+        stats = self.stats
+        catalog = self.catalog
+        links = {}
+        for filename in self.__linked:
+            entry = catalog[filename]
+            links[entry.file_id] = links.get(entry.file_id, entry.links) + 1
+        for filename in deleted:
+            entry = catalog[filename]
+            remaining = links.get(entry.file_id, entry.links) - 1
+            links[entry.file_id] = remaining
+            stats.files_deleted += 1
+            if remaining > 0:
+                stats.bytes_unlinked += entry.size
+            else:
+                stats.files_freed += 1
+                stats.bytes_reclaimed += entry.size
+
+    def write_plan(self, plan_file):
+        """ Writes the promotions and deletions planned to a plan file, which
+            apply_plan can effect later. """
+        from .planfile import write_plan
+        catalog = self.catalog
+        backend = self.__get_backend()
+        tops = [(backend.bucket_path(x[0], ""), x[0])
+                for x in self.__time_buckets]
+
+        def relative(path):
+            # Every file planned is within one of the time buckets.
+            top, bucket = next(x for x in tops if path.startswith(x[0]))
+            return bucket, path[len(top):]
+
+        promotions = (relative(x[1]) + (x[0], catalog[x[1]])
+                      for x in self.plan.promotions())
+        deletions = (relative(x) + (catalog[x],) for x in sorted(
+            self.plan.files_to_delete() - self.__unpromoted))
+        write_plan(plan_file, self.backup_root, promotions, deletions)
+        LOG.info("Wrote the plan to %s", plan_file)
+
+    def apply_plan(self, plan_file):
+        """ Effects the actions of a plan file (see planfile) without scanning
+            the time buckets. Actions on files whose inode, size or
+            modification time changed since they were planned are skipped, as
+            is the deletion of any file which could not be promoted. The
+            statistics are kept in stats. """
+        from .stats import RunStats
+        self.stats = RunStats(self.backup_root)
+        self.stats.dry_run = self.is_dry_run
+        try:
+            with self.span("apply", backup_root=self.backup_root):
+                self.__apply_plan(plan_file)
+        finally:
+            self.__get_backend().release()
+            self.stats.finish()
+
+    def __apply_plan(self, plan_file):
+        """ Applies a plan file, see apply_plan. """
+        from .planfile import read_plan, PlanFileException
+        backend = self.__get_backend()
+        stats = self.stats
+        if not backend.root_exists():
+            raise BackupRootFolderMissingException(self.backup_root)
+        buckets = set(x[0] for x in self.__time_buckets)
+        _, actions = read_plan(plan_file)
+        self.plan = Plan()
+        self.catalog = Catalog()
+        self.failures = []
+        self.__unpromoted = set()
+        self.__copied = set()
+        self.__linked = []
+        # The scan index no longer describes the time buckets.
+        self.__scan_index = None
+        promotions = []
+        deletions = []
+        with stats.phase("plan"):
+            for action in actions:
+                if action.bucket not in buckets or \
+                        action.target_bucket not in buckets | {None}:
+                    raise PlanFileException(
+                        plan_file, "%s is not a time bucket" % (
+                            action.target_bucket
+                            if action.bucket in buckets else action.bucket))
+                path = backend.bucket_path(action.bucket, action.path)
+                entry = self.__planned_entry(path, action)
+                if action.action == "promote":
+                    target_path = backend.bucket_path(
+                        action.target_bucket, action.path.rsplit("/", 1)[-1])
+                    if entry is None or self.__was_promoted(
+                            backend, entry, target_path):
+                        if entry is None:
+                            self.__unpromoted.add(path)
+                        continue
+                    promotions.append((path, target_path))
+                elif entry is not None:
+                    deletions.append(path)
+
+        with stats.phase("promote"):
+            self.__promote(promotions)
+        with stats.phase("delete"):
+            self.__delete(deletions)
+        if self.failures:
+            raise BackupEffectFailedException(self.failures)
+
+    def __planned_entry(self, path, action):
+        """ Returns the CatalogEntry of the file an action was planned for,
+            added to the catalog, or None if it is gone or has changed. """
+        try:
+            entry = self.__get_backend().stat(path)
+        except FileNotFoundError:
+            LOG.info("Skipping the %s of %s, it no longer exists.",
+                     action.action, path)
+            return None
+        except OSError as ex:
+            LOG.warning("Skipping the %s of %s, it could not be stat'ed: %s",
+                        action.action, path, ex)
+            self.stats.actions_skipped += 1
+            return None
+        if (entry.inode, entry.size, entry.mtime_ns) != \
+                (action.inode, action.size, action.mtime_ns):
+            LOG.warning("Skipping the %s of %s, it changed since it was "
+                        "planned.", action.action, path)
+            self.stats.actions_skipped += 1
+            return None
+        self.catalog[path] = entry
+        return entry
+
+    def __was_promoted(self, backend, entry, target_path):
+        """ Returns whether the promotion of entry to target_path was already
+            effected, e.g. by an earlier attempt to apply the plan. """
+        try:
+            target = backend.stat(target_path)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            # Let the promotion fail and report the error.
+            return False
+        # A copy keeps the size and modification time of its original.
+        if target.file_id != entry.file_id and \
+                (target.size, target.mtime_ns) != (entry.size, entry.mtime_ns):
+            return False
+        LOG.info("%s was already promoted to %s.", entry.path, target_path)
+        return True
+
+    def __reclaims_space(self):
+        """ Returns whether kept files may be deleted to free space. """
+        return self.ensure_free is not None or \
+            self.max_bucket_bytes is not None
+
+    def plan_reclaim(self):
+        """ Adds the deletions needed beyond the plan to meet max_bucket_bytes
+            and ensure_free, once the promotions are effected. Only kept files
+            older than the newest num_files_to_keep of every time bucket they
+            are in may be reclaimed, oldest first. """
+        if not self.__reclaims_space():
+            return
+        selected = self.__select_reclaims()
+        for candidate in selected:
+            LOG.debug("Reclaiming %s", candidate.path)
+            self.plan[candidate.bucket].files_to_reclaim.add(candidate.path)
+        for bucket_plan in self.plan:
+            if bucket_plan.files_to_reclaim:
+                bucket_plan.files_to_keep = deque(
+                    x for x in bucket_plan.files_to_keep
+                    if x not in bucket_plan.files_to_reclaim)
+        self.stats.files_reclaimed = len(selected)
+        if selected:
+            LOG.info("Deleting %s more files to reclaim space.",
+                     len(selected))
+
+    def __select_reclaims(self):
+        """ Returns the reclaim.Candidate to delete to meet max_bucket_bytes,
+            then ensure_free. """
+        from .reclaim import collect_candidates, count_links, remove_links, \
+            select_bucket_overflow
+        catalog = self.catalog
+        links, freed = count_links(
+            catalog, self.__linked,
+            self.plan.files_to_delete() - self.__unpromoted)
+        candidates, used = collect_candidates(
+            self.plan, catalog, self.__time_keys,
+            set(catalog[x].file_id for x in self.__unpromoted))
+        selected = []
+        if self.max_bucket_bytes is not None:
+            selected = select_bucket_overflow(candidates, used,
+                                              self.max_bucket_bytes)
+            freed += remove_links(selected, links)
+        if self.ensure_free is not None:
+            chosen = set(x.path for x in selected)
+            selected.extend(self.__select_free_space(
+                [x for x in candidates if x.path not in chosen], links,
+                freed))
+        return selected
+
+    def __select_free_space(self, candidates, links, freed):
+        """ Returns the candidates to delete, oldest first, to ensure_free
+            once freed bytes are, see reclaim.select_oldest_files. """
+        from .reclaim import bytes_needed, select_oldest_files
+        disk_usage = self.__get_backend().disk_usage()
+        if disk_usage is None:
+            LOG.warning("The free space of %s is unknown, unable to ensure "
+                        "free space.", self.backup_root)
+            return []
+        needed = bytes_needed(self.ensure_free, disk_usage) - freed
+        selected, selected_freed = select_oldest_files(candidates, links,
+                                                       needed)
+        if selected_freed < needed:
+            LOG.warning("Only %s of the %s bytes needed can be freed in %s.",
+                        selected_freed, needed, self.backup_root)
+        return selected
 
     def plan_promotions_and_deletions(self):
         """Generates a backup plan by walking through the time_buckets
            ordered by frequency and scanning the files. The
            time buckets must be ordered by decreasing grandularity
            (e.g. yearly first, daily last)"""
-        backup_plan = self.backup_plan
+        self.plan = Plan()
+        self.catalog = Catalog()
+        backend = self.__get_backend()
+        stats = self.stats
+        # Files are only promoted into the time buckets processed before, so
+        # never into the last.
+        backend.expect_links(x for x, _ in self.__time_buckets[:-1])
+        if self.scan_jobs > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=self.scan_jobs) as pool:
+                scans = {
+                    x: backend.start_scan(x, self.name_matcher(x), pool,
+                                          self.__scan_index, stats)
+                    for x, _ in self.__time_buckets}
+                self.__plan_buckets(scans)
+        else:
+            self.__plan_buckets(None)
+
+    def __plan_buckets(self, scans):
+        """ Plans every time bucket in processing order, consuming the scans
+            started for them if any, or else scanning each in turn. """
+        plan = self.plan
+        catalog = self.catalog
+        time_keys = self.__time_keys
+        backend = self.__get_backend()
+        stats = self.stats
         # Represents all of the time_buckets we've visited so far (as
         # we need to go back through their results)
         processed = []
 
-        # The filename pattern for the files to consider
-        pattern = fnmatch.translate(self.pattern)
-
-        # Scan through each backup directory listed
         for backup_directory, config in self.__time_buckets:
             # Initialize the results for the current directory
-            files_to_delete = set()
-            files_to_promote = []
-            results = {
-                "files_to_keep": [],
-                "files_to_delete": files_to_delete,
-                "files_to_promote": files_to_promote
-            }
-            backup_plan[backup_directory] = results
+            bucket_plan = plan.add_bucket(backup_directory, config)
+            name_filter = self.name_matcher(backup_directory)
+            self.__boundaries[backup_directory] = \
+                Boundaries(config["frequency"])
             LOG.info("Processing %s", backup_directory)
 
-            # Walk through all of the files in the target backup directory
-            backup_abs_dir = join(self.backup_root, backup_directory)
-            for (dirpath, _, filenames) in os.walk(backup_abs_dir):
-                # Note: ascending by default, so oldest files first.
-                sorted_file_abs_paths = sorted(map(
-                    partial(lambda x, dirpath_part: join(dirpath_part, x),
-                            dirpath_part=dirpath),
-                    filter(lambda x: re.match(pattern, x), filenames)),
-                    key=getmtime)
-
-                self.process_files(results, sorted_file_abs_paths,
-                                   config, processed)
-
-            # Now that we've processed the directory, we want to "save" any
-            # files marked for deletion younger than
-            # num_files_to_keep * timeunit
-            self.resurrect_young_files(
-                    results["files_to_keep"],
-                    files_to_delete,
-                    config)
-            # Resort the list by modification time in case it was modified.
-            results["files_to_keep"] = \
-                sorted(results["files_to_keep"], key=os.path.getmtime)
-
-            processed.append([backup_directory, config])
-
-    def resurrect_young_files(self, files_to_keep, files_to_delete, config):
-        """ Scans the files_to_delete for files which are within the grace period
-            and ressurrects them. """
+            # Scan every directory of the time bucket, each sorted oldest
+            # first, and merge them straight into the columns of a table of
+            # every file of the time bucket, oldest first.
+            with self.span("scan_bucket", bucket=backup_directory) \
+                    as attributes, stats.phase("scan"):
+                if scans is not None:
+                    directories = scans[backup_directory]
+                else:
+                    directories = backend.scan_bucket(
+                        backup_directory, name_filter, self.__scan_index,
+                        stats)
+                table = self.__merge_table(directories)
+                attributes["directories"] = len(table.directories)
+                attributes["files"] = len(table)
+            stats.files_scanned[backup_directory] = len(table)
+
+            with self.span("plan_bucket", bucket=backup_directory,
+                           files=len(table), bytes=table.total_size()):
+                self.process_files(bucket_plan, table, processed)
+
+                # Now that we've processed the directory, we want to "save"
+                # any files marked for deletion younger than
+                # num_files_to_keep * timeunit
+                self.resurrect_young_files(bucket_plan, table)
+                # Resort the deque by modification time in case it was
+                # modified.
+                bucket_plan.files_to_keep = deque(
+                    sorted(bucket_plan.files_to_keep,
+                           key=lambda x: catalog[x].mtime_ns))
+                if bucket_plan.files_to_keep:
+                    bucket_plan.next_keep_key = \
+                        self.__boundaries[backup_directory].next_after(
+                            time_keys[bucket_plan.files_to_keep[-1]])
+
+            processed.append(bucket_plan)
+
+    def __merge_table(self, directories):
+        """ Merges the directories scanned, each sorted oldest first, into a
+            FileTable of all of their files, whose entries the catalog makes
+            from its rows. """
+        from .columns import FileTable
+        table = FileTable(merge_entries(directories), self.vectorize)
+        self.catalog.add_table(table)
+        return table
+
+    def name_matcher(self, bucket):
+        """ Returns the matcher.NameMatcher of the files to consider in a
+            time bucket. """
+        from .matcher import NameMatcher
+        config = dict(self.__time_buckets).get(bucket, {})
+        include = config.get("include") or \
+            ([self.pattern] if self.pattern else []) + list(self.include)
+        exclude = list(self.exclude) + list(config.get("exclude", ()))
+        return NameMatcher(include, exclude)
+
+    def resurrect_young_files(self, bucket_plan, table):
+        """ Scans the files_to_delete of the FileTable for files which are
+            within the grace period and ressurrects them. """
+        files_to_keep = bucket_plan.files_to_keep
+        files_to_delete = bucket_plan.files_to_delete
+        time_keys = self.__time_keys
         if files_to_keep:
-            safe_duration = config["frequency"] * \
-                    (config["num_files_to_keep"] - 1)
-            safe_after_date = self.__get_mod_time(files_to_keep[-1]) - safe_duration
-            for filename in list(files_to_delete):
-                if self.__get_mod_time(filename) > safe_after_date:
+            # i.e. newest kept - frequency * (num_files_to_keep - 1)
+            safe_after_key = self.__boundaries[bucket_plan.name].grace_start(
+                time_keys[files_to_keep[-1]],
+                bucket_plan.config["num_files_to_keep"] - 1)
+            for index in table.indices_after(safe_after_key):
+                filename = table.path(index)
+                if filename in files_to_delete:
                     files_to_delete.remove(filename)
                     files_to_keep.append(filename)
+                    time_keys[filename] = table.time_key(index)
                     LOG.debug("Ressurrected file %s because it's "
                               "too young to die.", filename)
 
-    def process_files(self, results, sorted_abs_paths, config, processed):
-        """ Runs through the files provided and processes them, adding them to the
-            the appropriate lists (keep, promote, delete) """
-        backup_plan = self.backup_plan
-        for filename in sorted_abs_paths:
-            self.process_file(results, config, filename)
-            for promotion_dir, promotion_target_config in processed:
-                self.process_file(backup_plan[promotion_dir],
-                             promotion_target_config, filename, True)
-
-    def process_file(self, backup_results, backup_config, filename, promotion=False):
-        """ Processes a file by adding it to the appropriate list (files_to_keep,
-            files_to_promote, files_to_delete) """
+    def process_files(self, bucket_plan, table, processed):
+        """ Runs through the files of the FileTable and processes them, adding
+            them to the appropriate collections (keep, promote, delete) of
+            the bucket plan and promoting them into the processed bucket
+            plans. """
+        if table.is_sorted:
+            self.__keep_sorted_files(bucket_plan, table)
+        else:
+            # The local times went backwards, so each file must be compared
+            # with the newest one kept in turn.
+            for index in range(len(table)):
+                self.process_file(bucket_plan, table.path(index),
+                                  table.time_key(index))
+
+        # The processed bucket plans by the time key a file needs to reach
+        # to be promoted into them (-1 when they keep nothing yet), so that
+        # only the files promoted into them are visited.
+        waiting = [(x.next_keep_key if x.files_to_keep else -1, i)
+                   for i, x in enumerate(processed)]
+        heapq.heapify(waiting)
+        index = 0
+        while waiting and index < len(table):
+            if table.is_sorted:
+                index = table.search(waiting[0][0], index)
+                if index >= len(table):
+                    break
+            time_key = table.time_key(index)
+            if waiting[0][0] <= time_key:
+                promoted = []
+                while waiting and waiting[0][0] <= time_key:
+                    promoted.append(heapq.heappop(waiting)[1])
+                filename = table.path(index)
+                for plan_index in sorted(promoted):
+                    promotion_plan = processed[plan_index]
+                    self.process_file(promotion_plan, filename, time_key,
+                                      True)
+                    heapq.heappush(waiting, (promotion_plan.next_keep_key,
+                                             plan_index))
+            index += 1
+
+    def __keep_sorted_files(self, bucket_plan, table):
+        """ Plans the files of a sorted FileTable the way process_file would,
+            searching for each file kept, the first one at least one
+            frequency newer than the previous one kept, rather than
+            comparing every file. """
+        boundaries = self.__boundaries[bucket_plan.name]
+        kept = []
+        index = 0
+        while index < len(table):
+            kept.append(index)
+            bucket_plan.next_keep_key = \
+                boundaries.next_after(table.time_key(index))
+            index = table.search(bucket_plan.next_keep_key, index + 1)
+        kept = kept[-bucket_plan.config["num_files_to_keep"]:]
+        for index in kept:
+            filename = table.path(index)
+            bucket_plan.files_to_keep.append(filename)
+            self.__time_keys[filename] = table.time_key(index)
+        bucket_plan.files_to_delete.update(table.paths_except(kept))
+
+    def process_file(self, bucket_plan, filename, time_key, promotion=False):
+        """ Processes a file by adding it to the appropriate collection
+            (files_to_keep, files_to_promote, files_to_delete) """
         # Note: This logic assumes and requires that "files_to_keep" is pre-sorted
         #       in chronological order
-        files_to_keep = backup_results["files_to_keep"]
-        files_to_delete = backup_results["files_to_delete"]
-        files_to_keep = backup_results["files_to_keep"]
-        files_to_promote = backup_results["files_to_promote"]
-        freq = backup_config["frequency"]
-        if not files_to_keep or \
-                self.__get_mod_time(filename) >= self.__get_mod_time(files_to_keep[-1]) + freq:
-            if len(files_to_keep) >= backup_config["num_files_to_keep"]:
-                reject_file = files_to_keep.pop(0)
-                files_to_delete.add(reject_file)
-                if reject_file in files_to_promote:
-                    files_to_promote.remove(reject_file)
+        files_to_keep = bucket_plan.files_to_keep
+        files_to_promote = bucket_plan.files_to_promote
+        # i.e. the file is at least one frequency newer than the newest kept
+        if not files_to_keep or time_key >= bucket_plan.next_keep_key:
+            if len(files_to_keep) >= bucket_plan.config["num_files_to_keep"]:
+                reject_file = files_to_keep.popleft()
+                bucket_plan.files_to_delete.add(reject_file)
+                files_to_promote.pop(reject_file, None)
             files_to_keep.append(filename)
+            self.__time_keys[filename] = time_key
+            bucket_plan.next_keep_key = \
+                self.__boundaries[bucket_plan.name].next_after(time_key)
             if promotion:
-                files_to_promote.append(filename)
+                files_to_promote[filename] = None
         elif not promotion:
-            files_to_delete.add(filename)
-
+            bucket_plan.files_to_delete.add(filename)
 
     def rotate_backups(self):
-        """ Creates a plan, then affects promotions and deletions on it. """
-        if not os.path.exists(self.backup_root):
+        """ Creates a plan, then affects promotions and deletions on it. The
+            statistics of the rotation are kept in stats. """
+        from .stats import RunStats
+        self.stats = RunStats(self.backup_root)
+        self.stats.dry_run = self.is_dry_run
+        try:
+            with self.span("rotate", backup_root=self.backup_root):
+                self.__rotate_backups()
+        finally:
+            self.__get_backend().release()
+            self.stats.finish()
+
+    def __rotate_backups(self):
+        """ Rotates the backups, see rotate_backups. """
+        backend = self.__get_backend()
+        stats = self.stats
+        self.was_unchanged = False
+        if not backend.root_exists():
             raise BackupRootFolderMissingException(self.backup_root)
 
         for item in self.__time_buckets.copy():
             dir_name = item[0]
-            full_path = os.path.join(self.backup_root, dir_name)
-            if not os.path.exists(full_path):
+            if not backend.bucket_exists(dir_name):
                 logging.warning("The backup directory %s is missing, "
-                                "removing the time bucket.", full_path)
+                                "removing the time bucket.",
+                                join(self.backup_root, dir_name))
                 self.__time_buckets.remove(item)
-                os.mkdir(full_path)
+                backend.make_bucket(dir_name)
+
+        self.failures = []
+        self.__unpromoted = set()
+        self.__copied = set()
+        self.__linked = []
+        if self.use_index and backend.supports_index:
+            is_loaded = self.__prepare_scan_index()
+            # The free space changes without any directory changing, so a
+            # rotation reclaiming space is never skipped.
+            if not self.force_rescan and is_loaded and \
+                    not self.is_dry_run and not self.__reclaims_space() and \
+                    self.__scan_index.is_unchanged(
+                        [join(self.backup_root, x[0])
+                         for x in self.__time_buckets]):
+                LOG.info("Nothing changed since the last rotation of %s.",
+                         self.backup_root)
+                self.was_unchanged = stats.unchanged = True
+                return
+        else:
+            self.__scan_index = None
+
+        try:
+            with stats.phase("plan"):
+                self.plan_promotions_and_deletions()
+            # The planning time includes the scan.
+            stats.durations["plan"] -= stats.durations["scan"]
+            with stats.phase("promote"):
+                self.effect_promotions()
+            with stats.phase("delete"):
+                self.plan_reclaim()
+                if self.plan_out is not None:
+                    self.write_plan(self.plan_out)
+                self.effect_deletions()
+            if self.failures:
+                raise BackupEffectFailedException(self.failures)
+        except BaseException:
+            # The index no longer describes the backup root, so the next
+            # rotation must load it from disk again.
+            self.__scan_index = None
+            raise
+
+        if self.__scan_index is not None:
+            if self.is_dry_run:
+                self.__scan_index = None
+            else:
+                self.__update_scan_index()
+
+    def __prepare_scan_index(self):
+        """ Loads the scan index, or reuses the one kept in memory since the
+            last rotation by this rotator. Returns whether a usable index for
+            the current configuration was found. """
+        fingerprint = self.__get_fingerprint()
+        scan_index = self.__scan_index
+        if scan_index is not None and scan_index.fingerprint == fingerprint:
+            is_loaded = True
+        else:
+            from .index import ScanIndex
+            scan_index = self.__scan_index = \
+                ScanIndex(self.backup_root, self.index_path)
+            is_loaded = scan_index.load(fingerprint)
+        scan_index.start_scan(trust_recorded=not self.force_rescan)
+        for dirpath in self.rescan_paths:
+            scan_index.distrust(dirpath)
+        return is_loaded
+
+    def __get_fingerprint(self):
+        """ Describes the configuration a scan index is only valid for. """
+        return repr((self.pattern, list(self.include), list(self.exclude),
+                     [(x[0], sorted(x[1].items()))
+                      for x in self.__time_buckets]))
 
-        self.plan_promotions_and_deletions()
-        self.effect_promotions()
-        self.effect_deletions()
+    def __update_scan_index(self):
+        """ Records the effected plan in the scan index and saves it. """
+        promoted = []
+        for backup_directory, filename in self.plan.promotions():
+            source = self.catalog[filename]
+            target_path = join(self.backup_root, backup_directory,
+                               source.name)
+            if target_path in self.__copied:
+                # A copy is a file of its own.
+                source = CatalogEntry.from_stat(
+                    target_path, source.name, os.stat(target_path))
+            promoted.append((target_path, source))
+        self.__scan_index.forget_unseen()
+        self.__scan_index.apply_changes(promoted,
+                                        self.plan.files_to_delete())
+        self.__scan_index.save()
@@ -0,0 +1,272 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" Batch mode, which rotates many backup roots listed in a JSON config file
+    in one invocation using a pool of worker processes.
+
+    The config file looks like:
+    {
+        "defaults": {
+            "pattern": "*.tgz",
+            "jobs": 1,
+            "scan_jobs": 4,
+            "durable": true,
+            "index": true,
+            "time_buckets": {
+                "daily": {"num_files_to_keep": 7},
+                "monthly": {"num_files_to_keep": 12},
+                "yearly": {"num_files_to_keep": 3}
+            }
+        },
+        "roots": [
+            {"backup_root": "/srv/backups/tenant-1"},
+            {"backup_root": "/srv/backups/tenant-2", "pattern": "*.sql.zst"},
+            {"backup_root": "/srv/backups/tenant-3", "ensure_free": "20%",
+             "max_bucket_bytes": "500G"},
+            {"backup_root": "/srv/backups/tenant-4",
+             "include": ["*.tgz", "*.sql.zst"], "exclude": ["*.partial"]}
+        ]
+    }
+
+    Every setting of a root falls back to "defaults". The time buckets are
+    given the way a policy file gives them (see policy). A root needs a
+    "pattern" or "include" globs, which must be a list. Like on the command
+    line, the scan index is used unless "index" is false. A setting of the
+    wrong type refuses the whole config, naming the root and the setting.
+
+    A dry run reports what would have been kept, promoted and deleted, with
+    "dry_run" set in the summary and in the report of every root. """
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .backup_rotation import BackupRotator, BackupRotationException
+from .policy import resolve_time_buckets as resolve_policy_time_buckets
+from .reclaim import parse_free_target, parse_size
+
+LOG = logging.getLogger(__name__)
+
+EXIT_CODE_INVALID_BATCH_CONFIG = 102
+EXIT_CODE_BATCH_FAILURES = 103
+
+ROOT_SETTINGS = ("backup_root", "pattern", "include", "exclude", "jobs",
+                 "scan_jobs", "durable", "time_buckets", "ensure_free",
+                 "max_bucket_bytes", "index")
+
+# The settings given as text and how to parse them.
+PARSED_SETTINGS = (("ensure_free", parse_free_target),
+                   ("max_bucket_bytes", parse_size))
+
+
+def _is_globs(value):
+    """ Returns whether a setting is a list of globs. """
+    return isinstance(value, list) and all(isinstance(x, str) for x in value)
+
+
+def _is_count(value):
+    """ Returns whether a setting is a positive integer. """
+    return isinstance(value, int) and not isinstance(value, bool) and \
+        value >= 1
+
+
+# The other settings, what they must be and how to check it.
+CHECKED_SETTINGS = (
+    ("backup_root", "a string", lambda x: isinstance(x, str)),
+    ("pattern", "a string", lambda x: isinstance(x, str)),
+    ("include", "a list of globs", _is_globs),
+    ("exclude", "a list of globs", _is_globs),
+    ("jobs", "a positive integer", _is_count),
+    ("scan_jobs", "a positive integer", _is_count),
+    ("durable", "true or false", lambda x: isinstance(x, bool)),
+    ("index", "true or false", lambda x: isinstance(x, bool)))
+
+
+class BatchConfigException(BackupRotationException):
+    """ Exception for when the batch config file cannot be used """
+    def __init__(self, config_file, reason):
+        message = "The batch config \"%s\" is invalid: %s"
+        super().__init__(message % (config_file, reason),
+                         EXIT_CODE_INVALID_BATCH_CONFIG)
+
+
+class BatchFailedException(BackupRotationException):
+    """ Exception for when the rotation of some backup roots failed """
+    def __init__(self, summary):
+        message = "The rotation of %s of %s backup roots failed."
+        super().__init__(message % (summary["failed"], len(summary["roots"])),
+                         EXIT_CODE_BATCH_FAILURES)
+        self.summary = summary
+
+
+def load_batch_config(config_file, default_time_buckets):
+    """ Reads the config file and returns the settings of every root, with
+        the defaults applied and the time buckets resolved. """
+    try:
+        with open(config_file, "r") as config_raw:
+            config = json.load(config_raw)
+    except (OSError, ValueError) as ex:
+        raise BatchConfigException(config_file, ex) from ex
+
+    if not isinstance(config, dict) or \
+            not isinstance(config.get("roots"), list):
+        raise BatchConfigException(config_file, "no list of \"roots\"")
+    defaults = config.get("defaults", {})
+    root_configs = []
+    for root in config["roots"]:
+        if not isinstance(root, dict):
+            raise BatchConfigException(config_file,
+                                       "every root must be an object")
+        root_config = {"jobs": 1, "scan_jobs": 1}
+        for setting in ROOT_SETTINGS:
+            if setting in root:
+                root_config[setting] = root[setting]
+            elif setting in defaults:
+                root_config[setting] = defaults[setting]
+        check_root_settings(config_file, root_config)
+        for setting, parse in PARSED_SETTINGS:
+            try:
+                root_config[setting] = parse(str(root_config[setting])) \
+                    if setting in root_config else None
+            except ValueError as ex:
+                raise BatchConfigException(
+                    config_file, "invalid \"%s\": %s" % (setting, ex)) \
+                    from ex
+        root_config["time_buckets"] = resolve_time_buckets(
+            config_file, root_config.get("time_buckets"),
+            default_time_buckets)
+        root_configs.append(root_config)
+    return root_configs
+
+
+def check_root_settings(config_file, root_config):
+    """ Raises a BatchConfigException if a root's config, with the defaults
+        applied, misses a setting or has one of the wrong type. """
+    if "backup_root" not in root_config:
+        raise BatchConfigException(config_file,
+                                   "a root has no \"backup_root\"")
+    for setting, expected, check in CHECKED_SETTINGS:
+        if setting in root_config and not check(root_config[setting]):
+            raise BatchConfigException(
+                config_file, "the \"%s\" of the root %s must be %s" % (
+                    setting, json.dumps(root_config["backup_root"]),
+                    expected))
+    if "pattern" not in root_config and not root_config.get("include"):
+        raise BatchConfigException(config_file, "a root has no \"pattern\"")
+
+
+def resolve_time_buckets(config_file, time_buckets, default_time_buckets):
+    """ Turns the time buckets of a root's config into the time buckets used
+        by the BackupRotator. """
+    if time_buckets is None:
+        return default_time_buckets.copy()
+    if not isinstance(time_buckets, dict) or not time_buckets:
+        raise BatchConfigException(config_file,
+                                   "no object of \"time_buckets\"")
+    try:
+        return resolve_policy_time_buckets(time_buckets, default_time_buckets)
+    except ValueError as ex:
+        raise BatchConfigException(config_file, ex) from ex
+
+
+def rotate_root(root_config, is_dry_run=False):
+    """ Rotates a single backup root and returns its report. This never
+        raises so that one root cannot stop the others. """
+    report = {
+        "backup_root": root_config["backup_root"],
+        "status": "ok",
+        "dry_run": is_dry_run,
+        "seconds": None,
+        "files_kept": 0,
+        "files_promoted": 0,
+        "files_deleted": 0,
+        "failures": [],
+        "stats": None
+    }
+    started = time.monotonic()
+    rotator = BackupRotator(root_config["time_buckets"])
+    rotator.backup_root = root_config["backup_root"]
+    rotator.pattern = root_config.get("pattern")
+    rotator.include = root_config.get("include", [])
+    rotator.exclude = root_config.get("exclude", [])
+    rotator.jobs = root_config["jobs"]
+    rotator.scan_jobs = root_config["scan_jobs"]
+    rotator.durable = root_config.get("durable", False)
+    rotator.is_dry_run = is_dry_run
+    rotator.ensure_free = root_config.get("ensure_free")
+    rotator.max_bucket_bytes = root_config.get("max_bucket_bytes")
+    rotator.use_index = root_config.get("index", True)
+    try:
+        rotator.rotate_backups()
+        if rotator.was_unchanged:
+            report["status"] = "unchanged"
+    except BackupRotationException as ex:
+        report["status"] = "failed"
+        report["error"] = ex.message
+    except Exception as ex: # pylint: disable=broad-except
+        LOG.exception("Unexpected error rotating %s", rotator.backup_root)
+        report["status"] = "failed"
+        report["error"] = "%s: %s" % (type(ex).__name__, ex)
+    report["seconds"] = round(time.monotonic() - started, 6)
+    report["files_kept"] = sum(len(x.files_to_keep) for x in rotator.plan)
+    report["files_promoted"] = sum(1 for _ in rotator.plan.promotions())
+    # The links deleted, or which would have been in a dry run, see
+    # RunStats.
+    report["files_deleted"] = rotator.stats.files_deleted
+    report["failures"] = ["%s %s: %s" % (x.operation, x.path, x.error)
+                          for x in rotator.failures]
+    report["stats"] = rotator.stats.as_dict()
+    return report
+
+
+def _rotate_root_star(arguments):
+    """ Unpacks the arguments of rotate_root for ProcessPoolExecutor.map """
+    return rotate_root(*arguments)
+
+
+def rotate_batch(root_configs, processes=None, is_dry_run=False):
+    """ Rotates every root, independent roots in parallel across up to
+        `processes` worker processes (all CPUs by default), and returns the
+        aggregated summary. A single process rotates the roots inline. """
+    started = time.monotonic()
+    arguments = [(x, is_dry_run) for x in root_configs]
+    if processes == 1:
+        reports = list(map(_rotate_root_star, arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            # Hand out the roots in chunks as there may be thousands.
+            chunksize = max(
+                1, len(arguments) // ((processes or os.cpu_count() or 1) * 8))
+            reports = list(pool.map(_rotate_root_star, arguments,
+                                    chunksize=chunksize))
+    return {
+        "seconds": round(time.monotonic() - started, 6),
+        "dry_run": is_dry_run,
+        "succeeded": sum(1 for x in reports if x["status"] != "failed"),
+        "failed": sum(1 for x in reports if x["status"] == "failed"),
+        "files_kept": sum(x["files_kept"] for x in reports),
+        "files_promoted": sum(x["files_promoted"] for x in reports),
+        "files_deleted": sum(x["files_deleted"] for x in reports),
+        "roots": reports
+    }
@@ -0,0 +1,536 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" A scale benchmark for the BackupRotator. It generates synthetic backup
+    trees, plans a dry-run rotation of each, and reports the wall time of each
+    phase, the peak RSS once planned (and once checked) and the file system
+    calls made. Every plan is checked against the frozen reference
+    implementation. --no-numpy plans without NumPy even where it is
+    installed (see columns).
+
+    With --startup it instead measures the cost of importing the package and
+    its command line interface with python -X importtime, and times a dry
+    run of the command on a small tree, which fails once it takes longer
+    than --max-dry-run-ms or loads a module only other runs need.
+
+    Usage: python -m backup_rotation.bench [--sizes 10000,100000,1000000]
+                                           [--backend local|memory] [--json]
+                                           [--no-numpy]
+           python -m backup_rotation.bench --startup [--json]
+                                           [--max-dry-run-ms 300]
+"""
+import argparse
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest.mock
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from multiprocessing import get_context
+
+from .backends import LocalBackend, MemoryBackend, StorageBackend
+from .backup_rotation import BackupRotator
+from .cli import DEFAULT_TIME_BUCKETS, print_results
+from .columns import load_numpy
+from .reference import reference_plan
+
+DEFAULT_SIZES = "10000,100000,1000000"
+# The modules whose import time the startup benchmark measures, and the
+# modules importing the package alone must not load.
+STARTUP_MODULES = ("backup_rotation", "backup_rotation.cli")
+STARTUP_REPEAT = 5
+LAZY_MODULES = ("argparse", "dateutil", "sqlite3", "json",
+                "concurrent.futures", "tempfile", "fnmatch")
+# The number of files of the tree the startup benchmark dry runs the command
+# on, the longest the best of the dry runs may take, and the modules such a
+# dry run of a local backup root must not load.
+STARTUP_FILES = 200
+DEFAULT_MAX_DRY_RUN_MS = 300.0
+DRY_RUN_LAZY_MODULES = ("numpy", "boto3", "backup_rotation.objectstore",
+                        "backup_rotation.executor", "backup_rotation.transfer",
+                        "concurrent.futures", "json", "tempfile")
+PATTERN = "*.tgz"
+# The newest backup of the synthetic trees is from 2020-09-13.
+NEWEST_BACKUP = 1600000000
+HOUR = 3600
+DAY = 24 * HOUR
+# The share of the backup files in each bucket, the rest are daily.
+MONTHLY_SHARE = 0.10
+YEARLY_SHARE = 0.05
+# One in this many daily backups was retried and left a duplicate behind.
+DUPLICATE_EVERY = 10
+# Backups per host, which determines how many (deep) host directories exist.
+FILES_PER_HOST = 2000
+# One unrelated file for this many backups.
+MISCELLANEOUS_EVERY = 20
+
+
+class LocalTree():
+    """ Writes a synthetic tree to a directory on disk. """
+    def __init__(self, backup_root):
+        self.backup_root = backup_root
+
+    def add_file(self, relative_path, mtime):
+        """ Creates an empty file with the modification time given. """
+        path = os.path.join(self.backup_root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "a").close()
+        os.utime(path, times=(mtime, mtime))
+
+    def link(self, relative_source, relative_target):
+        """ Hardlinks a file created earlier. """
+        os.link(os.path.join(self.backup_root, relative_source),
+                os.path.join(self.backup_root, relative_target))
+
+
+class MemoryTree():
+    """ Writes a synthetic tree to a MemoryBackend. """
+    def __init__(self, backend):
+        self.backend = backend
+
+    def add_file(self, relative_path, mtime):
+        """ Creates a file with the modification time given. """
+        self.backend.add_file(relative_path, mtime)
+
+    def link(self, relative_source, relative_target):
+        """ Hardlinks a file created earlier. """
+        root = self.backend.backup_root
+        self.backend.link("%s/%s" % (root, relative_source),
+                          "%s/%s" % (root, relative_target))
+
+
+def generate_tree(tree, num_files, seed=0):
+    """ Generates about num_files backup files: daily backups of several
+        hosts in deep per-site/per-host directories (some retried, leaving
+        duplicates), monthly and yearly backups which are mostly hardlinks of
+        daily backups as promotions leave them, and unrelated files. """
+    rnd = random.Random(seed)
+    for bucket in ["yearly", "monthly", "daily"]:
+        tree.add_file("%s/.keep" % bucket, NEWEST_BACKUP)
+    num_daily = int(num_files * (1 - MONTHLY_SHARE - YEARLY_SHARE))
+    num_hosts = max(1, num_daily // FILES_PER_HOST)
+    hosts = ["site-%s/rack-%s/host-%s" % (x % 7, x % 3, x)
+             for x in range(num_hosts)]
+    daily_by_day = generate_daily(tree, num_daily, hosts, rnd)
+
+    for bucket, share, spacing in [("monthly", MONTHLY_SHARE, 30),
+                                   ("yearly", YEARLY_SHARE, 365)]:
+        for i in range(int(num_files * share)):
+            day = i * spacing // max(1, num_hosts) + rnd.randint(0, 2)
+            name = "%s-%s-%s.tgz" % (bucket, i % num_hosts, day)
+            source = daily_by_day.get(day)
+            if source is not None and rnd.random() < 0.8:
+                tree.link(source, "%s/%s" % (bucket, name))
+            else:
+                tree.add_file("%s/%s" % (bucket, name),
+                              NEWEST_BACKUP - day * DAY)
+
+
+def generate_daily(tree, num_daily, hosts, rnd):
+    """ Generates num_daily daily backup files of the hosts, a few hours
+        apart, and returns the path of one by the days it is old. """
+    created = 0
+    daily_by_day = {}
+    for i in range(num_daily):
+        host = hosts[i % len(hosts)]
+        hours_ago = (i // len(hosts)) * 6 + rnd.randint(0, 5)
+        mtime = NEWEST_BACKUP - hours_ago * HOUR - rnd.randint(0, 59) * 60
+        name = "%s-%s.tgz" % (os.path.basename(host), hours_ago)
+        if created % DUPLICATE_EVERY == DUPLICATE_EVERY - 1:
+            # A retried backup with the same modification time.
+            name = "%s-%s-retry.tgz" % (os.path.basename(host), hours_ago)
+        path = "daily/%s/%s" % (host, name)
+        tree.add_file(path, mtime)
+        daily_by_day.setdefault(hours_ago // 24, path)
+        created += 1
+        if created % MISCELLANEOUS_EVERY == 0:
+            tree.add_file("daily/%s/%s.partial" % (host, name), mtime)
+    return daily_by_day
+
+
+class InstrumentedBackend():
+    """ Wraps a backend to time the scan, separately from the planning it is
+        interleaved with, and to record what was scanned for the reference
+        implementation. Everything else is the wrapped backend's. """
+    # Scans started in a pool are timed too.
+    start_scan = StorageBackend.start_scan
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.scan_seconds = 0.0
+        self.scanned = {}
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def scan_bucket(self, bucket, name_filter, index=None, stats=None):
+        """ Scans the time bucket like the wrapped backend, timing each
+            directory it reads and recording its files. """
+        chunks = self.scanned.setdefault(bucket, [])
+        scan = iter(self.backend.scan_bucket(bucket, name_filter, index,
+                                             stats))
+        while True:
+            started = time.perf_counter()
+            entries = next(scan, None)
+            self.scan_seconds += time.perf_counter() - started
+            if entries is None:
+                return
+            chunks.append([(x.path, x.mtime) for x in entries])
+            yield entries
+
+
+class CountingDirEntry():
+    """ Wraps an os.DirEntry to count its stat calls. """
+    def __init__(self, dir_entry, syscalls):
+        self.__dir_entry = dir_entry
+        self.__syscalls = syscalls
+        self.name = dir_entry.name
+        self.path = dir_entry.path
+
+    def is_dir(self):
+        """ Delegates to the wrapped entry (free given d_type). """
+        return self.__dir_entry.is_dir()
+
+    def is_symlink(self):
+        """ Delegates to the wrapped entry (free given d_type). """
+        return self.__dir_entry.is_symlink()
+
+    def inode(self):
+        """ Delegates to the wrapped entry (free, read by scandir). """
+        return self.__dir_entry.inode()
+
+    def stat(self):
+        """ Counts the stat call and delegates to the wrapped entry. """
+        self.__syscalls["stat"] += 1
+        return self.__dir_entry.stat()
+
+
+def count_syscalls(syscalls):
+    """ Returns patches counting the file system calls made through os. """
+    real_scandir = os.scandir
+    real_stat = os.stat
+
+    class CountingScandir():
+        """ Wraps os.scandir to count directory listings. """
+        def __init__(self, path):
+            syscalls["scandir"] += 1
+            self.__iterator = real_scandir(path)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            self.__iterator.close()
+
+        def __iter__(self):
+            for dir_entry in self.__iterator:
+                yield CountingDirEntry(dir_entry, syscalls)
+
+    def counting_stat(*args, **kwargs):
+        syscalls["stat"] += 1
+        return real_stat(*args, **kwargs)
+
+    return [unittest.mock.patch("os.scandir", CountingScandir),
+            unittest.mock.patch("os.stat", counting_stat)]
+
+
+def normalize_plan(backup_plan, mtimes):
+    """ Makes plans comparable regardless of the collection types used.
+
+        The files kept are compared in order, except that each run of files
+        with the same modification time is compared as a set: the reference
+        resurrects young files in the iteration order of a set, which is
+        arbitrary between files of the same age. """
+    return {name: {"files_to_keep": [
+        sorted(group) for _, group in groupby(bucket["files_to_keep"],
+                                              key=mtimes.get)],
+                   "files_to_promote": list(bucket["files_to_promote"]),
+                   "files_to_delete": sorted(bucket["files_to_delete"])}
+            for name, bucket in backup_plan.items()}
+
+
+def run_benchmark(num_files, backend_kind="local", seed=0, workdir=None,
+                  vectorize=True):
+    """ Generates a tree of about num_files files, plans a dry-run rotation
+        of it and returns the measurements. """
+    result = {"files": num_files, "backend": backend_kind,
+              "numpy": vectorize and load_numpy() is not None}
+    tempdir = None
+    started = time.perf_counter()
+    if backend_kind == "memory":
+        backend = MemoryBackend()
+        generate_tree(MemoryTree(backend), num_files, seed)
+    else:
+        tempdir = tempfile.mkdtemp(prefix="backup-rotation-bench-",
+                                   dir=workdir)
+        generate_tree(LocalTree(tempdir), num_files, seed)
+        backend = LocalBackend(tempdir)
+    result["generate_seconds"] = time.perf_counter() - started
+    try:
+        instrumented = InstrumentedBackend(backend)
+        rotator = BackupRotator(DEFAULT_TIME_BUCKETS.copy(),
+                                backend=instrumented)
+        rotator.pattern = PATTERN
+        rotator.is_dry_run = True
+        rotator.vectorize = vectorize
+        time_rotation(rotator, instrumented, result)
+        compare_with_reference(rotator, instrumented, result)
+    finally:
+        if tempdir is not None:
+            shutil.rmtree(tempdir, ignore_errors=True)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def time_rotation(rotator, instrumented, result):
+    """ Plans and effects the dry-run rotation through the InstrumentedBackend
+        and adds the times, the peak RSS and the system calls to the
+        result. """
+    syscalls = Counter()
+    patches = count_syscalls(syscalls)
+    for patch in patches:
+        patch.start()
+    try:
+        started = time.perf_counter()
+        rotator.plan_promotions_and_deletions()
+        planned = time.perf_counter()
+        rotator.effect_promotions()
+        rotator.effect_deletions()
+        effected = time.perf_counter()
+    finally:
+        for patch in patches:
+            patch.stop()
+    result["scan_seconds"] = instrumented.scan_seconds
+    result["plan_seconds"] = planned - started - instrumented.scan_seconds
+    result["effect_seconds"] = effected - planned
+    result["plan_peak_rss_mb"] = peak_rss_mb()
+    result["syscalls"] = dict(syscalls)
+    result["files_scanned"] = sum(
+        len(chunk) for chunks in instrumented.scanned.values()
+        for chunk in chunks)
+
+
+def compare_with_reference(rotator, instrumented, result):
+    """ Plans what the InstrumentedBackend scanned with the reference
+        implementation and adds its time and whether the plan of the rotator
+        matches it to the result. """
+    started = time.perf_counter()
+    expected = reference_plan(
+        [(x.name, x.config) for x in rotator.plan], instrumented.scanned)
+    result["reference_seconds"] = time.perf_counter() - started
+    mtimes = {path: mtime for chunks in instrumented.scanned.values()
+              for chunk in chunks for path, mtime in chunk}
+    result["matches_reference"] = \
+        normalize_plan(rotator.backup_plan, mtimes) == \
+        normalize_plan(expected, mtimes)
+
+
+def peak_rss_mb():
+    """ Returns the peak RSS of this process so far in MB. """
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_isolated(num_files, backend_kind, seed, workdir, vectorize=True):
+    """ Runs a benchmark in a fresh process so that its peak RSS is its own."""
+    with ProcessPoolExecutor(max_workers=1,
+                             mp_context=get_context("spawn")) as pool:
+        return pool.submit(run_benchmark, num_files, backend_kind, seed,
+                           workdir, vectorize).result()
+
+
+def format_result(result):
+    """ Formats a result as a single line of text. """
+    return ("%(files)9d files (%(backend)s%(numpy_text)s): scan "
+            "%(scan_seconds).3fs, plan %(plan_seconds).3fs, effect "
+            "%(effect_seconds).3fs, reference %(reference_seconds).3fs, peak "
+            "RSS %(plan_peak_rss_mb).1f MB (%(peak_rss_mb).1f MB with the "
+            "reference), syscalls %(syscall_text)s, plan %(match)s"
+            % dict(result,
+                   numpy_text=", numpy" if result["numpy"] else "",
+                   syscall_text=", ".join(
+                       "%s=%s" % x for x in sorted(result["syscalls"].items()))
+                   or "none",
+                   match="matches the reference"
+                   if result["matches_reference"] else "DIFFERS"))
+
+
+def package_environment():
+    """ Returns the environment of a fresh interpreter importing this copy of
+        the package. """
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [package_root] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH")
+                          else []))
+    return env
+
+
+def run_importtime(arguments):
+    """ Runs a fresh interpreter with the arguments under python -X
+        importtime and returns the (module, cumulative microseconds) of every
+        module it imported. """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime"] + arguments,
+        env=package_environment(), stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    imported = []
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imported.append((name.strip(), int(cumulative)))
+    return imported
+
+
+def measure_import(module, repeat=STARTUP_REPEAT):
+    """ Imports module in fresh interpreters under python -X importtime and
+        returns the best cumulative import time in microseconds, with the
+        modules the import loaded. """
+    best = None
+    loaded = []
+    for _ in range(repeat):
+        imported = run_importtime(["-c", "import %s" % module])
+        loaded = [x[0] for x in imported]
+        cumulative = dict(imported)[module]
+        best = cumulative if best is None else min(best, cumulative)
+    return best, loaded
+
+
+def measure_dry_run(repeat=STARTUP_REPEAT, max_ms=DEFAULT_MAX_DRY_RUN_MS):
+    """ Runs backup-rotation --dry-run on a tree of STARTUP_FILES files in
+        fresh interpreters and returns the best wall time of the runs, with
+        the modules a run loaded. """
+    tempdir = tempfile.mkdtemp(prefix="backup-rotation-startup-")
+    try:
+        generate_tree(LocalTree(tempdir), STARTUP_FILES)
+        command = ["-m", "backup_rotation", "--dry-run", tempdir, PATTERN]
+        loaded = [x[0] for x in run_importtime(command)]
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            subprocess.run([sys.executable] + command,
+                           env=package_environment(),
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, check=True)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+    lazy_modules_loaded = sorted(x for x in DRY_RUN_LAZY_MODULES
+                                 if x in loaded)
+    return {
+        "command": "backup-rotation --dry-run",
+        "files": STARTUP_FILES,
+        "run_ms": round(best * 1000.0, 3),
+        "max_run_ms": max_ms,
+        "modules_loaded": len(loaded),
+        "lazy_modules_loaded": lazy_modules_loaded,
+        "regressed": best * 1000.0 > max_ms or bool(lazy_modules_loaded)
+    }
+
+
+def run_startup_benchmark(repeat=STARTUP_REPEAT,
+                          max_dry_run_ms=DEFAULT_MAX_DRY_RUN_MS):
+    """ Measures the import time of each of the STARTUP_MODULES and which of
+        the LAZY_MODULES importing the package loaded, then times a dry run
+        of the command (see measure_dry_run). """
+    results = []
+    for module in STARTUP_MODULES:
+        microseconds, loaded = measure_import(module, repeat)
+        results.append({
+            "module": module,
+            "import_ms": round(microseconds / 1000.0, 3),
+            "modules_loaded": len(loaded),
+            "lazy_modules_loaded": sorted(x for x in LAZY_MODULES
+                                          if x in loaded)
+        })
+    results.append(measure_dry_run(repeat, max_dry_run_ms))
+    return results
+
+
+def format_startup_result(result):
+    """ Formats a startup benchmark result as a single line of text. """
+    if "command" in result:
+        text = ("%(command)s of %(files)d files: %(run_ms).1fms (at most "
+                "%(max_run_ms).1fms), %(modules_loaded)d modules loaded" %
+                result)
+    else:
+        text = ("%(module)s: import %(import_ms).1fms, %(modules_loaded)d "
+                "modules loaded" % result)
+    return text + \
+        (", including %s" % ", ".join(result["lazy_modules_loaded"])
+         if result["lazy_modules_loaded"] else "") + \
+        (", REGRESSED" if result.get("regressed") else "")
+
+
+def main(argv=None):
+    """ Runs the benchmark for every size requested. """
+    parser = argparse.ArgumentParser(
+        prog="python -m backup_rotation.bench",
+        description="Benchmarks dry-run rotations of synthetic backup trees.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="Comma separated numbers of files to generate. "
+                             "(default: %(default)s)")
+    parser.add_argument("--backend", choices=["local", "memory"],
+                        default="local",
+                        help="Where to generate the trees. (default: "
+                             "%(default)s)")
+    parser.add_argument("--workdir", default=None,
+                        help="The directory to generate local trees in.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true",
+                        help="Prints the results as JSON.")
+    parser.add_argument("--no-numpy", action="store_true",
+                        help="Plans without NumPy even if it is installed.")
+    parser.add_argument("--startup", action="store_true",
+                        help="Measures the import time of the package and "
+                             "times a dry run of the command instead.")
+    parser.add_argument("--max-dry-run-ms", type=float,
+                        default=DEFAULT_MAX_DRY_RUN_MS,
+                        help="The longest the dry run of --startup may "
+                             "take. (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        results = print_results(
+            run_startup_benchmark(max_dry_run_ms=args.max_dry_run_ms),
+            format_startup_result, args.json)
+        return 1 if any(x.get("regressed") for x in results) else 0
+
+    results = print_results(
+        (run_isolated(int(x), args.backend, args.seed, args.workdir,
+                      not args.no_numpy) for x in args.sizes.split(",")),
+        format_result, args.json)
+    return 0 if all(x["matches_reference"] for x in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
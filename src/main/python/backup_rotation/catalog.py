@@ -0,0 +1,319 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" The scan layer used to build a catalog of the backup files within a time
+    bucket. Every candidate file is stat'ed exactly once and the results are
+    kept in compact entries which the planner reads from afterwards. """
+import heapq
+import logging
+import os
+from operator import attrgetter
+from os.path import join
+from types import SimpleNamespace
+
+LOG = logging.getLogger(__name__)
+
+NANOSECONDS_PER_SECOND = 1000000000
+
+
+class CatalogEntry():
+    """ The metadata of a single backup file as captured during the scan.
+        Hardlinks of one file share (device, inode), and links is the number
+        of hardlinks the file had when scanned. """
+    __slots__ = ("path", "name", "mtime_ns", "size", "inode", "device",
+                 "links")
+
+    def __init__(self, path, name, mtime_ns, size, inode, device=0, links=1):
+        # One argument per slot.
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.path = path
+        self.name = name
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.inode = inode
+        self.device = device
+        self.links = links
+
+    @classmethod
+    def from_stat(cls, path, name, stat_result):
+        """ Creates an entry from the result of a stat call. """
+        return cls(path, name, stat_result.st_mtime_ns,
+                   stat_result.st_size, stat_result.st_ino,
+                   stat_result.st_dev, stat_result.st_nlink)
+
+    @property
+    def file_id(self):
+        """ Identifies the file, which all of its hardlinks share. """
+        return (self.device, self.inode)
+
+    def linked_as(self, path, name):
+        """ Returns the entry of another hardlink of the same file. """
+        return CatalogEntry(path, name, self.mtime_ns, self.size, self.inode,
+                            self.device, self.links)
+
+    @property
+    def mtime(self):
+        """ The modification time in seconds (see mtime_seconds). """
+        return mtime_seconds(self.mtime_ns)
+
+    def __repr__(self):
+        return "CatalogEntry(%r, mtime_ns=%r, size=%r, inode=%r, " \
+            "device=%r, links=%r)" % (self.path, self.mtime_ns, self.size,
+                                      self.inode, self.device, self.links)
+
+
+def mtime_seconds(mtime_ns):
+    """ Returns a modification time in nanoseconds in seconds, computed the
+        same way as os.stat_result.st_mtime so that it matches
+        os.path.getmtime. """
+    seconds, nanoseconds = divmod(mtime_ns, NANOSECONDS_PER_SECOND)
+    return seconds + nanoseconds * 1e-9
+
+
+class Catalog():
+    """ Maps the path of every file of a rotation to its CatalogEntry. The
+        entries of the files of the tables added (see columns.FileTable) are
+        made from their rows whenever they are looked up rather than kept,
+        the others are kept as they are set. """
+    def __init__(self):
+        self.__entries = {}
+        # The table holding the files of each directory, by its path up to
+        # the last "/", and the rows of the files by name.
+        self.__tables = {}
+
+    def add_table(self, table):
+        """ Adds the files of a table, found by name in its rows and made
+            into entries by its entry method. """
+        for directory, rows in zip(table.directories, table.rows):
+            self.__tables[directory[:-1]] = (table, rows)
+
+    def __setitem__(self, path, entry):
+        self.__entries[path] = entry
+
+    def __getitem__(self, path):
+        directory, _, name = path.rpartition("/")
+        found = self.__tables.get(directory)
+        if found is not None:
+            row = found[1].get(name)
+            if row is not None:
+                return found[0].entry(row, path)
+        return self.__entries[path]
+
+
+def scan_directory(top, name_filter, index=None, stats=None, handles=None,
+                   inodes=None):
+    """ Walks the directory tree below top in the same order as os.walk
+        (top-down, without descending into symlinked directories) and yields
+        one list of CatalogEntry per directory, sorted oldest first.
+
+        name_filter is called with each file name before any stat call is made
+        so that unrelated files only cost the directory read. If it has an
+        excluded method (see matcher.NameMatcher), entries whose name it
+        excludes are skipped before finding out whether they are directories,
+        so excluded directories are not scanned either.
+
+        When a ScanIndex is provided, directories whose modification time is
+        unchanged since they were recorded are not read again.
+
+        The stat calls made are counted in the RunStats provided, if any.
+        With DirectoryHandles, each directory is read through its descriptor
+        so that every file is stat'ed relative to it.
+
+        inodes, if given, maps the file_id of every file scanned which has
+        other hardlinks to its entry so that they, sharing its metadata, are
+        not stat'ed again. It may be shared by several scans. """
+    # The optional parts of a scan are passed along to every directory.
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    pending = [top]
+    while pending:
+        dirpath = pending.pop()
+        scanned = _scan_one(dirpath, name_filter, index, stats, handles,
+                            inodes)
+        if scanned is None:
+            continue
+        entries, subdirs = scanned
+        yield entries
+        pending.extend(reversed(subdirs))
+
+
+def new_stat_counter():
+    """ Returns a counter of the stat calls made by a scan running in a
+        worker thread, so that only the thread consuming the scan adds them
+        to the RunStats. """
+    return SimpleNamespace(stat_calls=0)
+
+
+def scan_directory_concurrently(top, name_filter, pool, index=None,
+                                stats=None, handles=None, inodes=None):
+    """ Starts scanning the directory tree below top in the
+        concurrent.futures executor given and returns an iterator yielding
+        what scan_directory would, in the same order. Every directory is
+        read and its files stat'ed by a task of its own, submitted as soon as
+        its parent has been read, so the tree is scanned ahead of the
+        consumer. The stat calls are added to the RunStats provided as the
+        directories are consumed.
+
+        Hardlinks of a file being scanned concurrently may each be stat'ed,
+        as they can be reached before either has been added to inodes. """
+    # See scan_directory.
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def scan(dirpath):
+        counter = new_stat_counter()
+        scanned = _scan_one(dirpath, name_filter, index, counter, handles,
+                            inodes)
+        if scanned is None:
+            return counter.stat_calls, None, []
+        entries, subdirs = scanned
+        return counter.stat_calls, entries, \
+            [pool.submit(scan, x) for x in subdirs]
+
+    def consume(pending):
+        while pending:
+            stat_calls, entries, subdirs = pending.pop().result()
+            if stats is not None:
+                stats.stat_calls += stat_calls
+            pending.extend(reversed(subdirs))
+            if entries is not None:
+                yield entries
+
+    return consume([pool.submit(scan, top)])
+
+
+def _scan_one(dirpath, name_filter, index, stats, handles, inodes):
+    """ Reads a single directory for scan_directory, or finds it unchanged in
+        the index, and returns its entries sorted oldest first and the paths
+        of its subdirectories, or None when it cannot be read. """
+    # See scan_directory.
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    device = None
+    if index is not None or inodes is not None:
+        try:
+            if stats is not None:
+                stats.stat_calls += 1
+            dir_stat = _stat_directory(dirpath, handles)
+        except OSError as ex:
+            LOG.debug("Unable to scan %s: %s", dirpath, ex)
+            return None
+        device = dir_stat.st_dev
+    if index is not None:
+        dir_mtime_ns = dir_stat.st_mtime_ns
+        record = index.lookup(dirpath, dir_mtime_ns)
+        if record is not None:
+            if inodes is not None:
+                for entry in record.entries:
+                    if entry.links > 1:
+                        inodes.setdefault(entry.file_id, entry)
+            return record.entries, [join(dirpath, x) for x in record.subdirs]
+    try:
+        entries, subdirs = _list_directory(dirpath, name_filter, stats,
+                                           handles, inodes, device)
+    except OSError as ex:
+        # os.walk silently skips unreadable directories, so do we.
+        LOG.debug("Unable to scan %s: %s", dirpath, ex)
+        return None
+    if index is not None:
+        index.record(dirpath, dir_mtime_ns, subdirs, entries)
+    return entries, subdirs
+
+
+def _stat_directory(dirpath, handles):
+    """ Stats a directory, through its descriptor if it can be kept open. """
+    descriptor = handles.get(dirpath) if handles is not None else None
+    if descriptor is not None:
+        return os.stat(descriptor)
+    return os.stat(dirpath)
+
+
+def _list_directory(dirpath, name_filter, stats=None, handles=None,
+                    inodes=None, device=None):
+    """ Reads a single directory, returning the entries of the matching files
+        sorted oldest first and the paths of its subdirectories. Files already
+        in inodes, looked up by the device of the directory and the inode
+        number the directory lists, are not stat'ed. """
+    # See scan_directory.
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    entries = []
+    subdirs = []
+    excluded = getattr(name_filter, "excluded", None)
+    descriptor = handles.get(dirpath) if handles is not None else None
+    # The entries of a descriptor are stat'ed relative to it, but their path
+    # is only their name.
+    with os.scandir(dirpath if descriptor is None else descriptor) \
+            as scandir_it:
+        for dir_entry in scandir_it:
+            if excluded is not None and excluded(dir_entry.name):
+                continue
+            if _is_directory(dir_entry):
+                if not dir_entry.is_symlink():
+                    subdirs.append(join(dirpath, dir_entry.name))
+                continue
+            if not name_filter(dir_entry.name):
+                continue
+            path = join(dirpath, dir_entry.name)
+            if inodes is not None:
+                known = inodes.get((device, dir_entry.inode()))
+                if known is not None:
+                    entries.append(known.linked_as(path, dir_entry.name))
+                    continue
+            entry = _stat_entry(dir_entry, path, stats)
+            if entry is None:
+                continue
+            if inodes is not None and entry.links > 1:
+                inodes[entry.file_id] = entry
+            entries.append(entry)
+    # Note: ascending by default, so oldest files first.
+    entries.sort(key=lambda x: x.mtime_ns)
+    return entries, subdirs
+
+
+def _is_directory(dir_entry):
+    """ Returns whether an entry listed by os.scandir is a directory, taking
+        the entries which cannot tell for files like os.walk. """
+    try:
+        return dir_entry.is_dir()
+    except OSError:
+        return False
+
+
+def _stat_entry(dir_entry, path, stats):
+    """ Stats a file listed by os.scandir and returns its entry, or None if
+        it could not be stat'ed. """
+    if stats is not None:
+        stats.stat_calls += 1
+    try:
+        stat_result = dir_entry.stat()
+    except OSError as ex:
+        LOG.warning("Skipping %s, it could not be stat'ed: %s", path, ex)
+        return None
+    return CatalogEntry.from_stat(path, dir_entry.name, stat_result)
+
+
+def merge_entries(directories):
+    """ Lazily merges the lists of entries of each directory, as yielded by
+        scan_directory, into one stream ordered oldest first across every
+        directory. Ties keep the order the directories were scanned in.
+
+        Every directory is scanned before the first entry is yielded, as the
+        oldest entry could be in any of them, but the list of each is
+        released as soon as it has been merged. """
+    return heapq.merge(*map(iter, directories), key=attrgetter("mtime_ns"))
@@ -21,12 +21,16 @@
 #
 
 """ Backup file rotation script for backup files. See DESCRIPTION."""
+# Modules which only some modes need are imported where they are used to
+# keep the startup fast.
+# pylint: disable=import-outside-toplevel
 import logging
 import argparse
 import sys
-from dateutil.relativedelta import relativedelta
 
 from .backup_rotation import BackupRotator, BackupRotationException
+from .frequencies import DAILY, MONTHLY, YEARLY
+from .reclaim import parse_free_target, parse_size
 from .__version__ import __VERSION__
 
 # Set up exit codes
@@ -58,12 +62,15 @@ PARSER = argparse.ArgumentParser(
     formatter_class=argparse.RawTextHelpFormatter)
 PARSER.add_argument(
     "backup_root",
-    default="backups",
+    nargs="?",
+    default=None,
     help="The directory in which the yearly, monthly, and daily " \
-         "time buckets reside.")
+         "time buckets reside, or the s3://bucket/prefix of an object " \
+         "store.")
 PARSER.add_argument(
     "pattern",
-    default="*",
+    nargs="?",
+    default=None,
     help="The pattern (which you probably need to quote due to shell " \
          "expansion) of the files to be considered.")
 PARSER.add_argument(
@@ -74,25 +81,164 @@ PARSER.add_argument(
     '-v', '--verbose',
     action="store_true",
     help="Turns on verbose logging")
+PARSER.add_argument(
+    '-j', '--jobs',
+    type=int,
+    default=1,
+    help="The number of promotions or deletions to run concurrently, " \
+         "which helps on network file systems. (default: %(default)s)")
+PARSER.add_argument(
+    '--durable',
+    action="store_true",
+    help="Syncs each directory promoted into once, before anything is " \
+         "deleted, and each directory deleted from once, so that a crash " \
+         "cannot lose a promotion.")
+PARSER.add_argument(
+    '--scan-jobs',
+    type=int,
+    default=1,
+    metavar="N",
+    help="The number of threads reading and stat'ing the time buckets, " \
+         "which are then all scanned at once ahead of the planning. " \
+         "(default: %(default)s)")
+PARSER.add_argument(
+    '--endpoint-url',
+    metavar="URL",
+    help="The endpoint of the S3 compatible object store of an s3:// " \
+         "backup_root. (default: AWS)")
+PARSER.add_argument(
+    '--batch',
+    metavar="CONFIG_FILE",
+    help="Rotates every backup root listed in the JSON config file instead " \
+         "of backup_root, and prints a JSON summary of the results.")
+PARSER.add_argument(
+    '--processes',
+    type=int,
+    default=None,
+    help="The number of backup roots rotated in parallel in batch mode. " \
+         "(default: the number of CPUs)")
+PARSER.add_argument(
+    '--watch',
+    action="store_true",
+    help="Keeps running and rotates within seconds of a backup landing in " \
+         "a time bucket (Linux only).")
+PARSER.add_argument(
+    '--resync-interval',
+    type=float,
+    default=3600.0,
+    metavar="SECONDS",
+    help="How often watch mode fully rescans the time buckets. " \
+         "(default: %(default)s)")
+PARSER.add_argument(
+    '--rescan',
+    action="store_true",
+    help="Ignores the scan index and lists every time bucket directory " \
+         "again.")
+PARSER.add_argument(
+    '--no-index',
+    action="store_true",
+    help="Neither reads nor writes the scan index kept in the backup root.")
+PARSER.add_argument(
+    '--policy',
+    metavar="POLICY_FILE",
+    help="Uses the time buckets of the JSON policy file (such as hourly, " \
+         "weekly or every 15m ones) instead of daily, monthly and yearly " \
+         "buckets keeping 3 files each.")
+PARSER.add_argument(
+    '--include',
+    action="append",
+    default=[],
+    metavar="GLOB",
+    help="Also considers the files matching GLOB, on top of pattern. May " \
+         "be repeated, in which case pattern may be left out.")
+PARSER.add_argument(
+    '--exclude',
+    action="append",
+    default=[],
+    metavar="GLOB",
+    help="Ignores the files, and directories, matching GLOB (such as " \
+         "'*.partial') even if included. May be repeated.")
+PARSER.add_argument(
+    '--bucket-include',
+    action="append",
+    default=[],
+    nargs=2,
+    metavar=("BUCKET", "GLOB"),
+    help="Considers the files matching GLOB in the time BUCKET instead of " \
+         "pattern and --include. May be repeated.")
+PARSER.add_argument(
+    '--bucket-exclude',
+    action="append",
+    default=[],
+    nargs=2,
+    metavar=("BUCKET", "GLOB"),
+    help="Also ignores the files, and directories, matching GLOB in the " \
+         "time BUCKET. May be repeated.")
+PARSER.add_argument(
+    '--ensure-free',
+    type=parse_free_target,
+    metavar="SPACE",
+    help="Deletes kept backups too, oldest first, until SPACE (a " \
+         "percentage of the volume such as 20%% or a size such as 50G) is " \
+         "free. The newest backups of every time bucket are never deleted.")
+PARSER.add_argument(
+    '--max-bucket-bytes',
+    type=parse_size,
+    metavar="SIZE",
+    help="Deletes kept backups too, oldest first, until no time bucket " \
+         "holds more than SIZE (such as 500G). The newest backups of every " \
+         "time bucket are never deleted.")
+PARSER.add_argument(
+    '--plan-out',
+    metavar="FILE",
+    help="Plans the rotation without changing anything and writes the " \
+         "promotions and deletions to FILE as JSON Lines, for " \
+         "--apply-plan.")
+PARSER.add_argument(
+    '--apply-plan',
+    metavar="FILE",
+    help="Effects the promotions and deletions of a --plan-out FILE in " \
+         "backup_root without scanning it, skipping those whose file " \
+         "changed since it was planned. pattern is not needed.")
+PARSER.add_argument(
+    '--stats-json',
+    metavar="FILE",
+    help="Writes the counters and timings of the rotation to FILE as JSON.")
+PARSER.add_argument(
+    '--prometheus-textfile',
+    metavar="FILE",
+    help="Writes the counters and timings of the rotation to FILE (which " \
+         "should end in .prom) for the node_exporter textfile collector.")
+PARSER.add_argument(
+    '--profile',
+    metavar="FILE",
+    help="Profiles the run, writing the cProfile output to FILE and a " \
+         "summary of the slowest functions and the peak memory traced to " \
+         "FILE.txt. In batch mode only the rotations run with " \
+         "--processes 1 are profiled.")
 PARSER.add_argument(
     '--version',
     action="version",
     version="%(prog)s " + __VERSION__)
 
+# The scheme of the backup roots in an object store, see
+# objectstore.URL_SCHEME. It is checked without importing objectstore.
+OBJECT_STORE_SCHEME = "s3://"
+
 # Configuration of our time buckets and their frequencies.
 # Note: The time bucket names are also directory names in the backup_root
 DEFAULT_TIME_BUCKETS = {
     "daily": {
         "num_files_to_keep": 3,
-        "frequency": relativedelta(days=1, hour=0, minute=0, second=0)
+        "frequency": DAILY
     },
     "monthly": {
         "num_files_to_keep": 3,
-        "frequency": relativedelta(months=1, day=0, hour=0, minute=0, second=0)
+        "frequency": MONTHLY
     },
     "yearly": {
         "num_files_to_keep": 3,
-        "frequency": relativedelta(years=1, day=0, hour=0, minute=0, second=0)
+        "frequency": YEARLY
     }
 }
 
@@ -108,20 +254,171 @@ def rotate(argv):
         logging.basicConfig(format='%(levelname).1s: %(module)s:%(lineno)d: '
                                    '%(message)s', level=logging.WARNING)
 
-    backup_rotator = BackupRotator(DEFAULT_TIME_BUCKETS.copy())
-    if args.dry_run:
+    if args.batch:
+        check_batch_args(args)
+        return run_profiled(args, rotate_batch_and_report, args)
+    if args.apply_plan:
+        if args.plan_out or args.watch:
+            PARSER.error("--apply-plan cannot be used with --plan-out or "
+                         "--watch")
+        if not args.backup_root:
+            PARSER.error("the backup_root argument is required")
+    elif args.plan_out and args.watch:
+        PARSER.error("--plan-out cannot be used with --watch")
+    elif not args.backup_root or not (args.pattern or args.include):
+        PARSER.error("the backup_root and pattern arguments are required")
+
+    time_buckets = time_buckets_from_args(args)
+    backup_rotator = BackupRotator(time_buckets)
+    # objectstore, and all it imports, is only loaded for object stores.
+    if args.backup_root.startswith(OBJECT_STORE_SCHEME):
+        from .objectstore import ObjectStoreBackend, DEFAULT_LIST_JOBS
+        if args.watch:
+            PARSER.error("--watch cannot be used with an object store")
+        backup_rotator.backend = ObjectStoreBackend.from_url(
+            args.backup_root, args.endpoint_url,
+            max(args.jobs, DEFAULT_LIST_JOBS))
+    if args.dry_run or args.plan_out:
         backup_rotator.is_dry_run = True
+    backup_rotator.plan_out = args.plan_out
 
     if args.backup_root:
         backup_rotator.backup_root = args.backup_root
 
-    if args.pattern:
-        backup_rotator.pattern = args.pattern
+    backup_rotator.pattern = args.pattern
+    backup_rotator.include = args.include
+    backup_rotator.exclude = args.exclude
 
-    backup_rotator.rotate_backups()
+    backup_rotator.jobs = args.jobs
+    backup_rotator.scan_jobs = args.scan_jobs
+    backup_rotator.durable = args.durable
+    backup_rotator.use_index = not args.no_index
+    backup_rotator.force_rescan = args.rescan
+    backup_rotator.ensure_free = args.ensure_free
+    backup_rotator.max_bucket_bytes = args.max_bucket_bytes
+
+    run_profiled(args, rotate_backups, backup_rotator, args, time_buckets)
     return backup_rotator
 
 
+def time_buckets_from_args(args):
+    """ Returns the time buckets of the policy file, or the default ones,
+        with the globs given for each. """
+    if args.policy:
+        from .policy import load_policy
+        time_buckets = load_policy(args.policy, DEFAULT_TIME_BUCKETS)
+    else:
+        time_buckets = {x: y.copy() for x, y in DEFAULT_TIME_BUCKETS.items()}
+    for option, setting in (("bucket_include", "include"),
+                            ("bucket_exclude", "exclude")):
+        for bucket, glob in getattr(args, option):
+            if bucket not in time_buckets:
+                PARSER.error("unknown time bucket %s, expected one of %s" % (
+                    bucket, ", ".join(sorted(time_buckets))))
+            time_buckets[bucket].setdefault(setting, []).append(glob)
+    return time_buckets
+
+
+def run_profiled(args, function, *function_args):
+    """ Returns function(*function_args), profiled if asked to. """
+    if args.profile:
+        from .profiling import profile_call
+        return profile_call(args.profile, function, *function_args)
+    return function(*function_args)
+
+
+def rotate_backups(backup_rotator, args, time_buckets=None):
+    """ Rotates the backups once, or keeps rotating them in watch mode,
+        writing the statistics after every rotation. """
+    if args.watch:
+        watch(backup_rotator, time_buckets or DEFAULT_TIME_BUCKETS,
+              args.resync_interval,
+              lambda: write_stats(backup_rotator.stats, args))
+    elif args.apply_plan:
+        try:
+            backup_rotator.apply_plan(args.apply_plan)
+        finally:
+            write_stats(backup_rotator.stats, args)
+        if args.dry_run:
+            print(backup_rotator.stats.describe_space())
+    else:
+        try:
+            backup_rotator.rotate_backups()
+        finally:
+            write_stats(backup_rotator.stats, args)
+        if args.dry_run:
+            print(backup_rotator.stats.describe_space())
+
+
+def write_stats(stats, args):
+    """ Writes the statistics of a rotation to the files requested. """
+    try:
+        if args.stats_json:
+            stats.write_json(args.stats_json)
+        if args.prometheus_textfile:
+            stats.write_textfile(args.prometheus_textfile)
+    except OSError as ex:
+        LOG.error("Unable to write the rotation statistics: %s", ex)
+
+
+def watch(backup_rotator, time_buckets, resync_interval, after_rotation=None):
+    """ Runs watch mode until interrupted or terminated. """
+    import signal
+    from .watch import BackupWatcher
+    watcher = BackupWatcher(backup_rotator, time_buckets, after_rotation)
+    watcher.resync_interval = resync_interval
+    signal.signal(signal.SIGTERM, lambda *_: watcher.stop())
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        LOG.info("Interrupted, no longer watching.")
+
+
+def check_batch_args(args):
+    """ Exits with a usage error for the arguments which only apply to a
+        single backup root. """
+    if args.backup_root or args.pattern:
+        PARSER.error("backup_root and pattern are taken from the batch "
+                     "config file in batch mode")
+    if args.plan_out or args.apply_plan or args.policy:
+        PARSER.error("--plan-out, --apply-plan and --policy cannot be "
+                     "used in batch mode")
+
+
+def rotate_batch_and_report(args):
+    """ Rotates the backup roots of the batch config file and prints the
+        aggregated summary as JSON. """
+    import json
+    from .batch import load_batch_config, rotate_batch, BatchFailedException
+    root_configs = load_batch_config(args.batch, DEFAULT_TIME_BUCKETS)
+    if args.no_index:
+        for root_config in root_configs:
+            root_config["index"] = False
+    summary = rotate_batch(root_configs, args.processes, args.dry_run)
+    json.dump(summary, sys.stdout, indent=4)
+    sys.stdout.write("\n")
+    if summary["failed"]:
+        raise BatchFailedException(summary)
+    return summary
+
+
+def print_results(results, format_result, as_json=False):
+    """ Prints each of the results of a benchmark or a simulation with
+        format_result as soon as it is produced, or all of them as JSON once
+        the last one is, and returns them. """
+    printed = []
+    for result in results:
+        printed.append(result)
+        if not as_json:
+            print(format_result(result))
+            sys.stdout.flush()
+    if as_json:
+        import json
+        json.dump(printed, sys.stdout, indent=4)
+        sys.stdout.write("\n")
+    return printed
+
+
 def rotate_and_exit(argv=None):
     """ Wraps the main but actually handles exceptions and translates them
         into appropriate exit statuses. """
@@ -0,0 +1,233 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" A columnar table of the files of a time bucket, which the planner reads
+    instead of keeping a time key per path. The time keys (see timekeys) are
+    held in one int64 column, computed and searched with NumPy when it is
+    installed and the time bucket is large enough to be worth it, or else in
+    an array.array searched with bisect. Either way every kept file is found
+    by a binary search for the next boundary of the frequency rather than by
+    comparing every file with the newest one kept. """
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .catalog import CatalogEntry, NANOSECONDS_PER_SECOND, mtime_seconds
+from .timekeys import MICROSECONDS_PER_SECOND, local_key
+
+# The fewest files a time bucket needs for NumPy to be used, below which
+# importing it costs more than it saves.
+NUMPY_MIN_FILES = 10000
+
+SECONDS_PER_DAY = 86400
+
+_NUMPY = []
+
+
+def load_numpy():
+    """ Returns the numpy module, or None when it is not installed. It is
+        only imported once, on first use. """
+    if not _NUMPY:
+        try:
+            # Optional, and slow to import.
+            # pylint: disable=import-outside-toplevel
+            import numpy
+        except ImportError:
+            numpy = None
+        _NUMPY.append(numpy)
+    return _NUMPY[0]
+
+
+class FileTable():
+    """ The files of a time bucket in the order they are planned in, oldest
+        first, held in columns. The directory of every file is interned in
+        directories, and directory_indices and names give each path. sizes,
+        inodes and time_keys hold the rest of what the planner reads, and
+        mtimes_ns, devices and links the rest of the CatalogEntry of each
+        file, which entry makes from its row. rows maps the names of the
+        files of each directory to their row. numpy is the module used for
+        the time keys, or None for an array.array.
+
+        The columns are filled from an iterable of CatalogEntry, such as the
+        lazy merge of a scan (see catalog.merge_entries), consumed once, so
+        that no entry need be kept (see catalog.Catalog).
+
+        Local times go backwards when daylight saving time ends, so the time
+        keys are only known to be in order when is_sorted is True. """
+    # One attribute per column.
+    # pylint: disable=too-many-instance-attributes
+    __slots__ = ("directories", "directory_indices", "names", "rows",
+                 "sizes", "inodes", "mtimes_ns", "devices", "links",
+                 "time_keys", "numpy", "is_sorted")
+
+    def __init__(self, entries, vectorize=True):
+        directories = {}
+        self.directory_indices = array("I")
+        self.names = []
+        self.rows = []
+        self.sizes = array("q")
+        self.inodes = array("Q")
+        self.mtimes_ns = mtimes_ns = array("q")
+        self.devices = array("Q")
+        self.links = array("Q")
+        for row, entry in enumerate(entries):
+            directory = entry.path[:len(entry.path) - len(entry.name)]
+            index = directories.setdefault(directory, len(directories))
+            if index == len(self.rows):
+                self.rows.append({})
+            self.rows[index][entry.name] = row
+            self.directory_indices.append(index)
+            self.names.append(entry.name)
+            self.sizes.append(entry.size)
+            self.inodes.append(entry.inode)
+            mtimes_ns.append(entry.mtime_ns)
+            self.devices.append(entry.device)
+            self.links.append(entry.links)
+        self.directories = list(directories)
+
+        numpy = load_numpy() \
+            if vectorize and len(mtimes_ns) >= NUMPY_MIN_FILES else None
+        self.numpy = numpy
+        if numpy is not None:
+            self.time_keys = local_keys(
+                numpy, numpy.frombuffer(mtimes_ns, numpy.int64))
+            self.is_sorted = bool(
+                (self.time_keys[1:] >= self.time_keys[:-1]).all())
+        else:
+            self.time_keys = array("q", (local_key(mtime_seconds(x))
+                                         for x in mtimes_ns))
+            self.is_sorted = all(
+                x <= y for x, y in zip(self.time_keys,
+                                       self.time_keys[1:]))
+
+    def __len__(self):
+        return len(self.names)
+
+    def path(self, index):
+        """ Returns the path of the file at index. """
+        return self.directories[self.directory_indices[index]] + \
+            self.names[index]
+
+    def entry(self, row, path):
+        """ Returns the CatalogEntry of the file at row, whose path is
+            given. """
+        return CatalogEntry(path, self.names[row], self.mtimes_ns[row],
+                            self.sizes[row], self.inodes[row],
+                            self.devices[row], self.links[row])
+
+    def time_key(self, index):
+        """ Returns the time key of the file at index. """
+        return int(self.time_keys[index])
+
+    def total_size(self):
+        """ Returns the size of the files, counting the hardlinks of a file,
+            which share its inode, once. A time bucket is taken to be on a
+            single device. """
+        if self.numpy is not None:
+            numpy = self.numpy
+            _, first = numpy.unique(
+                numpy.frombuffer(self.inodes, numpy.uint64),
+                return_index=True)
+            return int(numpy.frombuffer(self.sizes, numpy.int64)[first].sum())
+        return sum(dict(zip(self.inodes, self.sizes)).values())
+
+    def search(self, time_key, start=0):
+        """ Returns the index of the first file from start whose time key is
+            at least time_key, or the number of files if there is none. The
+            table must be sorted. """
+        if self.numpy is not None:
+            return start + int(self.numpy.searchsorted(
+                self.time_keys[start:], time_key, "left"))
+        return bisect_left(self.time_keys, time_key, start)
+
+    def paths_except(self, indices):
+        """ Returns the paths of every file but those at the indices. """
+        if self.numpy is not None:
+            selected = self.numpy.ones(len(self), bool)
+            selected[list(indices)] = False
+            return [self.path(i)
+                    for i in self.numpy.flatnonzero(selected).tolist()]
+        excluded = set(indices)
+        return [self.path(i) for i in range(len(self)) if i not in excluded]
+
+    def indices_after(self, time_key):
+        """ Returns the indices of the files whose time key is greater than
+            time_key, in order. """
+        if self.numpy is not None:
+            return self.numpy.flatnonzero(self.time_keys > time_key).tolist()
+        if self.is_sorted:
+            return range(bisect_right(self.time_keys, time_key), len(self))
+        return [i for i, x in enumerate(self.time_keys) if x > time_key]
+
+
+def local_keys(numpy, mtime_ns):
+    """ Returns the time keys of an int64 array of modification times in
+        nanoseconds, each equal to local_key of the CatalogEntry.mtime of the
+        same modification time.
+
+        The timestamp in seconds is rounded to microseconds the way
+        datetime.fromtimestamp rounds it. The UTC offset of every day is
+        then looked up once, at its first and last second, and only the files
+        of the days whose offset changes are converted one by one; this
+        assumes, as every time zone does, that the offset never changes
+        twice within a day. """
+    whole_seconds, microseconds = _round_to_microseconds(numpy, mtime_ns)
+    days, day_indices = numpy.unique(whole_seconds // SECONDS_PER_DAY,
+                                     return_inverse=True)
+    offsets = numpy.empty(len(days), numpy.int64)
+    is_changing = numpy.zeros(len(days), bool)
+    for i, day in enumerate(days.tolist()):
+        start = day * SECONDS_PER_DAY
+        offsets[i] = _offset_key(start)
+        is_changing[i] = \
+            offsets[i] != _offset_key(start + SECONDS_PER_DAY - 1)
+    time_keys = whole_seconds * MICROSECONDS_PER_SECOND + \
+        offsets[day_indices.ravel()] + microseconds.astype(numpy.int64)
+    for i in numpy.flatnonzero(is_changing[day_indices.ravel()]).tolist():
+        time_keys[i] = whole_seconds[i] * MICROSECONDS_PER_SECOND + \
+            _offset_key(int(whole_seconds[i])) + int(microseconds[i])
+    return time_keys
+
+
+def _round_to_microseconds(numpy, mtime_ns):
+    """ Returns the whole seconds, as int64, and the microseconds, as
+        float64, of the timestamps of modification times in nanoseconds
+        rounded to microseconds. """
+    seconds, nanoseconds = numpy.divmod(mtime_ns, NANOSECONDS_PER_SECOND)
+    timestamps = seconds.astype(numpy.float64) + \
+        nanoseconds.astype(numpy.float64) * 1e-9
+    whole_seconds = numpy.trunc(timestamps)
+    microseconds = numpy.rint((timestamps - whole_seconds) * 1e6)
+    carry = microseconds >= 1e6
+    microseconds[carry] -= 1e6
+    whole_seconds[carry] += 1
+    borrow = microseconds < 0
+    microseconds[borrow] += 1e6
+    whole_seconds[borrow] -= 1
+    return whole_seconds.astype(numpy.int64), microseconds
+
+
+def _offset_key(seconds):
+    """ Returns what is added to a whole number of seconds since the epoch,
+        in microseconds, to give its local time key. """
+    return local_key(seconds) - seconds * MICROSECONDS_PER_SECOND
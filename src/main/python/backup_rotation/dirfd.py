@@ -0,0 +1,103 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Descriptors of open directories, so that stat, link and unlink calls can
+    name files relative to their directory (the dir_fd argument) rather than
+    by a path the kernel resolves component by component on every call. This
+    matters on deep backup roots on NFS, and also pins each directory for the
+    rest of the run should it be renamed or replaced meanwhile. """
+import os
+import threading
+
+# Whether this platform can operate relative to directory descriptors.
+SUPPORTED = hasattr(os, "O_DIRECTORY") and \
+    {os.stat, os.link, os.unlink} <= os.supports_dir_fd and \
+    os.scandir in os.supports_fd
+
+# The most directories kept open at once, the others are used by path.
+MAX_OPEN_DIRECTORIES = 256
+
+
+class DirectoryHandles():
+    """ Opens each directory once, on first use, and keeps it open until
+        close. Safe to use from several threads: a descriptor handed out is
+        never closed before close is called. """
+    def __init__(self, max_open=MAX_OPEN_DIRECTORIES):
+        self.max_open = max_open
+        self.__descriptors = {}
+        self.__lock = threading.Lock()
+
+    def get(self, directory):
+        """ Returns the descriptor of the directory, or None when too many
+            directories are open already and the directory must be used by
+            its path. """
+        descriptor = self.__descriptors.get(directory)
+        if descriptor is not None:
+            return descriptor
+        with self.__lock:
+            descriptor = self.__descriptors.get(directory)
+            if descriptor is None and \
+                    len(self.__descriptors) < self.max_open:
+                descriptor = os.open(directory, os.O_RDONLY |
+                                     os.O_DIRECTORY | os.O_CLOEXEC)
+                self.__descriptors[directory] = descriptor
+            return descriptor
+
+    def split(self, path):
+        """ Returns (dir_fd, name) to use for path, dir_fd being None when
+            the directory could not be kept open and name then being the
+            whole path. """
+        directory, name = os.path.split(path)
+        descriptor = self.get(directory)
+        if descriptor is None:
+            return None, path
+        return descriptor, name
+
+    def stat(self, path):
+        """ Stats path relative to its directory. """
+        descriptor, name = self.split(path)
+        return os.stat(name, dir_fd=descriptor)
+
+    def link(self, path, target_path):
+        """ Hardlinks path to target_path relative to their directories. """
+        source_descriptor, source_name = self.split(path)
+        target_descriptor, target_name = self.split(target_path)
+        os.link(source_name, target_name, src_dir_fd=source_descriptor,
+                dst_dir_fd=target_descriptor)
+
+    def unlink(self, path):
+        """ Removes path relative to its directory. """
+        descriptor, name = self.split(path)
+        os.unlink(name, dir_fd=descriptor)
+
+    def close(self):
+        """ Closes every directory. The handles may be used again. """
+        with self.__lock:
+            descriptors = list(self.__descriptors.values())
+            self.__descriptors.clear()
+        for descriptor in descriptors:
+            os.close(descriptor)
+
+    def __len__(self):
+        return len(self.__descriptors)
@@ -0,0 +1,144 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" Effects the promotions and deletions of a plan through a storage backend,
+    optionally using a bounded pool of worker threads. """
+import logging
+from collections import namedtuple
+
+LOG = logging.getLogger(__name__)
+
+# How many operations may be queued per worker before waiting for some of
+# them to finish, which bounds the memory used for huge plans.
+QUEUED_OPERATIONS_PER_JOB = 4
+
+EffectFailure = namedtuple("EffectFailure",
+                           ["operation", "path", "target", "error"])
+EffectResult = namedtuple("EffectResult",
+                          ["operation", "path", "target", "result"])
+
+
+class PlanExecutor():
+    """ Runs backend operations either inline (jobs=1) or concurrently on up
+        to `jobs` worker threads. Operations failing with an OSError are
+        collected in `failures` instead of aborting the run, and the values
+        returned by the operations which succeeded (other than None) in
+        `results`. """
+    def __init__(self, backend, jobs=1):
+        self.backend = backend
+        self.jobs = max(1, jobs)
+        self.failures = []
+        self.results = []
+
+    def __run(self, operation, function, arguments):
+        """ Runs function for each tuple of arguments and returns the
+            EffectFailure of those which failed. A function running a batch
+            returns the list of EffectFailure of its items instead. """
+        failed = []
+
+        def run_one(args):
+            target = args[1] if len(args) > 1 else None
+            try:
+                result = function(*args)
+            except OSError as ex:
+                return EffectFailure(operation, args[0], target, ex)
+            if result is None or isinstance(result, list):
+                # Nothing, or the failures of a batch.
+                return result
+            return EffectResult(operation, args[0], target, result)
+
+        def record(outcome):
+            if isinstance(outcome, list):
+                for item in outcome:
+                    record(item)
+            elif isinstance(outcome, EffectFailure):
+                LOG.error("Unable to %s %s: %s", outcome.operation,
+                          outcome.path, outcome.error)
+                self.failures.append(outcome)
+                failed.append(outcome)
+            elif outcome is not None:
+                self.results.append(outcome)
+
+        if self.jobs == 1:
+            for args in arguments:
+                record(run_one(args))
+            return failed
+
+        # Only imported once there is more than one job, to start quickly.
+        # pylint: disable=import-outside-toplevel
+        from concurrent import futures
+        max_queued = self.jobs * QUEUED_OPERATIONS_PER_JOB
+        with futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            pending = set()
+            for args in arguments:
+                if len(pending) >= max_queued:
+                    done, pending = futures.wait(
+                        pending, return_when=futures.FIRST_COMPLETED)
+                    for future in done:
+                        record(future.result())
+                pending.add(pool.submit(run_one, args))
+            for future in pending:
+                record(future.result())
+        return failed
+
+    def promote(self, promotions):
+        """ Links each (path, target_path) pair and returns the failures. All
+            of the links have completed when this returns. """
+        return self.__run("promote", self.backend.link, promotions)
+
+    def delete(self, paths):
+        """ Deletes each path and returns the failures, in batches of up to
+            the delete_batch_size of the backend. """
+        batch_size = self.backend.delete_batch_size
+        if batch_size <= 1:
+            return self.__run("delete", self.backend.delete,
+                              ((path,) for path in paths))
+        return self.__run("delete", self.__delete_batch,
+                          ((x,) for x in _batches(paths, batch_size)))
+
+    def sync(self, directories):
+        """ Syncs each directory and returns the failures. """
+        return self.__run("sync", self.backend.sync_directory,
+                          ((x,) for x in directories))
+
+    def __delete_batch(self, paths):
+        """ Deletes a batch of paths and returns the EffectFailure of each
+            which could not be deleted. """
+        try:
+            failures = self.backend.delete_many(paths)
+        except OSError as ex:
+            failures = [(path, ex) for path in paths]
+        return [EffectFailure("delete", path, None, error)
+                for path, error in failures]
+
+
+def _batches(items, size):
+    """ Yields lists of up to size items. """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
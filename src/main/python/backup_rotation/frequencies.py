@@ -0,0 +1,193 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" A small calendar arithmetic engine for the frequencies of time buckets.
+    CalendarDelta behaves like the subset of dateutil's relativedelta the
+    time buckets use, without having to import dateutil at startup. """
+from datetime import datetime, timedelta
+
+DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# The relative and absolute fields, as named by relativedelta.
+RELATIVE_FIELDS = ("years", "months", "days", "hours", "minutes", "seconds")
+ABSOLUTE_FIELDS = ("day", "hour", "minute", "second")
+
+
+def days_in_month(year, month):
+    """ Returns the number of days in a month of the Gregorian calendar. """
+    if month == 2 and year % 4 == 0 and \
+            (year % 100 != 0 or year % 400 == 0):
+        return 29
+    return DAYS_IN_MONTH[month - 1]
+
+
+class CalendarDelta():
+    """ A calendar aware delta which can be added to, or subtracted from, a
+        datetime. The relative fields (years, months, days, hours, minutes,
+        seconds) are added, moving to the last day of the month when a
+        month is shorter, and the absolute fields (day, hour, minute,
+        second) replace those of the datetime first. Like relativedelta, a
+        day of 0 is ignored, so that day=0 does nothing.
+
+        For example, CalendarDelta(days=1, hour=0, minute=0, second=0) added
+        to a datetime is midnight of the next day. """
+    # One slot per field of relativedelta's keyword arguments.
+    # pylint: disable=too-many-instance-attributes
+    __slots__ = RELATIVE_FIELDS + ABSOLUTE_FIELDS
+
+    def __init__(self, *, years=0, months=0, days=0, hours=0, minutes=0,
+                 seconds=0, day=None, hour=None, minute=None, second=None):
+        # pylint: disable=too-many-arguments
+        # Carry whole months into years, keeping the sign of both the same.
+        months = years * 12 + months
+        sign = -1 if months < 0 else 1
+        self.years, self.months = (sign * x for x in divmod(abs(months), 12))
+        self.days = days
+        self.hours = hours
+        self.minutes = minutes
+        self.seconds = seconds
+        self.day = day
+        self.hour = hour
+        self.minute = minute
+        self.second = second
+
+    def __add__(self, other):
+        if not hasattr(other, "toordinal") or not hasattr(other, "hour"):
+            return NotImplemented
+        year = other.year + self.years
+        month = other.month
+        if self.months:
+            month += self.months
+            if month > 12:
+                year += 1
+                month -= 12
+            elif month < 1:
+                year -= 1
+                month += 12
+        replacements = {
+            "year": year,
+            "month": month,
+            "day": min(days_in_month(year, month), self.day or other.day)
+        }
+        for field in ("hour", "minute", "second"):
+            value = getattr(self, field)
+            if value is not None:
+                replacements[field] = value
+        return other.replace(**replacements) + timedelta(
+            days=self.days, hours=self.hours, minutes=self.minutes,
+            seconds=self.seconds)
+
+    __radd__ = __add__
+
+    def __rsub__(self, other):
+        return (-self).__add__(other)
+
+    def __neg__(self):
+        return self * -1
+
+    def __mul__(self, factor):
+        if not isinstance(factor, int):
+            return NotImplemented
+        values = {x: getattr(self, x) * factor for x in RELATIVE_FIELDS}
+        values.update((x, getattr(self, x)) for x in ABSOLUTE_FIELDS)
+        return CalendarDelta(**values)
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        if not isinstance(other, CalendarDelta):
+            return NotImplemented
+        return all(getattr(self, x) == getattr(other, x)
+                   for x in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, x) for x in self.__slots__))
+
+    def __repr__(self):
+        fields = ["%s=%+d" % (x, getattr(self, x)) for x in RELATIVE_FIELDS
+                  if getattr(self, x)]
+        fields.extend("%s=%s" % (x, getattr(self, x)) for x in ABSOLUTE_FIELDS
+                      if getattr(self, x) is not None)
+        return "CalendarDelta(%s)" % ", ".join(fields)
+
+
+MINUTELY = CalendarDelta(minutes=1, second=0)
+HOURLY = CalendarDelta(hours=1, minute=0, second=0)
+DAILY = CalendarDelta(days=1, hour=0, minute=0, second=0)
+WEEKLY = CalendarDelta(days=7, hour=0, minute=0, second=0)
+MONTHLY = CalendarDelta(months=1, day=0, hour=0, minute=0, second=0)
+YEARLY = CalendarDelta(years=1, day=0, hour=0, minute=0, second=0)
+
+# The frequencies known by name.
+FREQUENCIES = {
+    "minutely": MINUTELY,
+    "hourly": HOURLY,
+    "daily": DAILY,
+    "weekly": WEEKLY,
+    "monthly": MONTHLY,
+    "yearly": YEARLY
+}
+
+# The units of frequencies such as 15m, the relative field they add to and
+# by how much, and the absolute fields they reset to the start of the unit.
+FREQUENCY_UNITS = {
+    "m": ("minutes", 1, {"second": 0}),
+    "h": ("hours", 1, {"minute": 0, "second": 0}),
+    "d": ("days", 1, {"hour": 0, "minute": 0, "second": 0}),
+    "w": ("days", 7, {"hour": 0, "minute": 0, "second": 0}),
+    "mo": ("months", 1, {"day": 0, "hour": 0, "minute": 0, "second": 0}),
+    "y": ("years", 1, {"day": 0, "hour": 0, "minute": 0, "second": 0})
+}
+
+# The moment frequencies are measured from to order them, the start of a
+# day, month and year (see nominal_length).
+REFERENCE_MOMENT = datetime(2001, 1, 1)
+
+
+def parse_frequency(text):
+    """ Returns the frequency named (see FREQUENCIES), or of a number of
+        units such as 15m, 6h, 2d, 2w, 3mo or 10y. Like the named ones, the
+        frequency of a file is counted from the start of the unit it was
+        modified in, e.g. the 15m after 10:07:30 end at 10:22:00. Raises a
+        ValueError for anything else. """
+    if text in FREQUENCIES:
+        return FREQUENCIES[text]
+    number = text.rstrip("abcdefghijklmnopqrstuvwxyz")
+    unit = text[len(number):]
+    if unit not in FREQUENCY_UNITS or not number.isdigit() or \
+            int(number) < 1:
+        raise ValueError("unknown frequency \"%s\", expected one of %s or "
+                         "a number of %s" % (
+                             text, ", ".join(FREQUENCIES),
+                             "/".join(FREQUENCY_UNITS)))
+    field, factor, absolute = FREQUENCY_UNITS[unit]
+    values = {field: int(number) * factor}
+    values.update(absolute)
+    return CalendarDelta(**values)
+
+
+def nominal_length(frequency):
+    """ Returns the timedelta a frequency spans from REFERENCE_MOMENT, which
+        orders frequencies by granularity the same way on every run. """
+    return (REFERENCE_MOMENT + frequency) - REFERENCE_MOMENT
@@ -0,0 +1,315 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" A persistent index of the time bucket directories and the backup files
+    within them. It allows a scan to skip re-listing directories whose
+    modification time has not changed since the last successful rotation and
+    allows the rotation to be skipped entirely when nothing changed.
+
+    Note: A directory's modification time only changes when entries are
+    added, removed or renamed within it. Backups which are rewritten in place
+    are not noticed until the directory changes or a full rescan is forced."""
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter
+from os.path import join, relpath
+
+from .catalog import CatalogEntry
+
+LOG = logging.getLogger(__name__)
+
+INDEX_FILENAME = ".backup-rotation.index"
+INDEX_SCHEMA_VERSION = "2"
+
+# Directory modification times this close to the time they were recorded may
+# still change within the same timestamp granularity, so they are not trusted.
+RACY_WINDOW_NS = 2 * 1000000000
+UNTRUSTED_MTIME_NS = -1
+
+
+def trusted_mtime_ns(mtime_ns):
+    """ Returns the modification time unless it is too recent to be trusted
+        to change when the directory changes again. """
+    if time.time() * 1e9 - mtime_ns < RACY_WINDOW_NS:
+        return UNTRUSTED_MTIME_NS
+    return mtime_ns
+
+
+class DirectoryRecord():
+    """ What the index knows about a single directory. """
+    # A record is only its slots.
+    # pylint: disable=too-few-public-methods
+    __slots__ = ("mtime_ns", "subdirs", "entries")
+
+    def __init__(self, mtime_ns, subdirs, entries):
+        self.mtime_ns = mtime_ns
+        self.subdirs = subdirs
+        self.entries = entries
+
+
+class ScanIndex():
+    """ An index, stored as a small SQLite database, of every directory and
+        backup file seen by the last successful rotation. """
+    # The settings, the records and what the current scan changed.
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, backup_root, path=None):
+        self.backup_root = backup_root
+        self.path = path or join(backup_root, INDEX_FILENAME)
+        self.fingerprint = None
+        self.trust_recorded = True
+        self.directories = {}
+        self.__dirty = set()
+        self.__removed = set()
+        self.__seen = set()
+
+    def __relative(self, dirpath):
+        return relpath(dirpath, self.backup_root)
+
+    def __connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY, mtime_ns INTEGER, subdirs TEXT);
+            CREATE TABLE IF NOT EXISTS entries (
+                directory TEXT, name TEXT, mtime_ns INTEGER, size INTEGER,
+                inode INTEGER, device INTEGER, links INTEGER);
+            CREATE INDEX IF NOT EXISTS entries_by_directory
+                ON entries (directory);
+        """)
+        return connection
+
+    def load(self, fingerprint):
+        """ Loads the index from disk. The index is discarded if it was
+            recorded with a different fingerprint (e.g. another pattern or
+            other time buckets). Returns whether a usable index was found. """
+        self.fingerprint = fingerprint
+        self.directories = {}
+        self.__dirty = set()
+        self.__removed = set()
+        self.__seen = set()
+        if not os.path.exists(self.path):
+            return False
+        try:
+            connection = self.__connect()
+            try:
+                meta = dict(connection.execute("SELECT key, value FROM meta"))
+                if meta.get("schema") != INDEX_SCHEMA_VERSION or \
+                        meta.get("fingerprint") != fingerprint:
+                    LOG.info("Discarding the scan index %s, it was recorded "
+                             "with another configuration.", self.path)
+                    self.__removed = None
+                    return False
+                entries = {}
+                for directory, name, mtime_ns, size, inode, device, links in \
+                        connection.execute("SELECT directory, name, mtime_ns,"
+                                           " size, inode, device, links "
+                                           "FROM entries"):
+                    path = join(self.backup_root, directory, name)
+                    entries.setdefault(directory, []).append(
+                        CatalogEntry(path, name, mtime_ns, size, inode,
+                                     device, links))
+                for directory, mtime_ns, subdirs in connection.execute(
+                        "SELECT path, mtime_ns, subdirs FROM directories"):
+                    self.directories[directory] = DirectoryRecord(
+                        mtime_ns,
+                        subdirs.split("/") if subdirs else [],
+                        sorted(entries.get(directory, []),
+                               key=lambda x: x.mtime_ns))
+            finally:
+                connection.close()
+        except sqlite3.Error as ex:
+            LOG.warning("Ignoring the unreadable scan index %s: %s",
+                        self.path, ex)
+            self.directories = {}
+            self.__removed = None
+            return False
+        return True
+
+    def start_scan(self, trust_recorded=True):
+        """ Prepares the index, loaded earlier, for another scan. Nothing
+            recorded is used when trust_recorded is False. """
+        self.trust_recorded = trust_recorded
+        self.__seen = set()
+
+    def is_unchanged(self, bucket_dirs):
+        """ Returns whether every directory recorded within the bucket
+            directories still has the modification time it was recorded
+            with. This costs one stat per directory and no directory reads."""
+        relative_buckets = set(map(self.__relative, bucket_dirs))
+        recorded_buckets = set(
+            x for x in self.directories if os.sep not in x)
+        if not self.directories or relative_buckets != recorded_buckets:
+            return False
+        for directory, record in self.directories.items():
+            if record.mtime_ns == UNTRUSTED_MTIME_NS:
+                return False
+            try:
+                mtime_ns = os.stat(join(self.backup_root,
+                                        directory)).st_mtime_ns
+            except OSError:
+                return False
+            if mtime_ns != record.mtime_ns:
+                return False
+        return True
+
+    def lookup(self, dirpath, mtime_ns):
+        """ Returns the recorded record for the directory if its modification
+            time is unchanged, otherwise None. """
+        directory = self.__relative(dirpath)
+        self.__seen.add(directory)
+        record = self.directories.get(directory)
+        if record is None or not self.trust_recorded or \
+                record.mtime_ns == UNTRUSTED_MTIME_NS or \
+                record.mtime_ns != mtime_ns:
+            return None
+        return record
+
+    def distrust(self, dirpath):
+        """ Makes the next scan list the directory again, as something within
+            it changed without changing its modification time (e.g. a backup
+            rewritten in place). """
+        record = self.directories.get(self.__relative(dirpath))
+        if record is not None:
+            record.mtime_ns = UNTRUSTED_MTIME_NS
+
+    def record(self, dirpath, mtime_ns, subdirs, entries):
+        """ Records the freshly listed contents of a directory. """
+        directory = self.__relative(dirpath)
+        self.__seen.add(directory)
+        self.directories[directory] = DirectoryRecord(
+            trusted_mtime_ns(mtime_ns),
+            [os.path.basename(x) for x in subdirs],
+            list(entries))
+        self.__dirty.add(directory)
+
+    def forget_unseen(self):
+        """ Drops any recorded directory which the scan did not reach. """
+        for directory in list(self.directories):
+            if directory not in self.__seen:
+                del self.directories[directory]
+                if self.__removed is not None:
+                    self.__removed.add(directory)
+
+    def apply_changes(self, promoted, deleted):
+        """ Updates the index after promotions and deletions were effected.
+            promoted is an iterable of (target_path, CatalogEntry), the entry
+            being the source for a hardlink or the target itself for a copy,
+            and deleted an iterable of paths. The directories touched are
+            stat'ed again so that the rotation's own changes are not mistaken
+            for outside ones on the next run, and the link counts of the
+            files linked or unlinked are updated. """
+        touched = set()
+        link_changes = Counter()
+        deleted_by_directory = {}
+        for path in deleted:
+            directory = self.__relative(os.path.dirname(path))
+            deleted_by_directory.setdefault(directory, set()).add(path)
+        for directory, paths in deleted_by_directory.items():
+            record = self.directories.get(directory)
+            if record is not None:
+                kept = []
+                for entry in record.entries:
+                    if entry.path in paths:
+                        link_changes[entry.file_id] -= 1
+                    else:
+                        kept.append(entry)
+                record.entries = kept
+                touched.add(directory)
+        for target_path, source in promoted:
+            directory = self.__relative(os.path.dirname(target_path))
+            if source.path == target_path:
+                entry = source
+            else:
+                entry = source.linked_as(target_path,
+                                         os.path.basename(target_path))
+                link_changes[source.file_id] += 1
+            record = self.directories.get(directory)
+            if record is not None:
+                record.entries.append(entry)
+                record.entries.sort(key=lambda x: x.mtime_ns)
+                touched.add(directory)
+        self.__apply_link_changes(link_changes)
+        for directory in touched:
+            record = self.directories[directory]
+            try:
+                mtime_ns = os.stat(join(self.backup_root,
+                                        directory)).st_mtime_ns
+            except OSError:
+                mtime_ns = UNTRUSTED_MTIME_NS
+            record.mtime_ns = trusted_mtime_ns(mtime_ns)
+            self.__dirty.add(directory)
+
+    def __apply_link_changes(self, link_changes):
+        """ Adds the changes of link counts, by file_id, to every entry of
+            the files linked or unlinked, wherever they are recorded. """
+        if not link_changes:
+            return
+        for directory, record in self.directories.items():
+            for entry in record.entries:
+                if entry.file_id in link_changes:
+                    entry.links += link_changes[entry.file_id]
+                    self.__dirty.add(directory)
+
+    def save(self):
+        """ Writes the changed directories back to disk in one transaction."""
+        if self.__removed is None:
+            # Recorded with another configuration or schema, or unreadable,
+            # so it is rewritten from scratch.
+            os.remove(self.path)
+            dirty = set(self.directories)
+        else:
+            dirty = self.__dirty | self.__removed
+        connection = self.__connect()
+        try:
+            with connection:
+                for directory in dirty:
+                    connection.execute(
+                        "DELETE FROM directories WHERE path = ?",
+                        (directory,))
+                    connection.execute(
+                        "DELETE FROM entries WHERE directory = ?",
+                        (directory,))
+                    record = self.directories.get(directory)
+                    if record is None:
+                        continue
+                    connection.execute(
+                        "INSERT INTO directories VALUES (?, ?, ?)",
+                        (directory, record.mtime_ns,
+                         "/".join(record.subdirs)))
+                    connection.executemany(
+                        "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        ((directory, x.name, x.mtime_ns, x.size, x.inode,
+                          x.device, x.links)
+                         for x in record.entries))
+                connection.executemany(
+                    "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                    (("schema", INDEX_SCHEMA_VERSION),
+                     ("fingerprint", self.fingerprint)))
+        finally:
+            connection.close()
+        self.__dirty = set()
+        self.__removed = set()
@@ -0,0 +1,100 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Matching of file names against include and exclude globs. The globs are
+    compiled once per rotation, so each name read from a directory costs at
+    most a str.endswith call and a regex match for the includes, and the same
+    for the excludes, before anything else is done with it. """
+import fnmatch
+import re
+
+GLOB_SPECIAL_CHARACTERS = frozenset("*?[")
+
+
+class NameMatcher():
+    """ Accepts the file names which match any of the include globs and none
+        of the exclude globs. Globs which only fix the end of a name, such as
+        *.tgz, are checked with str.endswith and the others are joined into a
+        single regex. Directories whose name matches an exclude glob are not
+        scanned at all (see excluded). """
+    __slots__ = ("include", "exclude", "__include", "__exclude")
+
+    def __init__(self, include=("*",), exclude=()):
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.__include = compile_globs(self.include)
+        self.__exclude = compile_globs(self.exclude)
+
+    def __call__(self, name):
+        return not self.__exclude(name) and self.__include(name)
+
+    def excluded(self, name):
+        """ Returns whether a name matches one of the exclude globs. """
+        return self.__exclude(name)
+
+    def __eq__(self, other):
+        return isinstance(other, NameMatcher) and \
+            (self.include, self.exclude) == (other.include, other.exclude)
+
+    def __hash__(self):
+        return hash((self.include, self.exclude))
+
+    def __repr__(self):
+        return "NameMatcher(include=%r, exclude=%r)" % (list(self.include),
+                                                         list(self.exclude))
+
+
+def compile_globs(globs):
+    """ Returns a function of a name which is true if the name matches any of
+        the globs. """
+    suffixes = []
+    patterns = []
+    for glob in globs:
+        if glob == "*":
+            return _match_any
+        if glob.startswith("*") and len(glob) > 1 and \
+                not GLOB_SPECIAL_CHARACTERS.intersection(glob[1:]):
+            suffixes.append(glob[1:])
+        else:
+            patterns.append(fnmatch.translate(glob))
+    suffixes = tuple(suffixes)
+    if not patterns:
+        if not suffixes:
+            return _match_none
+        return lambda name: name.endswith(suffixes)
+    regex_match = re.compile("|".join(patterns)).match
+    if not suffixes:
+        return lambda name: regex_match(name) is not None
+    return lambda name: name.endswith(suffixes) or \
+        regex_match(name) is not None
+
+
+def _match_any(_):
+    """ Matches every name. """
+    return True
+
+
+def _match_none(_):
+    """ Matches no name. """
+    return False
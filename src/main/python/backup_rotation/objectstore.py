@@ -0,0 +1,485 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" A storage backend for backup roots kept in an S3 compatible object store,
+    such as s3://my-bucket/backups. The time buckets are the key prefixes
+    backups/daily/, backups/monthly/ and backups/yearly/, and every further
+    "/" in a key is a directory for the planner.
+
+    The modification time of an object is its LastModified, unless it was
+    promoted by this backend: a promotion is a server-side copy, which the
+    store dates from the time of the copy, so the modification time of the
+    original is kept in the copy's metadata. Promotions never copy into the
+    finest time bucket, the objects of which are dated by the listing alone,
+    while those of the other time buckets are HEAD-ed, concurrently with the
+    paginated listing of each prefix. The entries HEAD-ed are only cached by
+    the backend, so a new process, such as every run of the command, HEADs
+    each of those objects again. Deletions are sent in batches of up to 1000
+    keys.
+
+    Objects have no inodes, each key is a file of its own identified by a
+    hash of the key and its ETag, so an object which is replaced counts as
+    another file, the way a replaced local file does.
+
+    The backend talks to a boto3 S3 client (which is only imported when no
+    client is given), or to the FakeObjectStoreClient used by the tests. """
+import hashlib
+import logging
+import posixpath
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+from .backends import StorageBackend
+from .backup_rotation import BackupRotationException
+from .catalog import CatalogEntry, NANOSECONDS_PER_SECOND
+from .transfer import Transfer
+
+LOG = logging.getLogger(__name__)
+
+EXIT_CODE_OBJECT_STORE_UNAVAILABLE = 106
+
+URL_SCHEME = "s3://"
+# The metadata of a promoted copy holding the modification time of the
+# original, in nanoseconds since the epoch.
+MTIME_METADATA = "backup-rotation-mtime-ns"
+# The most keys a DeleteObjects request, and a page of ListObjectsV2, hold.
+MAX_KEYS_PER_REQUEST = 1000
+# The largest object CopyObject can copy, larger ones need a multipart copy.
+MAX_COPY_OBJECT_SIZE = 5 * 1024 ** 3
+DEFAULT_LIST_JOBS = 8
+# The error codes meaning there is no such key or bucket.
+NOT_FOUND_CODES = frozenset(("404", "NoSuchKey", "NoSuchBucket", "NotFound"))
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class ObjectStoreUnavailableException(BackupRotationException):
+    """ Exception for when an object store cannot be used """
+    def __init__(self, reason):
+        message = "The object store is unavailable: %s"
+        super().__init__(message % reason,
+                         EXIT_CODE_OBJECT_STORE_UNAVAILABLE)
+
+
+def _error_code(ex):
+    """ Returns the error code of a client error, or None. """
+    response = getattr(ex, "response", None)
+    if not isinstance(response, dict):
+        return None
+    return str(response.get("Error", {}).get("Code"))
+
+
+def _as_os_error(ex, key):
+    """ Returns the OSError to raise for an exception of the client, so that
+        failures are handled like those of a file system, or None if it is
+        not an error of the client. """
+    if isinstance(ex, OSError):
+        return ex
+    code = _error_code(ex)
+    if code in NOT_FOUND_CODES:
+        return FileNotFoundError("%s: %s" % (key, ex))
+    if code is not None or type(ex).__module__.startswith("botocore"):
+        return OSError("%s: %s" % (key, ex))
+    return None
+
+
+class ObjectStoreBackend(StorageBackend):
+    """ A backend for a backup root in an object store bucket below a key
+        prefix (see the module). Up to list_jobs prefixes are listed, and
+        objects HEAD-ed, at once. """
+    delete_batch_size = MAX_KEYS_PER_REQUEST
+
+    def __init__(self, bucket, prefix="", client=None,
+                 list_jobs=DEFAULT_LIST_JOBS):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.backup_root = "%s%s/%s" % (URL_SCHEME, bucket, self.prefix)
+        self.client = client
+        self.list_jobs = max(1, list_jobs)
+        # The entry of every object scanned by key, reused while its ETag
+        # and LastModified are unchanged so it is only HEAD-ed once.
+        self.__entries = {}
+        # The time buckets objects may be copied into, None while unknown
+        # (see expect_links).
+        self.__linked_buckets = None
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url, endpoint_url=None, list_jobs=DEFAULT_LIST_JOBS):
+        """ Creates the backend of an s3://bucket/prefix URL, with a boto3
+            client using the default credentials. """
+        bucket, _, prefix = url[len(URL_SCHEME):].partition("/")
+        if not bucket:
+            raise ObjectStoreUnavailableException(
+                "no bucket in %s" % url)
+        try:
+            # Only object stores need boto3, which is optional.
+            # pylint: disable=import-outside-toplevel
+            import boto3
+        except ImportError as ex:
+            raise ObjectStoreUnavailableException(
+                "boto3 is not installed (%s)" % ex) from ex
+        client = boto3.client("s3", endpoint_url=endpoint_url)
+        return cls(bucket, prefix, client, list_jobs)
+
+    def __call(self, key, function, **kwargs):
+        """ Calls the client, raising its errors as OSError. """
+        try:
+            return function(Bucket=self.bucket, **kwargs)
+        except Exception as ex:  # pylint: disable=broad-except
+            error = _as_os_error(ex, key)
+            if error is None:
+                raise
+            raise error from ex
+
+    def root_exists(self):
+        try:
+            self.__call(self.backup_root, self.client.head_bucket)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def bucket_exists(self, bucket):
+        # Prefixes exist as soon as a key has them.
+        return True
+
+    def make_bucket(self, bucket):
+        pass
+
+    def bucket_path(self, bucket, name):
+        return posixpath.join(self.prefix, bucket, name)
+
+    def expect_links(self, buckets):
+        self.__linked_buckets = frozenset(buckets)
+
+    def scan_bucket(self, bucket, name_filter, index=None, stats=None):
+        excluded = getattr(name_filter, "excluded", None)
+        # No object of a time bucket never copied into has the metadata.
+        is_linked = self.__linked_buckets is None or \
+            bucket in self.__linked_buckets
+        with ThreadPoolExecutor(max_workers=self.list_jobs) as pool:
+            pending = [pool.submit(self.__list_prefix,
+                                   self.bucket_path(bucket, ""))]
+            while pending:
+                objects, subprefixes = pending.pop().result()
+                pending.extend(
+                    pool.submit(self.__list_prefix, x) for x in subprefixes
+                    if excluded is None or
+                    not excluded(posixpath.basename(x.rstrip("/"))))
+                objects = [x for x in objects
+                           if name_filter(posixpath.basename(x["Key"]))]
+                if is_linked:
+                    entries = list(pool.map(
+                        lambda x: self.__entry(x, stats), objects))
+                else:
+                    entries = [self.__listed_entry(x) for x in objects]
+                entries.sort(key=lambda x: x.mtime_ns)
+                yield entries
+
+    def __list_prefix(self, prefix):
+        """ Lists a prefix, one page after the other, and returns its objects
+            and the prefixes below it. """
+        objects = []
+        subprefixes = []
+        arguments = {"Prefix": prefix, "Delimiter": "/",
+                     "MaxKeys": MAX_KEYS_PER_REQUEST}
+        while True:
+            page = self.__call(prefix, self.client.list_objects_v2,
+                               **arguments)
+            objects.extend(x for x in page.get("Contents", ())
+                           if not x["Key"].endswith("/"))
+            subprefixes.extend(x["Prefix"]
+                               for x in page.get("CommonPrefixes", ()))
+            if not page.get("IsTruncated"):
+                return objects, subprefixes
+            arguments["ContinuationToken"] = page["NextContinuationToken"]
+
+    def __entry(self, listed, stats=None):
+        """ Returns the CatalogEntry of a listed object, HEAD-ing it unless
+            it was already since it last changed. """
+        key = listed["Key"]
+        version = (listed.get("ETag"), listed["LastModified"])
+        with self.__lock:
+            known = self.__entries.get(key)
+        if known is not None and known[0] == version:
+            return known[1]
+        entry = self.stat(key)
+        if stats is not None:
+            with self.__lock:
+                stats.stat_calls += 1
+        return entry
+
+    def __listed_entry(self, listed):
+        """ Returns the CatalogEntry of a listed object dated by its
+            LastModified, caching it for link. """
+        key = listed["Key"]
+        etag = listed.get("ETag", "")
+        entry = CatalogEntry(key, posixpath.basename(key),
+                             _timestamp_ns(listed["LastModified"]),
+                             listed["Size"], _inode(key, etag))
+        with self.__lock:
+            self.__entries[key] = ((etag, listed["LastModified"]), entry)
+        return entry
+
+    def stat(self, path):
+        head = self.__call(path, self.client.head_object, Key=path)
+        last_modified = head["LastModified"]
+        mtime_ns = head.get("Metadata", {}).get(MTIME_METADATA)
+        if mtime_ns is None:
+            mtime_ns = _timestamp_ns(last_modified)
+        etag = head.get("ETag", "")
+        entry = CatalogEntry(path, posixpath.basename(path), int(mtime_ns),
+                             head["ContentLength"], _inode(path, etag))
+        with self.__lock:
+            self.__entries[path] = ((etag, last_modified), entry)
+        return entry
+
+    def link(self, path, target_path):
+        """ Copies the object within the store, keeping its modification
+            time in the metadata of the copy. Raises FileExistsError rather
+            than replacing an object. """
+        try:
+            self.stat(target_path)
+        except FileNotFoundError:
+            pass
+        else:
+            raise FileExistsError(target_path)
+        with self.__lock:
+            known = self.__entries.get(path)
+        entry = known[1] if known is not None else self.stat(path)
+        started = time.perf_counter()
+        metadata = {MTIME_METADATA: str(entry.mtime_ns)}
+        source = {"Bucket": self.bucket, "Key": path}
+        if entry.size <= MAX_COPY_OBJECT_SIZE:
+            response = self.__call(
+                target_path, self.client.copy_object, Key=target_path,
+                CopySource=source, Metadata=metadata,
+                MetadataDirective="REPLACE")
+            # The copy need not be HEAD-ed when it is scanned next.
+            result = (response or {}).get("CopyObjectResult")
+            if result:
+                etag = result.get("ETag", "")
+                with self.__lock:
+                    self.__entries[target_path] = (
+                        (etag, result["LastModified"]), CatalogEntry(
+                            target_path, posixpath.basename(target_path),
+                            entry.mtime_ns, entry.size,
+                            _inode(target_path, etag)))
+        else:
+            # The managed copy of boto3 copies large objects in parts.
+            self.__call(target_path, self.client.copy, Key=target_path,
+                        CopySource=source, ExtraArgs={
+                            "Metadata": metadata,
+                            "MetadataDirective": "REPLACE"})
+        return Transfer("copy", entry.size, time.perf_counter() - started)
+
+    def delete(self, path):
+        self.__call(path, self.client.delete_object, Key=path)
+        with self.__lock:
+            self.__entries.pop(path, None)
+
+    def delete_many(self, paths):
+        paths = list(paths)
+        response = self.__call(paths[0], self.client.delete_objects, Delete={
+            "Objects": [{"Key": x} for x in paths], "Quiet": True})
+        with self.__lock:
+            for path in paths:
+                self.__entries.pop(path, None)
+        return [(x["Key"], OSError("%s: %s %s" % (
+            x["Key"], x.get("Code"), x.get("Message"))))
+                for x in response.get("Errors", ())]
+
+    def release(self):
+        # The entries only live as long as the objects are unchanged, which
+        # is checked on every scan, so they are kept between rotations.
+        pass
+
+
+def _inode(key, etag):
+    """ Returns the number identifying a version of an object. """
+    return int.from_bytes(hashlib.blake2b(
+        ("%s\0%s" % (key, etag)).encode("utf-8"), digest_size=8).digest(),
+                          "big")
+
+
+def _timestamp_ns(moment):
+    """ Returns the nanoseconds since the epoch of an aware datetime. """
+    delta = moment - EPOCH
+    return (delta // timedelta(seconds=1)) * NANOSECONDS_PER_SECOND + \
+        delta.microseconds * 1000
+
+
+class FakeClientError(Exception):
+    """ An error of the FakeObjectStoreClient, shaped like botocore's
+        ClientError. """
+    def __init__(self, code, operation):
+        super().__init__("An error occurred (%s) when calling the %s "
+                         "operation" % (code, operation))
+        self.response = {"Error": {"Code": code, "Message": code}}
+
+
+class FakeObjectStoreClient():
+    """ An in-process stand-in for the boto3 S3 client, implementing the
+        calls ObjectStoreBackend makes against a single bucket held in
+        memory. Each call takes latency seconds and is counted in calls, the
+        most calls seen in flight at once in peak_concurrency. Pages of
+        listings hold at most page_size keys. The keys in failing_keys cannot
+        be copied to or deleted. """
+    # The settings, the objects and the counters of the fake.
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, bucket, latency=0.0, page_size=MAX_KEYS_PER_REQUEST):
+        self.bucket = bucket
+        self.latency = latency
+        self.page_size = page_size
+        self.objects = {}
+        self.calls = Counter()
+        self.peak_concurrency = 0
+        self.failing_keys = set()
+        self.__in_flight = 0
+        self.__lock = threading.Lock()
+
+    def put(self, key, mtime, size=0, metadata=None):
+        """ Stores an object as if it was uploaded at mtime, in seconds since
+            the epoch. """
+        etag = '"%s"' % hashlib.md5(
+            ("%s\0%s\0%s" % (key, mtime, size)).encode("utf-8")).hexdigest()
+        self.objects[key] = {
+            "LastModified": datetime.fromtimestamp(mtime, timezone.utc),
+            "ContentLength": size, "ETag": etag,
+            "Metadata": dict(metadata or {})}
+
+    def __request(self, operation, bucket, key=None):
+        with self.__lock:
+            self.calls[operation] += 1
+            self.__in_flight += 1
+            self.peak_concurrency = max(self.peak_concurrency,
+                                        self.__in_flight)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self.__lock:
+                self.__in_flight -= 1
+        if bucket != self.bucket:
+            raise FakeClientError("NoSuchBucket", operation)
+        if key in self.failing_keys:
+            raise FakeClientError("AccessDenied", operation)
+
+    def head_bucket(self, Bucket):  # pylint: disable=invalid-name
+        """ See S3 HeadBucket. """
+        self.__request("HeadBucket", Bucket)
+
+    def list_objects_v2(self, Bucket, Prefix="", Delimiter=None,
+                        MaxKeys=MAX_KEYS_PER_REQUEST,
+                        ContinuationToken=None):
+        # pylint: disable=invalid-name,too-many-arguments
+        """ See S3 ListObjectsV2. """
+        self.__request("ListObjectsV2", Bucket)
+        contents = []
+        prefixes = []
+        for key in sorted(self.objects):
+            if not key.startswith(Prefix) or \
+                    (ContinuationToken is not None and
+                     key <= ContinuationToken):
+                continue
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                prefix = Prefix + rest[:rest.index(Delimiter) + 1]
+                if prefixes and prefixes[-1] == prefix:
+                    continue
+                prefixes.append(prefix)
+            else:
+                contents.append(key)
+            if len(contents) + len(prefixes) >= min(MaxKeys, self.page_size):
+                break
+        # Every key below the last prefix sorts before its token.
+        last = max(contents[-1:] + [x + "\uffff" for x in prefixes[-1:]],
+                   default=None)
+        is_truncated = last is not None and any(
+            x > last and x.startswith(Prefix) for x in self.objects)
+        page = {"IsTruncated": is_truncated,
+                "Contents": [dict(self.__listed(x), Key=x) for x in contents],
+                "CommonPrefixes": [{"Prefix": x} for x in prefixes]}
+        if is_truncated:
+            page["NextContinuationToken"] = last
+        return page
+
+    def __listed(self, key):
+        stored = self.objects[key]
+        return {"LastModified": stored["LastModified"],
+                "ETag": stored["ETag"], "Size": stored["ContentLength"]}
+
+    def head_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        """ See S3 HeadObject. """
+        self.__request("HeadObject", Bucket)
+        try:
+            stored = self.objects[Key]
+        except KeyError:
+            raise FakeClientError("404", "HeadObject") from None
+        return dict(stored, Metadata=dict(stored["Metadata"]))
+
+    def copy_object(self, Bucket, Key, CopySource, Metadata=None,
+                    MetadataDirective="COPY"):
+        # pylint: disable=invalid-name,too-many-arguments
+        """ See S3 CopyObject, the copy is dated now. """
+        self.__request("CopyObject", Bucket, Key)
+        try:
+            source = self.objects[CopySource["Key"]]
+        except KeyError:
+            raise FakeClientError("NoSuchKey", "CopyObject") from None
+        copy = self.objects[Key] = dict(
+            source, LastModified=datetime.now(timezone.utc),
+            Metadata=dict(Metadata if MetadataDirective == "REPLACE"
+                          else source["Metadata"]))
+        return {"CopyObjectResult": {"ETag": copy["ETag"],
+                                     "LastModified": copy["LastModified"]}}
+
+    def copy(self, CopySource, Bucket, Key, ExtraArgs=None):
+        # pylint: disable=invalid-name
+        """ See the managed copy of boto3, made here of a single CopyObject
+            whatever the size of the object. """
+        extra_args = ExtraArgs or {}
+        self.copy_object(Bucket, Key, CopySource,
+                         extra_args.get("Metadata"),
+                         extra_args.get("MetadataDirective", "COPY"))
+
+    def delete_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        """ See S3 DeleteObject. """
+        self.__request("DeleteObject", Bucket, Key)
+        self.objects.pop(Key, None)
+
+    def delete_objects(self, Bucket, Delete):  # pylint: disable=invalid-name
+        """ See S3 DeleteObjects. """
+        self.__request("DeleteObjects", Bucket)
+        if len(Delete["Objects"]) > MAX_KEYS_PER_REQUEST:
+            raise FakeClientError("MalformedXML", "DeleteObjects")
+        errors = []
+        for item in Delete["Objects"]:
+            if item["Key"] in self.failing_keys:
+                errors.append({"Key": item["Key"], "Code": "AccessDenied",
+                               "Message": "Access Denied"})
+            else:
+                self.objects.pop(item["Key"], None)
+        return {"Errors": errors} if errors else {}
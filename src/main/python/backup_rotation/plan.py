@@ -0,0 +1,101 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" The plan of promotions and deletions produced by the BackupRotator. """
+from collections import deque
+
+
+class BucketPlan():
+    """ The planned outcome for a single time bucket.
+
+        files_to_keep is a deque ordered oldest first so that the oldest file
+        can be rejected in constant time, files_to_promote is a dict used as
+        an insertion-ordered set and files_to_delete is a set.
+        files_to_reclaim is the set of kept files deleted anyway to reclaim
+        space (see reclaim).
+
+        next_keep_key is the time key a file must reach to be kept after the
+        newest file in files_to_keep. """
+    # The plan of a time bucket is mostly its slots.
+    # pylint: disable=too-few-public-methods
+    __slots__ = ("name", "config", "files_to_keep", "files_to_delete",
+                 "files_to_promote", "files_to_reclaim", "next_keep_key")
+
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.files_to_keep = deque()
+        self.files_to_delete = set()
+        self.files_to_promote = {}
+        self.files_to_reclaim = set()
+        self.next_keep_key = None
+
+    def as_dict(self):
+        """ Exports this bucket in the dict format used by earlier releases."""
+        return {
+            "files_to_keep": list(self.files_to_keep),
+            "files_to_delete": set(self.files_to_delete),
+            "files_to_promote": list(self.files_to_promote)
+        }
+
+
+class Plan():
+    """ The planned outcome for every time bucket, in processing order. """
+    __slots__ = ("buckets",)
+
+    def __init__(self):
+        self.buckets = {}
+
+    def add_bucket(self, name, config):
+        """ Adds, and returns, an empty plan for a time bucket. """
+        bucket_plan = BucketPlan(name, config)
+        self.buckets[name] = bucket_plan
+        return bucket_plan
+
+    def __getitem__(self, name):
+        return self.buckets[name]
+
+    def __iter__(self):
+        return iter(self.buckets.values())
+
+    def promotions(self):
+        """ Yields (bucket name, path) for every file to promote. """
+        for bucket_plan in self.buckets.values():
+            for filename in bucket_plan.files_to_promote:
+                yield bucket_plan.name, filename
+
+    def files_to_delete(self):
+        """ Returns every file to delete across all of the time buckets (a
+            file cycled out of both daily AND monthly is only listed once),
+            including those deleted to reclaim space. """
+        files_to_delete = set()
+        for bucket_plan in self.buckets.values():
+            files_to_delete |= bucket_plan.files_to_delete
+            files_to_delete |= bucket_plan.files_to_reclaim
+        return files_to_delete
+
+    def as_dict(self):
+        """ Exports the plan in the nested dict format used by earlier
+            releases, keyed by time bucket. """
+        return {name: bucket_plan.as_dict()
+                for name, bucket_plan in self.buckets.items()}
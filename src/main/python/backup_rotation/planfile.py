@@ -0,0 +1,162 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Plan files, written by --plan-out as JSON Lines and effected later by
+    --apply-plan, possibly on another host. The first line describes the
+    plan:
+
+    {"plan_version": 1, "backup_root": "/mnt/replica", "created": 1600000000.0}
+
+    and every further line an action, all of the promotions first:
+
+    {"action": "promote", "bucket": "daily", "path": "host-a/1.tgz",
+     "target_bucket": "monthly", "inode": 1234, "size": 4096,
+     "mtime_ns": 1600000000000000000}
+    {"action": "delete", "bucket": "daily", "path": "host-a/0.tgz",
+     "inode": 1233, "size": 4096, "mtime_ns": 1599900000000000000}
+
+    Paths are relative to their time bucket, so that a plan made on a replica
+    mounted elsewhere applies to the original. The inode, size and
+    modification time of a file are those it had when planned, and an action
+    is only applied to a file which still has them. """
+import json
+import time
+from collections import namedtuple
+
+from .exceptions import BackupRotationException
+from .stats import write_atomically
+
+PLAN_VERSION = 1
+EXIT_CODE_INVALID_PLAN = 105
+
+ACTIONS = ("promote", "delete")
+
+# An action read from a plan file, target_bucket being None for deletions.
+PlannedAction = namedtuple("PlannedAction", [
+    "action", "bucket", "path", "target_bucket", "inode", "size",
+    "mtime_ns"])
+
+
+class PlanFileException(BackupRotationException):
+    """ Exception for when a plan file cannot be read """
+    def __init__(self, plan_file, reason):
+        message = "The plan file \"%s\" is invalid: %s"
+        super().__init__(message % (plan_file, reason),
+                         EXIT_CODE_INVALID_PLAN)
+
+
+def write_plan(plan_file, backup_root, promotions, deletions):
+    """ Writes a plan file, one line at a time. promotions yields (bucket,
+        relative path, target bucket, CatalogEntry) and deletions (bucket,
+        relative path, CatalogEntry). """
+    write_atomically(plan_file, _plan_lines(backup_root, promotions,
+                                            deletions))
+
+
+def _plan_lines(backup_root, promotions, deletions):
+    """ Yields the lines of a plan file. """
+    yield json.dumps({"plan_version": PLAN_VERSION,
+                      "backup_root": backup_root,
+                      "created": time.time()}) + "\n"
+    for bucket, path, target_bucket, entry in promotions:
+        yield _action_line("promote", bucket, path, entry, target_bucket)
+    for bucket, path, entry in deletions:
+        yield _action_line("delete", bucket, path, entry)
+
+
+def _action_line(action, bucket, path, entry, target_bucket=None):
+    """ Returns the line of a single action. """
+    record = {"action": action, "bucket": bucket, "path": path}
+    if target_bucket is not None:
+        record["target_bucket"] = target_bucket
+    record["inode"] = entry.inode
+    record["size"] = entry.size
+    record["mtime_ns"] = entry.mtime_ns
+    return json.dumps(record) + "\n"
+
+
+def read_plan(plan_file):
+    """ Returns the description of a plan file and an iterator over its
+        PlannedAction, which reads the file as it goes. """
+    try:
+        # Closed by _read_actions once every action has been read.
+        # pylint: disable=consider-using-with
+        plan_lines = open(plan_file, "r")
+    except OSError as ex:
+        raise PlanFileException(plan_file, ex) from ex
+    try:
+        header = _parse_line(plan_file, 1, plan_lines.readline())
+        if header.get("plan_version") != PLAN_VERSION:
+            raise PlanFileException(plan_file, "unsupported plan_version %r"
+                                    % header.get("plan_version"))
+    except BaseException:
+        plan_lines.close()
+        raise
+    return header, _read_actions(plan_file, plan_lines)
+
+
+def _read_actions(plan_file, plan_lines):
+    """ Yields the PlannedAction of every further line, then closes the
+        file. """
+    with plan_lines:
+        for number, line in enumerate(plan_lines, 2):
+            if not line.strip():
+                continue
+            record = _parse_line(plan_file, number, line)
+            try:
+                action = PlannedAction(
+                    record["action"], record["bucket"], record["path"],
+                    record.get("target_bucket"), int(record["inode"]),
+                    int(record["size"]), int(record["mtime_ns"]))
+            except KeyError as ex:
+                raise PlanFileException(
+                    plan_file, "line %s has no %s" % (number, ex)) from ex
+            except (TypeError, ValueError) as ex:
+                raise PlanFileException(
+                    plan_file, "line %s has an invalid field (%s)" % (
+                        number, ex)) from ex
+            if action.action not in ACTIONS or \
+                    (action.action == "promote") != \
+                    (action.target_bucket is not None):
+                raise PlanFileException(
+                    plan_file, "line %s has an unknown action" % number)
+            if action.path.startswith("/") or \
+                    ".." in action.path.split("/"):
+                raise PlanFileException(
+                    plan_file, "line %s has a path outside its time bucket"
+                    % number)
+            yield action
+
+
+def _parse_line(plan_file, number, line):
+    """ Returns the JSON object of a line. """
+    try:
+        record = json.loads(line)
+    except ValueError as ex:
+        raise PlanFileException(plan_file, "line %s: %s" % (number, ex)) \
+            from ex
+    if not isinstance(record, dict):
+        raise PlanFileException(plan_file,
+                                "line %s is not an object" % number)
+    return record
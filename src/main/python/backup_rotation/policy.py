@@ -0,0 +1,122 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Policy files, which replace the default daily, monthly and yearly time
+    buckets. A policy file is JSON such as:
+    {
+        "time_buckets": {
+            "quarter-hourly": {"frequency": "15m", "num_files_to_keep": 8},
+            "hourly": {"num_files_to_keep": 48},
+            "daily": {"num_files_to_keep": 7},
+            "weekly": {"num_files_to_keep": 4},
+            "monthly": {"num_files_to_keep": 12},
+            "yearly": {"num_files_to_keep": 5}
+        }
+    }
+
+    A time bucket's frequency is the name of one of the default time buckets
+    (whose num_files_to_keep it also takes by default), one of the
+    frequencies.FREQUENCIES, or a number of units such as 15m or 2w (see
+    frequencies.parse_frequency); it is the bucket's own name unless
+    "frequency" is given. Time buckets are processed coarsest first whatever
+    the order they are listed in; "order" breaks ties between time buckets of
+    the same frequency, lower first. A time bucket may also have its own
+    "include" and "exclude" globs. """
+import json
+
+from .backup_rotation import BackupRotationException
+from .frequencies import parse_frequency
+
+EXIT_CODE_INVALID_POLICY = 107
+
+# The num_files_to_keep of time buckets which are not default ones.
+DEFAULT_NUM_FILES_TO_KEEP = 3
+
+
+class PolicyFileException(BackupRotationException):
+    """ Exception for when a policy file cannot be used """
+    def __init__(self, policy_file, reason):
+        message = "The policy file \"%s\" is invalid: %s"
+        super().__init__(message % (policy_file, reason),
+                         EXIT_CODE_INVALID_POLICY)
+
+
+def load_policy(policy_file, default_time_buckets):
+    """ Reads a policy file and returns its time buckets, in the format the
+        BackupRotator takes. """
+    try:
+        with open(policy_file, "r") as policy_raw:
+            policy = json.load(policy_raw)
+    except (OSError, ValueError) as ex:
+        raise PolicyFileException(policy_file, ex) from ex
+    if not isinstance(policy, dict) or \
+            not isinstance(policy.get("time_buckets"), dict) or \
+            not policy["time_buckets"]:
+        raise PolicyFileException(policy_file,
+                                  "no object of \"time_buckets\"")
+    try:
+        return resolve_time_buckets(policy["time_buckets"],
+                                    default_time_buckets)
+    except ValueError as ex:
+        raise PolicyFileException(policy_file, ex) from ex
+
+
+def resolve_time_buckets(time_buckets, default_time_buckets):
+    """ Turns the time buckets of a policy, or of a batch config, into the
+        time buckets used by the BackupRotator. Raises a ValueError if one is
+        invalid. """
+    resolved = {}
+    for name, bucket in time_buckets.items():
+        if not isinstance(bucket, dict):
+            raise ValueError("the time bucket \"%s\" must be an object"
+                             % name)
+        frequency_name = bucket.get("frequency", name)
+        if frequency_name in default_time_buckets:
+            default_bucket = default_time_buckets[frequency_name]
+            frequency = default_bucket["frequency"]
+            num_files_to_keep = default_bucket["num_files_to_keep"]
+        else:
+            frequency = parse_frequency(str(frequency_name))
+            num_files_to_keep = DEFAULT_NUM_FILES_TO_KEEP
+        num_files_to_keep = bucket.get("num_files_to_keep",
+                                       num_files_to_keep)
+        if not isinstance(num_files_to_keep, int) or num_files_to_keep < 1:
+            raise ValueError("invalid \"num_files_to_keep\" of \"%s\"" % name)
+        resolved[name] = {
+            "num_files_to_keep": num_files_to_keep,
+            "frequency": frequency
+        }
+        if "order" in bucket:
+            if not isinstance(bucket["order"], int):
+                raise ValueError("invalid \"order\" of \"%s\"" % name)
+            resolved[name]["order"] = bucket["order"]
+        for setting in ("include", "exclude"):
+            if setting in bucket:
+                globs = bucket[setting]
+                if not isinstance(globs, list) or \
+                        not all(isinstance(x, str) for x in globs):
+                    raise ValueError("the \"%s\" of \"%s\" must be a list "
+                                     "of globs" % (setting, name))
+                resolved[name][setting] = list(globs)
+    return resolved
@@ -0,0 +1,80 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Profiling of a run with cProfile and tracemalloc, used by --profile. """
+import cProfile
+import io
+import logging
+import pstats
+import tracemalloc
+
+LOG = logging.getLogger(__name__)
+
+# The number of functions and allocation sites listed in the summary.
+SUMMARY_LINES = 25
+
+
+def profile_call(path, function, *args):
+    """ Calls function(*args) under cProfile and tracemalloc and returns its
+        result. The profile is dumped to path, for use with pstats or
+        snakeviz, and a summary of the slowest functions and of the memory
+        used is written to path + ".txt", even if the call raised. """
+    profiler = cProfile.Profile()
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, "reset_peak"):
+        # Only available from Python 3.9.
+        tracemalloc.reset_peak()
+    profiler.enable()
+    try:
+        return function(*args)
+    finally:
+        profiler.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        if not was_tracing:
+            tracemalloc.stop()
+        try:
+            profiler.dump_stats(path)
+            with open(path + ".txt", "w") as summary:
+                summary.write(summarize(profiler, current, peak, snapshot))
+        except OSError as ex:
+            LOG.error("Unable to write the profile: %s", ex)
+        else:
+            LOG.info("Wrote the profile to %s and %s.txt", path, path)
+
+
+def summarize(profiler, current, peak, snapshot):
+    """ Returns a text summary of a profile and of the memory traced. """
+    text = io.StringIO()
+    text.write("Peak traced memory: %.1f MiB (%.1f MiB at the end)\n\n" % (
+        peak / 1048576.0, current / 1048576.0))
+    text.write("Largest allocation sites still alive at the end:\n")
+    for statistic in snapshot.statistics("lineno")[:SUMMARY_LINES]:
+        text.write("  %s\n" % statistic)
+    text.write("\n")
+    stats = pstats.Stats(profiler, stream=text)
+    stats.sort_stats("cumulative").print_stats(SUMMARY_LINES)
+    return text.getvalue()
@@ -0,0 +1,210 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Emergency reclaim: the extra deletions, beyond those of the regular
+    rotation, needed to bring the free space of the backup volume or the
+    size of each time bucket back within a limit. Files are deleted oldest
+    first, a file only counting as freed once every link to it is deleted,
+    and the newest num_files_to_keep files of every time bucket are never
+    candidates. """
+import heapq
+import math
+from collections import Counter, namedtuple
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3,
+              "T": 1024 ** 4, "P": 1024 ** 5}
+
+# A file system link which may be deleted to reclaim space, links being the
+# number of links its file had when scanned. key is the time key of the
+# file, so candidates are deleted oldest first.
+Candidate = namedtuple("Candidate",
+                       ["key", "path", "bucket", "file_id", "size", "links"])
+
+# The free space to ensure, either a percentage of the volume or a size.
+FreeTarget = namedtuple("FreeTarget", ["percent", "size"])
+
+
+def parse_size(text):
+    """ Returns the bytes of a size such as 1048576, 500M or 2G (binary
+        units, an optional trailing B or iB is ignored). """
+    value = text.strip().upper()
+    for suffix in ("IB", "B"):
+        if value.endswith(suffix) and value[:-len(suffix)][-1:].isalnum():
+            value = value[:-len(suffix)]
+            break
+    unit = value[-1:] if value[-1:].isalpha() else ""
+    if unit not in SIZE_UNITS:
+        raise ValueError("Unknown size unit in %r" % text)
+    size = float(value[:len(value) - len(unit)]) * SIZE_UNITS[unit]
+    if size < 0:
+        raise ValueError("Negative size %r" % text)
+    return int(size)
+
+
+def parse_free_target(text):
+    """ Returns the FreeTarget of a percentage of the volume such as 20% or
+        of a size (see parse_size). """
+    if text.strip().endswith("%"):
+        percent = float(text.strip()[:-1])
+        if not 0 <= percent <= 100:
+            raise ValueError("Percentage out of range %r" % text)
+        return FreeTarget(percent, None)
+    return FreeTarget(None, parse_size(text))
+
+
+def bytes_needed(target, disk_usage):
+    """ Returns how many bytes must be freed to meet the FreeTarget, given
+        the (total, available) bytes of the volume. """
+    total, available = disk_usage
+    if target.percent is not None:
+        wanted = int(math.ceil(total * target.percent / 100.0))
+    else:
+        wanted = target.size
+    return max(0, wanted - available)
+
+
+def count_links(catalog, linked, deleted):
+    """ Returns, by file_id, the links left to the files which gained a link
+        (the paths linked) or lost one (the paths deleted), and the bytes of
+        the files left without any. """
+    links = {}
+    for path in linked:
+        entry = catalog[path]
+        links[entry.file_id] = links.get(entry.file_id, entry.links) + 1
+    return links, remove_links((catalog[x] for x in deleted), links)
+
+
+def remove_links(items, links):
+    """ Counts one link less, in links, for the file of every item (a
+        CatalogEntry or a Candidate) and returns the bytes of the files left
+        without any. links maps the file_id of the files which gained or
+        lost links to the number of links they have, the others having
+        item.links. """
+    freed = 0
+    for item in items:
+        remaining = links[item.file_id] = links.get(item.file_id,
+                                                    item.links) - 1
+        if remaining <= 0:
+            freed += item.size
+    return freed
+
+
+def collect_candidates(plan, catalog, time_keys, protected):
+    """ Returns the Candidate of every file the Plan keeps beyond the newest
+        num_files_to_keep of its time bucket, and the bytes every time
+        bucket keeps by name. Files promoted, newer ones, and those whose
+        file_id is in protected (which is updated) are not candidates, not
+        even through a link in another time bucket. """
+    candidates = []
+    used = {}
+    for bucket_plan in plan:
+        files_to_keep = list(bucket_plan.files_to_keep)
+        oldest = max(0, len(files_to_keep) -
+                     bucket_plan.config["num_files_to_keep"])
+        files_to_promote = bucket_plan.files_to_promote
+        sizes = {}
+        for index, filename in enumerate(files_to_keep):
+            entry = catalog[filename]
+            sizes[entry.file_id] = entry.size
+            if index >= oldest or filename in files_to_promote:
+                protected.add(entry.file_id)
+            else:
+                candidates.append(Candidate(
+                    time_keys[filename], filename, bucket_plan.name,
+                    entry.file_id, entry.size, entry.links))
+        used[bucket_plan.name] = sum(sizes.values())
+    return [x for x in candidates if x.file_id not in protected], used
+
+
+def select_bucket_overflow(candidates, used, max_bytes):
+    """ Returns the candidates to delete, oldest first, so that no time
+        bucket uses more than max_bytes. used maps each time bucket to the
+        bytes of the files it keeps, every link to the same file within a
+        time bucket being deleted together and counted once. """
+    heaps = {}
+    for candidate in candidates:
+        if used.get(candidate.bucket, 0) > max_bytes:
+            heaps.setdefault(candidate.bucket, []).append(candidate)
+    selected = []
+    for bucket, heap in heaps.items():
+        groups = _link_groups(heap)
+        popped = set()
+        heapq.heapify(heap)
+        remaining = used[bucket]
+        while heap and remaining > max_bytes:
+            group = _pop_group(heap, groups, popped)
+            if group:
+                selected.extend(group)
+                remaining -= group[0].size
+    return selected
+
+
+def select_oldest_files(candidates, links, needed):
+    """ Returns the candidates to delete, oldest file first, to free needed
+        bytes and the bytes they free. links maps the file_id of the files
+        which lost links to the number of links they have left, the others
+        having candidate.links. A file with links which are not candidates
+        (in another time bucket, or outside the backup root) is skipped as
+        deleting its candidates would free nothing. """
+    if needed <= 0:
+        return [], 0
+    counts = Counter(x.file_id for x in candidates)
+    heap = [x for x in candidates
+            if counts[x.file_id] >= links.get(x.file_id, x.links)]
+    groups = _link_groups(heap, counts)
+    popped = set()
+    heapq.heapify(heap)
+    selected = []
+    freed = 0
+    while heap and freed < needed:
+        group = _pop_group(heap, groups, popped)
+        if group:
+            selected.extend(group)
+            freed += group[0].size
+    return selected, freed
+
+
+def _link_groups(candidates, counts=None):
+    """ Returns, by file_id, the candidates which are one of several links to
+        the same file. Most files only have one, so the rest are left out. """
+    if counts is None:
+        counts = Counter(x.file_id for x in candidates)
+    groups = {}
+    for candidate in candidates:
+        if counts[candidate.file_id] > 1:
+            groups.setdefault(candidate.file_id, []).append(candidate)
+    return groups
+
+
+def _pop_group(heap, groups, popped):
+    """ Pops the oldest candidate of the heap and returns it with the other
+        links to its file, or nothing if those were already returned. """
+    candidate = heapq.heappop(heap)
+    group = groups.get(candidate.file_id)
+    if group is None:
+        return [candidate]
+    if candidate.file_id in popped:
+        return []
+    popped.add(candidate.file_id)
+    return group
@@ -0,0 +1,101 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" A frozen copy of the original planning algorithm of the BackupRotator.
+    It is deliberately simple and slow, and must not be optimised: the
+    benchmark compares the plans of the BackupRotator against it so that
+    performance work cannot silently change retention decisions. """
+from datetime import datetime
+
+
+def reference_plan(time_buckets, scanned_buckets):
+    """ Plans the promotions and deletions the original way.
+
+        time_buckets is the list of (name, config) in processing order (e.g.
+        yearly first, daily last), and scanned_buckets maps each name to the
+        list of directory chunks the scan produced, where each chunk is a list
+        of (path, mtime) sorted oldest first. The files of every chunk of a
+        bucket are processed together, ordered oldest first. Returns the plan
+        in the dict format of BackupRotator.backup_plan. """
+    # The locals of the original algorithm are kept as they were.
+    # pylint: disable=too-many-locals
+    mtimes = {}
+    for chunks in scanned_buckets.values():
+        for chunk in chunks:
+            for path, mtime in chunk:
+                mtimes[path] = mtime
+
+    def get_mod_time(filename):
+        return datetime.fromtimestamp(mtimes[filename])
+
+    def process_file(backup_results, backup_config, filename,
+                     promotion=False):
+        files_to_keep = backup_results["files_to_keep"]
+        files_to_delete = backup_results["files_to_delete"]
+        files_to_promote = backup_results["files_to_promote"]
+        freq = backup_config["frequency"]
+        if not files_to_keep or \
+                get_mod_time(filename) >= \
+                get_mod_time(files_to_keep[-1]) + freq:
+            if len(files_to_keep) >= backup_config["num_files_to_keep"]:
+                reject_file = files_to_keep.pop(0)
+                files_to_delete.add(reject_file)
+                if reject_file in files_to_promote:
+                    files_to_promote.remove(reject_file)
+            files_to_keep.append(filename)
+            if promotion:
+                files_to_promote.append(filename)
+        elif not promotion:
+            files_to_delete.add(filename)
+
+    backup_plan = {}
+    processed = []
+    for backup_directory, config in time_buckets:
+        files_to_delete = set()
+        results = {
+            "files_to_keep": [],
+            "files_to_delete": files_to_delete,
+            "files_to_promote": []
+        }
+        backup_plan[backup_directory] = results
+        all_files = [x for chunk in scanned_buckets.get(backup_directory, [])
+                     for x in chunk]
+        for filename, _ in sorted(all_files, key=lambda x: x[1]):
+            process_file(results, config, filename)
+            for promotion_dir, promotion_target_config in processed:
+                process_file(backup_plan[promotion_dir],
+                             promotion_target_config, filename, True)
+
+        files_to_keep = results["files_to_keep"]
+        if files_to_keep:
+            safe_duration = config["frequency"] * \
+                (config["num_files_to_keep"] - 1)
+            safe_after_date = get_mod_time(files_to_keep[-1]) - safe_duration
+            for filename in list(files_to_delete):
+                if get_mod_time(filename) > safe_after_date:
+                    files_to_delete.remove(filename)
+                    files_to_keep.append(filename)
+        results["files_to_keep"] = sorted(files_to_keep,
+                                          key=lambda x: mtimes[x])
+        processed.append([backup_directory, config])
+    return backup_plan
@@ -0,0 +1,251 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" A retention simulator. It drives the BackupRotator with a virtual clock
+    against a MemoryBackend: a backup lands in the most granular time bucket
+    every interval and the backups are rotated as they would be in
+    production (after a day of backups by default, as a daily cron job
+    would), so years of backups are simulated in seconds. For every
+    candidate policy it reports the peak number of files and bytes stored,
+    and the largest gaps between the backups retained at the end.
+
+    A policy lists the number of files to keep in each time bucket, and
+    optionally the frequency when it is not the bucket's own name, e.g.
+    "hourly=24,daily=7,archive=12/monthly", or is a policy file (see
+    policy).
+
+    Usage: python -m backup_rotation.simulate [--years 10] [--interval 1h]
+                                              [--rotate-every 1d] [--size 1G]
+                                              [--json]
+                                              [--policy POLICY ...]
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+
+from .backends import MemoryBackend
+from .backup_rotation import BackupRotator, BackupRotationException
+from .cli import DEFAULT_TIME_BUCKETS, print_results
+from .frequencies import nominal_length
+from .policy import load_policy, resolve_time_buckets
+from .reclaim import parse_size
+
+DEFAULT_POLICY = "daily=3,monthly=3,yearly=3"
+# The first virtual backup is made at midnight on 2020-01-01, local time.
+DEFAULT_START = datetime(2020, 1, 1).timestamp()
+PATTERN = "*.tgz"
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+YEAR = 365 * DAY
+GIB = 1024 ** 3
+DURATION_UNITS = {"s": 1, "m": MINUTE, "h": HOUR, "d": DAY, "w": 7 * DAY}
+# The windows, by age of the backups, in which the largest gap between the
+# retained backups is reported.
+GAP_WINDOWS = (("day", DAY), ("week", 7 * DAY), ("month", 30 * DAY),
+               ("year", YEAR), ("all", None))
+
+
+def parse_duration(text):
+    """ Returns the seconds of a duration such as 90, 30m, 1h or 2d. """
+    number, unit = text, "s"
+    if text[-1:].lower() in DURATION_UNITS:
+        number, unit = text[:-1], text[-1:].lower()
+    try:
+        seconds = float(number) * DURATION_UNITS[unit]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "invalid duration: %r" % text) from None
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError(
+            "the duration must be positive: %r" % text)
+    return seconds
+
+
+def parse_policy(text, default_time_buckets=None):
+    """ Returns the time buckets of a policy such as "daily=7,monthly=12",
+        or of a policy file (see policy) if text ends in .json. Each time
+        bucket takes the frequency it is named after, or the one given after
+        a slash such as "quarter-hourly=8/15m". """
+    if default_time_buckets is None:
+        default_time_buckets = DEFAULT_TIME_BUCKETS
+    if text.endswith(".json"):
+        try:
+            return load_policy(text, default_time_buckets)
+        except BackupRotationException as ex:
+            raise argparse.ArgumentTypeError(ex.message) from None
+    time_buckets = {}
+    for item in text.split(","):
+        name, _, setting = item.strip().partition("=")
+        num_files, _, frequency_name = setting.partition("/")
+        try:
+            num_files = int(num_files)
+        except ValueError:
+            num_files = 0
+        if num_files < 1:
+            raise argparse.ArgumentTypeError(
+                "invalid number of files to keep for %s in policy %r" % (
+                    name, text))
+        time_buckets[name] = {"num_files_to_keep": num_files,
+                              "frequency": frequency_name or name}
+    try:
+        return resolve_time_buckets(time_buckets, default_time_buckets)
+    except ValueError as ex:
+        raise argparse.ArgumentTypeError(
+            "%s in policy %r" % (ex, text)) from None
+
+
+def simulate(time_buckets, duration, interval, size=0, rotate_every=None):
+    """ Simulates duration seconds of backups of size bytes made every
+        interval seconds from DEFAULT_START, rotated every rotate_every
+        seconds (after every backup by default). Returns the results as a
+        dict. """
+    backend = MemoryBackend("simulation")
+    rotator = BackupRotator(time_buckets, backend=backend)
+    rotator.backup_root = backend.backup_root
+    rotator.pattern = PATTERN
+    rotator.use_index = False
+    for bucket in time_buckets:
+        backend.make_bucket(bucket)
+    # New backups land in the time bucket processed last, the one with the
+    # shortest frequency.
+    landing = max(time_buckets, key=lambda x: (
+        -nominal_length(time_buckets[x]["frequency"]),
+        time_buckets[x].get("order", 0)))
+
+    started = time.perf_counter()
+    counts = {"backups_made": 0, "rotations": 0, "peak_files": 0,
+              "peak_bytes": 0}
+    now = next_rotation = DEFAULT_START
+    while now < DEFAULT_START + duration:
+        backend.add_file("%s/%08d.tgz" % (landing, counts["backups_made"]),
+                         now, size)
+        counts["backups_made"] += 1
+        if now >= next_rotation:
+            counts["peak_files"] = max(counts["peak_files"], backend.files)
+            counts["peak_bytes"] = max(counts["peak_bytes"], backend.used)
+            rotator.rotate_backups()
+            counts["rotations"] += 1
+            next_rotation += rotate_every or interval
+        now += interval
+    now -= interval
+
+    retained = retained_times(backend, time_buckets)
+    result = {"policy": {x: y["num_files_to_keep"]
+                         for x, y in time_buckets.items()}}
+    result.update(counts)
+    result.update({
+        "files": backend.files,
+        "bytes": backend.used,
+        "oldest_age": now - retained[0] if retained else None,
+        "largest_gaps": largest_gaps(retained, now),
+        "seconds": round(time.perf_counter() - started, 3)
+    })
+    return result
+
+
+def retained_times(backend, time_buckets):
+    """ Returns the modification times of the files stored in the time
+        buckets, each hardlinked file once, oldest first. """
+    times = {}
+    for bucket in time_buckets:
+        for path in backend.list_files(bucket):
+            entry = backend.stat(path)
+            times[entry.inode] = entry.mtime
+    return sorted(times.values())
+
+
+def largest_gaps(times, now):
+    """ Returns the largest gap between consecutive times, in seconds, among
+        the times within each of the GAP_WINDOWS before now. """
+    gaps = {}
+    for name, window in GAP_WINDOWS:
+        within = [x for x in times if window is None or now - x <= window]
+        gaps[name] = max((y - x for x, y in zip(within, within[1:])),
+                         default=None)
+    return gaps
+
+
+def format_duration(seconds):
+    """ Returns a duration in the largest unit in which it is at least 1. """
+    if seconds is None:
+        return "-"
+    for unit, length in (("years", YEAR), ("days", DAY), ("hours", HOUR),
+                         ("minutes", MINUTE)):
+        if seconds >= length:
+            return "%.1f %s" % (seconds / length, unit)
+    return "%.0f seconds" % seconds
+
+
+def format_result(result):
+    """ Returns a human readable summary of a simulation. """
+    policy = ",".join("%s=%s" % x for x in result["policy"].items())
+    gaps = ", ".join("%s %s" % (x, format_duration(result["largest_gaps"][x]))
+                     for x, _ in GAP_WINDOWS)
+    return ("%s: peak %d files, %.1f GiB; kept %d files, %.1f GiB, the "
+            "oldest %s old; largest gaps: %s (%d rotations in %.1fs)" % (
+                policy, result["peak_files"], result["peak_bytes"] / GIB,
+                result["files"], result["bytes"] / GIB,
+                format_duration(result["oldest_age"]), gaps,
+                result["rotations"], result["seconds"]))
+
+
+def main(argv=None):
+    """ Simulates every policy requested. """
+    parser = argparse.ArgumentParser(
+        prog="python -m backup_rotation.simulate",
+        description="Simulates the retention of backup rotation policies.")
+    parser.add_argument("--policy", action="append", type=parse_policy,
+                        help="The number of files to keep in each time "
+                             "bucket, e.g. %s (the default). May be "
+                             "repeated to compare policies." % DEFAULT_POLICY)
+    parser.add_argument("--years", type=float, default=10.0,
+                        help="How long to simulate. (default: %(default)s)")
+    parser.add_argument("--interval", type=parse_duration, default=HOUR,
+                        metavar="DURATION",
+                        help="The time between backups, such as 30m or 1d. "
+                             "(default: 1h)")
+    parser.add_argument("--rotate-every", type=parse_duration, default=DAY,
+                        metavar="DURATION",
+                        help="The time between rotations, at least the "
+                             "interval. (default: 1d)")
+    parser.add_argument("--size", type=parse_size, default=GIB,
+                        help="The size of every backup, such as 50G. "
+                             "(default: 1G)")
+    parser.add_argument("--json", action="store_true",
+                        help="Prints the results as JSON.")
+    args = parser.parse_args(argv)
+
+    print_results(
+        (simulate(x, args.years * YEAR, args.interval, args.size,
+                  rotate_every=max(args.rotate_every, args.interval))
+         for x in args.policy or [parse_policy(DEFAULT_POLICY)]),
+        format_result, args.json)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
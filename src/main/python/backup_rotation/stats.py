@@ -0,0 +1,235 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Counters and timings collected while rotating a backup root, and their
+    export as a JSON report or a Prometheus node_exporter textfile. """
+import os
+import time
+from contextlib import contextmanager, suppress
+
+PHASES = ("scan", "plan", "promote", "delete")
+
+METRIC_PREFIX = "backup_rotation_"
+
+# name, type, help and the RunStats attribute of every root wide metric
+ROOT_METRICS = (
+    ("stat_calls", "gauge", "The stat calls made scanning the time buckets.",
+     "stat_calls"),
+    ("links_created", "gauge", "The files promoted into a time bucket.",
+     "links_created"),
+    ("files_deleted", "gauge", "The links deleted from the time buckets.",
+     "files_deleted"),
+    ("files_freed", "gauge",
+     "The files whose last link was deleted.", "files_freed"),
+    ("bytes_reclaimed", "gauge",
+     "The space freed by deleting the last link of files.",
+     "bytes_reclaimed"),
+    ("files_reclaimed", "gauge",
+     "The kept files deleted anyway to meet a space limit.",
+     "files_reclaimed"),
+    ("bytes_unlinked", "gauge",
+     "The size of the deleted links whose file is still linked elsewhere.",
+     "bytes_unlinked"),
+    ("files_copied", "gauge",
+     "The promotions which had to copy as hardlinks were impossible.",
+     "files_copied"),
+    ("bytes_copied", "gauge", "The size of the files copied.",
+     "bytes_copied"),
+    ("copy_seconds", "gauge", "The time spent copying files.",
+     "copy_seconds"),
+    ("directories_synced", "gauge",
+     "The directories synced to make the links made and deleted durable.",
+     "directories_synced"),
+    ("sync_seconds", "gauge", "The time spent syncing directories.",
+     "sync_seconds"),
+    ("failures", "gauge", "The promotions or deletions which failed.",
+     "failures"),
+    ("actions_skipped", "gauge",
+     "The actions of a plan file skipped as their file changed.",
+     "actions_skipped"),
+    ("dry_run", "gauge",
+     "1 if nothing was changed and the counts are what would be.",
+     "dry_run"),
+    ("unchanged", "gauge",
+     "1 if the rotation was skipped as nothing changed.", "unchanged"),
+    ("last_run_timestamp_seconds", "gauge",
+     "When the last rotation finished.", "finished")
+)
+
+
+class RunStats():
+    """ The statistics of a single rotation of a backup root. The durations
+        are in seconds, scan being the time spent listing and stat'ing the
+        time buckets and plan the rest of the time spent planning.
+
+        files_deleted counts the links removed, while files_freed and
+        bytes_reclaimed only count the files whose last link was removed.
+        A dry run counts what would have been promoted and deleted. """
+    # One attribute per counter, as exported.
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, backup_root):
+        self.backup_root = backup_root
+        self.files_scanned = {}
+        self.stat_calls = 0
+        self.links_created = 0
+        self.files_deleted = 0
+        self.files_freed = 0
+        self.bytes_reclaimed = 0
+        self.bytes_unlinked = 0
+        self.files_reclaimed = 0
+        self.files_copied = 0
+        self.bytes_copied = 0
+        self.copy_seconds = 0.0
+        self.directories_synced = 0
+        self.sync_seconds = 0.0
+        self.failures = 0
+        self.actions_skipped = 0
+        self.dry_run = False
+        self.unchanged = False
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.finished = None
+
+    @contextmanager
+    def phase(self, name):
+        """ Adds the time spent within the with block to a phase. """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] += time.perf_counter() - started
+
+    def finish(self):
+        """ Marks the rotation as finished. """
+        self.finished = time.time()
+
+    def describe_space(self):
+        """ Returns a line describing the space the deletions free. """
+        return "%s %s links: %s files freed (%s bytes), %s bytes still " \
+            "linked elsewhere." % (
+                "Would delete" if self.dry_run else "Deleted",
+                self.files_deleted, self.files_freed, self.bytes_reclaimed,
+                self.bytes_unlinked)
+
+    def as_dict(self):
+        """ Returns the statistics as a dict suitable for JSON. """
+        return {
+            "backup_root": self.backup_root,
+            "finished": self.finished,
+            "dry_run": self.dry_run,
+            "unchanged": self.unchanged,
+            "files_scanned": dict(self.files_scanned),
+            "stat_calls": self.stat_calls,
+            "links_created": self.links_created,
+            "files_deleted": self.files_deleted,
+            "files_freed": self.files_freed,
+            "bytes_reclaimed": self.bytes_reclaimed,
+            "bytes_unlinked": self.bytes_unlinked,
+            "files_reclaimed": self.files_reclaimed,
+            "files_copied": self.files_copied,
+            "bytes_copied": self.bytes_copied,
+            "copy_seconds": round(self.copy_seconds, 6),
+            "directories_synced": self.directories_synced,
+            "sync_seconds": round(self.sync_seconds, 6),
+            "failures": self.failures,
+            "actions_skipped": self.actions_skipped,
+            "durations": {x: round(y, 6) for x, y in self.durations.items()}
+        }
+
+    def to_prometheus(self):
+        """ Returns the statistics in the Prometheus text exposition format,
+            every sample labelled with the backup root. """
+        root_label = 'backup_root="%s"' % _escape_label(self.backup_root)
+        lines = []
+
+        def add_metric(name, metric_type, description, samples):
+            lines.append("# HELP %s%s %s" % (METRIC_PREFIX, name, description))
+            lines.append("# TYPE %s%s %s" % (METRIC_PREFIX, name, metric_type))
+            for labels, value in samples:
+                lines.append("%s%s{%s} %s" % (
+                    METRIC_PREFIX, name, ",".join((root_label,) + labels),
+                    _format_value(value)))
+
+        add_metric("files_scanned", "gauge",
+                   "The backup files found in a time bucket.",
+                   [(('bucket="%s"' % _escape_label(x),), y)
+                    for x, y in sorted(self.files_scanned.items())])
+        add_metric("phase_duration_seconds", "gauge",
+                   "The time spent in each phase of the rotation.",
+                   [(('phase="%s"' % x,), self.durations[x]) for x in PHASES])
+        for name, metric_type, description, attribute in ROOT_METRICS:
+            add_metric(name, metric_type, description,
+                       [((), getattr(self, attribute) or 0)])
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        """ Writes the statistics as JSON, atomically replacing path. """
+        # Only imported when asked for, as most runs write no statistics.
+        import json  # pylint: disable=import-outside-toplevel
+        write_atomically(path, json.dumps(self.as_dict(), indent=4) + "\n")
+
+    def write_textfile(self, path):
+        """ Writes the statistics for the node_exporter textfile collector,
+            atomically replacing path so the collector never reads a partial
+            file. path must end in .prom to be collected. """
+        write_atomically(path, self.to_prometheus())
+
+
+def write_atomically(path, text):
+    """ Writes text, or each string of an iterable of them, to a temporary
+        file next to path and renames it over path, so readers see either the
+        old or the new content. """
+    import tempfile  # pylint: disable=import-outside-toplevel
+    directory, name = os.path.split(os.path.abspath(path))
+    descriptor, temp_path = tempfile.mkstemp(
+        prefix=".%s." % name, suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(descriptor, "w") as temp_file:
+            if isinstance(text, str):
+                temp_file.write(text)
+            else:
+                temp_file.writelines(text)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        # mkstemp creates the file readable by its owner only.
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(temp_path)
+        raise
+
+
+def _escape_label(value):
+    """ Escapes a label value of the Prometheus text format. """
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace('"', '\\"')
+
+
+def _format_value(value):
+    """ Formats a sample value of the Prometheus text format. """
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
@@ -0,0 +1,112 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" Integer keys for modification times. A key encodes the naive local
+    datetime of a timestamp as the number of microseconds since
+    0001-01-01 00:00:00, so keys order exactly as the naive datetimes do. The
+    planner converts each file once and compares keys instead of building
+    datetimes for every comparison. """
+from datetime import datetime, timedelta
+
+MICROSECONDS_PER_SECOND = 1000000
+MICROSECONDS_PER_DAY = 86400 * MICROSECONDS_PER_SECOND
+
+
+def local_key(timestamp):
+    """ Returns the key of a timestamp given in seconds since the epoch, using
+        the same conversion as datetime.fromtimestamp. """
+    return datetime_key(datetime.fromtimestamp(timestamp))
+
+
+def datetime_key(moment):
+    """ Returns the key of a naive datetime. """
+    return ((moment.toordinal() * 86400 + moment.hour * 3600 +
+             moment.minute * 60 + moment.second) * MICROSECONDS_PER_SECOND +
+            moment.microsecond)
+
+
+def key_datetime(key):
+    """ Returns the naive datetime a key encodes. """
+    ordinal, microseconds = divmod(key, MICROSECONDS_PER_DAY)
+    return datetime.fromordinal(ordinal) + \
+        timedelta(microseconds=microseconds)
+
+
+# The absolute fields of a frequency (a CalendarDelta or relativedelta)
+# which truncate a time, from the finest, and the period starting where
+# they are all reset.
+TRUNCATING_FIELDS = (("second", 60 * MICROSECONDS_PER_SECOND),
+                     ("minute", 3600 * MICROSECONDS_PER_SECOND),
+                     ("hour", MICROSECONDS_PER_DAY))
+
+
+def truncated_period(frequency):
+    """ Returns the microseconds of the minute, hour or day a frequency
+        truncates times to, adding it to any time of such a period giving
+        the same result but for the microseconds, or None for a frequency
+        which does not truncate times. """
+    period = None
+    for field, length in TRUNCATING_FIELDS:
+        if getattr(frequency, field, None) is None:
+            break
+        period = length
+    return period
+
+
+class Boundaries():
+    """ Computes the calendar dependent boundaries of a time bucket's
+        frequency (a CalendarDelta, a relativedelta, or anything else which
+        can be added to and subtracted from a datetime) as keys. The
+        frequency is applied to real datetimes so the results are identical
+        to the datetime arithmetic, but only once per period the frequency
+        truncates times to, e.g. once per day for the default time buckets
+        (their day=0 keeps the day of the month, so months and years are too
+        coarse). """
+    def __init__(self, frequency):
+        self.frequency = frequency
+        self.period = truncated_period(frequency)
+        # Whether the microseconds of a time are carried over unchanged.
+        self.__keeps_microseconds = \
+            getattr(frequency, "microsecond", None) is None
+        self.__next = {}
+
+    def next_after(self, key):
+        """ Returns the key of the earliest time a file must have to be kept
+            after a file with the given key, i.e. key + frequency. """
+        if self.period is None:
+            return datetime_key(key_datetime(key) + self.frequency)
+        period, offset = divmod(key, self.period)
+        boundary = self.__next.get(period)
+        if boundary is None:
+            boundary = datetime_key(
+                key_datetime(period * self.period) + self.frequency)
+            self.__next[period] = boundary
+        if self.__keeps_microseconds:
+            return boundary + offset % MICROSECONDS_PER_SECOND
+        return boundary
+
+    def grace_start(self, key, periods):
+        """ Returns the key of key - frequency * periods, after which files
+            are too young to be deleted. Only computed once per time bucket,
+            so it is not cached. """
+        return datetime_key(key_datetime(key) - self.frequency * periods)
@@ -0,0 +1,236 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Promotion of local backup files. A promotion is a hardlink whenever
+    possible. When the target time bucket is on another file system, or on
+    one without hardlinks, the file is cloned (a reflink, sharing the data
+    blocks), or else copied in the kernel with copy_file_range or sendfile,
+    or else copied in chunks. Copies keep the modification time of the
+    original, which the planner relies on. """
+import errno
+import logging
+import os
+import time
+from collections import namedtuple
+
+LOG = logging.getLogger(__name__)
+
+# The errors meaning a method is not available for these files, so the next
+# one should be tried. Any other error fails the promotion.
+UNSUPPORTED_ERRNOS = frozenset(
+    getattr(errno, x) for x in ("EXDEV", "EPERM", "EMLINK", "ENOTSUP",
+                                "EOPNOTSUPP", "ENOSYS", "EINVAL", "ENOTTY",
+                                "EBADF")
+    if hasattr(errno, x))
+
+# The FICLONE ioctl of Linux, _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+CHUNK_SIZE = 1024 * 1024
+# The most copy_file_range and sendfile are asked to copy per call.
+KERNEL_COPY_SIZE = 1024 * 1024 * 1024
+PARTIAL_SUFFIX = ".promoting"
+
+Transfer = namedtuple("Transfer", ["method", "size", "seconds"])
+
+
+class UnsupportedMethod(Exception):
+    """ Raised by a copy method which cannot copy these files. """
+
+
+def promote_file(path, target_path, handles=None, sync=False):
+    """ Makes the file at path available at target_path, which must not
+        exist, and returns the Transfer describing how. The hardlink is made
+        relative to the directories of the DirectoryHandles given. A copy's
+        data is synced to disk before it is in place when sync is set. """
+    started = time.perf_counter()
+    try:
+        if handles is not None:
+            handles.link(path, target_path)
+        else:
+            os.link(path, target_path)
+        return Transfer("hardlink", 0, time.perf_counter() - started)
+    except OSError as ex:
+        if ex.errno not in UNSUPPORTED_ERRNOS:
+            raise
+        LOG.debug("Unable to hardlink %s to %s, copying it: %s", path,
+                  target_path, ex)
+    if os.path.lexists(target_path):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST),
+                              target_path)
+    method, size = copy_file(path, target_path, sync)
+    transfer = Transfer(method, size, time.perf_counter() - started)
+    LOG.info("Promoted %s to %s with %s: %s", path, target_path, method,
+             format_throughput(transfer))
+    return transfer
+
+
+def copy_file(path, target_path, sync=False):
+    """ Copies the file at path to target_path, keeping its permissions and
+        modification time. The copy is made next to the target and renamed
+        into place, so an interrupted copy is never mistaken for a backup,
+        after syncing its data to disk when sync is set. Returns the method
+        used and the number of bytes copied. """
+    partial_path = target_path + PARTIAL_SUFFIX
+    with open(path, "rb") as source:
+        source_stat = os.fstat(source.fileno())
+        descriptor = os.open(partial_path,
+                             os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                             source_stat.st_mode & 0o7777)
+        try:
+            with open(descriptor, "wb") as target:
+                method = _copy_contents(source.fileno(), target.fileno(),
+                                        source_stat.st_size)
+                os.utime(target.fileno(), ns=(source_stat.st_atime_ns,
+                                              source_stat.st_mtime_ns))
+                if sync:
+                    os.fsync(target.fileno())
+            _rename_no_replace(partial_path, target_path)
+        except BaseException:
+            try:
+                os.unlink(partial_path)
+            except OSError:
+                pass
+            raise
+    return method, source_stat.st_size
+
+
+def _copy_contents(source_fd, target_fd, size):
+    """ Copies size bytes between the descriptors with the first method
+        which works, returning its name. """
+    for method, copier in COPY_METHODS[:-1]:
+        try:
+            copier(source_fd, target_fd, size)
+            return method
+        except UnsupportedMethod as ex:
+            LOG.debug("Unable to copy with %s: %s", method, ex)
+            # Start over as the method may have copied a part.
+            os.lseek(source_fd, 0, os.SEEK_SET)
+            os.lseek(target_fd, 0, os.SEEK_SET)
+            os.ftruncate(target_fd, 0)
+    # The last method works everywhere.
+    method, copier = COPY_METHODS[-1]
+    copier(source_fd, target_fd, size)
+    return method
+
+
+def _unsupported(ex):
+    """ Returns UnsupportedMethod for an OSError meaning a method is not
+        available, or the OSError itself. """
+    if ex.errno in UNSUPPORTED_ERRNOS:
+        return UnsupportedMethod(ex)
+    return ex
+
+
+def _clone(source_fd, target_fd, _size):
+    """ Shares the data blocks of the source (btrfs, XFS, ...), whatever
+        their size. """
+    try:
+        # fcntl only exists on Unix.
+        import fcntl  # pylint: disable=import-outside-toplevel
+    except ImportError as ex:
+        raise UnsupportedMethod(ex) from ex
+    try:
+        fcntl.ioctl(target_fd, FICLONE, source_fd)
+    except OSError as ex:
+        raise _unsupported(ex) from ex
+
+
+def _copy_file_range(source_fd, target_fd, size):
+    """ Copies in the kernel, which lets NFS and CIFS copy on the server. """
+    if not hasattr(os, "copy_file_range"):
+        raise UnsupportedMethod("copy_file_range needs Python 3.8")
+    copied = 0
+    while copied < size:
+        try:
+            count = os.copy_file_range(source_fd, target_fd,
+                                       min(size - copied, KERNEL_COPY_SIZE))
+        except OSError as ex:
+            raise _unsupported(ex) from ex
+        if count == 0:
+            break
+        copied += count
+
+
+def _sendfile(source_fd, target_fd, size):
+    """ Copies in the kernel through the page cache. """
+    if not hasattr(os, "sendfile"):
+        raise UnsupportedMethod("sendfile is not available")
+    copied = 0
+    while copied < size:
+        try:
+            count = os.sendfile(target_fd, source_fd, copied,
+                                min(size - copied, KERNEL_COPY_SIZE))
+        except OSError as ex:
+            raise _unsupported(ex) from ex
+        if count == 0:
+            break
+        copied += count
+
+
+def _chunked_copy(source_fd, target_fd, size):
+    """ Copies through user space, which works everywhere. """
+    copied = 0
+    while copied < size:
+        chunk = os.read(source_fd, min(size - copied, CHUNK_SIZE))
+        if not chunk:
+            break
+        copied += len(chunk)
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(target_fd, view):]
+
+
+COPY_METHODS = (
+    ("reflink", _clone),
+    ("copy_file_range", _copy_file_range),
+    ("sendfile", _sendfile),
+    ("copy", _chunked_copy)
+)
+
+
+def _rename_no_replace(path, target_path):
+    """ Renames path to target_path, failing if target_path exists. A
+        hardlink is used to do so atomically where the file system allows
+        it. """
+    try:
+        os.link(path, target_path)
+    except OSError as ex:
+        if ex.errno not in UNSUPPORTED_ERRNOS:
+            raise
+        if os.path.lexists(target_path):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST),
+                                  target_path) from ex
+        os.rename(path, target_path)
+    else:
+        os.unlink(path)
+
+
+def format_throughput(transfer):
+    """ Describes the size and throughput of a transfer. """
+    mebibytes = transfer.size / 1048576.0
+    if transfer.seconds <= 0:
+        return "%.1f MiB" % mebibytes
+    return "%.1f MiB in %.2fs (%.1f MiB/s)" % (
+        mebibytes, transfer.seconds, mebibytes / transfer.seconds)
@@ -0,0 +1,273 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" Watch mode, which keeps running and rotates a local backup root shortly
+    after new backups land in it. Linux inotify is used (through ctypes) to
+    learn about backups which were closed after writing or moved into a time
+    bucket. The scan index is kept in memory between rotations so that only
+    the directories which changed are listed again, and a full rescan is made
+    periodically to catch anything inotify could not report. A directory an
+    event came from is listed again even if its modification time did not
+    change, as it does not when a backup is rewritten in place. """
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+
+from .backup_rotation import BackupRotationException
+from .transfer import PARTIAL_SUFFIX
+
+LOG = logging.getLogger(__name__)
+
+EXIT_CODE_WATCH_UNAVAILABLE = 104
+
+# See inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+# How long to wait for a burst of events to end before rotating, how long a
+# burst may delay the rotation at most, and how often to fully rescan.
+DEFAULT_DEBOUNCE_SECONDS = 2.0
+DEFAULT_MAX_DELAY_SECONDS = 10.0
+DEFAULT_RESYNC_SECONDS = 3600.0
+POLL_SECONDS = 0.5
+
+
+class WatchUnavailableException(BackupRotationException):
+    """ Exception for when watch mode cannot be used on this system """
+    def __init__(self, reason):
+        message = "Watch mode is unavailable: %s"
+        super().__init__(message % reason, EXIT_CODE_WATCH_UNAVAILABLE)
+
+
+class Inotify():
+    """ A minimal ctypes binding of Linux inotify. """
+    def __init__(self):
+        library = ctypes.util.find_library("c")
+        try:
+            self.__libc = ctypes.CDLL(library, use_errno=True)
+            self.__libc.inotify_init1.argtypes = [ctypes.c_int]
+            self.__libc.inotify_add_watch.argtypes = \
+                [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        except (OSError, AttributeError) as ex:
+            raise WatchUnavailableException(
+                "no inotify in libc (%s)" % ex) from ex
+        self.fd = self.__libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise WatchUnavailableException(os.strerror(error))
+        self.__poll = select.poll()
+        self.__poll.register(self.fd, select.POLLIN)
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """ Watches the directory at path and returns the watch descriptor."""
+        wd = self.__libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read_events(self, timeout):
+        """ Waits up to timeout seconds and returns the events read as a list
+            of (wd, mask, cookie, name). """
+        if not self.__poll.poll(int(timeout * 1000)):
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, cookie, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        """ Closes the inotify file descriptor and with it every watch. """
+        os.close(self.fd)
+
+
+class BackupWatcher():
+    """ Rotates the backups of a BackupRotator whenever backups land in its
+        time buckets. The rotator must use its local backup_root.
+        after_rotation, if given, is called without arguments after every
+        rotation, whether it failed or not. """
+    # The settings are attributes, like those of the BackupRotator.
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, rotator, time_bucket_names, after_rotation=None):
+        self.rotator = rotator
+        self.after_rotation = after_rotation
+        self.time_bucket_names = list(time_bucket_names)
+        self.debounce = DEFAULT_DEBOUNCE_SECONDS
+        self.max_delay = DEFAULT_MAX_DELAY_SECONDS
+        self.resync_interval = DEFAULT_RESYNC_SECONDS
+        # The number of rotations made, mostly of interest to tests.
+        self.rotations = 0
+        self.__name_filters = [rotator.name_matcher(x)
+                               for x in self.time_bucket_names]
+        self.__inotify = None
+        self.__watched = {}
+        # The paths the last rotation copied promotions to, whose events are
+        # the rotation's own.
+        self.__effected = set()
+        self.__is_stopped = False
+
+    def stop(self):
+        """ Asks the watcher, possibly running in another thread, to stop. """
+        self.__is_stopped = True
+
+    def __watch_tree(self):
+        """ Watches every directory of every time bucket. """
+        for bucket in self.time_bucket_names:
+            self.__watch_directory(os.path.join(self.rotator.backup_root,
+                                                bucket))
+
+    def __watch_directory(self, top):
+        """ Watches a directory and everything below it, skipping those which
+            vanished meanwhile. Running out of watches, for one, makes watch
+            mode unavailable. """
+        for dirpath, _, _ in os.walk(top):
+            try:
+                wd = self.__inotify.add_watch(dirpath)
+            except OSError as ex:
+                if ex.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise WatchUnavailableException(
+                        "unable to watch %s (%s)" % (dirpath, ex.strerror)) \
+                        from ex
+                continue
+            self.__watched[wd] = dirpath
+
+    def __rotate(self, full_rescan=False, directories=()):
+        """ Rotates the backups, listing the directories given again, and
+            logs rather than raises failures so the watcher keeps running. """
+        self.rotator.force_rescan = full_rescan
+        self.rotator.rescan_paths = sorted(directories)
+        LOG.info("Rotating %s%s", self.rotator.backup_root,
+                 " with a full rescan" if full_rescan else "")
+        try:
+            self.rotator.rotate_backups()
+        except BackupRotationException as ex:
+            LOG.error(ex.message)
+        except OSError as ex:
+            LOG.error("Rotation of %s failed: %s", self.rotator.backup_root,
+                      ex)
+        self.__rotated()
+
+    def __rotated(self):
+        """ Counts a rotation, notes the paths it copied to and calls
+            after_rotation. """
+        self.rotations += 1
+        self.__effected = set(self.rotator.copied_paths)
+        if self.after_rotation is not None:
+            self.after_rotation()
+
+    def __is_relevant(self, mask, path):
+        """ Returns whether an event about path calls for a rotation. Links,
+            copies and deletions the rotation makes itself are not relevant,
+            so they never cause another rotation. """
+        if mask & IN_Q_OVERFLOW:
+            LOG.warning("The inotify queue overflowed, rescanning.")
+            return True
+        if mask & IN_ISDIR:
+            return bool(mask & (IN_CREATE | IN_MOVED_TO))
+        if path in self.__effected:
+            self.__effected.discard(path)
+            return False
+        name = os.path.basename(path)
+        return bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO)) and \
+            not name.endswith(PARTIAL_SUFFIX) and \
+            any(x(name) for x in self.__name_filters)
+
+    def run(self):
+        """ Rotates once, then keeps rotating as backups land until stopped.
+            Failures of the first rotation, such as a missing backup root,
+            are raised. """
+        self.__inotify = Inotify()
+        try:
+            # Watch before rotating so nothing landing meanwhile is missed,
+            # and again afterwards for any time bucket the rotation created.
+            self.__watch_tree()
+            try:
+                self.rotator.rotate_backups()
+            finally:
+                self.__rotated()
+            self.__watch_tree()
+            last_resync = time.monotonic()
+            first_event = last_event = None
+            needs_full_rescan = False
+            changed_directories = set()
+            while not self.__is_stopped:
+                for wd, mask, _, name in \
+                        self.__inotify.read_events(POLL_SECONDS):
+                    if mask & IN_IGNORED:
+                        self.__watched.pop(wd, None)
+                        continue
+                    directory = self.__watched.get(wd)
+                    path = name if directory is None else \
+                        os.path.join(directory, name)
+                    if not self.__is_relevant(mask, path):
+                        continue
+                    LOG.debug("Noticed %s in %s", name, directory)
+                    if mask & IN_ISDIR and directory is not None:
+                        self.__watch_directory(path)
+                    if mask & IN_Q_OVERFLOW:
+                        needs_full_rescan = True
+                    elif directory is not None:
+                        changed_directories.add(directory)
+                    last_event = time.monotonic()
+                    if first_event is None:
+                        first_event = last_event
+                now = time.monotonic()
+                if first_event is not None and \
+                        (now - last_event >= self.debounce or
+                         now - first_event >= self.max_delay):
+                    self.__rotate(needs_full_rescan, changed_directories)
+                    first_event = last_event = None
+                    needs_full_rescan = False
+                    changed_directories = set()
+                elif now - last_resync >= self.resync_interval:
+                    self.__watch_tree()
+                    self.__rotate(full_rescan=True)
+                    last_resync = time.monotonic()
+        finally:
+            self.__inotify.close()
+            self.__inotify = None
@@ -0,0 +1,107 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+Feature: Storage Backends
+  Scenario: Backups held in memory are rotated
+     Given 364 daily backup files in memory
+      When the in-memory backups are rotated
+      Then 3 daily backup files remain in memory
+       And 3 monthly backup files remain in memory
+       And 1 yearly backup file remains in memory
+
+  Scenario: Backups on a slow remote backend are rotated
+     Given 30 daily backup files in memory
+      When the in-memory backups are rotated through a remote backend
+      Then 3 daily backup files remain in memory
+       And the remote backend received 27 delete requests
+       And the remote backend received 2 link requests
+
+  Scenario: A dry-run against a remote backend changes nothing
+     Given 30 daily backup files in memory
+      When the in-memory backups are rotated through a remote backend in a dry-run
+      Then 30 daily backup files remain in memory
+       And the remote backend received 0 delete requests
+
+  Scenario: A month is counted from the day and midnight of the last kept file
+     Given daily backup files in memory modified at
+       | mtime               |
+       | 2020-01-15 10:30:00 |
+       | 2020-02-10 10:30:00 |
+       | 2020-02-15 00:00:00 |
+      When the in-memory backups are rotated
+      Then the monthly backup files in memory were modified at
+       | mtime               |
+       | 2020-01-15 10:30:00 |
+       | 2020-02-15 00:00:00 |
+
+  Scenario: Backups in subdirectories are processed in global time order
+     Given daily backup files in memory modified at
+       | mtime               | subdirectory |
+       | 2020-06-05 00:00:00 | host-a       |
+       | 2020-06-06 00:00:00 | host-b       |
+       | 2020-06-07 00:00:00 | host-a       |
+       | 2020-06-08 00:00:00 | host-b       |
+       | 2020-06-09 00:00:00 | host-a       |
+       | 2020-06-10 00:00:00 | host-b       |
+       | 2020-06-11 00:00:00 | host-a       |
+       | 2020-06-12 00:00:00 | host-b       |
+       | 2020-06-13 00:00:00 | host-a       |
+       | 2020-06-14 00:00:00 | host-b       |
+      When the in-memory backups are rotated
+      Then the daily backup files in memory were modified at
+       | mtime               |
+       | 2020-06-12 00:00:00 |
+       | 2020-06-13 00:00:00 |
+       | 2020-06-14 00:00:00 |
+
+  Scenario Outline: Backends answer each operation
+     Given 3 daily backup files in memory
+      When the <backend> backend is asked to <operation> "<arguments>"
+      Then the backend <outcome>
+
+    Examples: The interface
+      | backend  | operation     | arguments         | outcome                    |
+      | abstract | root_exists   |                   | raised NotImplementedError |
+      | abstract | bucket_exists | daily             | raised NotImplementedError |
+      | abstract | make_bucket   | daily             | raised NotImplementedError |
+      | abstract | scan_bucket   | daily             | raised NotImplementedError |
+      | abstract | bucket_path   | daily 1.txt       | raised NotImplementedError |
+      | abstract | link          | daily/1 daily/2   | raised NotImplementedError |
+      | abstract | delete        | daily/1           | raised NotImplementedError |
+      | abstract | stat          | daily/1           | raised NotImplementedError |
+      | abstract | disk_usage    |                   | returned None              |
+
+    Examples: In memory
+      | backend | operation   | arguments                                           | outcome                    |
+      | memory  | stat        | memory/daily/9.backup.txt                           | raised FileNotFoundError   |
+      | memory  | delete      | memory/daily/9.backup.txt                           | raised FileNotFoundError   |
+      | memory  | link        | memory/daily/0.backup.txt memory/daily/1.backup.txt | raised FileExistsError     |
+      | memory  | scan_bucket | weekly                                              | returned []                |
+      | memory  | delete_many | memory/daily/9.backup.txt memory/daily/0.backup.txt | failed on 1 file           |
+
+    Examples: Remote and local
+      | backend | operation   | arguments                 | outcome                    |
+      | remote  | stat        | memory/daily/9.backup.txt | raised FileNotFoundError   |
+      | remote  | make_bucket | weekly                    | returned None              |
+      | remote  | disk_usage  |                           | returned None              |
+      | local   | disk_usage  |                           | returned the volume usage  |
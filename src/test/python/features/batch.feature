@@ -0,0 +1,150 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+Feature: Batch Mode
+  Scenario: Several backup roots are rotated in one invocation
+     Given a batch of 3 backup roots with 364 daily backup files each
+      When the batch is rotated with 2 processes
+      Then the batch summary reports 3 succeeded and 0 failed roots
+       And every backup root of the batch has 3 daily backup files left
+       And every backup root of the batch has 3 monthly backup files left
+       And the script should exit with status 0
+
+  Scenario: A missing backup root only fails itself
+     Given a batch of 2 backup roots with 30 daily backup files each
+       And the batch also lists a missing backup root
+      When the batch is rotated with 1 processes
+      Then the batch summary reports 2 succeeded and 1 failed roots
+       And the script should exit with status 103
+
+  Scenario: Each backup root has its own time bucket policy
+     Given a batch of 2 backup roots with 30 daily backup files each
+       And the first backup root of the batch keeps 7 daily backups
+      When the batch is rotated with 1 processes
+      Then the first backup root of the batch has 7 daily backup files left
+       And the second backup root of the batch has 3 daily backup files left
+
+  Scenario: A dry-run reports what it would delete
+     Given a batch of 2 backup roots with 30 daily backup files each
+      When the batch is rotated in a dry-run with 1 processes
+      Then the batch summary reports a dry-run which would delete 54 files
+       And every backup root of the batch has 30 daily backup files left
+
+  Scenario: A backup root which did not change is not rotated again
+     Given a batch of 2 backup roots with 30 daily backup files each
+      When the batch is rotated with 1 processes
+       And the time bucket directories of the batch are aged by an hour
+       And the batch is rotated with 1 processes
+       And the batch is rotated with 1 processes
+      Then the first backup root of the batch is reported as unchanged
+       And the second backup root of the batch is reported as unchanged
+
+  Scenario: A backup root can be rotated without the scan index
+     Given a batch of 2 backup roots with 30 daily backup files each
+       And the first backup root of the batch does not use the scan index
+      When the batch is rotated with 1 processes
+       And the time bucket directories of the batch are aged by an hour
+       And the batch is rotated with 1 processes
+       And the batch is rotated with 1 processes
+      Then the first backup root of the batch is reported as ok
+       And the second backup root of the batch is reported as unchanged
+
+  Scenario: No backup root uses the scan index with --no-index
+     Given a batch of 2 backup roots with 30 daily backup files each
+      When the batch is rotated with 1 processes and the option --no-index
+       And the time bucket directories of the batch are aged by an hour
+       And the batch is rotated with 1 processes and the option --no-index
+       And the batch is rotated with 1 processes and the option --no-index
+      Then the first backup root of the batch is reported as ok
+       And the second backup root of the batch is reported as ok
+
+  Scenario: An unexpected error only fails its backup root
+     Given a batch of 2 backup roots with 30 daily backup files each
+       And rotating the first backup root of the batch raises a RuntimeError
+      When the batch is rotated with 1 processes
+      Then the batch summary reports 1 succeeded and 1 failed roots
+       And the first backup root of the batch is reported as failed
+       And the second backup root of the batch is reported as ok
+       And the script should exit with status 103
+
+  Scenario: An invalid batch config file is reported
+     Given a batch config file which is not JSON
+      When the batch is rotated with 1 processes
+      Then the script should exit with status 102
+
+  Scenario Outline: Options which only apply to a single backup root are refused
+     Given a batch of 1 backup roots with 30 daily backup files each
+      When the batch is rotated with 1 processes and the option <option>
+      Then the script should exit with status 2
+       And every backup root of the batch has 30 daily backup files left
+
+    Examples: Options
+      | option                   |
+      | /srv/backups             |
+      | --policy=policy.json     |
+      | --plan-out=rotation.plan |
+
+  Scenario Outline: An invalid batch config is refused
+     Given a batch config file holding <config>
+      When the batch is rotated with 1 processes
+      Then the script should exit with status 102
+
+    Examples: Configs
+      | config                                                                          |
+      | {"roots": {}}                                                                   |
+      | {"roots": ["/srv/backups"]}                                                     |
+      | {"roots": [{"pattern": "*.tgz"}]}                                               |
+      | {"roots": [{"backup_root": "/srv/backups"}]}                                    |
+      | {"roots": [{"backup_root": "/srv/backups", "pattern": "*", "ensure_free": "lots"}]} |
+      | {"roots": [{"backup_root": "/srv/backups", "pattern": "*", "time_buckets": []}]}    |
+      | {"roots": [{"backup_root": "/srv/backups", "pattern": "*", "time_buckets": {"daily": 3}}]} |
+
+  Scenario Outline: The settings of a backup root must have the right type
+     Given a batch config file holding {"defaults": {"pattern": "*.tgz"}, "roots": [{"backup_root": "/srv/a", <setting>}]}
+      When the batch config file is loaded
+      Then the batch config was refused as "<reason>"
+
+    Examples: Settings
+      | setting                  | reason                                                 |
+      | "include": "*.tgz"       | the "include" of the root "/srv/a" must be a list of globs |
+      | "exclude": ["*.tmp", 1]  | the "exclude" of the root "/srv/a" must be a list of globs |
+      | "pattern": ["*.tgz"]     | the "pattern" of the root "/srv/a" must be a string    |
+      | "durable": "false"       | the "durable" of the root "/srv/a" must be true or false |
+      | "index": 0               | the "index" of the root "/srv/a" must be true or false |
+      | "jobs": "4"              | the "jobs" of the root "/srv/a" must be a positive integer |
+      | "scan_jobs": 0           | the "scan_jobs" of the root "/srv/a" must be a positive integer |
+      | "jobs": true             | the "jobs" of the root "/srv/a" must be a positive integer |
+
+  Scenario: The backup root of a batch root must be a string
+     Given a batch config file holding {"roots": [{"backup_root": ["/srv/a"], "pattern": "*"}]}
+      When the batch config file is loaded
+      Then the batch config was refused as "the "backup_root" of the root ["/srv/a"] must be a string"
+
+  Scenario Outline: A backup root and a pattern are required without a batch
+      When the backup script is executed with only the arguments "<arguments>"
+      Then the script should exit with status 2
+
+    Examples:
+      | arguments |
+      | {root}    |
+      | -d        |
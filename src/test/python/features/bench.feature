@@ -0,0 +1,75 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+Feature: Benchmark
+  Scenario: In-memory benchmark plans match the reference implementation
+      When the benchmark is run for 5000 files in memory
+      Then the benchmark plan matches the reference implementation
+       And the benchmark reports the scan, plan and effect times
+
+  Scenario: Local benchmark plans match the reference implementation
+      When the benchmark is run for 2000 files on disk
+      Then the benchmark plan matches the reference implementation
+       And the benchmark counted at most 1 stat call per backup file scanned
+
+  Scenario: Importing the package leaves the heavier modules unloaded
+      When the startup benchmark is run
+      Then importing backup_rotation loaded none of argparse, dateutil, sqlite3, json, concurrent.futures, tempfile, fnmatch
+       And the startup benchmark reports the import time of backup_rotation.cli
+       And the dry run of the command stayed within its time and loaded none of numpy, boto3, backup_rotation.objectstore, backup_rotation.executor, backup_rotation.transfer
+
+  Scenario: Only the cli module is imported as an attribute of the package
+      Then the cli module can be used as an attribute of the package
+       And the package has no attribute named "climate"
+
+  Scenario: The benchmark compares plans from the command line
+      When the benchmark command is run with "--sizes 300,500 --backend memory --no-numpy"
+      Then the benchmark command exited with status 0
+       And the benchmark command printed 2 lines containing "plan matches the reference"
+
+  Scenario: The benchmark prints JSON
+      When the benchmark command is run with "--sizes 300 --backend memory --json"
+      Then the benchmark command exited with status 0
+       And the benchmark command printed the JSON of 1 benchmark matching the reference
+
+  Scenario: The startup benchmark runs from the command line
+      When the benchmark command is run with "--startup"
+      Then the benchmark command exited with status 0
+       And the benchmark command printed 3 lines containing "modules loaded"
+
+  Scenario: The startup benchmark fails once the dry run takes too long
+      When the benchmark command is run with "--startup --max-dry-run-ms 0.001"
+      Then the benchmark command exited with status 1
+       And the benchmark command reported the dry run as "REGRESSED"
+
+  Scenario: The instrumented backend records the scan of a rotation
+     Given 30 daily backup files in memory
+      When the in-memory backups are rotated through the instrumented backend
+      Then 3 daily backup files remain in memory
+       And the instrumented backend recorded 30 daily backup files
+
+  Scenario: Files promoted then rotated out in one run match the reference
+     Given 400 daily backup files in memory
+      When the in-memory backups are rotated through the instrumented backend
+      Then 3 monthly backup files remain in memory
+       And the plan of the rotation matches the reference implementation
@@ -0,0 +1,125 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+Feature: Backup Catalog
+  Scenario: Each backup file is stat'ed at most once
+     Given 364 daily backup files
+      When the backup script is executed while counting stat calls
+      Then each daily backup file was stat'ed at most once
+       And only the 3 most recent daily backup files remain
+       And only the 3 most recent monthly backup files remain
+
+  Scenario: Files which do not match the pattern are never stat'ed
+     Given 5 daily backup files
+       And 4 daily miscellaneous files
+      When the backup script is executed while counting stat calls
+      Then no daily miscellaneous file was stat'ed
+       And all daily miscellaneous files remain
+
+  Scenario: Backup files in subdirectories are rotated with the others
+     Given daily files of the ages
+       | name                     | days |
+       | 1.backup.txt             | 1    |
+       | a/2.backup.txt           | 2    |
+       | a/b/3.backup.txt         | 3    |
+       | a/4.backup.txt           | 4    |
+       | a/b/5.backup.txt         | 5    |
+      When the backup script is executed
+      Then the daily files left are
+       | name                     |
+       | 1.backup.txt             |
+       And the daily/a files left are
+       | name                     |
+       | 2.backup.txt             |
+       And the daily/a/b files left are
+       | name                     |
+       | 3.backup.txt             |
+
+  Scenario: Subdirectories which did not change are read from the scan index
+     Given 5 daily backup files
+       And daily files of the ages
+       | name                     | days |
+       | a/1.backup.txt           | 1    |
+       | a/2.backup.txt           | 2    |
+      When the backup script is executed
+       And every directory of the backup root is aged by an hour
+       And the backup script is executed
+       And a new daily backup file arrives
+       And the backup script is executed while counting stat calls
+      Then the daily directory was listed once
+       And the daily/a directory was listed 0 times
+
+  Scenario: Symlinked directories are not scanned
+     Given 5 daily backup files
+       And a directory outside the backup root with 5 old backup files is linked as daily/elsewhere
+      When the backup script is executed
+      Then the directory outside the backup root still holds 5 backup files
+
+  Scenario Outline: A directory which cannot be read is skipped
+     Given 5 daily backup files
+       And daily files of the ages
+       | name                     | days |
+       | locked/1.backup.txt      | 10   |
+       | locked/2.backup.txt      | 20   |
+       And <operation> the daily/locked directory fails with PermissionError
+      When the backup script is executed with the arguments "--scan-jobs <jobs>"
+      Then the daily files left are
+       | name                     |
+       | 0..backup.txt            |
+       | 1..backup.txt            |
+       | 2..backup.txt            |
+       And the daily/locked files left are
+       | name                     |
+       | 1.backup.txt             |
+       | 2.backup.txt             |
+
+    Examples:
+      | operation | jobs |
+      | listing   | 1    |
+      | stat'ing  | 1    |
+      | listing   | 4    |
+
+  Scenario: A backup file which cannot be stat'ed is skipped
+     Given 5 daily backup files
+       And the daily backup file 4..backup.txt cannot be stat'ed while scanning
+      When the backup script is executed internally
+      Then the daily files left are
+       | name                     |
+       | 0..backup.txt            |
+       | 1..backup.txt            |
+       | 2..backup.txt            |
+       | 4..backup.txt            |
+
+  Scenario: A backup file which cannot tell whether it is a directory is still rotated
+     Given 5 daily backup files
+       And the daily backup file 4..backup.txt cannot tell whether it is a directory
+      When the backup script is executed internally
+      Then the daily files left are
+       | name                     |
+       | 0..backup.txt            |
+       | 1..backup.txt            |
+       | 2..backup.txt            |
+
+  Scenario: Catalog entries are shown with their metadata
+     Given a catalog entry of daily/1.tgz modified at 1592179200000000000
+      Then the catalog entry is shown as CatalogEntry('daily/1.tgz', mtime_ns=1592179200000000000, size=100, inode=7, device=1, links=2)
@@ -0,0 +1,89 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+Feature: Columnar Planning
+  Scenario Outline: Backups are planned like the reference
+     Given <num> daily backup files in memory a minute apart until 2020-07-01
+      When the in-memory backups are planned <how>
+      Then the plan matches the reference
+
+    Examples: Planning
+      | num   | how           |
+      | 12000 | without NumPy |
+      | 12000 | with NumPy    |
+
+  Scenario Outline: Backups across the end of daylight saving time are planned like the reference
+     Given the local time zone is America/New_York
+       And <num> daily backup files in memory a minute apart until 2020-11-03
+      When the in-memory backups are planned <how>
+      Then the plan matches the reference
+
+    Examples: Planning
+      | num   | how           |
+      | 3000  | without NumPy |
+      | 12000 | without NumPy |
+      | 12000 | with NumPy    |
+
+  Scenario: NumPy computes the same time keys as datetime
+     Given NumPy is installed
+       And the local time zone is Europe/London
+      When the time keys of 20000 modification times around 2020-10-25 are computed with NumPy
+      Then they are the time keys datetime computes
+
+  Scenario Outline: NumPy plans the same as the array.array
+     Given NumPy is installed
+       And the local time zone is <zone>
+       And <num> daily backup files in memory a minute apart until <date>
+      When the in-memory backups are planned with NumPy
+      Then the plan is the same as without NumPy
+
+    Examples: Planning
+      | zone             | num   | date       |
+      | UTC              | 12000 | 2020-07-01 |
+      | America/New_York | 30000 | 2020-11-03 |
+
+  Scenario: Backups are planned without NumPy when it cannot be imported
+     Given NumPy cannot be imported
+       And 12000 daily backup files in memory a minute apart until 2020-07-01
+      When the in-memory backups are planned with NumPy where it can be imported
+      Then the plan matches the reference
+
+  Scenario Outline: A file table holds its files in columns
+      When a file table is made <how> of the entries
+       | path                  | size | inode |
+       | daily/a/1.backup.txt  | 100  | 1     |
+       | daily/b/2.backup.txt  | 200  | 2     |
+       | daily/a/3.backup.txt  | 300  | 3     |
+       | daily/b/2-copy.txt    | 200  | 2     |
+      Then the file table has the directories "daily/a/" and "daily/b/"
+       And the file table has the paths of the entries
+       And the total size of the file table is 600
+       And a catalog of the file table has the entries of the paths
+       And a catalog of the file table has no entry for "daily/c/1.backup.txt"
+
+    Examples: Tables
+      | how           |
+      | without NumPy |
+      | with NumPy    |
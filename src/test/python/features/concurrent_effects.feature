@@ -0,0 +1,52 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+Feature: Concurrent Effects
+  Scenario: Deletions on a slow remote backend run concurrently
+     Given 30 daily backup files in memory
+      When the in-memory backups are rotated through a remote backend with 8 jobs
+      Then 3 daily backup files remain in memory
+       And the remote backend had between 2 and 8 requests in flight at once
+
+  Scenario: A failed promotion neither aborts the run nor loses its source
+     Given 30 daily backup files in memory
+       And the remote backend fails to create "monthly/29.backup.txt"
+      When the in-memory backups are rotated through a remote backend with 4 jobs
+      Then the rotation reported 1 failure
+       And 4 daily backup files remain in memory
+       And 0 monthly backup files remain in memory
+       And 1 yearly backup file remains in memory
+
+  Scenario: A failed deletion does not abort the run
+     Given 30 daily backup files in memory
+       And the remote backend fails to delete "daily/10.backup.txt"
+      When the in-memory backups are rotated through a remote backend with 4 jobs
+      Then the rotation reported 1 failure
+       And 4 daily backup files remain in memory
+
+  Scenario: Local backups are rotated with several jobs
+     Given 364 daily backup files
+      When the backup script is executed with 4 jobs
+      Then only the 3 most recent daily backup files remain
+       And only the 3 most recent monthly backup files remain
+       And only the most recent yearly backup file remains
@@ -0,0 +1,46 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+Feature: Concurrent Scanning
+  Scenario: Scanning the time buckets concurrently plans the same rotation
+     Given 364 daily backup files
+       And the daily backup files are spread over 12 subdirectories
+       And 40 monthly backup files
+      When the backups are planned with 1 scan job
+       And the backups are planned with 4 scan jobs
+      Then the plans are the same
+       And the same number of stat calls were counted
+
+  Scenario: Backups are rotated with concurrent scanning
+     Given 364 daily backup files
+      When the backup script is executed with the arguments "--scan-jobs 4"
+      Then only the 3 most recent daily backup files remain
+       And only the 3 most recent monthly backup files remain
+
+  Scenario: The time buckets of a slow remote backend are scanned at once
+     Given 30 daily backup files in memory
+      When the in-memory backups are rotated through a remote backend scanning with 3 jobs
+      Then 3 daily backup files remain in memory
+       And the remote backend had between 3 and 3 requests in flight at once
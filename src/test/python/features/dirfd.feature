@@ -0,0 +1,42 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+Feature: Directory Relative Operations
+  Scenario: Each directory is opened once per rotation
+     Given 364 daily backup files
+      When the backups are rotated while counting the directories opened
+      Then each time bucket directory was opened once
+       And only the 3 most recent daily backup files remain
+
+  Scenario: Deletions apply to the directory scanned even if it is replaced
+     Given 30 daily backup files
+      When the backups are rotated while the daily directory is replaced before deleting
+      Then the replaced daily directory has 3 backup files left
+       And the new daily directory was left alone
+
+  Scenario: Directories beyond the most kept open are used by their path
+     Given 30 daily backup files
+      When the backups are rotated keeping at most 1 directory open
+      Then at most 1 directory was open at once
+       And only the 3 most recent daily backup files remain
@@ -0,0 +1,61 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+Feature: Durable Rotations
+  Scenario: Each directory is synced once, links before deletions
+     Given 364 daily backup files
+      When the backup script is executed with the arguments "--durable" while recording the file system operations
+      Then only the 3 most recent daily backup files remain
+       And only the 3 most recent monthly backup files remain
+       And the operations were links, directory syncs, unlinks and directory syncs
+       And the monthly directory was synced 1 time
+       And the yearly directory was synced 1 time
+       And the daily directory was synced 1 time
+
+  Scenario: Directories are synced by their path without directory descriptors
+     Given 364 daily backup files
+       And directory descriptors are unsupported
+      When the backup script is executed with the arguments "--durable" while recording the file system operations
+      Then only the 3 most recent daily backup files remain
+       And only the 3 most recent monthly backup files remain
+       And the monthly directory was synced 1 time
+       And the yearly directory was synced 1 time
+       And the daily directory was synced 1 time
+
+  Scenario: Directory syncs are reported in the statistics
+     Given 364 daily backup files
+      When the backup script is executed durably while writing statistics
+      Then the statistics report 3 directories synced
+
+  Scenario: Nothing is synced unless the rotation is durable
+     Given 364 daily backup files
+      When the backup script is executed while recording the file system operations
+      Then no directory was synced
+
+  Scenario: Promoted files are not deleted when their links cannot be synced
+     Given 40 daily backup files
+      When the backup script is executed with the arguments "--durable" while directory syncs fail
+      Then the script should exit with status 101
+       And the daily time bucket holds 5 backups
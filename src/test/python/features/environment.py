@@ -25,6 +25,7 @@
 import logging
 import tempfile
 import os
+import unittest.mock
 import backup_rotation as br
 
 # Load the script we're testing
@@ -44,5 +45,7 @@ def before_scenario(context, _):
         context.created_files[bucket] = {"backup": [], "miscellaneous": []}
 
 def after_scenario(context, _):
-    """ Cleans up the temporary directories created during the tests. """
+    """ Cleans up the temporary directories created during the tests, once
+        the functions the scenario patched work again. """
+    unittest.mock.patch.stopall()
     context.backup_root_raw.cleanup()
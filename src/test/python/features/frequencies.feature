@@ -0,0 +1,62 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+Feature: Calendar Frequencies
+  Scenario Outline: Frequencies step through the calendar like relativedelta
+     Given the <frequency> frequency
+      Then <moment> plus <periods> periods is the same as with relativedelta
+       And <moment> minus <periods> periods is the same as with relativedelta
+
+    Examples:
+      | frequency | moment                     | periods |
+      | daily     | 2020-02-28 13:45:10.250000 | 1       |
+      | daily     | 2020-12-31 23:59:59.999999 | 3       |
+      | monthly   | 2020-01-31 12:00:00        | 1       |
+      | monthly   | 2020-03-31 00:00:00        | 2       |
+      | monthly   | 2019-12-15 08:30:00        | 13      |
+      | yearly    | 2020-02-29 18:00:00        | 1       |
+      | yearly    | 2021-02-28 00:00:01        | 4       |
+      | yearly    | 2020-06-15 00:00:00        | 0       |
+
+  Scenario Outline: Boundaries are computed once per period
+     Given the frequency <frequency>
+      Then the boundaries of <moment> and <other> are the same as with datetimes
+       And the boundaries are computed <count> times
+
+    Examples:
+      | frequency                   | moment                     | other                      | count |
+      | daily                       | 2020-02-28 13:45:10.250000 | 2020-02-28 23:59:59.999999 | 1     |
+      | monthly                     | 2020-01-31 12:00:00        | 2020-01-31 00:00:00.000001 | 1     |
+      | yearly                      | 2020-02-29 18:00:00        | 2020-02-29 06:00:00        | 1     |
+      | 15m                         | 2020-06-15 10:07:30.500000 | 2020-06-15 10:07:59        | 1     |
+      | 6h                          | 2020-06-15 10:07:30        | 2020-06-15 10:59:00.750000 | 1     |
+      | 15m                         | 2020-06-15 10:07:30        | 2020-06-15 10:08:00        | 2     |
+      | relativedelta(months=1)     | 2020-01-31 12:00:00        | 2020-01-31 12:00:00.500000 | 2     |
+      | relativedelta(microsecond=0, second=0) | 2020-06-15 10:07:30.500000 | 2020-06-15 10:07:00 | 1 |
+
+  Scenario: Frequencies are values
+     Given the monthly frequency
+      Then the frequency equals and hashes like the same calendar delta
+       And the frequency differs from the daily frequency and from text
+       And the frequency cannot be added to a number nor multiplied by 1.5
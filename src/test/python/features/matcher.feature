@@ -0,0 +1,145 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+Feature: Include and Exclude Globs
+  Scenario: Several kinds of backups are rotated together
+     Given daily files of the ages
+       | name           | days |
+       | 1.tgz          | 1    |
+       | 2.sql.zst      | 2    |
+       | 3.tgz          | 3    |
+       | 4.sql.zst      | 4    |
+       | 5.tgz          | 5    |
+       | 6.tgz.partial  | 6    |
+       | notes.txt      | 7    |
+      When the backup script is executed with the arguments "--include *.tgz --include *.sql.zst --exclude *.partial" while counting stat calls
+      Then the daily files left are
+       | name           |
+       | 1.tgz          |
+       | 2.sql.zst      |
+       | 3.tgz          |
+       | 6.tgz.partial  |
+       | notes.txt      |
+       And the daily files "6.tgz.partial, notes.txt" were not stat'ed
+
+  Scenario: Globs which fix more than the end of a name are rotated with the others
+     Given daily files of the ages
+       | name                 | days |
+       | 1.tgz                | 1    |
+       | backup-2.sql         | 2    |
+       | 3.sql.1              | 3    |
+       | 4.tgz                | 4    |
+       | backup-5.sql         | 5    |
+       | 6.sql.2              | 6    |
+       | backup-7.sql.partial | 7    |
+       | notes.sql            | 8    |
+       | 9.sql.x              | 9    |
+      When the backup script is executed with the arguments "--include *.tgz --include backup-*.sql --include *.sql.[0-9] --exclude *.partial"
+      Then the daily files left are
+       | name                 |
+       | 1.tgz                |
+       | backup-2.sql         |
+       | 3.sql.1              |
+       | backup-7.sql.partial |
+       | notes.sql            |
+       | 9.sql.x              |
+
+  Scenario: A time bucket's globs may all fix more than the end of a name
+     Given daily files of the ages
+       | name                 | days |
+       | backup-1.tgz         | 1    |
+       | backup-2.tgz         | 2    |
+       | backup-3.tgz         | 3    |
+       | backup-4.tgz         | 4    |
+       | notes.tgz            | 5    |
+      When the backup script is executed with the arguments "--bucket-include daily backup-*.tgz"
+      Then the daily files left are
+       | name                 |
+       | backup-1.tgz         |
+       | backup-2.tgz         |
+       | backup-3.tgz         |
+       | notes.tgz            |
+
+  Scenario: A time bucket may include every file
+     Given daily files of the ages
+       | name                 | days |
+       | 1.tgz                | 1    |
+       | 2.sql                | 2    |
+       | 3.txt                | 3    |
+       | 4.tgz                | 4    |
+       | 5.tgz.partial        | 5    |
+      When the backup script is executed with the arguments "--bucket-include daily * --exclude *.partial"
+      Then the daily files left are
+       | name                 |
+       | 1.tgz                |
+       | 2.sql                |
+       | 3.txt                |
+       | 5.tgz.partial        |
+
+  Scenario: Matchers are values
+     Given a matcher including "*.tgz backup-*.sql" and excluding "*.partial"
+      Then the matcher equals and hashes like a matcher of the same globs
+       And the matcher differs from a matcher of other globs and from text
+       And the matcher is shown as NameMatcher(include=['*.tgz', 'backup-*.sql'], exclude=['*.partial'])
+
+  Scenario: A time bucket has globs of its own
+     Given daily files of the ages
+       | name           | days |
+       | 1.sql.zst      | 1    |
+       | 2.sql.zst      | 2    |
+       | 3.sql.zst      | 3    |
+       | 4.sql.zst      | 4    |
+       | 5.tgz          | 5    |
+       | 6.tgz          | 6    |
+       | 7.tgz          | 7    |
+       | 8.tgz          | 8    |
+      When the backup script is executed with the arguments "--include *.tgz --bucket-include daily *.sql.zst" while counting stat calls
+      Then the daily files left are
+       | name           |
+       | 1.sql.zst      |
+       | 2.sql.zst      |
+       | 3.sql.zst      |
+       | 5.tgz          |
+       | 6.tgz          |
+       | 7.tgz          |
+       | 8.tgz          |
+
+  Scenario: Excluded directories are not listed
+     Given 5 daily backup files
+       And daily files of the ages
+       | name                            | days |
+       | incoming.partial/1.backup.txt   | 1    |
+       | incoming.partial/2.backup.txt   | 2    |
+      When the backup script is executed with the arguments "--exclude *.partial" while counting stat calls
+      Then the daily/incoming.partial directory was listed 0 times
+       And the daily/incoming.partial files left are
+       | name           |
+       | 1.backup.txt   |
+       | 2.backup.txt   |
+
+  Scenario: A time bucket which does not exist is refused
+     Given 5 daily backup files
+      When the backup script is executed with the arguments "--bucket-include weekly *.tgz"
+      Then the script should exit with status 2
@@ -0,0 +1,148 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+Feature: Object Store Backend
+  Scenario: Backups in an object store are rotated
+     Given 1100 daily backup objects in a fake object store
+      When the backup objects are rotated
+      Then 3 daily backup objects remain in the object store
+       And 3 monthly backup objects remain in the object store
+       And 3 yearly backup objects remain in the object store
+       And the object store received 2 DeleteObjects requests
+       And the object store received 0 DeleteObject requests
+
+  Scenario: Promoted copies keep the modification time of the original
+     Given 364 daily backup objects in a fake object store
+      When the backup objects are rotated
+       And the backup objects are rotated again
+      Then the object store received 0 CopyObject requests
+       And the object store received 0 HeadObject requests
+       And 3 monthly backup objects remain in the object store
+       And the monthly backup objects keep the modification times of their originals
+
+  Scenario: Every run HEADs only the objects which may be promoted copies
+     Given 364 daily backup objects in a fake object store
+      When the backup objects are rotated
+       And the backup objects are rotated again by a new backend
+      Then the object store received 0 CopyObject requests
+       And the object store received 4 HeadObject requests
+       And 3 monthly backup objects remain in the object store
+       And 1 yearly backup object remains in the object store
+       And the monthly backup objects keep the modification times of their originals
+
+  Scenario: Listings are paginated and run concurrently
+     Given 60 daily backup objects in a fake object store across 6 hosts
+       And the object store lists 4 keys per page
+      When the backup objects are rotated
+      Then 3 daily backup objects remain in the object store
+       And the object store received 22 ListObjectsV2 requests
+       And the object store had several requests in flight at once
+
+  Scenario: Objects which cannot be deleted are reported
+     Given 30 daily backup objects in a fake object store
+       And the object store fails to delete "daily/20.backup.txt"
+      When the backup objects are rotated
+      Then 4 daily backup objects remain in the object store
+       And the rotation reported 1 failure
+
+  Scenario: A batch the object store fails to delete is reported whole
+     Given 30 daily backup objects in a fake object store
+       And the object store fails to delete objects in batches
+      When the backup objects are rotated
+      Then 30 daily backup objects remain in the object store
+       And the rotation reported 27 failures
+
+  Scenario: Objects too large for CopyObject are copied in parts
+     Given 30 daily backup objects of 6 GiB in a fake object store
+      When the backup objects are rotated
+      Then 3 daily backup objects remain in the object store
+       And 1 monthly backup object remains in the object store
+       And the monthly backup objects keep the modification times of their originals
+
+  Scenario: An object store without the bucket has no backup root
+     Given 30 daily backup objects in a fake object store
+      When the backup objects of the bucket "other" are rotated
+      Then a BackupRootFolderMissingException should have been raised
+       And 30 daily backup objects remain in the object store
+
+  Scenario: An object deleted after it was scanned is not copied
+     Given 30 daily backup objects in a fake object store
+      When the object store backend is asked to stat "nightly/daily/0.backup.txt"
+       And the object "nightly/daily/0.backup.txt" is deleted behind the backend
+       And the object store backend is asked to link "nightly/daily/0.backup.txt nightly/monthly/0.backup.txt"
+      Then the backend raised FileNotFoundError
+
+  Scenario Outline: The object store backend answers each operation
+     Given 30 daily backup objects in a fake object store
+       And the object store fails to delete "daily/1.backup.txt"
+      When the object store backend is asked to <operation> "<arguments>"
+      Then the backend <outcome>
+
+    Examples:
+      | operation   | arguments                                            | outcome                  |
+      | make_bucket | weekly                                               | returned None            |
+      | stat        | nightly/daily/99.backup.txt                          | raised FileNotFoundError |
+      | link        | nightly/daily/2.backup.txt nightly/daily/3.backup.txt | raised FileExistsError   |
+      | delete      | nightly/daily/2.backup.txt                           | returned None            |
+      | delete      | nightly/daily/1.backup.txt                           | raised OSError           |
+
+  Scenario Outline: Errors of the object store client are told apart
+     Given 30 daily backup objects in a fake object store
+       And the object store client fails with <error>
+      When the object store backend is asked to stat "nightly/daily/2.backup.txt"
+      Then the backend raised <raised>
+
+    Examples:
+      | error                   | raised               |
+      | a ClientError 404       | FileNotFoundError    |
+      | a ClientError SlowDown  | OSError              |
+      | a botocore error        | OSError              |
+      | a ConnectionResetError  | ConnectionResetError |
+      | a RuntimeError          | RuntimeError         |
+
+  Scenario: The fake object store refuses to delete too many objects at once
+     Given 30 daily backup objects in a fake object store
+      When the object store backend is asked to delete 1001 objects at once
+      Then the backend raised OSError
+
+  Scenario: Backups in an object store are rotated from the command line
+     Given 30 daily backup objects in a fake object store
+       And boto3 makes clients of the fake object store
+      When the backup script is executed with only the arguments "s3://backups/nightly *.backup.txt"
+      Then 3 daily backup objects remain in the object store
+       And the fake object store client was made for the endpoint None
+
+  Scenario Outline: Object stores the command line cannot use are refused
+     Given 30 daily backup objects in a fake object store
+       And boto3 <boto3>
+      When the backup script is executed with only the arguments "<arguments>"
+      Then <outcome>
+       And 30 daily backup objects remain in the object store
+
+    Examples:
+      | boto3                                        | arguments                                 | outcome                                                    |
+      | makes clients of the fake object store       | s3://backups/nightly *.backup.txt --watch | the script should exit with status 2                       |
+      | makes clients of the fake object store       | s3:///nightly *.backup.txt                | the object store was reported unavailable: no bucket       |
+      | cannot be imported                           | s3://backups/nightly *.backup.txt         | the object store was reported unavailable: boto3 is not installed |
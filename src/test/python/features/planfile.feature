@@ -0,0 +1,241 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+Feature: Plan Files
+  Scenario: A plan is written without changing anything
+     Given daily files of the ages
+       | name           | days |
+       | 1.backup.txt   | 1    |
+       | 2.backup.txt   | 2    |
+       | 3.backup.txt   | 3    |
+       | 4.backup.txt   | 4    |
+       | 5.backup.txt   | 5    |
+      When the rotation is planned to rotation.plan
+      Then the plan rotation.plan describes 2 promotions and 2 deletions
+       And the daily files left are
+       | name           |
+       | 1.backup.txt   |
+       | 2.backup.txt   |
+       | 3.backup.txt   |
+       | 4.backup.txt   |
+       | 5.backup.txt   |
+
+  Scenario: A plan is applied without scanning the time buckets
+     Given daily files of the ages
+       | name           | days |
+       | 1.backup.txt   | 1    |
+       | 2.backup.txt   | 2    |
+       | 3.backup.txt   | 3    |
+       | 4.backup.txt   | 4    |
+       | 5.backup.txt   | 5    |
+      When the rotation is planned to rotation.plan
+       And the plan rotation.plan is applied while counting stat calls
+      Then the daily files left are
+       | name           |
+       | 1.backup.txt   |
+       | 2.backup.txt   |
+       | 3.backup.txt   |
+       And the monthly files left are
+       | name           |
+       | 5.backup.txt   |
+       And the yearly files left are
+       | name           |
+       | 5.backup.txt   |
+       And the daily directory was listed 0 times
+
+  Scenario: Files changed since they were planned are left alone
+     Given daily files of the ages
+       | name           | days |
+       | 1.backup.txt   | 1    |
+       | 2.backup.txt   | 2    |
+       | 3.backup.txt   | 3    |
+       | 4.backup.txt   | 4    |
+       | 5.backup.txt   | 5    |
+      When the rotation is planned to rotation.plan
+       And the daily file 4.backup.txt is rewritten
+       And the plan rotation.plan is applied
+      Then the daily files left are
+       | name           |
+       | 1.backup.txt   |
+       | 2.backup.txt   |
+       | 3.backup.txt   |
+       | 4.backup.txt   |
+       And the plan skipped 1 actions
+
+  Scenario: A plan is applied once
+     Given daily files of the ages
+       | name           | days |
+       | 1.backup.txt   | 1    |
+       | 2.backup.txt   | 2    |
+       | 3.backup.txt   | 3    |
+       | 4.backup.txt   | 4    |
+       | 5.backup.txt   | 5    |
+      When the rotation is planned to rotation.plan
+       And the plan rotation.plan is applied
+       And the plan rotation.plan is applied
+      Then the monthly files left are
+       | name           |
+       | 5.backup.txt   |
+       And the plan skipped 0 actions
+
+  Scenario: Files which cannot be stat'ed are left alone
+     Given daily files of the ages
+       | name           | days |
+       | 1.backup.txt   | 1    |
+       | 2.backup.txt   | 2    |
+       | 3.backup.txt   | 3    |
+       | 4.backup.txt   | 4    |
+       | 5.backup.txt   | 5    |
+      When the rotation is planned to rotation.plan
+       And stat'ing the daily file 4.backup.txt fails with EACCES
+       And the plan rotation.plan is applied
+      Then the daily files left are
+       | name           |
+       | 1.backup.txt   |
+       | 2.backup.txt   |
+       | 3.backup.txt   |
+       | 4.backup.txt   |
+       And the plan skipped 1 actions
+
+  Scenario: Promotions are made when their target cannot be stat'ed
+     Given daily files of the ages
+       | name           | days |
+       | 1.backup.txt   | 1    |
+       | 2.backup.txt   | 2    |
+       | 3.backup.txt   | 3    |
+       | 4.backup.txt   | 4    |
+       | 5.backup.txt   | 5    |
+      When the rotation is planned to rotation.plan
+       And stat'ing the monthly file 5.backup.txt fails with EIO
+       And the plan rotation.plan is applied
+      Then the monthly files left are
+       | name           |
+       | 5.backup.txt   |
+       And the plan skipped 0 actions
+
+  Scenario: A plan whose deletions failed completes when applied again
+     Given daily files of the ages
+       | name           | days |
+       | 1.backup.txt   | 1    |
+       | 2.backup.txt   | 2    |
+       | 3.backup.txt   | 3    |
+       | 4.backup.txt   | 4    |
+       | 5.backup.txt   | 5    |
+      When the rotation is planned to rotation.plan
+       And the plan rotation.plan is applied while deletions fail
+      Then the script should exit with status 101
+       And all daily backup files remain
+      When the plan rotation.plan is applied
+      Then the daily files left are
+       | name           |
+       | 1.backup.txt   |
+       | 2.backup.txt   |
+       | 3.backup.txt   |
+       And the monthly files left are
+       | name           |
+       | 5.backup.txt   |
+       And the plan created 0 links
+
+  Scenario: A promotion onto another file fails and keeps its original
+     Given daily files of the ages
+       | name           | days |
+       | 1.backup.txt   | 1    |
+       | 2.backup.txt   | 2    |
+       | 3.backup.txt   | 3    |
+       | 4.backup.txt   | 4    |
+       | 5.backup.txt   | 5    |
+      When the rotation is planned to rotation.plan
+       And the monthly file 5.backup.txt is created
+       And the plan rotation.plan is applied
+      Then the script should exit with status 101
+       And the daily files left are
+       | name           |
+       | 1.backup.txt   |
+       | 2.backup.txt   |
+       | 3.backup.txt   |
+       | 5.backup.txt   |
+
+  Scenario: A plan is not applied without the backup root
+     Given the backup root does not exist
+      When the plan rotation.plan is applied
+      Then the script should exit with status 100
+
+  Scenario: An invalid plan is rejected
+     Given a plan rotation.plan holding
+       """
+       {"plan_version": 1, "backup_root": "/elsewhere"}
+
+       {"action": "delete", "bucket": "daily", "path": "../monthly/1.tgz", "inode": 1, "size": 0, "mtime_ns": 0}
+       """
+      When the plan rotation.plan is applied
+      Then the script should exit with status 105
+
+  Scenario Outline: Plans which are not valid are rejected before any action
+     Given 5 daily backup files
+       And a plan rotation.plan with the header <header> and the action <action>
+      When the plan rotation.plan is applied internally
+      Then the plan rotation.plan was rejected as "<reason>"
+       And all daily backup files remain
+
+    Examples:
+      | header              | action                                                                                                                     | reason                                    |
+      | {"plan_version": 2} | {"action": "delete", "bucket": "daily", "path": "1.tgz", "inode": 1, "size": 0, "mtime_ns": 0}                             | unsupported plan_version 2                |
+      | [1]                 | {"action": "delete", "bucket": "daily", "path": "1.tgz", "inode": 1, "size": 0, "mtime_ns": 0}                             | line 1 is not an object                   |
+      | {"plan_version": 1} | {"action":                                                                                                                 | line 2: Expecting value                   |
+      | {"plan_version": 1} | ["delete"]                                                                                                                 | line 2 is not an object                   |
+      | {"plan_version": 1} | {"action": "delete", "bucket": "daily", "path": "1.tgz", "size": 0, "mtime_ns": 0}                                         | line 2 has no 'inode'                     |
+      | {"plan_version": 1} | {"action": "delete", "bucket": "daily", "path": "1.tgz", "inode": 1, "size": "large", "mtime_ns": 0}                       | line 2 has an invalid field               |
+      | {"plan_version": 1} | {"action": "copy", "bucket": "daily", "path": "1.tgz", "inode": 1, "size": 0, "mtime_ns": 0}                               | line 2 has an unknown action              |
+      | {"plan_version": 1} | {"action": "promote", "bucket": "daily", "path": "1.tgz", "inode": 1, "size": 0, "mtime_ns": 0}                            | line 2 has an unknown action              |
+      | {"plan_version": 1} | {"action": "delete", "bucket": "daily", "path": "1.tgz", "inode": 1, "size": 0, "mtime_ns": 0, "target_bucket": "monthly"} | line 2 has an unknown action              |
+      | {"plan_version": 1} | {"action": "delete", "bucket": "daily", "path": "/etc/1.tgz", "inode": 1, "size": 0, "mtime_ns": 0}                        | line 2 has a path outside its time bucket |
+      | {"plan_version": 1} | {"action": "delete", "bucket": "daily", "path": "../monthly/1.tgz", "inode": 1, "size": 0, "mtime_ns": 0}                  | line 2 has a path outside its time bucket |
+      | {"plan_version": 1} | {"action": "delete", "bucket": "hourly", "path": "1.tgz", "inode": 1, "size": 0, "mtime_ns": 0}                            | hourly is not a time bucket               |
+      | {"plan_version": 1} | {"action": "promote", "bucket": "daily", "path": "1.tgz", "inode": 1, "size": 0, "mtime_ns": 0, "target_bucket": "weekly"} | weekly is not a time bucket               |
+
+  Scenario: A plan file which cannot be read is rejected
+     Given 5 daily backup files
+      When the plan missing.plan is applied internally
+      Then the plan missing.plan was rejected as "No such file or directory"
+
+  Scenario: Applying a plan in a dry-run changes nothing
+     Given daily files of the ages
+       | name           | days |
+       | 1.backup.txt   | 1    |
+       | 2.backup.txt   | 2    |
+       | 3.backup.txt   | 3    |
+       | 4.backup.txt   | 4    |
+      When the rotation is planned to rotation.plan
+       And the plan rotation.plan is applied in a dry-run
+      Then the daily files left are
+       | name           |
+       | 1.backup.txt   |
+       | 2.backup.txt   |
+       | 3.backup.txt   |
+       | 4.backup.txt   |
+
+  Scenario: A plan is only applied to the backup root given
+      When the backup script is executed with only the arguments "--apply-plan {root}/rotation.plan"
+      Then the script should exit with status 2
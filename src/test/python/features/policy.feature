@@ -0,0 +1,92 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+Feature: Policy Files
+  Scenario: Hourly backups are rotated with a policy file
+     Given the policy file
+       """
+       {"time_buckets": {"hourly": {"num_files_to_keep": 3},
+                         "daily": {"num_files_to_keep": 2}}}
+       """
+       And 30 hourly backups 60 minutes apart
+      When the backup script is executed with the policy file
+      Then the hourly time bucket holds 3 backups
+       And the daily time bucket holds 2 backups
+
+  Scenario: Time buckets of a policy file have their own globs
+     Given the policy file
+       """
+       {"time_buckets": {"hourly": {"num_files_to_keep": 3,
+                                    "include": ["*.txt"],
+                                    "exclude": ["1*"]}}}
+       """
+       And 30 hourly backups 60 minutes apart
+      When the backup script is executed with the policy file
+      Then the hourly time bucket holds 14 backups
+
+  Scenario: Time buckets are processed coarsest first whatever their order
+     Given the policy file
+       """
+       {"time_buckets": {"quarter-hourly": {"frequency": "15m"},
+                         "weekly": {"num_files_to_keep": 4},
+                         "fortnightly": {"frequency": "2w"},
+                         "hourly": {},
+                         "archive": {"frequency": "monthly", "order": 1},
+                         "monthly": {}}}
+       """
+      When the backups are rotated in memory with the policy file
+      Then the time buckets were processed in the order monthly, archive, fortnightly, weekly, hourly, quarter-hourly
+
+  Scenario: Sub-hourly backups are rotated with a policy file
+     Given the policy file
+       """
+       {"time_buckets": {"quarter-hourly": {"frequency": "15m",
+                                            "num_files_to_keep": 4},
+                         "hourly": {"num_files_to_keep": 2}}}
+       """
+       And 20 quarter-hourly backups 15 minutes apart
+       And an empty hourly time bucket
+      When the backup script is executed with the policy file
+      Then the quarter-hourly time bucket holds 4 backups
+       And the hourly time bucket holds 2 backups
+
+  Scenario Outline: An invalid policy file is rejected
+     Given the policy file
+       """
+       <policy>
+       """
+      When the backup script is executed with the policy file
+      Then the script should exit with status 107
+
+    Examples:
+      | policy                                                   |
+      | {"time_buckets": {"daily": {"frequency": "fortnightly"}}} |
+      | {"time_buckets": {}}                                     |
+      | {"time_buckets": {"daily": 3}}                           |
+      | {"time_buckets": {"daily": {"num_files_to_keep": 0}}}    |
+      | {"time_buckets": {"daily": {"order": "first"}}}          |
+      | {"time_buckets":                                         |
+      | {"time_buckets": {"daily": {"include": "*.tgz"}}}        |
+      | {"time_buckets": {"daily": {"exclude": ["*.tmp", 1]}}}   |
@@ -0,0 +1,59 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+Feature: Profiling and Tracing
+  Scenario: A run can be profiled
+     Given 10 daily backup files
+      When the backup script is executed with profiling
+      Then a cProfile dump was written
+       And the profile summary reports the peak memory traced
+       And only the 3 most recent daily backup files remain
+
+  Scenario: A rotation is profiled while tracemalloc is already tracing
+     Given 10 daily backup files
+       And tracemalloc is already tracing
+      When the backup script is executed with profiling
+      Then the profile summary reports the peak memory traced
+       And only the 3 most recent daily backup files remain
+
+  Scenario: A profile which cannot be written does not fail the rotation
+     Given 10 daily backup files
+      When the backup script is executed with profiling into a missing directory
+      Then no cProfile dump was written
+       And only the 3 most recent daily backup files remain
+
+  Scenario: Span hooks trace every phase of a rotation
+     Given 30 daily backup files in memory
+      When the in-memory backups are rotated with a span hook
+      Then the span hook saw the spans
+       | span        | bucket  | files |
+       | scan_bucket | yearly  | 0     |
+       | plan_bucket | yearly  | 0     |
+       | scan_bucket | monthly | 0     |
+       | plan_bucket | monthly | 0     |
+       | scan_bucket | daily   | 30    |
+       | plan_bucket | daily   | 30    |
+       | promote     |         | 2     |
+       | delete      |         | 27    |
+       | rotate      |         |       |
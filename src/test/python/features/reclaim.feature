@@ -0,0 +1,112 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+Feature: Emergency Reclaim
+  Scenario: The oldest backups are deleted until enough space is free
+     Given 48 daily backup files of 100 bytes an hour apart on a memory volume of 10000 bytes
+      When the in-memory backups are rotated ensuring 6000 bytes free
+      Then 40 daily backup files remain in memory
+       And the memory volume has 6000 bytes free
+       And the rotation reclaimed 8 files
+
+  Scenario: The free space can be a percentage of the volume
+     Given 48 daily backup files of 100 bytes an hour apart on a memory volume of 10000 bytes
+      When the in-memory backups are rotated ensuring 60% free
+      Then 40 daily backup files remain in memory
+       And the memory volume has 6000 bytes free
+
+  Scenario: The newest backups of every time bucket are never reclaimed
+     Given 48 daily backup files of 100 bytes an hour apart on a memory volume of 10000 bytes
+      When the in-memory backups are rotated
+       And the in-memory backups are rotated ensuring 100% free
+      Then 4 daily backup files remain in memory
+       And 1 monthly backup file remains in memory
+       And 1 yearly backup file remains in memory
+       And the memory volume has 9600 bytes free
+
+  Scenario: Time buckets are kept below a size
+     Given 48 daily backup files of 100 bytes an hour apart on a memory volume of 10000 bytes
+      When the in-memory backups are rotated keeping at most 2000 bytes per time bucket
+      Then 20 daily backup files remain in memory
+       And the rotation reclaimed 28 files
+
+  Scenario: A dry-run reports what it would reclaim
+     Given 48 daily backup files of 100 bytes an hour apart on a memory volume of 10000 bytes
+      When the in-memory backups are rotated in a dry-run ensuring 6000 bytes free
+      Then 48 daily backup files remain in memory
+       And the rotation reclaimed 8 files
+
+  Scenario: Nothing is reclaimed while enough space is free
+     Given 48 daily backup files of 100 bytes an hour apart on a memory volume of 10000 bytes
+      When the in-memory backups are rotated ensuring 5000 bytes free
+      Then 48 daily backup files remain in memory
+       And the rotation reclaimed 0 files
+
+  Scenario: Nothing is reclaimed where the free space is unknown
+     Given 48 daily backup files of 100 bytes an hour apart on a memory volume of unknown size
+      When the in-memory backups are rotated ensuring 60% free
+      Then 48 daily backup files remain in memory
+       And the rotation reclaimed 0 files
+
+  Scenario: Every link to a reclaimed file is deleted
+     Given 24 daily backup files of 100 bytes an hour apart on a memory volume of 10000 bytes
+       And every daily backup file is also linked as a copy
+      When the in-memory backups are rotated ensuring 8000 bytes free
+      Then 40 daily backup files remain in memory
+       And the memory volume has 8000 bytes free
+       And the rotation reclaimed 8 files
+
+  Scenario: Space is reclaimed from a backup root which did not change
+     Given 30 daily backup files of 100 bytes an hour apart in the backup root
+      When the backup script is executed
+       And every directory of the backup root is aged by an hour
+       And the backup script is executed
+       And the backup script is executed with the option --max-bucket-bytes 400
+      Then the daily time bucket holds 4 backups
+
+  Scenario Outline: The space limits are given on the command line
+     Given 10 daily backup files
+       And every daily backup file holds 100 bytes
+      When the backup script is executed with the option --max-bucket-bytes <size>
+      Then Only the 3 most recent daily backup files remain
+
+    Examples: Sizes
+      | size  |
+      | 1K    |
+      | 1KB   |
+      | 1KiB  |
+      | 1024b |
+
+  Scenario Outline: An invalid space limit is refused
+     Given 10 daily backup files
+      When the backup script is executed with the option <option> <value>
+      Then the script should exit with status 2
+
+    Examples: Limits
+      | option             | value |
+      | --ensure-free      | lots  |
+      | --ensure-free      | 150%  |
+      | --max-bucket-bytes | 5X    |
+      | --max-bucket-bytes | -5    |
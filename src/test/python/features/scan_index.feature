@@ -0,0 +1,111 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+Feature: Scan Index
+  Scenario: An unchanged backup root is not listed again
+     Given 364 daily backup files
+      When the backup script is executed
+       And the time bucket directories are aged by an hour
+       And the backup script is executed
+       And the backup script is executed while counting stat calls
+      Then no directory was listed
+       And only the 3 most recent daily backup files remain
+       And only the 3 most recent monthly backup files remain
+
+  Scenario: Only the directories which changed are listed again
+     Given 364 daily backup files
+      When the backup script is executed
+       And the time bucket directories are aged by an hour
+       And the backup script is executed
+       And a new daily backup file arrives
+       And the backup script is executed while counting stat calls
+      Then the daily directory was listed once
+       And the monthly directory was listed 0 times
+       And the yearly directory was listed 0 times
+
+  Scenario: A full rescan can be forced
+     Given 364 daily backup files
+      When the backup script is executed
+       And the time bucket directories are aged by an hour
+       And the backup script is executed
+       And the backup script is executed with a forced rescan while counting stat calls
+      Then the daily directory was listed once
+       And the monthly directory was listed once
+       And the yearly directory was listed once
+       And only the 3 most recent daily backup files remain
+
+  Scenario: A backup root changed moments ago is listed again
+     Given 10 daily backup files
+      When the backup script is executed
+       And the backup script is executed while counting stat calls
+      Then the daily directory was listed once
+       And only the 3 most recent daily backup files remain
+
+  Scenario: A scan index recorded for another pattern is not used
+     Given 364 daily backup files
+      When the backup script is executed
+       And the time bucket directories are aged by an hour
+       And the backup script is executed
+       And the backup script is executed for the pattern *.txt while counting stat calls
+      Then the daily directory was listed once
+       And the monthly directory was listed once
+       And the yearly directory was listed once
+
+  Scenario: An unreadable scan index is ignored and rewritten
+     Given 364 daily backup files
+       And the scan index is unreadable
+      When the backup script is executed
+       And the time bucket directories are aged by an hour
+       And the backup script is executed
+       And the backup script is executed while counting stat calls
+      Then no directory was listed
+       And only the 3 most recent daily backup files remain
+
+  Scenario: A time bucket the scan index could not record is listed again
+     Given 10 daily backup files
+       And listing the monthly directory fails with PermissionError
+      When the backup script is executed
+       And the time bucket directories are aged by an hour
+       And the backup script is executed while counting stat calls
+      Then the daily directory was listed once
+
+  Scenario: A subdirectory removed without its parent changing is forgotten
+     Given 5 daily backup files
+       And daily files of the ages
+       | name                     | days |
+       | a/1.backup.txt           | 1    |
+       | a/2.backup.txt           | 2    |
+      When the backup script is executed
+       And every directory of the backup root is aged by an hour
+       And the backup script is executed
+       And the daily/a directory is removed with its backups, keeping the modification time of its parent
+       And the backup script is executed
+       And every directory of the backup root is aged by an hour
+       And the backup script is executed
+       And the backup script is executed while counting stat calls
+      Then no directory was listed
+
+  Scenario: A directory which vanished during the rotation is not trusted
+     Given a scan index recording the backup file 1.backup.txt in the directory gone
+      When the scan index is told the backup file 1.backup.txt in the directory gone was deleted
+      Then the scan index records the directory gone with no backup file and an untrusted modification time
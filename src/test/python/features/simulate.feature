@@ -0,0 +1,85 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+Feature: Retention Simulator
+  Scenario: A policy is simulated with a virtual clock
+     Given the retention policy "daily=3,monthly=3,yearly=3"
+      When 90 days of daily backups of 1G are simulated
+      Then the simulation kept 6 files of 6G
+       And the simulation stored at most 7 files of 7G
+       And the largest gap between the backups kept was 31 days
+       And the largest gap between the backups kept within a week was 1 days
+
+  Scenario: Backups rotated once a day pile up in between
+     Given the retention policy "daily=3"
+      When 10 days of hourly backups of 1G are simulated, rotated daily
+      Then the simulation stored at most 73 files of 73G
+
+  Scenario: A policy with an unknown frequency is rejected
+      When the retention policy "daily=3,fortnightly=4" is parsed
+      Then the policy was rejected for the unknown frequency fortnightly
+
+  Scenario Outline: The simulator reports the peaks and the largest gaps
+     When the simulator is run with the arguments "<arguments>"
+      Then the simulator exited with status 0
+       And the simulator printed "<summary>"
+
+    Examples:
+      | arguments                                                         | summary |
+      | --years 3 --interval 1d                                           | daily=3,monthly=3,yearly=3: peak 10 files, 10.0 GiB; kept 9 files, 9.0 GiB, the oldest 3.0 years old; largest gaps: day 1.0 days, week 1.0 days, month 27.0 days, year 273.0 days, all 1.0 years |
+      | --years 0.001 --interval 1h --rotate-every 1h --policy hourly=3   | hourly=3: peak 4 files, 4.0 GiB; kept 3 files, 3.0 GiB, the oldest 2.0 hours old; largest gaps: day 1.0 hours, week 1.0 hours, month 1.0 hours, year 1.0 hours, all 1.0 hours |
+      | --years 0.00001 --interval 30s --rotate-every 30s --policy minutely=2 | minutely=2: peak 5 files, 5.0 GiB; kept 3 files, 3.0 GiB, the oldest 1.0 minutes old; largest gaps: day 30 seconds, week 30 seconds, month 30 seconds, year 30 seconds, all 30 seconds |
+      | --years 0.01 --interval 1d --policy daily=1 --policy daily=2      | daily=1: peak 2 files, 2.0 GiB; kept 1 files, 1.0 GiB, the oldest 0 seconds old; largest gaps: day -, week -, month -, year -, all - |
+      | --years 0.01 --interval 1d --policy daily=1 --policy daily=2      | daily=2: peak 3 files, 3.0 GiB; kept 2 files, 2.0 GiB, the oldest 1.0 days old; largest gaps: day 1.0 days |
+
+  Scenario: The simulator prints its results as JSON
+     When the simulator is run with the arguments "--years 0.25 --interval 1d --size 1M --json"
+      Then the simulator exited with status 0
+       And the simulator printed the JSON of 1 simulation
+       And the simulation stored at most 7 files of 7M
+       And the simulation kept 6 files of 6M
+       And the largest gap between the backups kept was 31 days
+       And the largest gap between the backups kept within a week was 1 days
+
+  Scenario: The simulator takes policy files
+     Given the policy file
+       """
+       {"time_buckets": {"daily": {"num_files_to_keep": 7}}}
+       """
+      When the simulator is run with the policy file and the arguments "--years 0.1 --interval 1d"
+      Then the simulator exited with status 0
+       And the simulator printed "daily=7: peak 8 files, 8.0 GiB; kept 7 files, 7.0 GiB"
+
+  Scenario Outline: The simulator refuses invalid arguments
+     When the simulator is run with the arguments "<arguments>"
+      Then the simulator exited with status 2
+
+    Examples:
+      | arguments                  |
+      | --interval soon            |
+      | --rotate-every 0           |
+      | --policy daily=0           |
+      | --policy daily=many        |
+      | --policy missing.json      |
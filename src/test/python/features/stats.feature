@@ -0,0 +1,84 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+Feature: Run Statistics
+  Scenario: The counters of a rotation are written as JSON
+     Given 10 daily backup files
+      When the backup script is executed with the statistics written as JSON
+      Then the statistics report 10 files scanned in the daily bucket
+       And the statistics report 7 files deleted and 2 links created
+       And the statistics report a duration for every phase
+
+  Scenario: A rotation which changed nothing is reported as unchanged
+     Given 10 daily backup files
+      When the backup script is executed internally
+       And the time bucket directories are aged by an hour
+       And the backup script is executed internally
+       And the backup script is executed with the statistics written as JSON
+       And the backup script is executed with the statistics written for Prometheus
+      Then the statistics report the rotation as unchanged
+       And the Prometheus textfile has the sample unchanged 1
+
+  Scenario: The counters of a rotation are written for Prometheus
+     Given 10 daily backup files
+      When the backup script is executed with the statistics written for Prometheus
+      Then the Prometheus textfile has the sample files_scanned{bucket="daily"} 10
+       And the Prometheus textfile has the sample files_deleted 7
+       And the Prometheus textfile was written atomically
+
+  Scenario: Statistics which cannot be written do not fail the rotation
+     Given 10 daily backup files
+       And a directory is in the way of the Prometheus textfile
+      When the backup script is executed with the statistics written for Prometheus
+      Then only the 3 most recent daily backup files remain
+       And no temporary file of the statistics was left behind
+
+  Scenario: Deleting a link of a promoted file frees no space
+     Given 10 daily backup files
+       And every daily backup file holds 100 bytes
+      When the backup script is executed with the statistics written as JSON
+      Then the statistics report 7 files deleted and 2 links created
+       And the statistics report 6 files freed, 600 bytes reclaimed and 100 bytes unlinked
+
+  Scenario: Files linked outside the time buckets are not freed
+     Given 10 daily backup files
+       And every daily backup file holds 100 bytes
+       And every daily backup file is also linked outside the time buckets
+      When the backup script is executed with the statistics written as JSON
+      Then the statistics report 0 files freed, 0 bytes reclaimed and 700 bytes unlinked
+
+  Scenario: A dry-run reports the space it would free
+     Given 10 daily backup files
+       And every daily backup file holds 100 bytes
+      When the backup script is executed in a dry-run with the statistics written as JSON
+      Then the statistics report 6 files freed, 600 bytes reclaimed and 100 bytes unlinked
+       And the statistics report a dry-run
+       And the dry-run printed "Would delete 7 links: 6 files freed (600 bytes), 100 bytes still linked elsewhere."
+       And all daily backup files remain
+
+  Scenario: Hardlinks of a scanned file are not stat'ed again
+     Given 10 daily backup files
+      When the backup script is executed internally
+       And the backup script is executed without the index and the statistics written as JSON
+      Then the statistics report a stat call for every inode scanned
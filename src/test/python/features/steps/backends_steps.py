@@ -0,0 +1,231 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" Module containing steps used to test the storage backends of the
+    backup_rotation package """
+import ast
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+START_DATE = datetime(2020, 6, 15)
+TIMEDELTAS = {
+    "yearly":  relativedelta(years=1),
+    "monthly": relativedelta(months=1),
+    "daily":   relativedelta(days=1)
+}
+
+
+@given("{num} {bucket} backup files in memory")
+def create_num_bucket_files_in_memory(context, num, bucket):
+    """ Creates the files in an in-memory backend, each one time bucket unit
+        older than the last. """
+    context.memory_backend = context.backup_rotation.MemoryBackend()
+    for bucket_name in ["yearly", "monthly", "daily"]:
+        context.memory_backend.make_bucket(bucket_name)
+    date_to_use = START_DATE
+    for i in range(int(num)):
+        date_to_use = date_to_use - TIMEDELTAS[bucket]
+        context.memory_backend.add_file(
+            "%s/%s.backup.txt" % (bucket, i), date_to_use.timestamp())
+
+
+@given("{bucket} backup files in memory modified at")
+def create_bucket_files_in_memory_at(context, bucket):
+    """ Creates a file in an in-memory backend for every modification time
+        listed in the table, within the subdirectory listed if any. """
+    context.memory_backend = context.backup_rotation.MemoryBackend()
+    for bucket_name in ["yearly", "monthly", "daily"]:
+        context.memory_backend.make_bucket(bucket_name)
+    for i, row in enumerate(context.table):
+        mtime = datetime.strptime(row["mtime"], "%Y-%m-%d %H:%M:%S")
+        directory = bucket
+        if "subdirectory" in row.headings:
+            directory = "%s/%s" % (bucket, row["subdirectory"])
+        context.memory_backend.add_file(
+            "%s/%s.backup.txt" % (directory, i), mtime.timestamp())
+
+
+@given('the remote backend fails to {operation} "{relative_path}"')
+def remote_backend_fails(context, operation, relative_path):
+    """ Makes the remote backend fail to link to (create) or delete the file
+        at the path relative to the in-memory backup root. """
+    assert operation in ("create", "delete")
+    context.failing_paths = getattr(context, "failing_paths", set())
+    context.failing_paths.add("%s/%s" % (
+        context.memory_backend.backup_root, relative_path))
+
+
+def rotate_in_memory(context, backend, is_dry_run=False, jobs=1,
+                     **settings):
+    """ Rotates the in-memory backups with the default time buckets, and
+        any other settings of the rotator given, returning the rotator. """
+    rotator = context.backup_rotation.BackupRotator(
+        context.backup_rotation.cli.DEFAULT_TIME_BUCKETS.copy(),
+        backend=backend)
+    rotator.pattern = "*.backup.txt"
+    rotator.is_dry_run = is_dry_run
+    rotator.jobs = jobs
+    for name, value in settings.items():
+        setattr(rotator, name, value)
+    try:
+        rotator.rotate_backups()
+    except context.backup_rotation.BackupRotationException as ex:
+        context.caught_exception = ex
+    return rotator
+
+
+@when("the in-memory backups are rotated")
+def rotate_memory_backend(context):
+    """ Rotates the backups held by the in-memory backend. """
+    rotate_in_memory(context, context.memory_backend)
+
+
+@when("the in-memory backups are rotated through a remote backend")
+@when("the in-memory backups are rotated through a remote backend with "
+      "{jobs:d} jobs")
+def rotate_through_remote_backend(context, is_dry_run=False, jobs=1):
+    """ Rotates the in-memory backups through a backend which simulates the
+        latency of a remote file system. """
+    context.remote_backend = context.backup_rotation.FakeRemoteBackend(
+        context.memory_backend, latency=0.001)
+    context.remote_backend.failing_paths = \
+        getattr(context, "failing_paths", set())
+    rotate_in_memory(context, context.remote_backend, is_dry_run, jobs)
+
+
+@when("the in-memory backups are rotated through a remote backend in a "
+      "dry-run")
+def rotate_through_remote_backend_dry_run(context):
+    """ Dry-runs the rotation through the simulated remote backend. """
+    rotate_through_remote_backend(context, is_dry_run=True)
+
+
+@then("{num} {bucket} backup files remain in memory")
+@then("{num} {bucket} backup file remains in memory")
+def num_files_remain_in_memory(context, num, bucket):
+    """ Verifies the number of files left in the in-memory bucket. """
+    found = context.memory_backend.list_files(bucket)
+    assert len(found) == int(num), \
+        "Found %s files in %s, expected %s" % (len(found), bucket, num)
+
+
+@then("the remote backend received {num} {kind} requests")
+def remote_backend_received_requests(context, num, kind):
+    """ Verifies the number of requests of a kind the remote backend saw. """
+    assert context.remote_backend.calls[kind] == int(num), \
+        "Received %s %s requests, expected %s" % (
+            context.remote_backend.calls[kind], kind, num)
+
+
+@then("the {bucket} backup files in memory were modified at")
+def bucket_files_in_memory_modified_at(context, bucket):
+    """ Verifies the modification times of the files left in the in-memory
+        bucket against those listed in the table. """
+    found = sorted(
+        datetime.fromtimestamp(context.memory_backend.stat(path).mtime)
+        for path in context.memory_backend.list_files(bucket))
+    expected = [datetime.strptime(row["mtime"], "%Y-%m-%d %H:%M:%S")
+                for row in context.table]
+    assert found == expected, "Found %s, expected %s" % (found, expected)
+
+
+@then("the remote backend had between {least:d} and {most:d} requests in "
+      "flight at once")
+def remote_backend_concurrency(context, least, most):
+    """ Verifies how many requests the remote backend served concurrently. """
+    peak = context.remote_backend.peak_concurrency
+    assert least <= peak <= most, \
+        "Up to %s requests were in flight, expected %s to %s" % (
+            peak, least, most)
+
+
+@then("the rotation reported {num:d} failure")
+@then("the rotation reported {num:d} failures")
+def rotation_reported_failures(context, num):
+    """ Verifies the number of failed operations the rotation reported. """
+    failures = context.caught_exception.failures
+    assert len(failures) == num, \
+        "Reported %s failures, expected %s: %s" % (len(failures), num,
+                                                   failures)
+
+
+@when('the {backend} backend is asked to {operation} ""')
+@when('the {backend} backend is asked to {operation} "{arguments}"')
+def call_backend(context, backend, operation, arguments=""):
+    """ Calls an operation of an abstract StorageBackend, of the in-memory
+        backend, of a remote backend wrapping it, of a backend of the backup
+        root or of the object store backend, with the space separated
+        arguments. """
+    backends = context.backup_rotation.backends
+    context.backend = {
+        "abstract": backends.StorageBackend,
+        "memory": lambda: context.memory_backend,
+        "remote": lambda: backends.FakeRemoteBackend(context.memory_backend,
+                                                     latency=0),
+        "local": lambda: backends.LocalBackend(context.backup_root),
+        "object store": lambda: context.object_store
+    }[backend]()
+    arguments = arguments.split()
+    context.backend_error = None
+    try:
+        if operation == "scan_bucket":
+            context.backend_result = list(context.backend.scan_bucket(
+                arguments[0], lambda _: True))
+        elif operation == "delete_many":
+            context.backend_result = context.backend.delete_many(arguments)
+        else:
+            context.backend_result = getattr(context.backend, operation)(
+                *arguments)
+    except (NotImplementedError, OSError, RuntimeError) as ex:
+        context.backend_error = ex
+
+
+@then("the backend raised {error}")
+def backend_raised(context, error):
+    """ Verifies the type of the error the backend raised. """
+    assert type(context.backend_error).__name__ == error, \
+        repr(context.backend_error)
+
+
+@then("the backend returned {result}")
+def backend_returned(context, result):
+    """ Verifies the backend returned the Python literal given, or the total
+        and available bytes of a volume. """
+    assert context.backend_error is None, repr(context.backend_error)
+    if result == "the volume usage":
+        total, available = context.backend_result
+        assert 0 <= available <= total, context.backend_result
+    else:
+        assert context.backend_result == ast.literal_eval(result), \
+            context.backend_result
+
+
+@then("the backend failed on {num:d} file")
+def backend_failed_on(context, num):
+    """ Verifies the number of files delete_many failed on, and that it
+        deleted the others. """
+    assert len(context.backend_result) == num, context.backend_result
+    for path, error in context.backend_result:
+        assert isinstance(error, FileNotFoundError), (path, error)
@@ -88,7 +88,8 @@ def create_num_bucket_backup_files_with_duplicates(
 
 @when("the backup script is executed")
 def execute_backup_script(context, entrypoint="external",
-                          is_dry_run=False, is_verbose_mode=False):
+                          is_dry_run=False, is_verbose_mode=False,
+                          extra_args=()):
     """ Actually executes the script we are testing """
     LOG.info("Will execute the backup script here")
     try:
@@ -99,6 +100,7 @@ def execute_backup_script(context, entrypoint="external",
             argv.append("-d")
         if is_verbose_mode:
             argv.append("-v")
+        argv.extend(extra_args)
         argv.append(context.backup_root)
         argv.append("*.backup.txt")
         # Execute the script
@@ -129,6 +131,17 @@ def execute_backup_script_verbose_mode(context):
     """ Executes the script with the verbose mode argument. """
     execute_backup_script(context, is_verbose_mode=True)
 
+@when("the backup script is executed with {jobs:d} jobs")
+def execute_backup_script_with_jobs(context, jobs):
+    """ Executes the script with several concurrent jobs. """
+    execute_backup_script(context, extra_args=["--jobs", str(jobs)])
+
+@when("the backup script is executed with a forced rescan")
+def execute_backup_script_forced_rescan(context):
+    """ Executes the script with the rescan argument. """
+    execute_backup_script(context, entrypoint="internal",
+                          extra_args=["--rescan"])
+
 @when("the backup script is executed internally")
 def execute_backup_script_internally(context):
     """ Executes the backup script using the module which exposes
@@ -136,6 +149,19 @@ def execute_backup_script_internally(context):
     execute_backup_script(context, entrypoint="internal")
 
 
+@when('the backup script is executed with only the arguments "{arguments}"')
+def execute_backup_script_with_only(context, arguments):
+    """ Executes the backup script internally with the arguments alone,
+        split on spaces, where {root} stands for the backup root. """
+    context.caught_exception = None
+    try:
+        context.backup_rotation.rotate(
+            arguments.replace("{root}", context.backup_root).split(" "))
+    except (SystemExit, context.backup_rotation.BackupRotationException) \
+            as ex:
+        context.caught_exception = ex
+
+
 def json_defaults(item_to_convert):
     """ convenience method used during json.dumps for non-json serializable
     items."""
@@ -0,0 +1,246 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" Module containing steps used to test the batch mode of the backup_rotation
+    package """
+import io
+import json
+import os
+import sys
+import unittest.mock
+from datetime import datetime, timedelta
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backup_rotation.batch import load_batch_config
+from backup_rotation.cli import DEFAULT_TIME_BUCKETS
+
+START_DATE = datetime(2020, 6, 15)
+ORDINALS = {"first": 0, "second": 1, "third": 2}
+
+
+def write_batch_config(context):
+    """ Writes the batch config of the scenario into the backup root. """
+    context.batch_config_file = os.path.join(context.backup_root,
+                                             "batch.json")
+    with open(context.batch_config_file, "w") as config_raw:
+        json.dump(context.batch_config, config_raw)
+
+
+@given("a batch of {num_roots:d} backup roots with {num:d} daily backup files "
+       "each")
+def create_batch_of_roots(context, num_roots, num):
+    """ Creates backup roots, each with daily backup files a day apart, and a
+        batch config file listing them. """
+    context.batch_config = {"defaults": {"pattern": "*.backup.txt"},
+                            "roots": []}
+    for root_number in range(num_roots):
+        backup_root = os.path.join(context.backup_root,
+                                   "root-%s" % root_number)
+        for bucket in ["yearly", "monthly", "daily"]:
+            os.makedirs(os.path.join(backup_root, bucket))
+        for i in range(num):
+            mtime = (START_DATE - timedelta(days=i + 1)).timestamp()
+            filename = os.path.join(backup_root, "daily",
+                                    "%s.backup.txt" % i)
+            open(filename, "a").close()
+            os.utime(filename, times=(mtime, mtime))
+        context.batch_config["roots"].append({"backup_root": backup_root})
+    write_batch_config(context)
+
+
+@given("the batch also lists a missing backup root")
+def batch_lists_missing_root(context):
+    """ Adds a backup root which does not exist to the batch config. """
+    context.batch_config["roots"].append(
+        {"backup_root": os.path.join(context.backup_root, "missing")})
+    write_batch_config(context)
+
+
+@given("the {ordinal} backup root of the batch keeps {num:d} daily backups")
+def batch_root_keeps(context, ordinal, num):
+    """ Gives one backup root of the batch its own time bucket policy. """
+    context.batch_config["roots"][ORDINALS[ordinal]]["time_buckets"] = {
+        "daily": {"num_files_to_keep": num},
+        "monthly": {},
+        "yearly": {}
+    }
+    write_batch_config(context)
+
+
+@given("a batch config file which is not JSON")
+def invalid_batch_config(context):
+    """ Writes a batch config file which cannot be parsed. """
+    context.batch_config_file = os.path.join(context.backup_root,
+                                             "batch.json")
+    with open(context.batch_config_file, "w") as config_raw:
+        config_raw.write("roots: [")
+
+
+@given("the {ordinal} backup root of the batch does not use the scan "
+       "index")
+def batch_root_without_index(context, ordinal):
+    """ Turns the scan index off for one backup root of the batch. """
+    context.batch_config["roots"][ORDINALS[ordinal]]["index"] = False
+    write_batch_config(context)
+
+
+@given("rotating the {ordinal} backup root of the batch raises a "
+       "RuntimeError")
+def batch_root_raises(context, ordinal):
+    """ Makes the rotation of one backup root of the batch fail with an
+        error which is not a BackupRotationException. """
+    failing_root = context.batch_config["roots"][ORDINALS[ordinal]]
+    real_rotate_backups = context.backup_rotation.BackupRotator.rotate_backups
+
+    def rotate_backups(rotator):
+        if rotator.backup_root == failing_root["backup_root"]:
+            raise RuntimeError("unexpected")
+        real_rotate_backups(rotator)
+    patch = unittest.mock.patch.object(context.backup_rotation.BackupRotator,
+                                       "rotate_backups", rotate_backups)
+    patch.start()
+    context.add_cleanup(patch.stop)
+
+
+@given("a batch config file holding {config}")
+def batch_config_holding(context, config):
+    """ Writes a batch config file with the given content. """
+    context.batch_config_file = os.path.join(context.backup_root,
+                                             "batch.json")
+    with open(context.batch_config_file, "w") as config_raw:
+        config_raw.write(config)
+
+
+@when("the batch config file is loaded")
+def load_batch_config_file(context):
+    """ Loads the batch config file, keeping the exception it raised. """
+    context.caught_exception = None
+    try:
+        load_batch_config(context.batch_config_file, DEFAULT_TIME_BUCKETS)
+    except context.backup_rotation.BackupRotationException as ex:
+        context.caught_exception = ex
+
+
+@when("the batch is rotated with {processes:d} processes")
+def rotate_batch(context, processes, extra_args=()):
+    """ Runs the cli in batch mode and captures its JSON summary. """
+    argv = ["--batch", context.batch_config_file,
+            "--processes", str(processes)] + list(extra_args)
+    output = io.StringIO()
+    with unittest.mock.patch.object(sys, "stdout", output):
+        try:
+            context.backup_rotation.rotate_and_exit(argv)
+        except SystemExit as ex:
+            context.caught_exception = ex
+    context.batch_output = output.getvalue()
+
+
+@when("the batch is rotated with {processes:d} processes and the option "
+      "{option}")
+def rotate_batch_with_option(context, processes, option):
+    """ Runs the cli in batch mode with an option. """
+    rotate_batch(context, processes, [option])
+
+
+@when("the batch is rotated in a dry-run with {processes:d} processes")
+def dry_run_batch(context, processes):
+    """ Runs the cli in batch mode without changing anything. """
+    rotate_batch(context, processes, ["--dry-run"])
+
+
+@when("the time bucket directories of the batch are aged by an hour")
+def age_batch_directories(context):
+    """ Moves the modification time of the time bucket directories of every
+        backup root an hour into the past, see catalog_steps. """
+    for root in context.batch_config["roots"]:
+        for bucket in ["yearly", "monthly", "daily"]:
+            directory = os.path.join(root["backup_root"], bucket)
+            an_hour_ago = os.stat(directory).st_mtime - 3600
+            os.utime(directory, times=(an_hour_ago, an_hour_ago))
+
+
+@then("the batch summary reports {succeeded:d} succeeded and {failed:d} "
+      "failed roots")
+def batch_summary_reports(context, succeeded, failed):
+    """ Verifies the counts of the aggregated summary. """
+    summary = json.loads(context.batch_output)
+    assert summary["succeeded"] == succeeded and \
+        summary["failed"] == failed, \
+        "Summary: %s" % context.batch_output
+    assert len(summary["roots"]) == succeeded + failed
+    for report in summary["roots"]:
+        assert report["seconds"] is not None
+
+
+@then("the batch summary reports a dry-run which would delete {num:d} "
+      "files")
+def batch_summary_dry_run(context, num):
+    """ Verifies the summary of a dry-run counts what would have been
+        deleted. """
+    summary = json.loads(context.batch_output)
+    assert summary["dry_run"] and \
+        all(x["dry_run"] for x in summary["roots"]), \
+        "Summary: %s" % context.batch_output
+    assert summary["files_deleted"] == num, \
+        "Summary: %s" % context.batch_output
+
+
+@then("the {ordinal} backup root of the batch is reported as {status}")
+def root_reported_as(context, ordinal, status):
+    """ Verifies the status of one backup root in the summary. """
+    report = json.loads(context.batch_output)["roots"][ORDINALS[ordinal]]
+    assert report["status"] == status, "Report: %s" % report
+
+
+def count_backup_files(backup_root, bucket):
+    """ Counts the backup files in a bucket of a backup root. """
+    return len([x for x in os.listdir(os.path.join(backup_root, bucket))
+                if x.endswith(".backup.txt")])
+
+
+@then("every backup root of the batch has {num:d} {bucket} backup files left")
+def every_root_has_files_left(context, num, bucket):
+    """ Verifies the number of files left in the bucket of each root. """
+    for root in context.batch_config["roots"]:
+        found = count_backup_files(root["backup_root"], bucket)
+        assert found == num, "Found %s files in %s of %s, expected %s" % (
+            found, bucket, root["backup_root"], num)
+
+
+@then("the {ordinal} backup root of the batch has {num:d} {bucket} backup "
+      "files left")
+def root_has_files_left(context, ordinal, num, bucket):
+    """ Verifies the number of files left in the bucket of one root. """
+    root = context.batch_config["roots"][ORDINALS[ordinal]]
+    found = count_backup_files(root["backup_root"], bucket)
+    assert found == num, "Found %s files in %s of %s, expected %s" % (
+        found, bucket, root["backup_root"], num)
+
+
+@then('the batch config was refused as "{reason}"')
+def batch_config_refused(context, reason):
+    """ Verifies the reason the batch config was refused for. """
+    assert context.caught_exception is not None
+    assert context.caught_exception.message.endswith(reason), \
+        context.caught_exception.message
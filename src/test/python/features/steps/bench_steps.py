@@ -0,0 +1,206 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" Module containing steps used to test the benchmark of the backup_rotation
+    package """
+import io
+import json
+import runpy
+import sys
+import unittest.mock
+# pylint: disable=no-name-in-module
+from behave import when, then
+from backup_rotation.bench import InstrumentedBackend, run_benchmark, \
+    run_startup_benchmark, compare_with_reference
+from backends_steps import rotate_in_memory
+
+
+@when("the benchmark is run for {num:d} files in memory")
+def run_memory_benchmark(context, num):
+    """ Runs the benchmark against an in-memory tree. """
+    context.bench_result = run_benchmark(num, "memory")
+
+
+@when("the benchmark is run for {num:d} files on disk")
+def run_local_benchmark(context, num):
+    """ Runs the benchmark against a tree generated in the scenario's
+        temporary directory. """
+    context.bench_result = run_benchmark(num, "local",
+                                         workdir=context.backup_root)
+
+
+@then("the benchmark plan matches the reference implementation")
+def bench_matches_reference(context):
+    """ Verifies the plan was the same as the reference implementation's. """
+    assert context.bench_result["matches_reference"]
+    assert context.bench_result["files_scanned"] > 0
+
+
+@then("the benchmark reports the scan, plan and effect times")
+def bench_reports_times(context):
+    """ Verifies every phase was timed. """
+    for phase in ["scan", "plan", "effect", "reference"]:
+        assert context.bench_result["%s_seconds" % phase] >= 0
+
+
+@then("the benchmark counted at most 1 stat call per backup file scanned")
+def bench_counted_syscalls(context):
+    """ Verifies the stat calls counted while planning, the hardlinks of a
+        file already scanned not being stat'ed again. """
+    assert 0 < context.bench_result["syscalls"]["stat"] <= \
+        context.bench_result["files_scanned"], context.bench_result
+
+
+@when("the startup benchmark is run")
+def run_startup(context):
+    """ Measures the import time of the package and times a dry run of the
+        command. """
+    context.startup_results = {
+        x.get("module", x.get("command")): x
+        for x in run_startup_benchmark(repeat=1)}
+
+
+@then("importing {module} loaded none of {modules}")
+def startup_left_modules_unloaded(context, module, modules):
+    """ Verifies none of the modules listed were imported. """
+    result = context.startup_results[module]
+    unexpected = set(modules.split(", ")) & \
+        set(result["lazy_modules_loaded"])
+    assert not unexpected, result
+
+
+@then("the startup benchmark reports the import time of {module}")
+def startup_reports_import_time(context, module):
+    """ Verifies the import time of the module was measured. """
+    assert context.startup_results[module]["import_ms"] > 0
+
+
+@then("the dry run of the command stayed within its time and loaded none "
+      "of {modules}")
+def dry_run_did_not_regress(context, modules):
+    """ Verifies the dry run was timed, within the time it may take, and
+        imported none of the modules listed. """
+    result = context.startup_results["backup-rotation --dry-run"]
+    unexpected = set(modules.split(", ")) & \
+        set(result["lazy_modules_loaded"])
+    assert 0 < result["run_ms"] <= result["max_run_ms"], result
+    assert not unexpected and not result["regressed"], result
+
+
+@then("the cli module can be used as an attribute of the package")
+def check_cli_attribute(context):
+    """ Verifies the cli module is imported as the package's attribute, as
+        if it had not been imported yet. """
+    package = context.backup_rotation
+    cli = sys.modules["backup_rotation.cli"]
+    delattr(package, "cli")
+    try:
+        assert package.cli is cli
+    finally:
+        package.cli = cli
+
+
+@then('the package has no attribute named "{name}"')
+def check_missing_attribute(context, name):
+    """ Verifies other attributes are still missing. """
+    try:
+        getattr(context.backup_rotation, name)
+    except AttributeError as ex:
+        assert name in str(ex), ex
+    else:
+        raise AssertionError("The package has an attribute %s" % name)
+
+
+@when('the benchmark command is run with "{arguments}"')
+def run_bench_command(context, arguments):
+    """ Runs python -m backup_rotation.bench with the arguments, split on
+        spaces, keeping what it printed and its exit status. """
+    output = io.StringIO()
+    with unittest.mock.patch.object(sys, "argv",
+                                    ["bench"] + arguments.split(" ")), \
+            unittest.mock.patch.object(sys, "stdout", output):
+        try:
+            runpy.run_module("backup_rotation.bench", run_name="__main__",
+                             alter_sys=True)
+        except SystemExit as ex:
+            context.bench_status = ex.code
+    context.bench_output = output.getvalue()
+
+
+@then("the benchmark command exited with status {status:d}")
+def bench_command_exited(context, status):
+    """ Verifies the exit status of the benchmark command. """
+    assert context.bench_status == status, \
+        "Exited with status %s, expected %s: %s" % (
+            context.bench_status, status, context.bench_output)
+
+
+@then('the benchmark command printed {num:d} lines containing "{text}"')
+def bench_command_printed(context, num, text):
+    """ Verifies the benchmark command printed a line per result, each
+        containing the text. """
+    lines = context.bench_output.splitlines()
+    assert len(lines) == num and all(text in x for x in lines), \
+        "Printed %s" % context.bench_output
+
+
+@then('the benchmark command reported the dry run as "{text}"')
+def bench_command_reported_dry_run(context, text):
+    """ Verifies the last line printed, that of the dry run, contains the
+        text. """
+    lines = context.bench_output.splitlines()
+    assert lines and text in lines[-1], "Printed %s" % context.bench_output
+
+
+@then("the benchmark command printed the JSON of {num:d} benchmark "
+      "matching the reference")
+def bench_command_printed_json(context, num):
+    """ Verifies the benchmark command printed its results as JSON. """
+    results = json.loads(context.bench_output)
+    assert len(results) == num, "Printed %s" % context.bench_output
+    assert all(x["matches_reference"] for x in results), results
+
+
+@when("the in-memory backups are rotated through the instrumented backend")
+def rotate_instrumented(context):
+    """ Rotates the in-memory backups through the InstrumentedBackend of the
+        benchmark. """
+    context.instrumented = InstrumentedBackend(context.memory_backend)
+    context.rotator = rotate_in_memory(context, context.instrumented)
+
+
+@then("the instrumented backend recorded {num:d} {bucket} backup files")
+def instrumented_recorded(context, num, bucket):
+    """ Verifies the files the InstrumentedBackend recorded scanning. """
+    scanned = [x for chunk in context.instrumented.scanned[bucket]
+               for x in chunk]
+    assert len(scanned) == num, scanned
+
+
+@then("the plan of the rotation matches the reference implementation")
+def rotation_matches_reference(context):
+    """ Verifies the plan of the instrumented rotation was the same as the
+        reference implementation's. """
+    result = {}
+    compare_with_reference(context.rotator, context.instrumented, result)
+    assert result["matches_reference"], context.rotator.backup_plan
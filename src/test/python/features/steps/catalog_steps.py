@@ -0,0 +1,360 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" Module containing steps used to test the scan layer of the
+    backup_rotation package """
+import errno
+import os
+import shutil
+import tempfile
+import unittest.mock
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backup_rotation.catalog import CatalogEntry
+from backup_rotation.index import ScanIndex, INDEX_FILENAME, \
+    UNTRUSTED_MTIME_NS
+
+
+class CountingDirEntry():
+    """ Wraps an os.DirEntry and counts the calls made to stat. """
+    def __init__(self, dir_entry, directory, stat_calls):
+        self.__dir_entry = dir_entry
+        self.__stat_calls = stat_calls
+        self.name = dir_entry.name
+        self.path = os.path.join(directory, dir_entry.name)
+
+    def is_dir(self):
+        """ Delegates to the wrapped entry. """
+        return self.__dir_entry.is_dir()
+
+    def is_symlink(self):
+        """ Delegates to the wrapped entry. """
+        return self.__dir_entry.is_symlink()
+
+    def inode(self):
+        """ Delegates to the wrapped entry. """
+        return self.__dir_entry.inode()
+
+    def stat(self):
+        """ Counts the call and delegates to the wrapped entry. """
+        self.__stat_calls[self.path] += 1
+        return self.__dir_entry.stat()
+
+
+class CountingScandir():
+    """ Wraps os.scandir so that every entry produced counts its stat calls."""
+    def __init__(self, path, stat_calls, scandir_calls):
+        self.__iterator = real_scandir(path)
+        if isinstance(path, int):
+            # A directory read through its descriptor.
+            path = os.readlink("/proc/self/fd/%d" % path)
+        scandir_calls[path] += 1
+        self.__directory = path
+        self.__stat_calls = stat_calls
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.__iterator.close()
+
+    def __iter__(self):
+        for dir_entry in self.__iterator:
+            yield CountingDirEntry(dir_entry, self.__directory,
+                                   self.__stat_calls)
+
+
+real_scandir = os.scandir
+
+
+@when("the backup script is executed while counting stat calls")
+def execute_backup_script_counting_stats(
+        context, step=u"When the backup script is executed internally"):
+    """ Executes the backup script while counting the directory listings
+        and the stat calls made for each file. """
+    context.stat_calls = Counter()
+    context.scandir_calls = Counter()
+    with unittest.mock.patch(
+            "os.scandir",
+            lambda path: CountingScandir(path, context.stat_calls,
+                                         context.scandir_calls)):
+        context.execute_steps(step)
+
+
+@when("the backup script is executed with a forced rescan while counting "
+      "stat calls")
+def execute_backup_script_rescan_counting_stats(context):
+    """ Executes the backup script with a forced rescan while counting the
+        directory listings and stat calls. """
+    execute_backup_script_counting_stats(
+        context, u"When the backup script is executed with a forced rescan")
+
+
+@when("the backup script is executed for the pattern {pattern} while "
+      "counting stat calls")
+def execute_backup_script_pattern_counting_stats(context, pattern):
+    """ Executes the backup script for another pattern while counting the
+        directory listings and stat calls. """
+    execute_backup_script_counting_stats(
+        context, u'When the backup script is executed with only the '
+        u'arguments "{root} %s"' % pattern)
+
+
+@when("the time bucket directories are aged by an hour")
+def age_time_bucket_directories(context):
+    """ Moves the modification time of every time bucket directory an hour
+        into the past, as if the last change happened long ago. """
+    for bucket in context.created_files:
+        directory = os.path.join(context.backup_root, bucket)
+        if os.path.exists(directory):
+            an_hour_ago = os.stat(directory).st_mtime - 3600
+            os.utime(directory, times=(an_hour_ago, an_hour_ago))
+
+
+@when("a new {bucket} backup file arrives")
+def new_backup_file_arrives(context, bucket):
+    """ Creates a backup file with the current time in the bucket. """
+    full_filename = os.path.join(context.backup_root, bucket,
+                                 "new..backup.txt")
+    open(full_filename, "a").close()
+    context.created_files[bucket]["backup"].append(
+        {"mtime": None, "file": full_filename})
+
+
+@then("the {bucket} directory was listed {num} times")
+@then("the {bucket} directory was listed once")
+def directory_was_listed(context, bucket, num=1):
+    """ Verifies how many times the time bucket directory was read. """
+    directory = os.path.join(context.backup_root, bucket)
+    assert context.scandir_calls[directory] == int(num), \
+        "%s was listed %s times, expected %s" % (
+            directory, context.scandir_calls[directory], num)
+
+
+@then("no directory was listed")
+def no_directory_was_listed(context):
+    """ Verifies that the backup root was not read at all. """
+    assert not context.scandir_calls, \
+        "Listed %s" % sorted(context.scandir_calls)
+
+
+@then("each {bucket} {file_type} file was stat'ed at most once")
+def each_file_stated_at_most_once(context, bucket, file_type):
+    """ Verifies that no file created in the bucket was stat'ed twice. """
+    for file_details in context.created_files[bucket][file_type]:
+        assert context.stat_calls[file_details["file"]] <= 1, \
+            "%s was stat'ed %s times" % (
+                file_details["file"], context.stat_calls[file_details["file"]])
+
+
+@then("no {bucket} {file_type} file was stat'ed")
+def no_file_was_stated(context, bucket, file_type):
+    """ Verifies that none of the files created in the bucket were stat'ed. """
+    for file_details in context.created_files[bucket][file_type]:
+        assert context.stat_calls[file_details["file"]] == 0, \
+            "%s was stat'ed" % file_details["file"]
+
+
+@when("every directory of the backup root is aged by an hour")
+def age_every_directory(context):
+    """ Moves the modification time of every directory below the backup
+        root an hour into the past. """
+    for dirpath, _, _ in os.walk(context.backup_root):
+        an_hour_ago = os.stat(dirpath).st_mtime - 3600
+        os.utime(dirpath, times=(an_hour_ago, an_hour_ago))
+
+
+@given("a directory outside the backup root with {num:d} old backup files "
+       "is linked as {link}")
+def link_directory_outside(context, num, link):
+    """ Creates backup files, all older than any other, in a directory
+        outside the backup root and links it into the backup root. """
+    context.outside_directory = tempfile.mkdtemp()
+    context.add_cleanup(shutil.rmtree, context.outside_directory)
+    mtime = datetime(2000, 1, 1).timestamp()
+    for i in range(num):
+        filename = os.path.join(context.outside_directory,
+                                "%s.old.backup.txt" % i)
+        open(filename, "a").close()
+        os.utime(filename, times=(mtime, mtime))
+    os.symlink(context.outside_directory,
+               os.path.join(context.backup_root, link))
+
+
+@then("the directory outside the backup root still holds {num:d} backup "
+      "files")
+def outside_directory_holds(context, num):
+    """ Verifies no file outside the backup root was rotated. """
+    found = len(os.listdir(context.outside_directory))
+    assert found == num, "Found %s files, expected %s" % (found, num)
+
+
+def refers_to(path, directory):
+    """ Returns whether a path, or a descriptor, is that of the directory. """
+    if isinstance(path, int):
+        path = os.readlink("/proc/self/fd/%d" % path)
+    return path == directory
+
+
+def failing_with(error):
+    """ Returns a function raising the OSError named, such as
+        PermissionError, whatever its arguments. """
+    error_number = {"PermissionError": errno.EACCES}[error]
+
+    def fail(*_, **__):
+        raise OSError(error_number, os.strerror(error_number))
+    return fail
+
+
+def patch_scan(context, target, replacement):
+    """ Replaces a function used by the scan until the scenario ends. """
+    patch = unittest.mock.patch(target, replacement)
+    patch.start()
+    context.add_cleanup(patch.stop)
+
+
+@given("listing the {directory} directory fails with {error}")
+def listing_directory_fails(context, directory, error):
+    """ Makes reading a directory below the backup root fail. """
+    directory = os.path.join(context.backup_root, directory)
+    fail = failing_with(error)
+
+    def scandir(path):
+        if refers_to(path, directory):
+            fail()
+        return real_scandir(path)
+    patch_scan(context, "os.scandir", scandir)
+
+
+@given("stat'ing the {directory} directory fails with {error}")
+def stating_directory_fails(context, directory, error):
+    """ Makes stat'ing a directory below the backup root fail. """
+    directory = os.path.join(context.backup_root, directory)
+    real_stat = os.stat
+    fail = failing_with(error)
+
+    def stat(path, *args, **kwargs):
+        if refers_to(path, directory):
+            fail()
+        return real_stat(path, *args, **kwargs)
+    patch_scan(context, "os.stat", stat)
+
+
+def patch_dir_entries(context, name, method):
+    """ Makes a method of the os.DirEntry of the file named fail with a
+        PermissionError while scanning. """
+    def wrap(dir_entry):
+        if dir_entry.name != name:
+            return dir_entry
+        wrapped = unittest.mock.Mock(wraps=dir_entry)
+        wrapped.name = dir_entry.name
+        setattr(wrapped, method, failing_with("PermissionError"))
+        return wrapped
+
+    @contextmanager
+    def scandir(path):
+        with real_scandir(path) as scandir_it:
+            yield [wrap(x) for x in scandir_it]
+    patch_scan(context, "os.scandir", scandir)
+
+
+@given("the {bucket} backup file {name} cannot be stat'ed while scanning")
+def file_cannot_be_stated(context, bucket, name):
+    """ Makes stat'ing a backup file fail while scanning its directory. """
+    del bucket
+    patch_dir_entries(context, name, "stat")
+
+
+@given("the {bucket} backup file {name} cannot tell whether it is a "
+       "directory")
+def file_cannot_tell_directory(context, bucket, name):
+    """ Makes finding out whether a backup file is a directory fail while
+        scanning its directory. """
+    del bucket
+    patch_dir_entries(context, name, "is_dir")
+
+
+@given("a catalog entry of {path} modified at {mtime_ns:d}")
+def create_catalog_entry(context, path, mtime_ns):
+    """ Creates the entry of a file of 100 bytes with two links. """
+    context.catalog_entry = CatalogEntry(path, os.path.basename(path),
+                                         mtime_ns, 100, 7, 1, 2)
+
+
+@then("the catalog entry is shown as {text}")
+def check_catalog_entry_repr(context, text):
+    """ Verifies the representation of the catalog entry. """
+    assert repr(context.catalog_entry) == text, repr(context.catalog_entry)
+
+
+@given("the scan index is unreadable")
+def scan_index_unreadable(context):
+    """ Writes something which is not an SQLite database as the index. """
+    with open(os.path.join(context.backup_root, INDEX_FILENAME),
+              "w") as index_raw:
+        index_raw.write("not a database\n" * 100)
+
+
+@when("the {directory} directory is removed with its backups, keeping the "
+      "modification time of its parent")
+def remove_directory_keeping_parent(context, directory):
+    """ Removes a directory below the backup root as if its parent had not
+        changed. """
+    path = os.path.join(context.backup_root, directory)
+    parent = os.stat(os.path.dirname(path))
+    shutil.rmtree(path)
+    os.utime(os.path.dirname(path),
+             ns=(parent.st_atime_ns, parent.st_mtime_ns))
+
+
+@given("a scan index recording the backup file {name} in the directory "
+       "{directory}")
+def scan_index_recording(context, name, directory):
+    """ Records a directory, which need not exist, holding a backup file in
+        a scan index of the backup root. """
+    context.scan_index = ScanIndex(context.backup_root)
+    path = os.path.join(context.backup_root, directory, name)
+    context.scan_index.record(
+        os.path.dirname(path), 0, [],
+        [CatalogEntry(path, name, 0, 100, 7, 1, 1)])
+
+
+@when("the scan index is told the backup file {name} in the directory "
+      "{directory} was deleted")
+def scan_index_deleted(context, name, directory):
+    """ Applies the deletion of a backup file to the scan index. """
+    context.scan_index.apply_changes(
+        [], [os.path.join(context.backup_root, directory, name)])
+
+
+@then("the scan index records the directory {directory} with no backup "
+      "file and an untrusted modification time")
+def scan_index_untrusted(context, directory):
+    """ Verifies the directory recorded in the scan index. """
+    record = context.scan_index.directories[directory]
+    assert record.entries == [], record.entries
+    assert record.mtime_ns == UNTRUSTED_MTIME_NS, record.mtime_ns
@@ -0,0 +1,233 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+""" Steps testing the columnar planning of the time buckets. """
+import os
+import random
+import sys
+import time
+import unittest.mock
+from datetime import datetime
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backup_rotation.bench import InstrumentedBackend, normalize_plan
+from backup_rotation.catalog import Catalog, CatalogEntry
+from backup_rotation import columns
+from backup_rotation.columns import FileTable, load_numpy, local_keys
+from backup_rotation.reference import reference_plan
+from backup_rotation.timekeys import local_key
+
+
+def skip_without_numpy(context):
+    """ Skips the scenario when NumPy is not installed. """
+    if load_numpy() is None:
+        context.scenario.skip("NumPy is not installed")
+
+
+@given("NumPy is installed")
+def numpy_is_installed(context):
+    """ Skips the scenario when NumPy is not installed. """
+    skip_without_numpy(context)
+
+
+@given("NumPy cannot be imported")
+def numpy_cannot_be_imported(context):
+    """ Makes importing NumPy fail until the end of the scenario. """
+    for patch in [unittest.mock.patch.dict(sys.modules, {"numpy": None}),
+                  unittest.mock.patch.object(columns, "_NUMPY", [])]:
+        patch.start()
+        context.add_cleanup(patch.stop)
+
+
+@given("the local time zone is {zone}")
+def local_time_zone(context, zone):
+    """ Sets the local time zone until the end of the scenario. """
+    previous = os.environ.get("TZ")
+
+    def restore():
+        if previous is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = previous
+        time.tzset()
+
+    os.environ["TZ"] = zone
+    time.tzset()
+    context.add_cleanup(restore)
+
+
+@given("{num:d} {bucket} backup files in memory a minute apart until "
+       "{date}")
+def create_files_a_minute_apart(context, num, bucket, date):
+    """ Creates the files in an in-memory backend, each a minute older than
+        the last in real time, so that the local times of the files go
+        backwards once when daylight saving time ends. """
+    context.memory_backend = context.backup_rotation.MemoryBackend()
+    for bucket_name in ["yearly", "monthly", "daily"]:
+        context.memory_backend.make_bucket(bucket_name)
+    timestamp = datetime.strptime(date, "%Y-%m-%d").timestamp()
+    for i in range(num):
+        timestamp -= 60
+        context.memory_backend.add_file(
+            "%s/%s.backup.txt" % (bucket, i), timestamp)
+
+
+@when("the in-memory backups are planned {how}")
+def plan_in_memory(context, how):
+    """ Plans a rotation of the in-memory backups with or without NumPy, or
+        with NumPy only if it can be imported. """
+    if how == "with NumPy":
+        skip_without_numpy(context)
+    context.instrumented = InstrumentedBackend(context.memory_backend)
+    context.rotator = context.backup_rotation.BackupRotator(
+        context.backup_rotation.cli.DEFAULT_TIME_BUCKETS.copy(),
+        backend=context.instrumented)
+    context.rotator.pattern = "*.backup.txt"
+    context.rotator.vectorize = how != "without NumPy"
+    context.rotator.plan_promotions_and_deletions()
+
+
+def comparable_plan(rotator):
+    """ Returns the plan of a rotator with the files to delete as a set. """
+    return {name: (list(bucket["files_to_keep"]),
+                   list(bucket["files_to_promote"]),
+                   set(bucket["files_to_delete"]))
+            for name, bucket in rotator.backup_plan.items()}
+
+
+@then("the plan is the same as without NumPy")
+def plan_same_without_numpy(context):
+    """ Verifies the plan, in order, against that of the array.array. """
+    rotator = context.backup_rotation.BackupRotator(
+        context.backup_rotation.cli.DEFAULT_TIME_BUCKETS.copy(),
+        backend=context.memory_backend)
+    rotator.pattern = "*.backup.txt"
+    rotator.vectorize = False
+    rotator.plan_promotions_and_deletions()
+    assert comparable_plan(context.rotator) == comparable_plan(rotator), \
+        "The plan differs"
+
+
+@then("the plan matches the reference")
+def plan_matches_reference(context):
+    """ Verifies the plan against the reference implementation. """
+    scanned = context.instrumented.scanned
+    expected = reference_plan(
+        [(x.name, x.config) for x in context.rotator.plan], scanned)
+    mtimes = {path: mtime for chunks in scanned.values()
+              for chunk in chunks for path, mtime in chunk}
+    assert normalize_plan(context.rotator.backup_plan, mtimes) == \
+        normalize_plan(expected, mtimes), "The plan differs"
+
+
+@when("the time keys of {num:d} modification times around {date} are "
+      "computed with NumPy")
+def compute_time_keys(context, num, date):
+    """ Computes the time keys of random modification times within a day of
+        the date, some on the edge of a microsecond. """
+    numpy = load_numpy()
+    middle = int(datetime.strptime(date, "%Y-%m-%d").timestamp())
+    randomizer = random.Random(0)
+    context.mtimes_ns = [
+        randomizer.randrange(middle - 86400, middle + 86400) * 1000000000 +
+        randomizer.choice([0, 500, 1500, 999999500,
+                           randomizer.randrange(1000000000)])
+        for _ in range(num)]
+    context.time_keys = local_keys(
+        numpy, numpy.array(context.mtimes_ns, numpy.int64)).tolist()
+
+
+@then("they are the time keys datetime computes")
+def time_keys_match_datetime(context):
+    """ Verifies the time keys against those of the pure Python code. """
+    expected = [local_key(CatalogEntry("", "", x, 0, 0).mtime)
+                for x in context.mtimes_ns]
+    mismatches = [x for x, y, z in zip(context.mtimes_ns, context.time_keys,
+                                       expected) if y != z]
+    assert not mismatches, "%s time keys differ, e.g. for %s" % (
+        len(mismatches), mismatches[:3])
+
+
+@when("a file table is made {how} of the entries")
+def make_file_table(context, how):
+    """ Makes a FileTable of the entries, a second apart, with or without
+        NumPy. """
+    if how == "with NumPy":
+        skip_without_numpy(context)
+        patch = unittest.mock.patch.object(columns, "NUMPY_MIN_FILES", 1)
+        patch.start()
+        context.add_cleanup(patch.stop)
+    context.entries = [
+        CatalogEntry(row["path"], os.path.basename(row["path"]),
+                     i * 1000000000, int(row["size"]), int(row["inode"]))
+        for i, row in enumerate(context.table)]
+    context.file_table = FileTable(iter(context.entries))
+    assert (context.file_table.numpy is not None) == (how == "with NumPy")
+
+
+@then('the file table has the directories "{first}" and "{second}"')
+def check_table_directories(context, first, second):
+    """ Verifies the directories interned by the FileTable. """
+    assert context.file_table.directories == [first, second], \
+        context.file_table.directories
+
+
+@then("the file table has the paths of the entries")
+def check_table_paths(context):
+    """ Verifies the paths given by the FileTable. """
+    table = context.file_table
+    paths = [table.path(i) for i in range(len(table))]
+    assert paths == [x.path for x in context.entries], paths
+    assert table.paths_except([1, 2]) == [paths[0], paths[3]]
+
+
+@then("the total size of the file table is {size:d}")
+def check_table_size(context, size):
+    """ Verifies the total size of the FileTable. """
+    assert context.file_table.total_size() == size, \
+        context.file_table.total_size()
+
+
+@then("a catalog of the file table has the entries of the paths")
+def check_catalog_entries(context):
+    """ Verifies a Catalog makes the entry of every file of the FileTable
+        from its row. """
+    catalog = Catalog()
+    catalog.add_table(context.file_table)
+    for entry in context.entries:
+        assert repr(catalog[entry.path]) == repr(entry), catalog[entry.path]
+
+
+@then('a catalog of the file table has no entry for "{path}"')
+def check_missing_catalog_entry(context, path):
+    """ Verifies a Catalog raises a KeyError for a path of no table. """
+    catalog = Catalog()
+    catalog.add_table(context.file_table)
+    try:
+        entry = catalog[path]
+    except KeyError:
+        return
+    raise AssertionError("The catalog has %r" % entry)
@@ -0,0 +1,85 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+""" Steps testing the concurrent scanning of the time buckets. """
+import os
+from os.path import join
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backends_steps import rotate_in_memory
+
+
+@given("the {bucket} backup files are spread over {num:d} subdirectories")
+def spread_over_subdirectories(context, bucket, num):
+    """ Moves the files of the time bucket into subdirectories, in turn. """
+    directory = join(context.backup_root, bucket)
+    for i, name in enumerate(sorted(os.listdir(directory))):
+        subdirectory = join(directory, "host-%s" % (i % num))
+        os.makedirs(subdirectory, exist_ok=True)
+        os.rename(join(directory, name), join(subdirectory, name))
+
+
+@when("the backups are planned with {jobs:d} scan job")
+@when("the backups are planned with {jobs:d} scan jobs")
+def plan_with_scan_jobs(context, jobs):
+    """ Dry-runs the rotation with the number of scan jobs given, keeping its
+        plan and the stat calls it counted. """
+    rotator = context.backup_rotation.BackupRotator(
+        context.backup_rotation.cli.DEFAULT_TIME_BUCKETS.copy())
+    rotator.backup_root = context.backup_root
+    rotator.pattern = "*.backup.txt"
+    rotator.is_dry_run = True
+    rotator.scan_jobs = jobs
+    rotator.rotate_backups()
+    if not hasattr(context, "scan_results"):
+        context.scan_results = []
+    context.scan_results.append((rotator.plan.as_dict(),
+                                 rotator.stats.stat_calls))
+
+
+@when("the in-memory backups are rotated through a remote backend scanning "
+      "with {jobs:d} jobs")
+def rotate_through_remote_backend_scanning(context, jobs):
+    """ Rotates the in-memory backups through the simulated remote backend
+        with the number of scan jobs given. """
+    context.remote_backend = context.backup_rotation.FakeRemoteBackend(
+        context.memory_backend, latency=0.01)
+    rotate_in_memory(context, context.remote_backend, scan_jobs=jobs)
+
+
+@then("the plans are the same")
+def plans_are_the_same(context):
+    """ Verifies every plan made was the same. """
+    plans = [x[0] for x in context.scan_results]
+    assert all(x == plans[0] for x in plans), "The plans differ: %s" % plans
+
+
+@then("the same number of stat calls were counted")
+def same_stat_calls(context):
+    """ Verifies every rotation counted the same number of stat calls. """
+    stat_calls = [x[1] for x in context.scan_results]
+    assert len(set(stat_calls)) == 1 and stat_calls[0] > 0, \
+        "Counted %s stat calls" % stat_calls
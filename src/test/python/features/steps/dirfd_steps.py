@@ -0,0 +1,143 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Steps testing the operations made relative to directory descriptors. """
+import os
+import unittest.mock
+from collections import Counter
+from contextlib import contextmanager
+from os.path import join
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backup_rotation import dirfd
+from backup_rotation.backends import LocalBackend
+from backup_rotation.cli import DEFAULT_TIME_BUCKETS
+
+real_open = os.open
+
+
+def make_rotator(context):
+    """ Returns a rotator for the scenario's backup root. """
+    rotator = context.backup_rotation.BackupRotator(
+        DEFAULT_TIME_BUCKETS.copy())
+    rotator.backup_root = context.backup_root
+    rotator.pattern = "*.backup.txt"
+    return rotator
+
+
+@when("the backups are rotated while counting the directories opened")
+def rotate_counting_opens(context):
+    """ Rotates the backups counting each directory opened. """
+    context.opened = Counter()
+
+    def counting_open(path, flags, *args, **kwargs):
+        if flags & os.O_DIRECTORY:
+            context.opened[path] += 1
+        return real_open(path, flags, *args, **kwargs)
+
+    with unittest.mock.patch.object(os, "open", counting_open):
+        make_rotator(context).rotate_backups()
+
+
+@then("each time bucket directory was opened once")
+def check_opened_once(context):
+    """ Checks every time bucket directory was opened exactly once. """
+    for bucket in ("yearly", "monthly", "daily"):
+        assert context.opened[join(context.backup_root, bucket)] == 1, \
+            context.opened
+    assert all(x == 1 for x in context.opened.values()), context.opened
+
+
+@when("the backups are rotated while the {bucket} directory is replaced "
+      "before deleting")
+def rotate_replacing_directory(context, bucket):
+    """ Rotates the backups, moving the time bucket directory aside and
+        creating an empty one in its place just before the deletions. """
+    directory = join(context.backup_root, bucket)
+    context.replaced = directory + ".replaced"
+
+    @contextmanager
+    def replace_directory(name, _):
+        if name == "delete":
+            os.rename(directory, context.replaced)
+            os.mkdir(directory)
+            with open(join(directory, "new.backup.txt"), "w"):
+                pass
+        yield
+
+    rotator = make_rotator(context)
+    rotator.add_span_hook(replace_directory)
+    rotator.rotate_backups()
+
+
+@then("the replaced {bucket} directory has {num:d} backup files left")
+def check_replaced_directory(context, bucket, num):
+    """ Checks the deletions were made in the directory scanned. """
+    assert context.replaced == join(context.backup_root,
+                                    bucket + ".replaced"), context.replaced
+    names = os.listdir(context.replaced)
+    assert len(names) == num, names
+
+
+@then("the new {bucket} directory was left alone")
+def check_new_directory(context, bucket):
+    """ Checks nothing was deleted from the directory put in its place. """
+    assert os.listdir(join(context.backup_root, bucket)) == \
+        ["new.backup.txt"]
+
+
+@when("the backups are rotated keeping at most {num:d} directory open")
+def rotate_with_few_directories(context, num):
+    """ Rotates the backups keeping at most num directories open, noting how
+        many were open at the start of each span. """
+    backend = LocalBackend(context.backup_root)
+    backend.handles.max_open = num
+    context.open_directories = []
+
+    @contextmanager
+    def count_open_directories(*_):
+        context.open_directories.append(len(backend.handles))
+        yield
+
+    rotator = make_rotator(context)
+    rotator.backend = backend
+    rotator.add_span_hook(count_open_directories)
+    rotator.rotate_backups()
+
+
+@then("at most {num:d} directory was open at once")
+def check_open_directories(context, num):
+    """ Checks the directories open never exceeded num, and that some were
+        open. """
+    assert max(context.open_directories) == num, context.open_directories
+
+
+@given("directory descriptors are unsupported")
+def disable_directory_descriptors(context):
+    """ Makes the local backends work by path, as on platforms which cannot
+        operate relative to directory descriptors. """
+    patch = unittest.mock.patch.object(dirfd, "SUPPORTED", False)
+    patch.start()
+    context.add_cleanup(patch.stop)
@@ -0,0 +1,142 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+""" Steps testing durable rotations. """
+import errno
+import json
+import os
+import shlex
+import stat
+import unittest.mock
+from collections import Counter
+from os.path import join
+# pylint: disable=no-name-in-module
+from behave import when, then
+
+from backup_rotation_steps import execute_backup_script
+
+real_fsync = os.fsync
+real_link = os.link
+real_unlink = os.unlink
+
+
+def directory_of_descriptor(descriptor):
+    """ Returns the path of a directory descriptor, or None if the descriptor
+        is not a directory. """
+    if not stat.S_ISDIR(os.fstat(descriptor).st_mode):
+        return None
+    return os.readlink("/proc/self/fd/%s" % descriptor)
+
+
+@when('the backup script is executed with the arguments "{arguments}" while '
+      'recording the file system operations')
+@when("the backup script is executed while recording the file system "
+      "operations")
+def execute_recording_operations(context, arguments=""):
+    """ Executes the script while recording every link, unlink and sync of a
+        directory made, in order. """
+    context.operations = []
+    context.directories_synced = Counter()
+
+    def fsync(descriptor):
+        directory = directory_of_descriptor(descriptor)
+        if directory is not None:
+            context.operations.append("sync")
+            context.directories_synced[directory] += 1
+        return real_fsync(descriptor)
+
+    def link(*args, **kwargs):
+        context.operations.append("link")
+        return real_link(*args, **kwargs)
+
+    def unlink(*args, **kwargs):
+        context.operations.append("unlink")
+        return real_unlink(*args, **kwargs)
+
+    with unittest.mock.patch("os.fsync", fsync), \
+            unittest.mock.patch("os.link", link), \
+            unittest.mock.patch("os.unlink", unlink):
+        execute_backup_script(context, entrypoint="internal",
+                              extra_args=shlex.split(arguments))
+
+
+@when("the backup script is executed durably while writing statistics")
+def execute_durably_writing_statistics(context):
+    """ Executes a durable rotation writing its statistics as JSON. """
+    context.stats_file = join(context.backup_root, "stats.json")
+    execute_backup_script(context, entrypoint="internal",
+                          extra_args=["--durable", "--stats-json",
+                                      context.stats_file])
+
+
+@when('the backup script is executed with the arguments "{arguments}" while '
+      'directory syncs fail')
+def execute_with_failing_syncs(context, arguments):
+    """ Executes the script while syncing a directory fails. """
+    def fsync(descriptor):
+        if directory_of_descriptor(descriptor) is not None:
+            raise OSError(errno.EIO, os.strerror(errno.EIO))
+        return real_fsync(descriptor)
+
+    with unittest.mock.patch("os.fsync", fsync):
+        execute_backup_script(context, extra_args=shlex.split(arguments))
+
+
+@then("the operations were links, directory syncs, unlinks and directory "
+      "syncs")
+def operations_in_order(context):
+    """ Verifies every link was synced before the first unlink. """
+    runs = []
+    for operation in context.operations:
+        if not runs or runs[-1] != operation:
+            runs.append(operation)
+    assert runs == ["link", "sync", "unlink", "sync"], \
+        "The operations were %s" % runs
+
+
+@then("the {bucket} directory was synced {num:d} times")
+@then("the {bucket} directory was synced {num:d} time")
+def directory_synced(context, bucket, num):
+    """ Verifies how many times a time bucket directory was synced. """
+    found = context.directories_synced[
+        os.path.realpath(join(context.backup_root, bucket))]
+    assert found == num, "Synced %s times, expected %s" % (found, num)
+
+
+@then("no directory was synced")
+def no_directory_synced(context):
+    """ Verifies no directory was synced. """
+    assert not context.directories_synced, \
+        "Synced %s" % dict(context.directories_synced)
+
+
+@then("the statistics report {num:d} directories synced")
+def statistics_report_directories_synced(context, num):
+    """ Verifies the directories synced of the statistics written. """
+    with open(context.stats_file, "r") as stats_raw:
+        stats = json.load(stats_raw)
+    assert stats["directories_synced"] == num, \
+        "Reported %s directories synced" % stats["directories_synced"]
+    assert stats["sync_seconds"] > 0
@@ -0,0 +1,150 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Steps testing the calendar arithmetic of the time bucket frequencies. """
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+# pylint: disable=no-name-in-module
+from behave import given, then
+
+from backup_rotation.cli import DEFAULT_TIME_BUCKETS
+from backup_rotation import timekeys
+from backup_rotation.frequencies import CalendarDelta, DAILY, \
+    parse_frequency
+from backup_rotation.timekeys import Boundaries, datetime_key, key_datetime
+
+RELATIVEDELTAS = {
+    "yearly":  relativedelta(years=1, day=0, hour=0, minute=0, second=0),
+    "monthly": relativedelta(months=1, day=0, hour=0, minute=0, second=0),
+    "daily":   relativedelta(days=1, hour=0, minute=0, second=0)
+}
+
+
+def parse_moment(moment):
+    """ Parses a moment given with or without microseconds. """
+    if "." in moment:
+        return datetime.strptime(moment, "%Y-%m-%d %H:%M:%S.%f")
+    return datetime.strptime(moment, "%Y-%m-%d %H:%M:%S")
+
+
+@given("the {bucket} frequency")
+def select_frequency(context, bucket):
+    """ Selects the frequency of a default time bucket. """
+    context.frequency = DEFAULT_TIME_BUCKETS[bucket]["frequency"]
+    context.relativedelta = RELATIVEDELTAS[bucket]
+
+
+@given("the frequency {frequency}")
+def parse_any_frequency(context, frequency):
+    """ Selects a frequency as given on the command line, or a
+        relativedelta built from its keyword arguments. """
+    if frequency.startswith("relativedelta("):
+        context.frequency = relativedelta(**dict(
+            (name, int(value)) for name, value in
+            (x.split("=") for x in frequency[14:-1].split(", "))))
+    else:
+        context.frequency = parse_frequency(frequency)
+
+
+@then("the boundaries of {moment} and {other} are the same as with "
+      "datetimes")
+def check_boundaries(context, moment, other):
+    """ Compares the boundaries of both moments with the datetime
+        arithmetic, counting the keys converted back to datetimes to apply
+        the frequency. """
+    boundaries = Boundaries(context.frequency)
+    real_key_datetime = timekeys.key_datetime
+    context.computed = 0
+
+    def counting_key_datetime(key):
+        context.computed += 1
+        return real_key_datetime(key)
+    for moment_to_use in (parse_moment(moment), parse_moment(other)):
+        key = datetime_key(moment_to_use)
+        timekeys.key_datetime = counting_key_datetime
+        try:
+            found = key_datetime(boundaries.next_after(key))
+        finally:
+            timekeys.key_datetime = real_key_datetime
+        expected = moment_to_use + context.frequency
+        assert found == expected, "%s != %s" % (found, expected)
+        found = key_datetime(boundaries.grace_start(key, 2))
+        expected = moment_to_use - context.frequency * 2
+        assert found == expected, "%s != %s" % (found, expected)
+
+
+@then("the boundaries are computed {num:d} times")
+def check_boundaries_computed(context, num):
+    """ Verifies how often the frequency was applied to find the next
+        boundaries. """
+    assert context.computed == num, "Computed %s times, expected %s" % (
+        context.computed, num)
+
+
+@then("{moment} plus {periods:d} periods is the same as with relativedelta")
+def check_addition(context, moment, periods):
+    """ Compares adding the frequency with adding the relativedelta. """
+    moment = parse_moment(moment)
+    found = moment + context.frequency * periods
+    expected = moment + context.relativedelta * periods
+    assert found == expected, "%s != %s" % (found, expected)
+
+
+@then("{moment} minus {periods:d} periods is the same as with relativedelta")
+def check_subtraction(context, moment, periods):
+    """ Compares subtracting the frequency with subtracting the
+        relativedelta. """
+    moment = parse_moment(moment)
+    found = moment - context.frequency * periods
+    expected = moment - context.relativedelta * periods
+    assert found == expected, "%s != %s" % (found, expected)
+
+
+@then("the frequency equals and hashes like the same calendar delta")
+def check_equal(context):
+    """ Compares the frequency with a calendar delta of the same fields. """
+    same = CalendarDelta(months=1, day=0, hour=0, minute=0, second=0)
+    assert context.frequency == same, repr(context.frequency)
+    assert len({context.frequency, same}) == 1
+
+
+@then("the frequency differs from the daily frequency and from text")
+def check_different(context):
+    """ Compares the frequency with different ones. """
+    assert context.frequency != DAILY
+    assert context.frequency != repr(context.frequency)
+
+
+@then("the frequency cannot be added to a number nor multiplied by 1.5")
+def check_unsupported_operations(context):
+    """ Checks the frequency only adds to datetimes and multiplies by whole
+        numbers. """
+    for operation in (lambda: 1 + context.frequency,
+                      lambda: context.frequency * 1.5):
+        try:
+            operation()
+        except TypeError:
+            continue
+        raise AssertionError("%r allowed an unsupported operation" %
+                             context.frequency)
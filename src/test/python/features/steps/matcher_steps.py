@@ -0,0 +1,114 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Steps testing the include and exclude globs. """
+import os
+from datetime import datetime, timedelta
+from os.path import join
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backup_rotation.matcher import NameMatcher
+from backup_rotation_steps import execute_backup_script
+from catalog_steps import execute_backup_script_counting_stats
+
+START_DATE = datetime(2020, 6, 15)
+
+
+@given("{bucket} files of the ages")
+def create_files_of_ages(context, bucket):
+    """ Creates the files named in the table, within the subdirectories of
+        the time bucket their name includes, each modified the number of
+        days listed before the start date. """
+    for row in context.table:
+        path = join(context.backup_root, bucket, row["name"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "a").close()
+        mtime = (START_DATE - timedelta(days=int(row["days"]))).timestamp()
+        os.utime(path, times=(mtime, mtime))
+
+
+@when('the backup script is executed with the arguments "{arguments}"')
+def execute_with_arguments(context, arguments):
+    """ Executes the script with further arguments, split on spaces. """
+    execute_backup_script(context, entrypoint="internal",
+                          extra_args=arguments.split(" "))
+
+
+@when('the backup script is executed with the arguments "{arguments}" while '
+      'counting stat calls')
+def execute_with_arguments_counting_stats(context, arguments):
+    """ Executes the script with further arguments while counting the
+        directory listings and stat calls. """
+    execute_backup_script_counting_stats(
+        context, 'When the backup script is executed with the arguments '
+        '"%s"' % arguments)
+
+
+@then("the {bucket} files left are")
+def files_left(context, bucket):
+    """ Verifies the names of the files left at the top of the time
+        bucket. """
+    directory = join(context.backup_root, bucket)
+    found = sorted(x for x in os.listdir(directory)
+                   if os.path.isfile(join(directory, x)))
+    expected = sorted(row["name"] for row in context.table)
+    assert found == expected, "Found %s, expected %s" % (found, expected)
+
+
+@then('the {bucket} files "{names}" were not stat\'ed')
+def files_not_stated(context, bucket, names):
+    """ Verifies none of the files named were stat'ed. """
+    for name in names.split(", "):
+        path = join(context.backup_root, bucket, name)
+        assert not context.stat_calls[path], \
+            "%s was stat'ed %s times" % (path, context.stat_calls[path])
+
+
+@given('a matcher including "{include}" and excluding "{exclude}"')
+def create_matcher(context, include, exclude):
+    """ Creates a NameMatcher of the space separated globs. """
+    context.matcher = NameMatcher(include.split(" "), exclude.split(" "))
+
+
+@then("the matcher equals and hashes like a matcher of the same globs")
+def check_matcher_equal(context):
+    """ Verifies a matcher of the same globs is equal and hashes alike. """
+    other = NameMatcher(list(context.matcher.include),
+                        list(context.matcher.exclude))
+    assert context.matcher == other
+    assert hash(context.matcher) == hash(other)
+
+
+@then("the matcher differs from a matcher of other globs and from text")
+def check_matcher_different(context):
+    """ Verifies the matcher differs from other matchers and from text. """
+    assert context.matcher != NameMatcher(context.matcher.include)
+    assert context.matcher != repr(context.matcher)
+
+
+@then("the matcher is shown as {text}")
+def check_matcher_repr(context, text):
+    """ Verifies the representation of the matcher. """
+    assert repr(context.matcher) == text, repr(context.matcher)
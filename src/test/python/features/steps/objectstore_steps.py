@@ -0,0 +1,233 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+""" Steps testing the object store backend against the fake client. """
+import posixpath
+import sys
+import unittest.mock
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backends_steps import rotate_in_memory
+from backup_rotation.objectstore import ObjectStoreBackend, \
+    FakeObjectStoreClient, FakeClientError, MTIME_METADATA, \
+    ObjectStoreUnavailableException
+
+START_DATE = datetime(2020, 6, 15)
+BUCKET = "backups"
+PREFIX = "nightly"
+
+
+@given("{num:d} daily backup objects in a fake object store")
+@given("{num:d} daily backup objects in a fake object store across "
+       "{hosts:d} hosts")
+@given("{num:d} daily backup objects of {gib:d} GiB in a fake object store")
+def create_backup_objects(context, num, hosts=0, gib=0):
+    """ Uploads daily backups a day apart to the fake object store, spread
+        across the host subdirectories if any, of 1 byte unless their size
+        is given. """
+    context.client = FakeObjectStoreClient(BUCKET, latency=0.001)
+    for i in range(num):
+        directory = "daily/host-%s" % (i % hosts) if hosts else "daily"
+        context.client.put(
+            "%s/%s/%s.backup.txt" % (PREFIX, directory, i),
+            (START_DATE - timedelta(days=i + 1)).timestamp(),
+            size=gib * 1024 ** 3 or 1)
+    context.object_store = ObjectStoreBackend(BUCKET, PREFIX, context.client)
+
+
+@given("the object store lists {num:d} keys per page")
+def object_store_page_size(context, num):
+    """ Shortens the pages of the listings. """
+    context.client.page_size = num
+
+
+@given('the object store fails to delete "{key}"')
+def object_store_fails(context, key):
+    """ Makes the deletion of a key below the prefix fail. """
+    context.client.failing_keys.add("%s/%s" % (PREFIX, key))
+
+
+@given("the object store client fails with {error}")
+def object_store_client_fails(context, error):
+    """ Makes the HEAD requests of the client raise an error. """
+    exception = {
+        "a ClientError 404": lambda: FakeClientError("404", "HeadObject"),
+        "a ClientError SlowDown":
+            lambda: FakeClientError("SlowDown", "HeadObject"),
+        "a botocore error": lambda: type(
+            "EndpointConnectionError", (Exception,),
+            {"__module__": "botocore.exceptions"})("Could not connect"),
+        "a ConnectionResetError": lambda: ConnectionResetError(104, "reset"),
+        "a RuntimeError": lambda: RuntimeError("unexpected")
+    }[error]
+
+    def head_object(**_):
+        raise exception()
+    context.client.head_object = head_object
+
+
+@given("the object store fails to delete objects in batches")
+def object_store_fails_batches(context):
+    """ Makes every DeleteObjects request fail as a whole. """
+    def delete_objects(**_):
+        raise FakeClientError("SlowDown", "DeleteObjects")
+    context.client.delete_objects = delete_objects
+
+
+@given("boto3 makes clients of the fake object store")
+def boto3_makes_fake_clients(context):
+    """ Installs a boto3 module whose S3 clients are the fake client, until
+        the end of the scenario. """
+    context.endpoint_urls = []
+
+    def client(service, endpoint_url=None):
+        assert service == "s3", service
+        context.endpoint_urls.append(endpoint_url)
+        return context.client
+    patch = unittest.mock.patch.dict(
+        sys.modules, {"boto3": SimpleNamespace(client=client)})
+    patch.start()
+    context.add_cleanup(patch.stop)
+
+
+@given("boto3 cannot be imported")
+def boto3_cannot_be_imported(context):
+    """ Makes importing boto3 fail until the end of the scenario. """
+    patch = unittest.mock.patch.dict(sys.modules, {"boto3": None})
+    patch.start()
+    context.add_cleanup(patch.stop)
+
+
+@when("the backup objects are rotated")
+def rotate_objects(context):
+    """ Rotates the backups in the fake object store with several jobs. """
+    rotate_in_memory(context, context.object_store, jobs=4)
+
+
+@when('the backup objects of the bucket "{bucket}" are rotated')
+def rotate_objects_of_bucket(context, bucket):
+    """ Rotates the backups of another bucket of the fake object store. """
+    context.caught_exception = None
+    rotate_in_memory(context, ObjectStoreBackend(bucket, PREFIX,
+                                                 context.client))
+
+
+@when('the object "{key}" is deleted behind the backend')
+def delete_object_behind_backend(context, key):
+    """ Deletes an object without the backend knowing. """
+    del context.client.objects[key]
+
+
+@when("the object store backend is asked to delete {num:d} objects at once")
+def delete_many_objects(context, num):
+    """ Deletes more objects in one request than the store accepts. """
+    context.backend_error = None
+    try:
+        context.object_store.delete_many(
+            "%s/daily/%s.backup.txt" % (PREFIX, i) for i in range(num))
+    except OSError as ex:
+        context.backend_error = ex
+
+
+@when("the backup objects are rotated again")
+def rotate_objects_again(context):
+    """ Rotates the backups again, counting only the requests made then. """
+    context.client.calls.clear()
+    rotate_objects(context)
+
+
+@when("the backup objects are rotated again by a new backend")
+def rotate_objects_by_new_backend(context):
+    """ Rotates the backups again with a backend which has cached nothing,
+        as a new run of the command does, counting only the requests made
+        then. """
+    context.object_store = ObjectStoreBackend(BUCKET, PREFIX, context.client)
+    rotate_objects_again(context)
+
+
+def keys_of(context, bucket):
+    """ Returns the keys of the objects stored in a time bucket. """
+    top = "%s/%s/" % (PREFIX, bucket)
+    return sorted(x for x in context.client.objects if x.startswith(top))
+
+
+@then("{num:d} {bucket} backup objects remain in the object store")
+@then("{num:d} {bucket} backup object remains in the object store")
+def objects_remain(context, num, bucket):
+    """ Verifies the number of objects left in a time bucket. """
+    found = keys_of(context, bucket)
+    assert len(found) == num, "Found %s in %s, expected %s" % (
+        found, bucket, num)
+
+
+@then("the object store received {num:d} {operation} requests")
+def object_store_received(context, num, operation):
+    """ Verifies the number of requests of an operation. """
+    found = context.client.calls[operation]
+    assert found == num, "Received %s %s requests, expected %s" % (
+        found, operation, num)
+
+
+@then("the object store had several requests in flight at once")
+def object_store_concurrency(context):
+    """ Verifies requests were made concurrently. """
+    assert context.client.peak_concurrency > 1, \
+        "Only %s requests were in flight" % context.client.peak_concurrency
+
+
+@then("the {bucket} backup objects keep the modification times of their "
+      "originals")
+def objects_keep_mtimes(context, bucket):
+    """ Verifies every promoted copy records the modification time of the
+        backup it was promoted from, whose name it shares. """
+    for key in keys_of(context, bucket):
+        name = posixpath.basename(key)
+        index = int(name.split(".")[0])
+        expected = START_DATE - timedelta(days=index + 1)
+        found = datetime.fromtimestamp(
+            context.object_store.stat(key).mtime_ns / 1e9)
+        assert found == expected, "%s was modified at %s, expected %s" % (
+            key, found, expected)
+        assert MTIME_METADATA in context.client.objects[key]["Metadata"]
+
+
+@then("the fake object store client was made for the endpoint {endpoint}")
+def client_endpoint(context, endpoint):
+    """ Verifies the endpoint the boto3 client was made for. """
+    assert context.endpoint_urls == [
+        None if endpoint == "None" else endpoint], context.endpoint_urls
+
+
+@then("the object store was reported unavailable: {reason}")
+def object_store_unavailable(context, reason):
+    """ Verifies the ObjectStoreUnavailableException raised and its reason.
+    """
+    ex = context.caught_exception
+    assert isinstance(ex, ObjectStoreUnavailableException), repr(ex)
+    assert reason in str(ex), str(ex)
+    assert ex.preferred_exit_code == 106, ex.preferred_exit_code
@@ -0,0 +1,173 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+""" Steps testing plan files. """
+import errno
+import json
+import os
+import unittest.mock
+from os.path import join
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backup_rotation.backends import LocalBackend
+from backup_rotation.planfile import PlanFileException
+from backup_rotation_steps import execute_backup_script
+from catalog_steps import execute_backup_script_counting_stats
+
+
+@given("a plan {name} holding")
+def plan_holding(context, name):
+    """ Writes the text of the step to a plan file. """
+    with open(join(context.backup_root, name), "w") as plan_file:
+        plan_file.write(context.text + "\n")
+
+
+@given("a plan {name} with the header {header} and the action {action}")
+def plan_with_action(context, name, header, action):
+    """ Writes a plan file of a header and a single action. """
+    with open(join(context.backup_root, name), "w") as plan_file:
+        plan_file.write("%s\n%s\n" % (header, action))
+
+
+@when("the rotation is planned to {name}")
+def plan_rotation(context, name):
+    """ Executes the script writing the plan to a file. """
+    execute_backup_script(context, entrypoint="internal", extra_args=[
+        "--plan-out", join(context.backup_root, name)])
+
+
+@when("the plan {name} is applied")
+def apply_plan(context, name):
+    """ Executes the script applying a plan file, keeping its statistics in
+        stats.json. """
+    execute_backup_script(context, extra_args=[
+        "--apply-plan", join(context.backup_root, name),
+        "--stats-json", join(context.backup_root, "stats.json")])
+
+
+@when("the plan {name} is applied in a dry-run")
+def apply_plan_dry_run(context, name):
+    """ Executes the script dry-running a plan file. """
+    execute_backup_script(context, is_dry_run=True, extra_args=[
+        "--apply-plan", join(context.backup_root, name)])
+
+
+@when("the plan {name} is applied internally")
+def apply_plan_internally(context, name):
+    """ Applies a plan file through the package, keeping the exception
+        raised. """
+    context.caught_exception = None
+    execute_backup_script(context, entrypoint="internal", extra_args=[
+        "--apply-plan", join(context.backup_root, name)])
+
+
+@when("the plan {name} is applied while counting stat calls")
+def apply_plan_counting_stats(context, name):
+    """ Applies a plan file while counting the directory listings and stat
+        calls. """
+    execute_backup_script_counting_stats(
+        context, "When the plan %s is applied" % name)
+
+
+@when("the plan {name} is applied while deletions fail")
+def apply_plan_failing_deletions(context, name):
+    """ Applies a plan file while removing any file fails. """
+    def fail(*_, **__):
+        raise OSError(errno.EACCES, os.strerror(errno.EACCES))
+    with unittest.mock.patch.object(os, "unlink", fail):
+        apply_plan(context, name)
+
+
+@when("stat'ing the {bucket} file {name} fails with {error}")
+def fail_stat(context, bucket, name, error):
+    """ Makes stat'ing the file fail with the error given for the rest of
+        the scenario. """
+    path = join(context.backup_root, bucket, name)
+    real_stat = LocalBackend.stat
+
+    def stat(backend, stat_path):
+        if stat_path == path:
+            code = getattr(errno, error)
+            raise OSError(code, os.strerror(code), stat_path)
+        return real_stat(backend, stat_path)
+    patch = unittest.mock.patch.object(LocalBackend, "stat", stat)
+    patch.start()
+    context.add_cleanup(patch.stop)
+
+
+@when("the {bucket} file {name} is created")
+def create_file(context, bucket, name):
+    """ Creates a file unrelated to any other. """
+    with open(join(context.backup_root, bucket, name), "w") as new_file:
+        new_file.write("unrelated")
+
+
+@when("the {bucket} file {name} is rewritten")
+def rewrite_file(context, bucket, name):
+    """ Replaces the content of a file, keeping its modification time. """
+    path = join(context.backup_root, bucket, name)
+    stat_result = os.stat(path)
+    with open(path, "w") as backup_file:
+        backup_file.write("rewritten")
+    os.utime(path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+
+
+@then("the plan {name} describes {promotions:d} promotions and "
+      "{deletions:d} deletions")
+def plan_describes(context, name, promotions, deletions):
+    """ Verifies the header and the number of actions of a plan file. """
+    with open(join(context.backup_root, name)) as plan_file:
+        records = [json.loads(x) for x in plan_file]
+    assert records[0]["plan_version"] == 1, records[0]
+    assert records[0]["backup_root"] == context.backup_root, records[0]
+    actions = [x["action"] for x in records[1:]]
+    assert actions == ["promote"] * promotions + ["delete"] * deletions, \
+        "Found the actions %s" % actions
+
+
+@then("the plan skipped {num:d} actions")
+def plan_skipped(context, num):
+    """ Verifies the actions skipped by the last application of a plan. """
+    with open(join(context.backup_root, "stats.json")) as stats_file:
+        found = json.load(stats_file)["actions_skipped"]
+    assert found == num, "Skipped %s actions, expected %s" % (found, num)
+
+
+@then('the plan {name} was rejected as "{reason}"')
+def plan_rejected(context, name, reason):
+    """ Verifies a plan file was rejected for the reason given. """
+    ex = context.caught_exception
+    assert isinstance(ex, PlanFileException), ex
+    assert join(context.backup_root, name) in ex.message, ex.message
+    assert reason in ex.message, ex.message
+
+
+@then("the plan created {num:d} links")
+def plan_linked(context, num):
+    """ Verifies the links created by the last application of a plan. """
+    with open(join(context.backup_root, "stats.json")) as stats_file:
+        found = json.load(stats_file)["links_created"]
+    assert found == num, "Created %s links, expected %s" % (found, num)
@@ -0,0 +1,101 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+""" Steps testing policy files. """
+import os
+from datetime import datetime, timedelta
+from os.path import join
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backup_rotation_steps import execute_backup_script
+from backup_rotation.cli import DEFAULT_TIME_BUCKETS
+from backup_rotation.policy import load_policy
+
+START_DATE = datetime(2020, 6, 15)
+POLICY_FILE = "policy.json"
+
+
+@given("the policy file")
+def policy_file(context):
+    """ Writes the text of the step to the policy file. """
+    with open(join(context.backup_root, POLICY_FILE), "w") as policy_raw:
+        policy_raw.write(context.text)
+
+
+@given("an empty {bucket} time bucket")
+def empty_time_bucket(context, bucket):
+    """ Creates an empty time bucket. """
+    os.makedirs(join(context.backup_root, bucket), exist_ok=True)
+
+
+@given("{num:d} {bucket} backups {minutes:d} minutes apart")
+def create_backups_minutes_apart(context, num, bucket, minutes):
+    """ Creates the time bucket, if need be, with backups the number of
+        minutes given apart before the start date. """
+    directory = join(context.backup_root, bucket)
+    os.makedirs(directory, exist_ok=True)
+    for i in range(num):
+        path = join(directory, "%s.backup.txt" % i)
+        open(path, "a").close()
+        mtime = (START_DATE - timedelta(minutes=minutes * i)).timestamp()
+        os.utime(path, times=(mtime, mtime))
+
+
+@when("the backup script is executed with the policy file")
+def execute_with_policy(context):
+    """ Executes the script with the time buckets of the policy file. """
+    execute_backup_script(context, extra_args=[
+        "--policy", join(context.backup_root, POLICY_FILE)])
+
+
+@when("the backups are rotated in memory with the policy file")
+def rotate_in_memory_with_policy(context):
+    """ Rotates an in-memory backup root holding every time bucket of the
+        policy file. """
+    time_buckets = load_policy(join(context.backup_root, POLICY_FILE),
+                               DEFAULT_TIME_BUCKETS)
+    backend = context.backup_rotation.MemoryBackend()
+    for bucket in time_buckets:
+        backend.make_bucket(bucket)
+    context.rotator = context.backup_rotation.BackupRotator(
+        time_buckets, backend=backend)
+    context.rotator.pattern = "*.backup.txt"
+    context.rotator.rotate_backups()
+
+
+@then("the {bucket} time bucket holds {num:d} backups")
+def bucket_holds(context, bucket, num):
+    """ Verifies the number of backups left in a time bucket. """
+    found = os.listdir(join(context.backup_root, bucket))
+    assert len(found) == num, "Found %s, expected %s backups" % (
+        sorted(found), num)
+
+
+@then("the time buckets were processed in the order {names}")
+def processing_order(context, names):
+    """ Verifies the order the time buckets were planned in. """
+    found = [x.name for x in context.rotator.plan]
+    assert found == names.split(", "), "Processed %s" % found
@@ -0,0 +1,105 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Steps testing the profiling and tracing of a rotation. """
+import os
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from os.path import join
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backup_rotation_steps import execute_backup_script
+
+
+@given("tracemalloc is already tracing")
+def start_tracemalloc(context):
+    """ Traces memory allocations until the end of the scenario. """
+    tracemalloc.start()
+    context.add_cleanup(tracemalloc.stop)
+
+
+@when("the backup script is executed with profiling")
+@when("the backup script is executed with profiling into {directory}")
+def execute_with_profiling(context, directory=""):
+    """ Executes the script with the profile argument, for a profile in a
+        directory of the backup root if given. """
+    context.profile = join(context.backup_root, directory, "rotation.prof")
+    execute_backup_script(context, entrypoint="internal",
+                          extra_args=["--profile", context.profile])
+
+
+@when("the in-memory backups are rotated with a span hook")
+def rotate_with_span_hook(context):
+    """ Rotates the in-memory backups recording every span as it ends. """
+    context.spans = []
+
+    @contextmanager
+    def record_span(name, attributes):
+        yield
+        context.spans.append((name, attributes))
+
+    rotator = context.backup_rotation.BackupRotator(
+        context.backup_rotation.cli.DEFAULT_TIME_BUCKETS.copy(),
+        backend=context.memory_backend)
+    rotator.pattern = "*.backup.txt"
+    rotator.add_span_hook(record_span)
+    rotator.rotate_backups()
+
+
+@then("a cProfile dump was written")
+def check_profile(context):
+    """ Checks the profile can be loaded and covers the rotation. """
+    stats = pstats.Stats(context.profile)
+    functions = [x[2] for x in stats.stats]
+    assert "plan_promotions_and_deletions" in functions
+
+
+@then("no cProfile dump was written")
+def check_no_profile(context):
+    """ Checks neither the profile nor its summary were written. """
+    assert not os.path.exists(context.profile)
+    assert not os.path.exists(context.profile + ".txt")
+
+
+@then("the profile summary reports the peak memory traced")
+def check_profile_summary(context):
+    """ Checks the human readable summary written next to the profile. """
+    assert os.path.exists(context.profile + ".txt")
+    with open(context.profile + ".txt", "r") as summary:
+        text = summary.read()
+    assert text.startswith("Peak traced memory: "), text
+    assert "plan_promotions_and_deletions" in text, text
+
+
+@then("the span hook saw the spans")
+def check_spans(context):
+    """ Checks the spans, in the order they ended, and their attributes. """
+    expected = [(row["span"], row["bucket"], row["files"])
+                for row in context.table]
+    found = [(name, attributes.get("bucket", ""),
+              str(attributes.get("files", "")))
+             for name, attributes in context.spans]
+    assert found == expected, found
@@ -0,0 +1,137 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Steps testing the deletions made to reclaim space. """
+import os
+from datetime import datetime, timedelta
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backup_rotation.reclaim import parse_free_target, parse_size
+from backends_steps import rotate_in_memory
+from backup_rotation_steps import execute_backup_script
+
+START_DATE = datetime(2020, 6, 15)
+
+
+@given("{num:d} daily backup files of {size:d} bytes an hour apart on a "
+       "memory volume of {capacity:d} bytes")
+def create_hourly_files_in_memory(context, num, size, capacity=None):
+    """ Creates the files in an in-memory backend of the given capacity, each
+        an hour older than the last, so that most are too young to be
+        deleted by the regular rotation. """
+    context.memory_backend = context.backup_rotation.MemoryBackend(
+        capacity=capacity)
+    for bucket_name in ["yearly", "monthly", "daily"]:
+        context.memory_backend.make_bucket(bucket_name)
+    date_to_use = START_DATE
+    for i in range(num):
+        date_to_use = date_to_use - timedelta(hours=1)
+        context.memory_backend.add_file(
+            "daily/%02d.backup.txt" % i, date_to_use.timestamp(), size)
+
+
+@given("{num:d} daily backup files of {size:d} bytes an hour apart in the "
+       "backup root")
+def create_hourly_files(context, num, size):
+    """ Creates the files in the daily time bucket of the backup root, each
+        an hour older than the last. """
+    date_to_use = START_DATE
+    for i in range(num):
+        date_to_use = date_to_use - timedelta(hours=1)
+        path = os.path.join(context.backup_root, "daily",
+                            "%02d.backup.txt" % i)
+        with open(path, "wb") as backup_file:
+            backup_file.write(b"x" * size)
+        os.utime(path, (date_to_use.timestamp(), date_to_use.timestamp()))
+
+
+@given("{num:d} daily backup files of {size:d} bytes an hour apart on a "
+       "memory volume of unknown size")
+def create_hourly_files_in_unknown_memory(context, num, size):
+    """ Creates the files in an in-memory backend of unknown capacity. """
+    create_hourly_files_in_memory(context, num, size)
+
+
+@given("every daily backup file is also linked as a copy")
+def link_copies_in_memory(context):
+    """ Hardlinks every in-memory daily backup file to a copy next to it,
+        the copy sorting after the file. """
+    for path in context.memory_backend.list_files("daily"):
+        context.memory_backend.link(
+            path, path.replace(".backup.txt", "-copy.backup.txt"))
+
+
+def rotate_reclaiming(context, ensure_free=None, max_bucket_bytes=None,
+                      is_dry_run=False):
+    """ Rotates the in-memory backups with the space limits given as on the
+        command line. """
+    context.rotator = rotate_in_memory(
+        context, context.memory_backend, is_dry_run,
+        ensure_free=ensure_free and parse_free_target(ensure_free),
+        max_bucket_bytes=max_bucket_bytes and parse_size(max_bucket_bytes))
+
+
+@when("the in-memory backups are rotated ensuring {space} free")
+def rotate_ensuring_free(context, space):
+    """ Rotates the in-memory backups ensuring free space. """
+    rotate_reclaiming(context, ensure_free=space.replace(" bytes", ""))
+
+
+@when("the in-memory backups are rotated in a dry-run ensuring {space} free")
+def dry_run_ensuring_free(context, space):
+    """ Dry-runs the rotation of the in-memory backups ensuring free
+        space. """
+    rotate_reclaiming(context, ensure_free=space.replace(" bytes", ""),
+                      is_dry_run=True)
+
+
+@when("the in-memory backups are rotated keeping at most {size:d} bytes per "
+      "time bucket")
+def rotate_keeping_buckets_below(context, size):
+    """ Rotates the in-memory backups keeping every time bucket below a
+        size. """
+    rotate_reclaiming(context, max_bucket_bytes=str(size))
+
+
+@when("the backup script is executed with the option {option} {value}")
+def execute_with_option(context, option, value):
+    """ Executes the script with an option and its value. """
+    execute_backup_script(context, entrypoint="internal",
+                          extra_args=[option, value])
+
+
+@then("the memory volume has {num:d} bytes free")
+def memory_volume_free(context, num):
+    """ Verifies the free space of the in-memory backend. """
+    free = context.memory_backend.disk_usage()[1]
+    assert free == num, "%s bytes are free, expected %s" % (free, num)
+
+
+@then("the rotation reclaimed {num:d} files")
+def rotation_reclaimed(context, num):
+    """ Verifies the number of kept files deleted to reclaim space. """
+    reclaimed = context.rotator.stats.files_reclaimed
+    assert reclaimed == num, "Reclaimed %s files, expected %s" % (
+        reclaimed, num)
@@ -0,0 +1,79 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" Module containing steps used to verify that planning scales linearly with
+    the number of backup files. """
+import time
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+# A backup every ten minutes, starting from 2020-09-13.
+START_TIMESTAMP = 1600000000
+BACKUP_INTERVAL = 600
+
+
+def time_planning(context, num, num_daily_to_keep):
+    """ Plans a dry-run rotation of num daily in-memory backup files and
+        returns the planning time per file. """
+    backend = context.backup_rotation.MemoryBackend()
+    for bucket in ["yearly", "monthly", "daily"]:
+        backend.make_bucket(bucket)
+    for i in range(num):
+        backend.add_file("daily/%s.backup.txt" % i,
+                         START_TIMESTAMP - i * BACKUP_INTERVAL)
+    time_buckets = {
+        name: dict(config) for name, config in
+        context.backup_rotation.cli.DEFAULT_TIME_BUCKETS.items()}
+    time_buckets["daily"]["num_files_to_keep"] = num_daily_to_keep
+    rotator = context.backup_rotation.BackupRotator(time_buckets,
+                                                    backend=backend)
+    rotator.pattern = "*.backup.txt"
+    rotator.is_dry_run = True
+    started = time.perf_counter()
+    rotator.plan_promotions_and_deletions()
+    return (time.perf_counter() - started) / num
+
+
+@given("the planning time per file for {num:d} in-memory backup files "
+       "keeping {num_to_keep:d} daily")
+def baseline_planning_time(context, num, num_to_keep):
+    """ Measures the baseline planning time per file. """
+    context.baseline_time_per_file = time_planning(context, num, num_to_keep)
+
+
+@when("{num:d} in-memory backup files are planned keeping {num_to_keep:d} "
+      "daily")
+def measured_planning_time(context, num, num_to_keep):
+    """ Measures the planning time per file for a larger number of files. """
+    context.time_per_file = time_planning(context, num, num_to_keep)
+
+
+@then("the planning time per file is at most {factor:d} times that of "
+      "{num:d} files")
+def planning_time_is_linear(context, factor, num):
+    """ Verifies that the time per file did not grow with the file count. """
+    assert context.time_per_file <= \
+        factor * context.baseline_time_per_file, \
+        "Planning took %.2f us per file, %.2f us per file for %s files" % (
+            context.time_per_file * 1e6,
+            context.baseline_time_per_file * 1e6, num)
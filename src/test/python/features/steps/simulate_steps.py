@@ -0,0 +1,157 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+
+""" Steps testing the retention simulator. """
+import argparse
+import io
+import json
+import runpy
+import sys
+import unittest.mock
+from os.path import join
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backup_rotation.reclaim import parse_size
+from backup_rotation.simulate import simulate, parse_policy, DAY, HOUR
+
+INTERVALS = {"hourly": HOUR, "daily": DAY}
+POLICY_FILE = "policy.json"
+
+
+@given('the retention policy "{policy}"')
+def retention_policy(context, policy):
+    """ Parses the policy to simulate. """
+    context.policy = parse_policy(policy)
+
+
+@when('the retention policy "{policy}" is parsed')
+def parse_retention_policy(context, policy):
+    """ Parses a policy, keeping the error if it is rejected. """
+    try:
+        context.policy = parse_policy(policy)
+    except argparse.ArgumentTypeError as ex:
+        context.caught_exception = ex
+
+
+@when("{days:d} days of {interval} backups of {size} are simulated")
+def simulate_backups(context, days, interval, size, rotate_every=None):
+    """ Simulates backups of the size given made at the interval given,
+        rotated after every backup unless rotate_every is given. """
+    context.simulation = simulate(context.policy, days * DAY,
+                                  INTERVALS[interval], parse_size(size),
+                                  rotate_every=rotate_every)
+
+
+@when("{days:d} days of {interval} backups of {size} are simulated, rotated "
+      "daily")
+def simulate_backups_rotated_daily(context, days, interval, size):
+    """ Simulates backups rotated once a day. """
+    simulate_backups(context, days, interval, size, rotate_every=DAY)
+
+
+@then("the simulation kept {num:d} files of {size}")
+def simulation_kept(context, num, size):
+    """ Verifies the files stored at the end of the simulation. """
+    result = context.simulation
+    assert (result["files"], result["bytes"]) == (num, parse_size(size)), \
+        "Kept %s files of %s bytes" % (result["files"], result["bytes"])
+
+
+@then("the simulation stored at most {num:d} files of {size}")
+def simulation_peak(context, num, size):
+    """ Verifies the most files stored during the simulation. """
+    result = context.simulation
+    assert (result["peak_files"], result["peak_bytes"]) == \
+        (num, parse_size(size)), "Stored at most %s files of %s bytes" % (
+            result["peak_files"], result["peak_bytes"])
+
+
+@then("the largest gap between the backups kept was {days:d} days")
+@then("the largest gap between the backups kept within a {window} was "
+      "{days:d} days")
+def largest_gap(context, days, window="all"):
+    """ Verifies the largest gap between the backups kept, among those within
+        the window given. """
+    gap = context.simulation["largest_gaps"][window]
+    assert gap == days * DAY, "The largest gap was %s days" % (gap / DAY)
+
+
+@then("the policy was rejected for the unknown frequency {frequency}")
+def policy_rejected(context, frequency):
+    """ Verifies the policy could not be parsed. """
+    message = str(context.caught_exception)
+    assert 'unknown frequency "%s"' % frequency in message, message
+
+
+@when('the simulator is run with the arguments "{arguments}"')
+def run_simulator(context, arguments, extra_args=()):
+    """ Runs python -m backup_rotation.simulate with the arguments, split on
+        spaces, keeping what it printed and its exit status. """
+    argv = ["simulate"] + arguments.split(" ") + list(extra_args)
+    output = io.StringIO()
+    with unittest.mock.patch.object(sys, "argv", argv), \
+            unittest.mock.patch.object(sys, "stdout", output), \
+            unittest.mock.patch.object(sys, "stderr", io.StringIO()):
+        try:
+            runpy.run_module("backup_rotation.simulate", run_name="__main__",
+                             alter_sys=True)
+        except SystemExit as ex:
+            context.simulator_status = ex.code
+    context.simulator_output = output.getvalue()
+
+
+@when('the simulator is run with the policy file and the arguments '
+      '"{arguments}"')
+def run_simulator_with_policy_file(context, arguments):
+    """ Runs the simulator with the policy file written by the policy
+        steps. """
+    run_simulator(context, arguments,
+                  ["--policy", join(context.backup_root, POLICY_FILE)])
+
+
+@then("the simulator exited with status {status:d}")
+def simulator_exited(context, status):
+    """ Verifies the exit status of the simulator. """
+    assert context.simulator_status == status, \
+        "Exited with status %s, expected %s" % (context.simulator_status,
+                                                status)
+
+
+@then('the simulator printed "{text}"')
+def simulator_printed(context, text):
+    """ Verifies the simulator printed a line starting with the text. """
+    lines = context.simulator_output.splitlines()
+    assert any(x.startswith(text) for x in lines), \
+        "Printed %s" % context.simulator_output
+
+
+@then("the simulator printed the JSON of {num:d} simulation")
+def simulator_printed_json(context, num):
+    """ Verifies the simulator printed the results as JSON and keeps the
+        first to verify further. """
+    results = json.loads(context.simulator_output)
+    assert len(results) == num, "Printed %s" % context.simulator_output
+    context.simulation = results[0]
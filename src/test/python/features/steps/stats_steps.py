@@ -0,0 +1,216 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Steps testing the statistics written about a rotation. """
+import io
+import json
+import os
+from contextlib import redirect_stdout
+from os.path import join
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backup_rotation_steps import execute_backup_script
+
+TEXTFILE = "backup_rotation.prom"
+
+
+@when("the backup script is executed with the statistics written as JSON")
+def execute_with_stats_json(context):
+    """ Executes the script writing the statistics to a JSON file. """
+    context.stats_file = join(context.backup_root, "stats.json")
+    execute_backup_script(context, entrypoint="internal",
+                          extra_args=["--stats-json", context.stats_file])
+    with open(context.stats_file, "r") as stats_raw:
+        context.stats = json.load(stats_raw)
+
+
+@given("a directory is in the way of the Prometheus textfile")
+def directory_in_the_way(context):
+    """ Creates a directory where the textfile is to be written. """
+    os.mkdir(join(context.backup_root, TEXTFILE))
+
+
+@when("the backup script is executed with the statistics written for "
+      "Prometheus")
+def execute_with_prometheus_textfile(context):
+    """ Executes the script writing the statistics to a textfile. """
+    context.textfile = join(context.backup_root, TEXTFILE)
+    execute_backup_script(context, entrypoint="internal",
+                          extra_args=["--prometheus-textfile",
+                                      context.textfile])
+
+
+@then("the statistics report {num:d} files scanned in the {bucket} bucket")
+def check_files_scanned(context, num, bucket):
+    """ Checks the number of files scanned in a time bucket. """
+    assert context.stats["files_scanned"][bucket] == num, \
+        context.stats["files_scanned"]
+
+
+@then("the statistics report {deleted:d} files deleted and {links:d} links "
+      "created")
+def check_files_deleted_and_linked(context, deleted, links):
+    """ Checks the number of deletions and promotions effected. """
+    assert context.stats["files_deleted"] == deleted, context.stats
+    assert context.stats["links_created"] == links, context.stats
+    assert context.stats["failures"] == 0, context.stats
+    assert context.stats["stat_calls"] >= 10, context.stats
+
+
+@then("the statistics report a duration for every phase")
+def check_durations(context):
+    """ Checks every phase of the rotation was timed. """
+    durations = context.stats["durations"]
+    assert sorted(durations) == ["delete", "plan", "promote", "scan"], \
+        durations
+    assert all(x >= 0 for x in durations.values()), durations
+    assert context.stats["finished"] is not None
+
+
+@then("the statistics report the rotation as unchanged")
+def check_unchanged(context):
+    """ Checks the rotation was skipped. """
+    assert context.stats["unchanged"] is True, context.stats
+    assert context.stats["files_deleted"] == 0, context.stats
+
+
+@then("the Prometheus textfile has the sample {sample}")
+def check_prometheus_sample(context, sample):
+    """ Checks the textfile has the sample, given without the label of the
+        backup root, for the backup root. """
+    metric, value = sample.split(" ")
+    name, _, labels = metric.rstrip("}").partition("{")
+    label_list = ['backup_root="%s"' % context.backup_root]
+    if labels:
+        label_list.append(labels)
+    expected = "backup_rotation_%s{%s} %s" % (name, ",".join(label_list),
+                                              value)
+    with open(context.textfile, "r") as textfile:
+        lines = textfile.read().splitlines()
+    assert expected in lines, "\n".join(lines)
+
+
+@then("the Prometheus textfile was written atomically")
+def check_written_atomically(context):
+    """ Checks no temporary file was left behind and that the textfile is
+        readable by the node_exporter. """
+    check_no_leftovers(context)
+    assert os.stat(context.textfile).st_mode & 0o044 == 0o044
+
+
+@then("no temporary file of the statistics was left behind")
+def check_no_leftovers(context):
+    """ Checks no temporary file was left next to the statistics. """
+    leftovers = [x for x in os.listdir(context.backup_root)
+                 if x.endswith(".tmp")]
+    assert not leftovers, leftovers
+
+
+@given("every {bucket} backup file holds {size:d} bytes")
+def fill_backup_files(context, bucket, size):
+    """ Writes size bytes to every backup file created in a time bucket,
+        keeping the modification times. """
+    for created in context.created_files[bucket]["backup"]:
+        stat = os.stat(created["file"])
+        with open(created["file"], "wb") as backup_file:
+            backup_file.write(b"x" * size)
+        os.utime(created["file"], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+@given("every {bucket} backup file is also linked outside the time buckets")
+def link_backup_files_elsewhere(context, bucket):
+    """ Hardlinks every backup file of a time bucket into a directory which
+        is not a time bucket. """
+    elsewhere = join(context.backup_root, "elsewhere")
+    os.mkdir(elsewhere)
+    for created in context.created_files[bucket]["backup"]:
+        os.link(created["file"],
+                join(elsewhere, os.path.basename(created["file"])))
+
+
+@when("the backup script is executed in a dry-run with the statistics "
+      "written as JSON")
+def execute_dry_run_with_stats_json(context):
+    """ Executes a dry-run writing the statistics to a JSON file, keeping
+        what it prints. """
+    context.stats_file = join(context.backup_root, "stats.json")
+    output = io.StringIO()
+    with redirect_stdout(output):
+        execute_backup_script(context, entrypoint="internal", is_dry_run=True,
+                              extra_args=["--stats-json", context.stats_file])
+    context.output = output.getvalue()
+    with open(context.stats_file, "r") as stats_raw:
+        context.stats = json.load(stats_raw)
+
+
+@when("the backup script is executed without the index and the statistics "
+      "written as JSON")
+def execute_without_index_with_stats_json(context):
+    """ Executes the script scanning every time bucket, writing the
+        statistics to a JSON file. """
+    context.stats_file = join(context.backup_root, "stats.json")
+    execute_backup_script(context, entrypoint="internal",
+                          extra_args=["--no-index",
+                                      "--stats-json", context.stats_file])
+    with open(context.stats_file, "r") as stats_raw:
+        context.stats = json.load(stats_raw)
+
+
+@then("the statistics report {freed:d} files freed, {reclaimed:d} bytes "
+      "reclaimed and {unlinked:d} bytes unlinked")
+def check_space(context, freed, reclaimed, unlinked):
+    """ Checks the space freed by the deletions. """
+    assert context.stats["files_freed"] == freed, context.stats
+    assert context.stats["bytes_reclaimed"] == reclaimed, context.stats
+    assert context.stats["bytes_unlinked"] == unlinked, context.stats
+
+
+@then("the statistics report a dry-run")
+def check_dry_run(context):
+    """ Checks the statistics are marked as those of a dry-run. """
+    assert context.stats["dry_run"] is True, context.stats
+    assert context.stats["links_created"] == 0, context.stats
+
+
+@then('the dry-run printed "{line}"')
+def check_dry_run_output(context, line):
+    """ Checks a line printed by the dry-run. """
+    assert line in context.output.splitlines(), context.output
+
+
+@then("the statistics report a stat call for every inode scanned")
+def check_hardlinks_not_stated(context):
+    """ Checks that the hardlinks of a file were only stat'ed once, the
+        stat calls also counting a stat of every time bucket directory. """
+    scanned = context.stats["files_scanned"]
+    inodes = set()
+    for bucket in scanned:
+        directory = join(context.backup_root, bucket)
+        for name in os.listdir(directory):
+            stat = os.stat(join(directory, name))
+            inodes.add((stat.st_dev, stat.st_ino))
+    assert len(inodes) < sum(scanned.values()), scanned
+    assert context.stats["stat_calls"] == len(scanned) + len(inodes), \
+        context.stats
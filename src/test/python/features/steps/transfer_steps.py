@@ -0,0 +1,349 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+""" Steps testing the fallbacks used when promotions cannot be hardlinks. """
+import errno
+import fcntl
+import json
+import os
+import sys
+import types
+import unittest.mock
+from os.path import join
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+
+from backup_rotation import transfer
+from backup_rotation_steps import execute_backup_script
+
+real_link = os.link
+real_fstat = os.fstat
+real_fsync = os.fsync
+real_write = os.write
+
+
+def failing_link(source, target, *args, **kwargs):
+    """ Fails like os.link does across file systems, except for the partial
+        copies being renamed into place. """
+    if source.endswith(transfer.PARTIAL_SUFFIX):
+        return real_link(source, target, *args, **kwargs)
+    raise OSError(errno.EXDEV, os.strerror(errno.EXDEV), source)
+
+
+def failing_with(name):
+    """ Returns a function failing with the errno of the name given. """
+    code = getattr(errno, name)
+
+    def fail(*_, **__):
+        raise OSError(code, os.strerror(code))
+    return fail
+
+
+def unsupported(*_):
+    """ Fails like an operation the file system does not support. """
+    raise OSError(errno.EOPNOTSUPP, os.strerror(errno.EOPNOTSUPP))
+
+
+def shrunk_fstat(descriptor):
+    """ Stats a file as if it had been 1 MiB larger. """
+    stat_result = real_fstat(descriptor)
+    return types.SimpleNamespace(st_mode=stat_result.st_mode,
+                                 st_size=stat_result.st_size + 1024 * 1024,
+                                 st_atime_ns=stat_result.st_atime_ns,
+                                 st_mtime_ns=stat_result.st_mtime_ns)
+
+
+class MissingAttribute():
+    """ A patch removing an attribute from a module while it is started. """
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+        self.value = None
+
+    def start(self):
+        """ Removes the attribute. """
+        self.value = getattr(self.module, self.name)
+        delattr(self.module, self.name)
+
+    def stop(self):
+        """ Puts the attribute back. """
+        setattr(self.module, self.name, self.value)
+
+
+UNSUPPORTED_PATCHES = {
+    "clones": (fcntl, "ioctl"),
+    "copy_file_range": (os, "copy_file_range"),
+    "sendfile": (os, "sendfile")
+}
+
+
+@when("the backup script is executed while hardlinks fail with EXDEV")
+def execute_without_hardlinks(context):
+    """ Executes the script as if the time buckets were on different file
+        systems. """
+    context.stats_file = join(context.backup_root, "stats.json")
+    with unittest.mock.patch.object(os, "link", failing_link):
+        execute_backup_script(context, entrypoint="internal",
+                              extra_args=["--stats-json", context.stats_file])
+    with open(context.stats_file, "r") as stats_raw:
+        context.stats = json.load(stats_raw)
+
+
+@given("a {size:d} MiB backup file")
+def create_sized_backup_file(context, size):
+    """ Creates a backup file of random contents in the daily bucket. """
+    context.source = join(context.backup_root, "daily", "large.backup.txt")
+    context.target = join(context.backup_root, "monthly", "large.backup.txt")
+    with open(context.source, "wb") as source:
+        source.write(os.urandom(size * 1024 * 1024))
+    os.utime(context.source, ns=(1500000000123456789, 1500000000123456789))
+    context.patches = []
+
+
+@given("hardlinks fail with EXDEV")
+def hardlinks_fail(context):
+    """ Makes every hardlink fail as if across file systems. """
+    context.patches.append(unittest.mock.patch.object(os, "link",
+                                                      failing_link))
+
+
+@given("hardlinks fail with {error}")
+def hardlinks_fail_with(context, error):
+    """ Makes every hardlink fail with the error given. """
+    context.patches.append(unittest.mock.patch.object(
+        os, "link", failing_with(error)))
+
+
+@given("hardlinks are not supported at all")
+def hardlinks_unsupported(context):
+    """ Makes every hardlink fail, including those renaming the partial
+        copies into place. """
+    context.patches.append(unittest.mock.patch.object(os, "link",
+                                                      unsupported))
+
+
+@given("{methods} fail with EOPNOTSUPP")
+def methods_fail(context, methods):
+    """ Makes the copy methods listed unsupported. """
+    for method in methods.replace(" and ", ", ").split(", "):
+        module, name = UNSUPPORTED_PATCHES[method]
+        context.patches.append(unittest.mock.patch.object(
+            module, name, unsupported, create=True))
+
+
+@given("{method} fail with {error}")
+def method_fails_with(context, method, error):
+    """ Makes the copy method fail with the error given. """
+    module, name = UNSUPPORTED_PATCHES[method]
+    context.patches.append(unittest.mock.patch.object(
+        module, name, failing_with(error), create=True))
+
+
+@given("renaming partial copies into place fails with {error}")
+def renames_fail_with(context, error):
+    """ Makes the hardlinks renaming the partial copies into place fail with
+        the error given, and the others as if across file systems. """
+    fail = failing_with(error)
+
+    def link(source, target, *args, **kwargs):
+        if source.endswith(transfer.PARTIAL_SUFFIX):
+            fail()
+        failing_link(source, target, *args, **kwargs)
+    context.patches.append(unittest.mock.patch.object(os, "link", link))
+
+
+@given("partial copies cannot be removed")
+def unlink_fails(context):
+    """ Makes removing any file fail. """
+    context.patches.append(unittest.mock.patch.object(
+        os, "unlink", failing_with("EACCES")))
+
+
+@given("fcntl is not available")
+def remove_fcntl(context):
+    """ Makes importing fcntl fail, as it does on Windows. """
+    context.patches.append(unittest.mock.patch.dict(sys.modules,
+                                                    {"fcntl": None}))
+
+
+@given("{names} are not available")
+def remove_os_functions(context, names):
+    """ Removes the functions of the os module listed, as older versions of
+        Python do not have them. """
+    for name in names.split(" and "):
+        context.patches.append(MissingAttribute(os, name))
+
+
+@given("writes are short")
+def short_writes(context):
+    """ Makes every write write at most 64 KiB. """
+    context.patches.append(unittest.mock.patch.object(
+        os, "write", lambda fd, data: real_write(fd, data[:65536])))
+
+
+@given("the backup file shrinks as it is copied")
+def shrink_backup_file(context):
+    """ Makes the backup file appear larger when it is stat'ed than the data
+        which can be read from it. """
+    context.patches.append(unittest.mock.patch.object(
+        os, "fstat", shrunk_fstat))
+
+
+@given("the promoted backup file appears while it is copied")
+def create_promoted_file_meanwhile(context):
+    """ Creates a different file where the backup file is promoted once its
+        contents have been copied. """
+    real_copy_contents = transfer._copy_contents  # pylint: disable=protected-access
+
+    def copy_contents(*args):
+        method = real_copy_contents(*args)
+        create_promoted_file(context)
+        return method
+    context.patches.append(unittest.mock.patch.object(
+        transfer, "_copy_contents", copy_contents))
+
+
+@given("the promoted backup file already exists")
+def create_promoted_file(context):
+    """ Creates a different file where the backup file would be promoted. """
+    with open(context.target, "wb") as target:
+        target.write(b"existing")
+
+
+@when("the backup file is promoted")
+def promote_backup_file(context, sync=False):
+    """ Promotes the backup file with the patches given applied. """
+    context.transfer = context.promote_error = None
+    for patch in context.patches:
+        patch.start()
+    try:
+        context.transfer = transfer.promote_file(context.source,
+                                                 context.target, sync=sync)
+    except OSError as ex:
+        context.promote_error = ex
+    finally:
+        for patch in reversed(context.patches):
+            patch.stop()
+
+
+@when("the backup file is promoted and synced")
+def promote_and_sync_backup_file(context):
+    """ Promotes the backup file, syncing the copy, noting the descriptors
+        synced. """
+    context.synced = []
+
+    def fsync(descriptor):
+        context.synced.append(os.fstat(descriptor).st_ino)
+        real_fsync(descriptor)
+    context.patches.append(unittest.mock.patch.object(os, "fsync", fsync))
+    promote_backup_file(context, sync=True)
+
+
+@then("it was promoted with {method}")
+def check_method(context, method):
+    """ Checks the method which made the promotion. """
+    assert context.promote_error is None, context.promote_error
+    assert context.transfer.method == method, context.transfer
+    assert context.transfer.size == os.path.getsize(context.source)
+
+
+@then("the promoted copy has the same contents and modification time")
+def check_copy(context):
+    """ Checks the copy is a separate file identical to the original. """
+    source_stat = os.stat(context.source)
+    target_stat = os.stat(context.target)
+    assert source_stat.st_ino != target_stat.st_ino
+    assert source_stat.st_mtime_ns == target_stat.st_mtime_ns
+    with open(context.source, "rb") as source, \
+            open(context.target, "rb") as target:
+        assert source.read() == target.read()
+    leftovers = [x for x in os.listdir(os.path.dirname(context.target))
+                 if x.endswith(transfer.PARTIAL_SUFFIX)]
+    assert not leftovers, leftovers
+
+
+@then("the promoted copy was synced")
+def check_synced(context):
+    """ Checks the copy was synced before it was renamed into place. """
+    assert os.stat(context.target).st_ino in context.synced, context.synced
+
+
+@then("the promotion failed with {error}")
+def check_failed_with(context, error):
+    """ Checks the promotion failed with the error given. """
+    assert isinstance(context.promote_error, OSError), context.promote_error
+    assert context.promote_error.errno == getattr(errno, error), \
+        context.promote_error
+    assert not os.path.exists(context.target)
+
+
+@then("no partial copy is left")
+def check_no_partial_copy(context):
+    """ Checks no partial copy was left in the target directory. """
+    leftovers = [x for x in os.listdir(os.path.dirname(context.target))
+                 if x.endswith(transfer.PARTIAL_SUFFIX)]
+    assert not leftovers, leftovers
+
+
+@given("a transfer of {size:d} MiB taking no measurable time")
+def create_instant_transfer(context, size):
+    """ Describes a transfer which took no measurable time. """
+    context.transfer = transfer.Transfer("copy", size * 1024 * 1024, 0.0)
+
+
+@then('the transfer is described as "{description}"')
+def check_description(context, description):
+    """ Checks the description of the transfer's throughput. """
+    assert transfer.format_throughput(context.transfer) == description, \
+        transfer.format_throughput(context.transfer)
+
+
+@then("the promotion failed as the file exists")
+def check_not_replaced(context):
+    """ Checks an existing file was left alone. """
+    assert isinstance(context.promote_error, FileExistsError), \
+        context.promote_error
+    with open(context.target, "rb") as target:
+        assert target.read() == b"existing"
+
+
+@then("the {bucket} backup files are copies keeping the modification time")
+def check_bucket_copies(context, bucket):
+    """ Checks every file of the bucket is a copy of a daily backup with the
+        same modification time. """
+    daily_mtimes = {x["file"].rsplit("/", 1)[1]: x["mtime"].timestamp()
+                    for x in context.created_files["daily"]["backup"]}
+    names = [x for x in os.listdir(join(context.backup_root, bucket))
+             if x.endswith(".backup.txt")]
+    assert names
+    for name in names:
+        path = join(context.backup_root, bucket, name)
+        assert os.stat(path).st_nlink == 1, path
+        assert os.path.getmtime(path) == daily_mtimes[name], path
+
+
+@then("the statistics report {num:d} files copied")
+def check_files_copied(context, num):
+    """ Checks the number of promotions which were copies. """
+    assert context.stats["files_copied"] == num, context.stats
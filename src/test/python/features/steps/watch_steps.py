@@ -0,0 +1,370 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+""" Module containing steps used to test the watch mode of the backup_rotation
+    package """
+import ctypes
+import ctypes.util
+import errno
+import os
+import signal
+import threading
+import time
+import types
+import unittest.mock
+from datetime import datetime, timedelta
+# pylint: disable=no-name-in-module
+from behave import given, when, then
+from backup_rotation import index, watch
+from backup_rotation.backup_rotation import BackupRotationException
+from backup_rotation.cli import DEFAULT_TIME_BUCKETS
+from backup_rotation.watch import BackupWatcher
+from backup_rotation_steps import execute_backup_script
+from transfer_steps import failing_link
+
+START_DATE = datetime(2020, 6, 15)
+
+
+def fail_with(error):
+    """ Returns -1 with the errno of ctypes set to error, or None if there
+        is no error. """
+    if error is None:
+        return None
+    ctypes.set_errno(error)
+    return -1
+
+
+def patch_libc(init_error=None, watch_errors=None):
+    """ Returns a patch loading the C library with inotify failing as asked:
+        inotify_init1 with init_error, and inotify_add_watch with the error
+        given for each path in watch_errors. """
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    watch_errors = watch_errors or {}
+
+    def inotify_init1(flags):
+        return fail_with(init_error) or libc.inotify_init1(flags)
+
+    def inotify_add_watch(descriptor, path, mask):
+        return fail_with(watch_errors.get(os.fsdecode(path))) or \
+            libc.inotify_add_watch(descriptor, path, mask)
+    fake_libc = types.SimpleNamespace(inotify_init1=inotify_init1,
+                                      inotify_add_watch=inotify_add_watch)
+    return unittest.mock.patch.object(ctypes, "CDLL",
+                                      lambda *_, **__: fake_libc)
+
+
+def start_patch(context, patch):
+    """ Starts the patch and returns a function stopping it, which may be
+        called more than once. The patch is stopped after the scenario at
+        the latest. """
+    patch.start()
+    stopped = []
+
+    def stop():
+        if not stopped:
+            stopped.append(True)
+            patch.stop()
+    context.add_cleanup(stop)
+    return stop
+
+
+def wait_for(condition, seconds):
+    """ Waits up to seconds for the condition to hold, returning whether it
+        did. """
+    deadline = time.monotonic() + seconds
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def stop_watching(context):
+    """ Stops the watcher started by the scenario. """
+    context.watcher.stop()
+    context.watcher_thread.join()
+
+
+@when("the backup root is being watched with a resync interval of "
+      "{seconds:d} second")
+@when('the backup root is being watched for "{pattern}"')
+@when("the backup root is being watched")
+def watch_backup_root(context, seconds=3600, pattern="*.backup.txt"):
+    """ Starts watching the backup root in a thread, once the first rotation
+        has completed, noting whether each rotation was a full rescan. """
+    rotator = context.backup_rotation.BackupRotator(
+        DEFAULT_TIME_BUCKETS.copy())
+    rotator.backup_root = context.backup_root
+    rotator.pattern = pattern
+    rotator.use_index = True
+    context.rotator = rotator
+    context.full_rescans = []
+    context.watcher = BackupWatcher(
+        rotator, DEFAULT_TIME_BUCKETS,
+        lambda: context.full_rescans.append(rotator.force_rescan))
+    context.watcher.debounce = 0.2
+    context.watcher.max_delay = 2
+    context.watcher.resync_interval = seconds
+    context.watcher_thread = threading.Thread(target=context.watcher.run)
+    context.watcher_thread.start()
+    context.add_cleanup(stop_watching, context)
+    assert wait_for(lambda: context.watcher.rotations == 1, 5)
+    context.rotations = 1
+    for patch in getattr(context, "patches", ()):
+        patch.stop()
+
+
+@when("{num:d} new {bucket} {file_type} files land {interval:g} seconds "
+      "apart")
+@when("{num:d} new {bucket} {file_type} files land in the new subdirectory")
+@when("{num:d} new {bucket} {file_type} files land")
+@when("a new {bucket} {file_type} file lands")
+def new_files_land(context, bucket, file_type, num=1, interval=0):
+    """ Writes new files, a day apart and newer than any other, outside of
+        the backup root and moves them into the bucket, or the subdirectory
+        created, interval seconds apart. Files landing again are newer than
+        those which landed before. """
+    directory = getattr(context, "new_subdirectory",
+                        os.path.join(context.backup_root, bucket))
+    first_day = len(getattr(context, "new_files", ()))
+    context.new_files = []
+    for i in range(first_day, first_day + num):
+        temporary_filename = os.path.join(context.backup_root,
+                                          "new-%s.tmp" % i)
+        with open(temporary_filename, "w") as new_file:
+            new_file.write("backup")
+        mtime = (START_DATE + timedelta(days=i + 1)).timestamp()
+        os.utime(temporary_filename, times=(mtime, mtime))
+        filename = os.path.join(directory, "new-%s..%s.txt" % (i, file_type))
+        os.rename(temporary_filename, filename)
+        context.new_files.append(filename)
+        time.sleep(interval)
+    context.new_files = context.new_files[-num:]
+
+
+@when("the newest {bucket} backup file is rewritten in place")
+def rewrite_in_place(context, bucket):
+    """ Rewrites the newest backup file of the time bucket, giving it a
+        modification time an hour later, and closes it once it is written. """
+    path = os.path.join(context.backup_root, bucket, "0..backup.txt")
+    mtime = os.stat(path).st_mtime + 3600
+    with open(path, "w") as backup:
+        backup.write("rewritten")
+        backup.flush()
+        os.utime(backup.fileno(), times=(mtime, mtime))
+    context.rewritten = (path, int(mtime) * 1000000000)
+
+
+@when("a new {bucket} subdirectory is created")
+def create_subdirectory(context, bucket):
+    """ Creates a directory in the time bucket for backups to land in. """
+    context.new_subdirectory = os.path.join(context.backup_root, bucket,
+                                            "new")
+    os.mkdir(context.new_subdirectory)
+
+
+@when("the event queue overflows")
+def overflow_event_queue(context):
+    """ Reports an overflow of the inotify queue to the watcher. """
+    real_read_events = watch.Inotify.read_events
+
+    def read_events(inotify, timeout):
+        stop()
+        return [(-1, watch.IN_Q_OVERFLOW, 0, "")] + \
+            real_read_events(inotify, timeout)
+    stop = start_patch(context, unittest.mock.patch.object(
+        watch.Inotify, "read_events", read_events))
+
+
+@when("the next rotation fails with {error}")
+def fail_next_rotation(context, error):
+    """ Makes the next rotation fail with an OSError or a
+        BackupRotationException. """
+    exception = {
+        "an OSError": OSError(errno.EIO, os.strerror(errno.EIO)),
+        "a BackupRotationException": BackupRotationException("Failed", 1)
+    }[error]
+
+    def rotate_backups():
+        del context.rotator.rotate_backups
+        raise exception
+    context.rotator.rotate_backups = rotate_backups
+
+
+@when("reading the event queue would block once")
+def block_reading_once(context):
+    """ Makes the next read of the inotify queue fail as there was nothing
+        to read after all. """
+    real_read = os.read
+
+    def read(descriptor, size):
+        if os.readlink("/proc/self/fd/%s" % descriptor).endswith(":inotify"):
+            stop()
+            raise BlockingIOError(errno.EAGAIN, os.strerror(errno.EAGAIN))
+        return real_read(descriptor, size)
+    stop = start_patch(context, unittest.mock.patch.object(os, "read", read))
+
+
+@given("promotions are copied as hardlinks fail {where}")
+def copy_promotions(context, where):
+    """ Makes the hardlinks of the first rotation fail as if across file
+        systems, and also those renaming the partial copies into place when
+        they fail everywhere. """
+    def link(source, *_, **__):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV), source)
+    context.patches = [unittest.mock.patch.object(os, "link", {
+        "across file systems": failing_link,
+        "everywhere": link
+    }[where])]
+    context.patches[0].start()
+
+
+@given("directory modification times are trusted at once")
+def trust_at_once(context):
+    """ Makes the scan index trust directory modification times however
+        recent, as if the rotations were far apart. """
+    start_patch(context, unittest.mock.patch.object(index, "RACY_WINDOW_NS",
+                                                    0))
+
+
+@given("the {bucket} time bucket vanishes before it is watched")
+def vanish_before_watching(context, bucket):
+    """ Makes watching the time bucket fail as if it had vanished. """
+    fail_watching_bucket(context, bucket, errno.ENOENT)
+
+
+@given("the {bucket} time bucket cannot be watched")
+def fail_watching_bucket(context, bucket, error=errno.EACCES):
+    """ Makes watching the time bucket fail with the error given. """
+    path = os.path.join(context.backup_root, bucket)
+    context.patches = [patch_libc(watch_errors={path: error})]
+    context.patches[0].start()
+
+
+@given("inotify is missing from libc")
+def remove_inotify(context):
+    """ Makes loading the C library fail. """
+    def fail(*_, **__):
+        raise OSError("libc.so.6: cannot open shared object file")
+    context.patches = [unittest.mock.patch.object(ctypes, "CDLL", fail)]
+    context.patches[0].start()
+
+
+@given("inotify cannot be initialised")
+def fail_inotify_init(context):
+    """ Makes creating an inotify instance fail. """
+    context.patches = [patch_libc(init_error=errno.EMFILE)]
+    context.patches[0].start()
+
+
+@when("the backup root is watched from the command line")
+def watch_from_command_line(context):
+    """ Runs watch mode as the script does. """
+    try:
+        execute_backup_script(context, extra_args=["--watch"])
+    finally:
+        for patch in getattr(context, "patches", ()):
+            patch.stop()
+
+
+@when("the backup root is watched from the command line until {name}")
+def watch_until_signalled(context, name):
+    """ Runs watch mode as the script does, sending the signal given to this
+        process once the first rotation wrote its statistics. """
+    stats_file = os.path.join(context.backup_root, "stats.json")
+    previous_handler = signal.getsignal(signal.SIGTERM)
+    context.add_cleanup(signal.signal, signal.SIGTERM, previous_handler)
+
+    def send_signal():
+        assert wait_for(lambda: os.path.exists(stats_file), 5)
+        os.kill(os.getpid(), getattr(signal, name))
+    sender = threading.Thread(target=send_signal)
+    sender.start()
+    try:
+        execute_backup_script(context,
+                              extra_args=["--watch", "--stats-json",
+                                          stats_file])
+    finally:
+        sender.join()
+
+
+@then("the backups are rotated again within {seconds:d} seconds")
+def rotated_again(context, seconds):
+    """ Waits for the watcher to rotate the backups again. """
+    context.rotations += 1
+    assert wait_for(lambda: context.watcher.rotations >= context.rotations,
+                    seconds)
+
+
+@then("the backups are rotated again with a full rescan within {seconds:d} "
+      "seconds")
+def rescanned_again(context, seconds):
+    """ Waits for the watcher to rotate the backups again with a full
+        rescan. """
+    rotated_again(context, seconds)
+    assert context.full_rescans == [False, True], context.full_rescans
+
+
+@then("the backups are not rotated again within {seconds:d} second")
+def not_rotated_again(context, seconds):
+    """ Verifies that the watcher did not rotate the backups again. """
+    assert not wait_for(lambda: context.watcher.rotations >= 2, seconds)
+
+
+@then("the rotation saw the new modification time of the rewritten file")
+def saw_rewritten_file(context):
+    """ Verifies that the last rotation listed the directory of the file
+        rewritten in place again, although its modification time did not
+        change. """
+    path, mtime_ns = context.rewritten
+    assert not context.rotator.was_unchanged
+    assert context.rotator.catalog[path].mtime_ns == mtime_ns, \
+        context.rotator.catalog[path]
+
+
+@then("the first rotation copied its promotions")
+def promotions_copied(context):
+    """ Verifies that the first rotation, and only rotation, had to copy the
+        files it promoted. """
+    assert context.watcher.rotations == 1, context.watcher.rotations
+    assert context.rotator.stats.files_copied > 0
+
+
+@then("the backups are not rotated once per backup file")
+def rotated_once(context):
+    """ Verifies that the burst of backups was rotated once, a while after
+        it ended. """
+    time.sleep(5 * context.watcher.debounce)
+    assert context.watcher.rotations == 2, context.watcher.rotations
+
+
+@then("only the new {bucket} {file_type} files remain")
+def only_new_files_remain(context, bucket, file_type):
+    """ Verifies that the files which landed are the only ones left. """
+    found = sorted(
+        os.path.join(directory, x)
+        for directory, _, names in os.walk(os.path.join(context.backup_root,
+                                                        bucket))
+        for x in names if x.endswith(".%s.txt" % file_type))
+    assert found == sorted(context.new_files), \
+        "Found %s, expected %s" % (found, context.new_files)
@@ -0,0 +1,126 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+
+Feature: Promotion Fallbacks
+  Scenario: Promotions are copied when hardlinks are impossible
+     Given 30 daily backup files
+      When the backup script is executed while hardlinks fail with EXDEV
+      Then only the 3 most recent daily backup files remain
+       And the monthly backup files are copies keeping the modification time
+       And the statistics report 2 files copied
+
+  Scenario Outline: Each copy method is tried in turn
+     Given a 3 MiB backup file
+       And hardlinks fail with EXDEV
+       And <unsupported> fail with EOPNOTSUPP
+      When the backup file is promoted
+      Then it was promoted with <method>
+       And the promoted copy has the same contents and modification time
+
+    Examples:
+      | unsupported                         | method          |
+      | clones                              | copy_file_range |
+      | clones and copy_file_range          | sendfile        |
+      | clones, copy_file_range and sendfile | copy           |
+
+  Scenario: A promotion never replaces an existing file
+     Given a 3 MiB backup file
+       And hardlinks fail with EXDEV
+       And the promoted backup file already exists
+      When the backup file is promoted
+      Then the promotion failed as the file exists
+
+  Scenario Outline: A backup file shrinking while it is copied is copied whole
+     Given a 3 MiB backup file
+       And hardlinks fail with EXDEV
+       And <unsupported> fail with EOPNOTSUPP
+       And the backup file shrinks as it is copied
+      When the backup file is promoted
+      Then the promoted copy has the same contents and modification time
+
+    Examples:
+      | unsupported                         |
+      | clones                              |
+      | clones and copy_file_range          |
+      | clones, copy_file_range and sendfile |
+
+  Scenario: Copy methods missing from the platform are skipped
+     Given a 3 MiB backup file
+       And hardlinks fail with EXDEV
+       And fcntl is not available
+       And copy_file_range and sendfile are not available
+       And writes are short
+      When the backup file is promoted and synced
+      Then it was promoted with copy
+       And the promoted copy has the same contents and modification time
+       And the promoted copy was synced
+
+  Scenario: Copies are renamed into place where there are no hardlinks
+     Given a 3 MiB backup file
+       And hardlinks are not supported at all
+       And clones, copy_file_range and sendfile fail with EOPNOTSUPP
+      When the backup file is promoted
+      Then it was promoted with copy
+       And the promoted copy has the same contents and modification time
+
+  Scenario: A copy never replaces a file which appeared meanwhile
+     Given a 3 MiB backup file
+       And hardlinks are not supported at all
+       And the promoted backup file appears while it is copied
+      When the backup file is promoted
+      Then the promotion failed as the file exists
+
+  Scenario: A hardlink failing otherwise fails the promotion
+     Given a 3 MiB backup file
+       And hardlinks fail with EACCES
+      When the backup file is promoted
+      Then the promotion failed with EACCES
+
+  Scenario: A copy failing otherwise fails the promotion
+     Given a 3 MiB backup file
+       And hardlinks fail with EXDEV
+       And clones fail with EIO
+      When the backup file is promoted
+      Then the promotion failed with EIO
+       And no partial copy is left
+
+  Scenario: A copy failing to be renamed into place fails the promotion
+     Given a 3 MiB backup file
+       And hardlinks fail with EXDEV
+       And renaming partial copies into place fails with EIO
+      When the backup file is promoted
+      Then the promotion failed with EIO
+       And no partial copy is left
+
+  Scenario: A failed copy's error is kept when the partial copy remains
+     Given a 3 MiB backup file
+       And hardlinks fail with EXDEV
+       And clones fail with EIO
+       And partial copies cannot be removed
+      When the backup file is promoted
+      Then the promotion failed with EIO
+
+  Scenario: The throughput of an instant transfer is left out
+     Given a transfer of 2 MiB taking no measurable time
+      Then the transfer is described as "2.0 MiB"
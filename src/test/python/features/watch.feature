@@ -0,0 +1,148 @@
+#
+# Copyright (c) 2020 Christopher Prevoe
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+
+Feature: Watch Mode
+  Scenario: Backups landing while watching are rotated within seconds
+     Given 30 daily backup files
+      When the backup root is being watched
+       And 3 new daily backup files land
+      Then the backups are rotated again within 5 seconds
+       And only the new daily backup files remain
+
+  Scenario: Unrelated files landing while watching are ignored
+     Given 30 daily backup files
+      When the backup root is being watched
+       And a new daily miscellaneous file lands
+      Then the backups are not rotated again within 1 second
+
+  Scenario: A burst of backups landing is rotated once
+     Given 30 daily backup files
+      When the backup root is being watched
+       And 3 new daily backup files land 0.05 seconds apart
+      Then the backups are rotated again within 5 seconds
+       And the backups are not rotated once per backup file
+       And only the new daily backup files remain
+
+  Scenario: Backups landing in a new directory are rotated
+     Given 30 daily backup files
+      When the backup root is being watched
+       And a new daily subdirectory is created
+      Then the backups are rotated again within 5 seconds
+      When 3 new daily backup files land in the new subdirectory
+      Then the backups are rotated again within 5 seconds
+       And only the new daily backup files remain
+
+  Scenario: Backups rewritten in place while watching are listed again
+     Given 30 daily backup files
+       And directory modification times are trusted at once
+      When the backup root is being watched
+       And the newest daily backup file is rewritten in place
+      Then the backups are rotated again within 5 seconds
+       And the rotation saw the new modification time of the rewritten file
+
+  Scenario Outline: Promotions copied while watching are not rotated again
+     Given 30 daily backup files
+       And promotions are copied as hardlinks fail <where>
+      When the backup root is being watched for "<pattern>"
+      Then the backups are not rotated again within 1 second
+       And the first rotation copied its promotions
+
+    Examples:
+      | where               | pattern       |
+      | across file systems | *.backup.txt* |
+      | everywhere          | *.backup.txt  |
+
+  Scenario: An overflowing event queue is followed by a full rescan
+     Given 30 daily backup files
+      When the backup root is being watched
+       And the event queue overflows
+      Then the backups are rotated again with a full rescan within 5 seconds
+
+  Scenario: The time buckets are fully rescanned periodically
+     Given 30 daily backup files
+      When the backup root is being watched with a resync interval of 1 second
+      Then the backups are rotated again with a full rescan within 5 seconds
+
+  Scenario Outline: Watching goes on when a rotation fails
+     Given 30 daily backup files
+      When the backup root is being watched
+       And the next rotation fails with <error>
+       And 3 new daily backup files land
+      Then the backups are rotated again within 5 seconds
+      When 3 new daily backup files land
+      Then the backups are rotated again within 5 seconds
+       And only the new daily backup files remain
+
+    Examples:
+      | error                     |
+      | an OSError                |
+      | a BackupRotationException |
+
+  Scenario: Events which cannot be read yet are read later
+     Given 30 daily backup files
+      When the backup root is being watched
+       And reading the event queue would block once
+       And 3 new daily backup files land
+      Then the backups are rotated again within 5 seconds
+       And only the new daily backup files remain
+
+  Scenario: Time buckets vanishing before they are watched are skipped
+     Given 30 daily backup files
+       And the monthly time bucket vanishes before it is watched
+      When the backup root is being watched
+       And 3 new daily backup files land
+      Then the backups are rotated again within 5 seconds
+       And only the new daily backup files remain
+
+  Scenario Outline: Watch mode is unavailable without inotify
+     Given 30 daily backup files
+       And <failure>
+      When the backup root is watched from the command line
+      Then the script should exit with status 104
+
+    Examples:
+      | failure                                     |
+      | inotify is missing from libc                |
+      | inotify cannot be initialised               |
+      | the daily time bucket cannot be watched     |
+
+  Scenario Outline: Watch mode stops when it is interrupted or terminated
+     Given 30 daily backup files
+      When the backup root is watched from the command line until <signal>
+      Then the script should exit with status 0
+       And only the 3 most recent daily backup files remain
+
+    Examples:
+      | signal  |
+      | SIGTERM |
+      | SIGINT  |
+
+  Scenario Outline: Watch mode cannot write or apply plans
+     Given 30 daily backup files
+      When the backup script is executed with the arguments "<arguments>"
+      Then the script should exit with status 2
+
+    Examples:
+      | arguments                        |
+      | --watch --plan-out plan.jsonl    |
+      | --watch --apply-plan plan.jsonl  |